@@ -1,7 +1,19 @@
+import atexit
+import logging
+
 from flask import Flask
 from app.config.config_loader import load_configurations, configure_logging
-from app.database.db_connection import init_engine_from_config, close_db_connection
-from app.views.webhook import webhook_blueprint
+from app.database.db_connection import (init_engine_from_config, close_db_connection, obtener_conexion,
+                                        desactivar_opciones_sin_tabla)
+from app.services.conversation_scheduler import init_conversation_scheduler
+from app.services.media_cache import init_media_cache
+from app.database.message_status import init_status_batch_writer
+from app.services.message_deduplicator import init_message_deduplicator
+from app.services.message_router import init_message_router
+from app.services.outbound_dispatcher import init_outbound_dispatcher
+from app.services.reply_streaming import init_reply_streamer
+from app.utils.graph_client import init_graph_client
+from app.utils.resilience import init_resilience
 
 def create_app():
     app = Flask(__name__)
@@ -13,11 +25,83 @@ def create_app():
     # Inicializar conexión a la base de datos al arrancar la app
     with app.app_context():
         init_engine_from_config()
+    # Las opciones que dependen de tablas nuevas se apagan si falta la migración
+    desactivar_opciones_sin_tabla(app.config)
+    from app.services.assistant_manager import apply_app_options
+
+    apply_app_options(app.config)
 
     # Cerrar sesión de base de datos al terminar cada request
     app.teardown_appcontext(close_db_connection)
 
-    # Registrar rutas (blueprints)
+    # Circuitos y reintentos compartidos por OpenAI y la Graph API
+    init_resilience(app.config)
+
+    # Cliente de la Graph API con pool de conexiones, compartido por todos los hilos
+    try:
+        init_graph_client(app.config)
+    except ValueError as e:
+        logging.warning(f"Cliente de la Graph API no inicializado: {e}")
+
+    # Media ya subida a WhatsApp (por hash del contenido) para no volver a subirla
+    init_media_cache(app.config, session_factory=obtener_conexion)
+
+    # Todos los mensajes salen por la cola con límite de throughput por número emisor
+    from app.utils.whatsapp_utils import deliver_outbound
+
+    dispatcher = init_outbound_dispatcher(app.config, deliver_outbound)
+    if dispatcher is not None:
+        atexit.register(dispatcher.stop)
+
+    # Acuse de lectura inmediato y respuestas largas enviadas por párrafos mientras se generan
+    from app.utils.whatsapp_utils import send_read_receipt
+
+    init_reply_streamer(app.config, send_read_receipt)
+
+    # Descartar reintentos del webhook (memoria y, opcionalmente, base de datos)
+    init_message_deduplicator(app.config, session_factory=obtener_conexion)
+
+    # Persistencia en lote de estados de entrega/lectura
+    status_writer = init_status_batch_writer(app.config)
+    if status_writer is not None:
+        atexit.register(status_writer.stop)
+
+    # Clasificador local: responde saludos, precios, stock y charla sin OpenAI
+    init_message_router(app.config, session_factory=obtener_conexion)
+
+    # Ejecución ordenada por conversación con límite global de concurrencia
+    scheduler = init_conversation_scheduler(app)
+    atexit.register(scheduler.shutdown)
+
+    # Agrupar ráfagas de mensajes del mismo cliente en un solo run
+    if app.config["DEBOUNCE_WINDOW_SECONDS"] > 0:
+        from app.services.message_debouncer import init_message_debouncer
+        from app.utils.whatsapp_utils import schedule_burst_response
+
+        debouncer = init_message_debouncer(app, schedule_burst_response)
+        atexit.register(debouncer.stop)
+
+    # Procesamiento en segundo plano: el webhook responde 200 y encola el evento
+    if app.config["WEBHOOK_ASYNC_MODE"]:
+        from app.services.webhook_worker_pool import init_webhook_worker_pool
+        from app.utils.whatsapp_utils import dispatch_webhook_event
+
+        pool = init_webhook_worker_pool(app, dispatch_webhook_event)
+        atexit.register(pool.stop)
+
+    # Asistente: se crea sin red; la verificación contra OpenAI ocurre en
+    # segundo plano o en el primer mensaje, una vez por proceso (seguro con fork)
+    if app.config["ASSISTANT_WARMUP"]:
+        from app.services.assistant_manager import get_assistant_manager
+
+        get_assistant_manager().warm_up()
+
+    # Registrar rutas (blueprints); se importan aquí para que la app ASGI
+    # (app.asgi) pueda importar el paquete sin cargar las vistas de Flask
+    from app.views.webhook import webhook_blueprint
+    from app.views.metrics import metrics_blueprint
+
     app.register_blueprint(webhook_blueprint)
+    app.register_blueprint(metrics_blueprint)
 
     return app
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.config.config_loader import build_config, configure_logging
+from app.database.async_db_connection import init_async_engine, close_async_engine
+from app.services.async_assistant_manager import AsyncAssistantManager
+from app.services.message_deduplicator import init_message_deduplicator
+from app.services.message_router import init_message_router
+from app.utils.async_whatsapp_utils import AsyncWhatsAppClient, process_webhook_event_async
+from app.utils.decorators import verificar_solicitud_firmada, verificar_token_metricas
+from app.utils.metrics import collect_metrics, register_metrics_provider
+from app.utils.whatsapp_payload import is_status_only_payload, parse_webhook_payload
+
+
+def create_async_app() -> FastAPI:
+    """
+    Fábrica de la app ASGI (FastAPI) con el mismo contrato de /webhook que create_app.
+
+    Ejecutar con: uvicorn app.asgi:create_async_app --factory
+    """
+    config = build_config()
+    configure_logging()
+
+    # El nivel persistente usa sesiones síncronas de Flask; aquí solo memoria
+    init_message_deduplicator({**config, "DEDUP_PERSISTENT": False})
+
+    # Router local sin catálogo (no hay sesión síncrona): precios y stock van al asistente
+    init_message_router(config)
+
+    # Tareas en curso cuando el webhook responde antes de procesar
+    background_tasks = set()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        init_async_engine(config)
+        app.state.assistant = AsyncAssistantManager()
+        await app.state.assistant.initialize()
+        app.state.whatsapp = AsyncWhatsAppClient.from_config(config)
+        register_metrics_provider(
+            "asgi_tasks", lambda: {"in_flight": len(background_tasks)}
+        )
+        try:
+            yield
+        finally:
+            if background_tasks:
+                await asyncio.gather(*background_tasks, return_exceptions=True)
+            await app.state.whatsapp.aclose()
+            await app.state.assistant.close()
+            await close_async_engine()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.config = config
+
+    async def _process_in_background(event):
+        try:
+            await process_webhook_event_async(event, app.state.assistant, app.state.whatsapp)
+        except Exception as e:
+            logging.error(f"Error procesando evento del webhook en segundo plano: {e}", exc_info=True)
+
+    # GET: Para verificar el webhook con el token de verificación
+    @app.get("/webhook")
+    async def webhook_get(request: Request):
+        mode = request.query_params.get("hub.mode")
+        token = request.query_params.get("hub.verify_token")
+        challenge = request.query_params.get("hub.challenge")
+        if mode and token:
+            if mode == "subscribe" and token == config.get("VERIFY_TOKEN"):
+                logging.info("WEBHOOK VERIFICADO")
+                return PlainTextResponse(challenge or "", status_code=200)
+            logging.info("VERIFICACION FALLIDA")
+            return JSONResponse({"status": "error", "message": "Verificación fallida"}, status_code=403)
+        logging.info("FALTAN PARAMETROS")
+        return JSONResponse({"status": "error", "message": "Faltan parámetros"}, status_code=400)
+
+    # POST: Para recibir mensajes de WhatsApp y otros eventos
+    @app.post("/webhook")
+    async def webhook_post(request: Request):
+        raw_body = await request.body()
+        error = verificar_solicitud_firmada(
+            raw_body,
+            request.headers.get("X-Hub-Signature-256", ""),
+            config.get("APP_SECRET"),
+        )
+        if error is not None:
+            cuerpo, codigo = error
+            return JSONResponse(cuerpo, status_code=codigo)
+
+        # Pre-chequeo barato: los eventos de solo estado no requieren respuesta
+        if is_status_only_payload(raw_body):
+            logging.info("Reciví un evento/actualización de estado de WhatsApp")
+            return JSONResponse({"status": "ok"}, status_code=200)
+
+        try:
+            event = parse_webhook_payload(raw_body)
+        except ValueError:
+            logging.error("Fallo al decodificar el JSON")
+            return JSONResponse({"status": "error", "message": "JSON proporcionado no válido"}, status_code=400)
+
+        if not event.is_valid_message_event:
+            if event.statuses:
+                logging.info("Reciví un evento/actualización de estado de WhatsApp")
+                return JSONResponse({"status": "ok"}, status_code=200)
+            return JSONResponse({"status": "error", "message": "No es un evento de WhatsApp válido"}, status_code=404)
+
+        if config.get("WEBHOOK_ASYNC_MODE"):
+            task = asyncio.create_task(_process_in_background(event))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+        else:
+            await process_webhook_event_async(event, app.state.assistant, app.state.whatsapp)
+        return JSONResponse({"status": "ok"}, status_code=200)
+
+    # GET: Métricas internas; requiere METRICS_TOKEN
+    @app.get("/metrics")
+    async def metrics_get(request: Request):
+        error = verificar_token_metricas(request.headers.get("Authorization", ""), config.get("METRICS_TOKEN") or "")
+        if error is not None:
+            cuerpo, codigo = error
+            return JSONResponse(cuerpo, status_code=codigo)
+        return JSONResponse(collect_metrics(), status_code=200)
+
+    return app
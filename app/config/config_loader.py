@@ -3,40 +3,153 @@ import os
 from dotenv import load_dotenv
 import logging
 
-def load_configurations(app):
-    """Carga variables de entorno y configura el diccionario app.config"""
+
+def _get_bool_env(key: str, default: bool = False) -> bool:
+    """Lee una variable de entorno booleana ("true"/"1"/"si")"""
+    value = os.getenv(key)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("true", "1", "yes", "si", "sí")
+
+
+def _get_int_env(key: str, default: int) -> int:
+    """Lee una variable de entorno entera con valor por defecto"""
+    try:
+        return int(os.getenv(key, default))
+    except (TypeError, ValueError):
+        logging.warning(f"Valor inválido para {key}, usando {default}")
+        return default
+
+
+def _get_float_env(key: str, default: float) -> float:
+    """Lee una variable de entorno decimal con valor por defecto"""
+    try:
+        return float(os.getenv(key, default))
+    except (TypeError, ValueError):
+        logging.warning(f"Valor inválido para {key}, usando {default}")
+        return default
+
+
+def build_config() -> dict:
+    """Construye el diccionario de configuración a partir de las variables de entorno"""
     load_dotenv(override=True)
+    config = {}
 
     # Variables esenciales para autenticación y funcionamiento
-    app.config["ACCESS_TOKEN"] = os.getenv("ACCESS_TOKEN")
-    app.config["MY_NUMBER"] = os.getenv("MY_NUMBER")
-    app.config["APP_ID"] = os.getenv("APP_ID")
-    app.config["APP_SECRET"] = os.getenv("APP_SECRET")
-    app.config["TEST_NUMBER_META"] = os.getenv("TEST_NUMBER_META")
-    app.config["VERSION"] = os.getenv("VERSION")
-    app.config["TEST_NUMBER_ID"] = os.getenv("TEST_NUMBER_ID")
-    app.config["ID_WHATSAPP_BUSSINES"] = os.getenv("ID_WHATSAPP_BUSSINES")
+    config["ACCESS_TOKEN"] = os.getenv("ACCESS_TOKEN")
+    config["MY_NUMBER"] = os.getenv("MY_NUMBER")
+    config["APP_ID"] = os.getenv("APP_ID")
+    config["APP_SECRET"] = os.getenv("APP_SECRET")
+    config["TEST_NUMBER_META"] = os.getenv("TEST_NUMBER_META")
+    config["VERSION"] = os.getenv("VERSION")
+    config["TEST_NUMBER_ID"] = os.getenv("TEST_NUMBER_ID")
+    config["ID_WHATSAPP_BUSSINES"] = os.getenv("ID_WHATSAPP_BUSSINES")
+    config["VERIFY_TOKEN"] = os.getenv("VERIFY_TOKEN")
+    # Token (Bearer) para GET /metrics; sin él el endpoint responde 403
+    config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN")
+    # Número emisor; en desarrollo se usa el número de prueba de Meta
+    config["PHONE_NUMBER_ID"] = os.getenv("PHONE_NUMBER_ID") or os.getenv("TEST_NUMBER_ID")
 
     # Claves de OpenAI
-    app.config["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-    app.config["OPENAI_ASSISTANT_ID"] = os.getenv("OPENAI_ASSISTANT_ID")
+    config["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+    config["OPENAI_ASSISTANT_ID"] = os.getenv("OPENAI_ASSISTANT_ID")
 
     # Configuración de base de datos
-    app.config["DB_USER"] = os.getenv("DB_USER")
-    app.config["DB_PASSWORD"] = os.getenv("DB_PASSWORD")
-    app.config["DB_HOST"] = os.getenv("DB_HOST")
-    app.config["DB_PORT"] = os.getenv("DB_PORT")
-    app.config["DB_NAME"] = os.getenv("DB_NAME")
+    config["DB_USER"] = os.getenv("DB_USER")
+    config["DB_PASSWORD"] = os.getenv("DB_PASSWORD")
+    config["DB_HOST"] = os.getenv("DB_HOST")
+    config["DB_PORT"] = os.getenv("DB_PORT")
+    config["DB_NAME"] = os.getenv("DB_NAME")
+
+    # Procesamiento en segundo plano del webhook (responder 200 primero)
+    config["WEBHOOK_ASYNC_MODE"] = _get_bool_env("WEBHOOK_ASYNC_MODE", False)
+    config["WEBHOOK_WORKERS"] = _get_int_env("WEBHOOK_WORKERS", 4)
+    config["WEBHOOK_QUEUE_SIZE"] = _get_int_env("WEBHOOK_QUEUE_SIZE", 100)
+
+    # Conversaciones atendidas en paralelo (cada una en orden) y cola máxima por cliente
+    config["CONVERSATION_MAX_CONCURRENCY"] = _get_int_env("CONVERSATION_MAX_CONCURRENCY", 8)
+    config["CONVERSATION_MAX_PENDING"] = _get_int_env("CONVERSATION_MAX_PENDING", 20)
+
+    # Deduplicación de reintentos del webhook por id de mensaje
+    config["DEDUP_ENABLED"] = _get_bool_env("DEDUP_ENABLED", True)
+    config["DEDUP_MAX_SIZE"] = _get_int_env("DEDUP_MAX_SIZE", 10000)
+    config["DEDUP_TTL_SECONDS"] = _get_int_env("DEDUP_TTL_SECONDS", 86400)
+    config["DEDUP_PERSISTENT"] = _get_bool_env("DEDUP_PERSISTENT", False)
+
+    # Agrupación de ráfagas de mensajes por cliente (0 = desactivada)
+    config["DEBOUNCE_WINDOW_SECONDS"] = _get_float_env("DEBOUNCE_WINDOW_SECONDS", 0.0)
+    config["DEBOUNCE_MAX_WAIT_SECONDS"] = _get_float_env("DEBOUNCE_MAX_WAIT_SECONDS", 8.0)
+    config["DEBOUNCE_MAX_MESSAGES"] = _get_int_env("DEBOUNCE_MAX_MESSAGES", 10)
+
+    # Persistencia en lote de estados de entrega/lectura (sent, delivered, read, failed)
+    config["STATUS_PERSISTENCE_ENABLED"] = _get_bool_env("STATUS_PERSISTENCE_ENABLED", False)
+    config["STATUS_FLUSH_INTERVAL_SECONDS"] = _get_float_env("STATUS_FLUSH_INTERVAL_SECONDS", 2.0)
+    config["STATUS_BATCH_SIZE"] = _get_int_env("STATUS_BATCH_SIZE", 500)
+    config["STATUS_BUFFER_LIMIT"] = _get_int_env("STATUS_BUFFER_LIMIT", 10000)
+
+    # Inicializar el asistente en segundo plano al arrancar (si no, en el primer mensaje)
+    config["ASSISTANT_WARMUP"] = _get_bool_env("ASSISTANT_WARMUP", True)
+
+    # Resumen de los turnos fuera de la ventana en contexto_conversaciones
+    config["CONTEXT_SUMMARY_ENABLED"] = _get_bool_env("CONTEXT_SUMMARY_ENABLED", True)
+
+    # Router local delante del asistente (saludos, precios, stock y charla sin OpenAI)
+    config["MESSAGE_ROUTER_ENABLED"] = _get_bool_env("MESSAGE_ROUTER_ENABLED", False)
+    config["MESSAGE_ROUTER_MIN_CONFIDENCE"] = _get_float_env("MESSAGE_ROUTER_MIN_CONFIDENCE", 0.2)
+    config["MESSAGE_ROUTER_CATALOG_REFRESH_SECONDS"] = _get_float_env("MESSAGE_ROUTER_CATALOG_REFRESH_SECONDS", 60.0)
+    config["MESSAGE_ROUTER_ASSISTANT_WINDOW_SECONDS"] = _get_float_env("MESSAGE_ROUTER_ASSISTANT_WINDOW_SECONDS", 600.0)
+
+    # Circuitos y reintentos de OpenAI y la Graph API (app/utils/resilience.py)
+    config["RESILIENCE_FAILURE_THRESHOLD"] = _get_int_env("RESILIENCE_FAILURE_THRESHOLD", 5)
+    config["RESILIENCE_OPEN_SECONDS"] = _get_float_env("RESILIENCE_OPEN_SECONDS", 30.0)
+    config["RESILIENCE_MAX_ATTEMPTS"] = _get_int_env("RESILIENCE_MAX_ATTEMPTS", 3)
+    config["RESILIENCE_BASE_DELAY_SECONDS"] = _get_float_env("RESILIENCE_BASE_DELAY_SECONDS", 0.2)
+    config["RESILIENCE_MAX_DELAY_SECONDS"] = _get_float_env("RESILIENCE_MAX_DELAY_SECONDS", 2.0)
+    config["RESILIENCE_RETRY_BUDGET_RATIO"] = _get_float_env("RESILIENCE_RETRY_BUDGET_RATIO", 0.2)
+
+    # Cliente compartido de la Graph API (pool de conexiones keep-alive)
+    config["GRAPH_API_BASE_URL"] = os.getenv("GRAPH_API_BASE_URL", "https://graph.facebook.com")
+    config["GRAPH_POOL_SIZE"] = _get_int_env("GRAPH_POOL_SIZE", 20)
+    config["GRAPH_CONNECT_TIMEOUT"] = _get_float_env("GRAPH_CONNECT_TIMEOUT", 3.05)
+    config["GRAPH_READ_TIMEOUT"] = _get_float_env("GRAPH_READ_TIMEOUT", 10.0)
+    config["GRAPH_UPLOAD_TIMEOUT"] = _get_float_env("GRAPH_UPLOAD_TIMEOUT", 30.0)
+
+    # Caché de media subida (hash del contenido → media ID de WhatsApp)
+    config["MEDIA_CACHE_ENABLED"] = _get_bool_env("MEDIA_CACHE_ENABLED", True)
+    config["MEDIA_CACHE_TTL_SECONDS"] = _get_int_env("MEDIA_CACHE_TTL_SECONDS", 29 * 86400)
+    config["MEDIA_CACHE_MAX_ENTRIES"] = _get_int_env("MEDIA_CACHE_MAX_ENTRIES", 1000)
+    config["MEDIA_CACHE_PERSISTENT"] = _get_bool_env("MEDIA_CACHE_PERSISTENT", False)
+
+    # Cola de salida: throughput por número emisor y respuestas antes que envíos masivos
+    config["OUTBOUND_ENABLED"] = _get_bool_env("OUTBOUND_ENABLED", True)
+    config["OUTBOUND_WORKERS"] = _get_int_env("OUTBOUND_WORKERS", 8)
+    config["OUTBOUND_MESSAGES_PER_SECOND"] = _get_float_env("OUTBOUND_MESSAGES_PER_SECOND", 80.0)
+    config["OUTBOUND_BURST"] = _get_float_env("OUTBOUND_BURST", 0.0)
+    config["OUTBOUND_MAX_BULK_QUEUE"] = _get_int_env("OUTBOUND_MAX_BULK_QUEUE", 10000)
+    config["OUTBOUND_MAX_ATTEMPTS"] = _get_int_env("OUTBOUND_MAX_ATTEMPTS", 5)
+    config["OUTBOUND_MAX_BACKOFF_SECONDS"] = _get_float_env("OUTBOUND_MAX_BACKOFF_SECONDS", 60.0)
+
+    # Acuse de lectura con "escribiendo…" y entrega de la respuesta por párrafos
+    config["REPLY_READ_RECEIPTS"] = _get_bool_env("REPLY_READ_RECEIPTS", True)
+    config["REPLY_PROGRESSIVE"] = _get_bool_env("REPLY_PROGRESSIVE", True)
+    config["REPLY_MIN_CHUNK_CHARS"] = _get_int_env("REPLY_MIN_CHUNK_CHARS", 300)
 
     # Validación de variables obligatorias
     required_keys = [
         "ACCESS_TOKEN", "OPENAI_API_KEY",
         "DB_USER", "DB_PASSWORD", "DB_HOST", "DB_PORT", "DB_NAME"
     ]
-    missing_keys = [key for key in required_keys if not app.config.get(key)]
+    missing_keys = [key for key in required_keys if not config.get(key)]
     if missing_keys:
         raise RuntimeError(f"Faltan variables de entorno obligatorias: {', '.join(missing_keys)}")
 
+    return config
+
+
+def load_configurations(app):
+    """Carga variables de entorno y configura el diccionario app.config"""
+    app.config.update(build_config())
+
 def configure_logging():
     """Configura logging con formato estándar"""
     logging.basicConfig(
@@ -0,0 +1,61 @@
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+# Variables globales (equivalentes asíncronos de db_connection)
+async_engine = None
+AsyncSessionFactory = None
+
+
+def init_async_engine(config: Dict[str, Any]):
+    """
+    Inicializa el motor asíncrono de SQLAlchemy (driver aiomysql).
+    Debe ser llamada al arrancar la app ASGI (en create_async_app).
+    """
+    global async_engine, AsyncSessionFactory
+
+    if async_engine is not None:
+        return  # Ya inicializado
+
+    try:
+        db_url = (
+            f"mysql+aiomysql://{config['DB_USER']}:"
+            f"{config['DB_PASSWORD']}@"
+            f"{config['DB_HOST']}:{config['DB_PORT']}/"
+            f"{config['DB_NAME']}"
+        )
+        async_engine = create_async_engine(db_url, pool_pre_ping=True)
+        AsyncSessionFactory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+        logging.info("Motor asíncrono de base de datos inicializado correctamente.")
+    except Exception as e:
+        logging.error(f"Error al inicializar motor asíncrono de base de datos: {e}", exc_info=True)
+        raise
+
+
+@asynccontextmanager
+async def get_async_db_session():
+    """
+    Entrega una sesión asíncrona y la cierra al salir del bloque.
+    Requiere que `init_async_engine()` haya sido llamado previamente.
+    """
+    if AsyncSessionFactory is None:
+        raise RuntimeError("El motor asíncrono de base de datos no ha sido inicializado. "
+                    "Llama a init_async_engine() en create_async_app().")
+
+    session: AsyncSession = AsyncSessionFactory()
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+async def close_async_engine():
+    """Libera las conexiones del pool asíncrono al apagar la app"""
+    global async_engine, AsyncSessionFactory
+    if async_engine is not None:
+        await async_engine.dispose()
+        async_engine = None
+        AsyncSessionFactory = None
+        logging.info("Motor asíncrono de base de datos cerrado.")
@@ -1,4 +1,7 @@
-from sqlalchemy import create_engine
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker, scoped_session
 from flask import current_app, g
 import logging
@@ -6,6 +9,17 @@ import logging
 # Variables globales
 engine = None
 SessionFactory = None
+# Fábrica de sesiones independientes del contexto Flask (hilos en segundo plano)
+_session_maker = None
+
+# Opciones que escriben en tablas agregadas en code_workbench/query.txt
+# después del esquema inicial (se desactivan si la tabla no existe)
+TABLAS_POR_OPCION = {
+    "DEDUP_PERSISTENT": "mensajes_procesados",
+    "STATUS_PERSISTENCE_ENABLED": "estados_mensajes",
+    "MEDIA_CACHE_PERSISTENT": "media_whatsapp",
+    "CONTEXT_SUMMARY_ENABLED": "contexto_conversaciones",
+}
 
 
 def init_engine_from_config():
@@ -13,7 +27,7 @@ def init_engine_from_config():
     Inicializa el motor SQLAlchemy y el SessionFactory.
     Debe ser llamada explícitamente al inicio de la aplicación Flask (en create_app).
     """
-    global engine, SessionFactory
+    global engine, SessionFactory, _session_maker
 
     if engine is not None:
         return  # Ya inicializado
@@ -26,13 +40,50 @@ def init_engine_from_config():
             f"{current_app.config['DB_NAME']}"
         )
         engine = create_engine(db_url, pool_pre_ping=True)
-        SessionFactory = scoped_session(sessionmaker(bind=engine))
+        _session_maker = sessionmaker(bind=engine)
+        SessionFactory = scoped_session(_session_maker)
         logging.info("Motor de base de datos inicializado correctamente.")
     except Exception as e:
         logging.error(f"Error al inicializar motor de base de datos: {e}", exc_info=True)
         raise
 
 
+def tablas_faltantes(nombres: Iterable[str]) -> Optional[List[str]]:
+    """
+    Retorna las tablas de `nombres` que no existen en la base de datos,
+    o None si no se pudo consultar el esquema.
+    """
+    if engine is None:
+        return None
+    try:
+        existentes = {nombre.lower() for nombre in inspect(engine).get_table_names()}
+    except SQLAlchemyError as e:
+        logging.warning(f"No se pudo verificar las tablas de la base de datos: {e}")
+        return None
+    return [nombre for nombre in nombres if nombre.lower() not in existentes]
+
+
+def desactivar_opciones_sin_tabla(config: Dict[str, Any]) -> List[str]:
+    """
+    Desactiva las opciones activas de TABLAS_POR_OPCION cuya tabla aún no se
+    creó (migración de code_workbench/query.txt sin aplicar).
+    Retorna las opciones desactivadas.
+    """
+    activas = {opcion: tabla for opcion, tabla in TABLAS_POR_OPCION.items() if config.get(opcion)}
+    if not activas:
+        return []
+    faltantes = tablas_faltantes(activas.values())
+    if not faltantes:
+        return []
+
+    desactivadas = [opcion for opcion, tabla in activas.items() if tabla in faltantes]
+    for opcion in desactivadas:
+        config[opcion] = False
+        logging.warning(f"{opcion} desactivado: falta la tabla {activas[opcion]} "
+                        f"(ver code_workbench/query.txt)")
+    return desactivadas
+
+
 def get_db_connection():
     """
     Retorna una sesión de base de datos válida dentro del contexto Flask.
@@ -47,6 +98,18 @@ def get_db_connection():
     return g.db_session
 
 
+def obtener_conexion():
+    """
+    Retorna una sesión nueva, no ligada al contexto Flask.
+    La usan los repositorios de app/database y los hilos en segundo plano;
+    quien la obtiene es responsable de cerrarla.
+    """
+    if _session_maker is None:
+        raise RuntimeError("El motor de base de datos no ha sido inicializado. "
+                    "Llama a init_engine_from_config() en create_app().")
+    return _session_maker()
+
+
 def close_db_connection(error=None):
     """
     Cierra la sesión de base de datos después de cada solicitud.
@@ -26,3 +26,56 @@ def obtener_mensajes_cliente(id_cliente):
         raise e
     finally:
         session.close()
+
+def obtener_historial_conversacion(telefono, limite=20):
+    """
+    Últimos `limite` mensajes del cliente con ese teléfono (wa_id), del más
+    reciente al más antiguo, como lista de (id_mensaje, contenido, tipo).
+    """
+    session = obtener_conexion()
+    try:
+        sql = """
+        SELECT m.id_mensaje, m.contenido, m.tipo
+        FROM mensajes m
+        JOIN clientes c ON c.id_cliente = m.id_cliente
+        WHERE c.telefono = :telefono
+        ORDER BY m.id_mensaje DESC
+        LIMIT :limite
+        """
+        filas = session.execute(text(sql), {"telefono": telefono, "limite": limite}).fetchall()
+        return [(str(fila[0]), fila[1], fila[2]) for fila in filas]
+    except Exception as e:
+        raise e
+    finally:
+        session.close()
+
+def guardar_intercambio(telefono, nombre, entradas, salida):
+    """
+    Guarda los mensajes del cliente y la respuesta en una sola transacción.
+    Registra al cliente (sin dirección) si aún no existe.
+    """
+    session = obtener_conexion()
+    try:
+        session.execute(
+            text("INSERT IGNORE INTO clientes (nombre, telefono) VALUES (:nombre, :telefono)"),
+            {"nombre": nombre or telefono, "telefono": telefono}
+        )
+        filas = [(contenido, "entrada") for contenido in entradas] + [(salida, "salida")]
+        valores = []
+        parametros = {"telefono": telefono}
+        for i, (contenido, tipo) in enumerate(filas):
+            valores.append(
+                f"((SELECT id_cliente FROM clientes WHERE telefono = :telefono), :contenido{i}, :tipo{i})"
+            )
+            parametros[f"contenido{i}"] = contenido
+            parametros[f"tipo{i}"] = tipo
+        session.execute(
+            text(f"INSERT INTO mensajes (id_cliente, contenido, tipo) VALUES {', '.join(valores)}"),
+            parametros
+        )
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.database.db_connection import obtener_conexion
+from app.utils.metrics import register_metrics_provider
+
+INSERT_COLUMNS = "(wa_message_id, wa_id, estado, fecha_evento, codigo_error, detalle_error)"
+
+
+class StatusBatchWriter:
+    """
+    Persiste las actualizaciones de estado (sent/delivered/read/failed) en lote.
+
+    El webhook solo añade eventos a un buffer en memoria; un hilo en segundo
+    plano los escribe con un único INSERT multi-fila por intervalo, de modo que
+    el camino caliente no hace viajes a la base de datos.
+    """
+
+    def __init__(self, session_factory: Callable = obtener_conexion, flush_interval: float = 2.0,
+                 max_batch_size: int = 500, max_buffer: int = 10000):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_buffer = max(self.max_batch_size, max_buffer)
+
+        self._buffer: List[Any] = []
+        self._condition = threading.Condition()
+        self._running = True
+
+        self._received = 0
+        self._written = 0
+        self._dropped = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._last_flush_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._flush_loop, name="status-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, statuses: List[Any]):
+        """Añade eventos al buffer sin bloquear (descarta si el buffer está lleno)"""
+        if not statuses:
+            return
+        with self._condition:
+            self._received += len(statuses)
+            space = self.max_buffer - len(self._buffer)
+            if space < len(statuses):
+                self._dropped += len(statuses) - max(space, 0)
+                statuses = statuses[:max(space, 0)]
+            self._buffer.extend(statuses)
+            if len(self._buffer) >= self.max_batch_size:
+                self._condition.notify()
+
+    def _flush_loop(self):
+        """Escribe el buffer cada `flush_interval` o al alcanzar `max_batch_size`"""
+        while True:
+            with self._condition:
+                if self._running and len(self._buffer) < self.max_batch_size:
+                    self._condition.wait(timeout=self.flush_interval)
+                running = self._running
+            self.flush()
+            if not running:
+                break
+
+    def flush(self):
+        """Escribe todo lo pendiente en lotes de `max_batch_size`"""
+        with self._condition:
+            pending, self._buffer = self._buffer, []
+
+        for start in range(0, len(pending), self.max_batch_size):
+            self._write_batch(pending[start:start + self.max_batch_size])
+
+    def _write_batch(self, batch: List[Any]):
+        """Un solo INSERT multi-fila y un solo commit por lote"""
+        rows, params = [], {}
+        for i, status in enumerate(batch):
+            rows.append(f"(:m{i}, :w{i}, :e{i}, FROM_UNIXTIME(:t{i}), :c{i}, :d{i})")
+            params[f"m{i}"] = status.message_id
+            params[f"w{i}"] = status.recipient_id
+            params[f"e{i}"] = status.status
+            params[f"t{i}"] = int(status.timestamp) if str(status.timestamp or "").isdigit() else None
+            params[f"c{i}"] = status.error_code
+            params[f"d{i}"] = (status.error_title or None) and status.error_title[:255]
+
+        sql = f"INSERT INTO estados_mensajes {INSERT_COLUMNS} VALUES " + ", ".join(rows)
+        started_at = time.monotonic()
+        session = self.session_factory()
+        try:
+            session.execute(text(sql), params)
+            session.commit()
+            with self._condition:
+                self._written += len(batch)
+                self._flushes += 1
+                self._last_flush_seconds = time.monotonic() - started_at
+        except SQLAlchemyError as e:
+            session.rollback()
+            logging.error(f"Error guardando {len(batch)} estados de mensajes: {e}")
+            with self._condition:
+                self._failed_flushes += 1
+                self._dropped += len(batch)
+        finally:
+            session.close()
+
+    def stop(self):
+        """Escribe lo pendiente y detiene el hilo"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout=self.flush_interval + 5)
+
+    def stats(self) -> Dict[str, Any]:
+        """Tamaño del buffer y contadores de escritura"""
+        with self._condition:
+            return {
+                "buffered": len(self._buffer),
+                "received": self._received,
+                "written": self._written,
+                "dropped": self._dropped,
+                "flushes": self._flushes,
+                "failed_flushes": self._failed_flushes,
+                "rows_per_flush": round(self._written / self._flushes, 2) if self._flushes else 0.0,
+                "last_flush_seconds": round(self._last_flush_seconds, 4),
+            }
+
+
+def obtener_latencias_entrega(horas: int = 24):
+    """
+    Latencia (segundos) de envío a entrega y de envío a lectura por mensaje
+    en las últimas `horas`.
+    """
+    session = obtener_conexion()
+    try:
+        sql = """
+        SELECT wa_message_id,
+               TIMESTAMPDIFF(SECOND, MIN(CASE WHEN estado = 'sent' THEN fecha_evento END),
+                                     MIN(CASE WHEN estado = 'delivered' THEN fecha_evento END)) AS segundos_entrega,
+               TIMESTAMPDIFF(SECOND, MIN(CASE WHEN estado = 'sent' THEN fecha_evento END),
+                                     MIN(CASE WHEN estado = 'read' THEN fecha_evento END)) AS segundos_lectura
+        FROM estados_mensajes
+        WHERE fecha_evento >= NOW() - INTERVAL :horas HOUR
+        GROUP BY wa_message_id
+        """
+        return session.execute(text(sql), {"horas": horas}).fetchall()
+    finally:
+        session.close()
+
+
+def obtener_envios_fallidos(limite: int = 100):
+    """Últimos envíos que WhatsApp reportó como fallidos, con el código de error"""
+    session = obtener_conexion()
+    try:
+        sql = """
+        SELECT wa_message_id, wa_id, codigo_error, detalle_error, fecha_evento
+        FROM estados_mensajes
+        WHERE estado = 'failed'
+        ORDER BY fecha_evento DESC
+        LIMIT :limite
+        """
+        return session.execute(text(sql), {"limite": limite}).fetchall()
+    finally:
+        session.close()
+
+
+# Instancia global (None cuando la persistencia de estados está desactivada)
+status_batch_writer: Optional[StatusBatchWriter] = None
+
+
+def init_status_batch_writer(config: Dict[str, Any]) -> Optional[StatusBatchWriter]:
+    """Crea el writer global a partir de la configuración"""
+    global status_batch_writer
+    if not config.get("STATUS_PERSISTENCE_ENABLED", False):
+        return None
+
+    if status_batch_writer is None:
+        status_batch_writer = StatusBatchWriter(
+            flush_interval=config.get("STATUS_FLUSH_INTERVAL_SECONDS", 2.0),
+            max_batch_size=config.get("STATUS_BATCH_SIZE", 500),
+            max_buffer=config.get("STATUS_BUFFER_LIMIT", 10000),
+        )
+        register_metrics_provider("message_statuses", status_batch_writer.stats)
+    return status_batch_writer
+
+
+def get_status_batch_writer() -> Optional[StatusBatchWriter]:
+    """Retorna el writer global o None si no está activo"""
+    return status_batch_writer
@@ -44,4 +44,76 @@ def registrar_envio_promocion(id_cliente, id_promocion):
         session.rollback()
         logging.error(f"❌ Error al registrar promoción enviada: {e}")
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+# Difusión por lotes (app/services/promotion_broadcast.py): los clientes se
+# recorren por id_cliente creciente (keyset) sin cargar la tabla completa
+CLIENTES_PENDIENTES_SQL = """
+SELECT c.id_cliente, c.telefono
+FROM clientes c
+LEFT JOIN clientes_promociones cp
+       ON cp.id_cliente = c.id_cliente AND cp.id_promocion = :id_promocion
+WHERE c.id_cliente > :despues_de AND cp.id_cliente IS NULL
+ORDER BY c.id_cliente
+LIMIT :limite
+"""
+
+PUNTO_CONTROL_SQL = """
+SELECT ultimo_id_cliente, enviados, fallidos, estado
+FROM difusiones_promociones WHERE id_promocion = :id_promocion
+"""
+
+GUARDAR_PUNTO_CONTROL_SQL = """
+INSERT INTO difusiones_promociones (id_promocion, ultimo_id_cliente, enviados, fallidos, estado)
+VALUES (:id_promocion, :ultimo_id_cliente, :enviados, :fallidos, :estado)
+ON DUPLICATE KEY UPDATE ultimo_id_cliente = VALUES(ultimo_id_cliente), enviados = VALUES(enviados),
+                        fallidos = VALUES(fallidos), estado = VALUES(estado)
+"""
+
+
+def obtener_promocion(session, id_promocion):
+    """Título, descripción y descuento de una promoción (None si no existe)"""
+    return session.execute(
+        text("SELECT titulo, descripcion, descuento FROM promociones WHERE id_promocion = :id_promocion"),
+        {"id_promocion": id_promocion}
+    ).fetchone()
+
+
+def obtener_clientes_pendientes(session, id_promocion, despues_de, limite):
+    """
+    Siguiente lote de clientes (id_cliente > despues_de) que aún no recibieron
+    la promoción, leído con un cursor del lado del servidor.
+    """
+    result = session.execute(
+        text(CLIENTES_PENDIENTES_SQL).execution_options(stream_results=True),
+        {"id_promocion": id_promocion, "despues_de": despues_de, "limite": limite}
+    )
+    return list(result)
+
+
+def registrar_envios_promocion(session, id_promocion, ids_clientes):
+    """Registra varios envíos con un solo INSERT multi-fila (sin commit)"""
+    if not ids_clientes:
+        return
+    filas, params = [], {"id_promocion": id_promocion}
+    for i, id_cliente in enumerate(ids_clientes):
+        filas.append(f"(:c{i}, :id_promocion)")
+        params[f"c{i}"] = id_cliente
+    sql = "INSERT IGNORE INTO clientes_promociones (id_cliente, id_promocion) VALUES " + ", ".join(filas)
+    session.execute(text(sql), params)
+
+
+def obtener_punto_control(session, id_promocion):
+    """Progreso guardado de la difusión (None si nunca empezó)"""
+    return session.execute(text(PUNTO_CONTROL_SQL), {"id_promocion": id_promocion}).fetchone()
+
+
+def guardar_punto_control(session, id_promocion, ultimo_id_cliente, enviados, fallidos, estado):
+    """Guarda el progreso de la difusión (sin commit)"""
+    session.execute(text(GUARDAR_PUNTO_CONTROL_SQL), {
+        "id_promocion": id_promocion,
+        "ultimo_id_cliente": ultimo_id_cliente,
+        "enviados": enviados,
+        "fallidos": fallidos,
+        "estado": estado,
+    })
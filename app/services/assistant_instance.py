@@ -1,2 +1,8 @@
-from app.services.assistant_manager import AssistantManager
-assistant_manager_instance = AssistantManager()
\ No newline at end of file
+from app.services.assistant_manager import get_assistant_manager
+
+
+def __getattr__(name):
+    """`assistant_manager_instance` se resuelve en el primer acceso (sin red al importar)"""
+    if name == "assistant_manager_instance":
+        return get_assistant_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
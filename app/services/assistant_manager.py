@@ -1,15 +1,29 @@
 import os
 import time
 import sys
+import threading
+import weakref
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
 from enum import Enum
-from typing import Optional, Dict, Any
-from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Callable, Tuple
+from dataclasses import dataclass, replace
 from dotenv import load_dotenv
+import httpx
 import openai
 from sqlalchemy import text
-from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from app.database.db_connection import get_db_connection
+from sqlalchemy.exc import SQLAlchemyError
+from app.database.db_connection import get_db_connection, obtener_conexion
+from app.services.conversation_context import ConversationContext
+from app.services.conversation_scheduler import get_conversation_scheduler
+from app.services.knowledge_base import KnowledgeBaseSync
+from app.services.knowledge_index import KnowledgeIndex
+from app.services.knowledge_version import KnowledgeVersion
+from app.services.openai_rate_limiter import PRIORITY_BACKGROUND, ConversationPriority, OpenAIRateLimiter
+from app.services.response_cache import ResponseCache
+from app.services.thread_cache import ThreadCache
+from app.utils.metrics import register_metrics_provider
+from app.utils.resilience import get_endpoint
 
 # Configuración de logging
 logging.basicConfig(
@@ -31,42 +45,473 @@ class AssistantConfig:
     openai_api_key: str
     assistant_id: Optional[str] = None
     model: str = "gpt-4o-mini"
-    max_polling_attempts: int = 60  # 30 segundos con 0.5s interval
-    polling_interval: float = 0.5
+    max_polling_attempts: int = 60
+    polling_interval: float = 0.25  # Primer intervalo; crece con polling_backoff
+    max_polling_interval: float = 2.0
+    polling_backoff: float = 1.5
+    run_timeout: float = 30.0  # Segundos máximos por run (ambos modos)
+    request_timeout: float = 30.0  # Timeout de las demás llamadas a la API (threads, asistente)
+    connect_timeout: float = 5.0
+    max_retries: int = 2  # Reintentos del SDK (backoff exponencial con jitter) por llamada
+    rate_limit_enabled: bool = True  # Limitador local por carriles de prioridad
+    rate_limit_rpm: float = 500  # Valores iniciales; se ajustan con los headers x-ratelimit-*
+    rate_limit_tpm: float = 200000
+    rate_limit_max_wait: float = 10.0  # Espera máxima por turno antes de responder "muchas solicitudes"
+    run_mode: str = "stream"  # "stream" (eventos del run) o "poll" (runs.retrieve)
+    response_engine: str = "assistants"  # "assistants" (threads y runs) o "chat" (chat completions)
+    run_poll_workers: int = 16  # Hilos de I/O del RunTracker compartidos por todos los runs
+    init_retry_seconds: float = 30  # Espera mínima entre intentos de inicialización fallidos
+    thread_cache_size: int = 5000  # Mapeos wa_id → thread_id en memoria
+    thread_cache_ttl: float = 3600  # Segundos antes de releer el mapeo desde la DB
+    response_cache_enabled: bool = False
+    response_cache_size: int = 1000
+    response_cache_ttl: float = 86400
+    response_cache_context_opt_out: float = 600  # Exclusión tras una pregunta dependiente del contexto
+    context_window_messages: int = 20  # Mensajes recientes que ve el modelo en cada respuesta
+    context_summary_enabled: bool = True  # Resumir los turnos que quedan fuera de la ventana
+    context_summary_batch: int = 10  # Mensajes fuera de la ventana que disparan una actualización del resumen
+    context_summary_model: Optional[str] = None  # None: el mismo modelo del asistente
     prompts_file_path: Optional[str] = None
+    knowledge_files: Tuple[str, ...] = ()  # Vacío: solo prompts.md
+    knowledge_manifest_path: Optional[str] = None
+    knowledge_index_enabled: bool = True  # Fragmentos del índice local en lugar de file_search
+    knowledge_index_path: Optional[str] = None
+    knowledge_index_top_k: int = 5
+    knowledge_index_min_score: float = 1.0  # Puntaje BM25 mínimo de un fragmento inyectado
+    knowledge_index_confident_score: float = 5.0  # Puntaje desde el cual el run no usa file_search
+    knowledge_index_refresh: float = 60  # Segundos entre revisiones de cambios en las fuentes
+    knowledge_max_chars: int = 12000  # Máximo de caracteres de conocimiento por respuesta
     assistant_name: str = "Asistente_FOBO"
 
+# Mensajes para el usuario cuando el asistente no está listo
+STATUS_ERROR_MESSAGES = {
+    AssistantStatus.NOT_INITIALIZED: "El asistente no está inicializado.",
+    AssistantStatus.INITIALIZING: "El asistente se está inicializando. Por favor espera.",
+    AssistantStatus.ERROR: "Error en la configuración del asistente.",
+    AssistantStatus.FILES_MISSING: "Faltan archivos de configuración del asistente."
+}
+
+# Modos de ejecución de runs soportados
+RUN_MODES = ("stream", "poll")
+
+# Motores de respuesta soportados (ver app/services/response_engine.py)
+RESPONSE_ENGINES = ("assistants", "chat")
+
+# Respuestas para los estados terminales de un run que no son "completed"
+RUN_FAILED_MESSAGE = "Ocurrió un error al procesar tu mensaje. Por favor intenta nuevamente."
+RUN_CANCELLED_MESSAGE = "La solicitud fue cancelada o expiró. Por favor intenta nuevamente."
+RUN_TIMEOUT_MESSAGE = "La solicitud tardó demasiado tiempo. Por favor intenta más tarde."
+RUN_TECHNICAL_ERROR_MESSAGE = "Hubo un problema técnico. Por favor intenta nuevamente."
+THREAD_ERROR_MESSAGE = "Error técnico creando conversación. Por favor intenta nuevamente."
+RATE_LIMITED_MESSAGE = "Estoy procesando muchas solicitudes. Por favor espera un momento e intenta nuevamente."
+OPENAI_UNAVAILABLE_MESSAGE = (
+    "En este momento no podemos responder tu consulta. Por favor escríbenos de nuevo en unos minutos."
+)
+
+# Respuestas de error que nunca se guardan en el cache de respuestas
+RUN_ERROR_MESSAGES = frozenset({
+    RUN_FAILED_MESSAGE, RUN_CANCELLED_MESSAGE, RUN_TIMEOUT_MESSAGE, RUN_TECHNICAL_ERROR_MESSAGE,
+    THREAD_ERROR_MESSAGE, OPENAI_UNAVAILABLE_MESSAGE, RATE_LIMITED_MESSAGE,
+})
+
+# Respuestas que indican que OpenAI no respondió a tiempo (cuentan para el circuito)
+OPENAI_OUTAGE_MESSAGES = frozenset({RUN_TIMEOUT_MESSAGE, RUN_TECHNICAL_ERROR_MESSAGE, THREAD_ERROR_MESSAGE})
+
+# Nombre del endpoint de OpenAI en app.utils.resilience
+OPENAI_ENDPOINT = "openai"
+
+# Espera máxima por cupo del limitador para escribir historial en segundo plano
+HISTORY_RATE_LIMIT_WAIT = 30.0
+
+
+def is_openai_failure(error: BaseException) -> bool:
+    """Errores que indican que OpenAI no está respondiendo (cuentan para el circuito)"""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (openai.APIConnectionError, openai.APITimeoutError))
+
+# Instrucciones base del asistente (compartidas por las variantes síncrona y asíncrona)
+ASSISTANT_INSTRUCTIONS = (
+    "Eres un asistente especializado en ayudar a emprendimientos. "
+    "Debes responder preguntas sobre productos, precios, stock y políticas "
+    "de la empresa. Usa EXCLUSIVAMENTE la información proporcionada en los archivos cargados. "
+    "Si no encuentras información específica, indica claramente que no tienes esa información "
+    "y sugiere contactar directamente con el equipo de soporte."
+)
+
+
+# Opciones de app.config que prevalecen sobre el entorno: create_app puede
+# apagarlas si falta su tabla (desactivar_opciones_sin_tabla)
+_app_options: Dict[str, Any] = {}
+
+
+def apply_app_options(config) -> None:
+    """Toma de app.config las opciones del asistente que dependen de tablas nuevas"""
+    _app_options["context_summary_enabled"] = bool(config.get("CONTEXT_SUMMARY_ENABLED", True))
+
+
+def load_assistant_config_from_env() -> AssistantConfig:
+    """Carga configuración desde variables de entorno"""
+    load_dotenv()
+    
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY no configurada en el entorno")
+    
+    run_mode = os.getenv("OPENAI_RUN_MODE", "stream").strip().lower()
+    if run_mode not in RUN_MODES:
+        logging.warning(f"OPENAI_RUN_MODE inválido ({run_mode}), se usa 'stream'")
+        run_mode = "stream"
+
+    response_engine = os.getenv("RESPONSE_ENGINE", "assistants").strip().lower()
+    if response_engine not in RESPONSE_ENGINES:
+        logging.warning(f"RESPONSE_ENGINE inválido ({response_engine}), se usa 'assistants'")
+        response_engine = "assistants"
+
+    config = AssistantConfig(
+        openai_api_key=api_key,
+        assistant_id=os.getenv("OPENAI_ASSISTANT_ID"),
+        model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+        run_mode=run_mode,
+        response_engine=response_engine,
+        run_timeout=float(os.getenv("OPENAI_RUN_TIMEOUT", "30")),
+        request_timeout=float(os.getenv("OPENAI_REQUEST_TIMEOUT", "30")),
+        connect_timeout=float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5")),
+        max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+        rate_limit_enabled=os.getenv("OPENAI_RATE_LIMIT_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on"),
+        rate_limit_rpm=float(os.getenv("OPENAI_RATE_LIMIT_RPM", "500")),
+        rate_limit_tpm=float(os.getenv("OPENAI_RATE_LIMIT_TPM", "200000")),
+        rate_limit_max_wait=float(os.getenv("OPENAI_RATE_LIMIT_MAX_WAIT_SECONDS", "10")),
+        run_poll_workers=int(os.getenv("OPENAI_RUN_POLL_WORKERS", "16")),
+        thread_cache_size=int(os.getenv("THREAD_CACHE_SIZE", "5000")),
+        thread_cache_ttl=float(os.getenv("THREAD_CACHE_TTL_SECONDS", "3600")),
+        response_cache_enabled=os.getenv("RESPONSE_CACHE_ENABLED", "false").strip().lower() in ("1", "true", "yes", "on"),
+        response_cache_size=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+        response_cache_ttl=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400")),
+        response_cache_context_opt_out=float(os.getenv("RESPONSE_CACHE_CONTEXT_OPT_OUT_SECONDS", "600")),
+        context_window_messages=int(os.getenv("CONTEXT_WINDOW_MESSAGES", "20")),
+        context_summary_enabled=os.getenv("CONTEXT_SUMMARY_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on"),
+        context_summary_batch=int(os.getenv("CONTEXT_SUMMARY_BATCH", "10")),
+        context_summary_model=os.getenv("CONTEXT_SUMMARY_MODEL"),
+        prompts_file_path=os.getenv("PROMPTS_FILE_PATH"),
+        knowledge_files=tuple(
+            path.strip() for path in os.getenv("KNOWLEDGE_FILES", "").split(",") if path.strip()
+        ),
+        knowledge_manifest_path=os.getenv("KNOWLEDGE_MANIFEST_PATH"),
+        knowledge_index_enabled=os.getenv("KNOWLEDGE_INDEX_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on"),
+        knowledge_index_path=os.getenv("KNOWLEDGE_INDEX_PATH"),
+        knowledge_index_top_k=int(os.getenv("KNOWLEDGE_INDEX_TOP_K", "5")),
+        knowledge_index_min_score=float(os.getenv("KNOWLEDGE_INDEX_MIN_SCORE", "1.0")),
+        knowledge_index_confident_score=float(os.getenv("KNOWLEDGE_INDEX_CONFIDENT_SCORE", "5.0")),
+        knowledge_index_refresh=float(os.getenv("KNOWLEDGE_INDEX_REFRESH_SECONDS", "60")),
+        knowledge_max_chars=int(os.getenv("KNOWLEDGE_MAX_CHARS", "12000"))
+    )
+    return replace(config, **_app_options)
+
+
+def get_prompts_file_path(config: AssistantConfig) -> Optional[str]:
+    """Obtiene la ruta del archivo de prompts"""
+    if config.prompts_file_path:
+        return config.prompts_file_path
+        
+    # Ruta por defecto
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+    default_path = os.path.join(base_dir, "app", "services", "prompts", "prompts.md")
+    
+    return default_path if os.path.exists(default_path) else None
+
+
+def get_knowledge_file_paths(config: AssistantConfig) -> List[str]:
+    """Archivos de conocimiento configurados (KNOWLEDGE_FILES o prompts.md)"""
+    if config.knowledge_files:
+        return list(config.knowledge_files)
+    prompts_path = get_prompts_file_path(config)
+    return [prompts_path] if prompts_path else []
+
+
+def _verify_existing_assistant(client, assistant_id: str):
+    """Retorna el asistente si existe y tiene file_search; None en otro caso"""
+    try:
+        assistant = client.beta.assistants.retrieve(assistant_id)
+        logging.info(f"Asistente válido: {assistant.name}")
+        
+        # Verificar si tiene herramientas de búsqueda de archivos
+        if not any(tool.type == "file_search" for tool in assistant.tools):
+            logging.warning("Asistente no tiene herramientas de búsqueda de archivos")
+            return None
+        return assistant
+    except openai.NotFoundError:
+        logging.warning(f"Asistente {assistant_id} no encontrado")
+        return None
+
+
+def _assistant_vector_store_id(assistant) -> Optional[str]:
+    """Primer vector store de file_search del asistente"""
+    resources = getattr(assistant, "tool_resources", None)
+    file_search = getattr(resources, "file_search", None) if resources else None
+    store_ids = getattr(file_search, "vector_store_ids", None) or []
+    return store_ids[0] if store_ids else None
+
+
+def setup_assistant(client, config: AssistantConfig) -> Tuple[AssistantStatus, Optional[str]]:
+    """
+    Verifica o crea el asistente y sincroniza sus archivos de conocimiento.
+
+    Usa OPENAI_ASSISTANT_ID o, si no está configurado, el asistente creado en
+    un arranque anterior (guardado en el manifiesto). Solo se suben los
+    archivos que cambiaron; un asistente nuevo se crea únicamente si no hay
+    ninguno válido. Los errores de credenciales o red se propagan.
+    """
+    knowledge = KnowledgeBaseSync(
+        client,
+        get_knowledge_file_paths(config),
+        manifest_path=config.knowledge_manifest_path,
+        vector_store_name=f"{config.assistant_name}_knowledge"
+    )
+
+    assistant_id = config.assistant_id or knowledge.assistant_id
+    assistant = _verify_existing_assistant(client, assistant_id) if assistant_id else None
+    if assistant is not None:
+        current_store_id = _assistant_vector_store_id(assistant)
+        vector_store_id = knowledge.sync(current_store_id)
+        if vector_store_id and vector_store_id != current_store_id:
+            client.beta.assistants.update(
+                assistant.id,
+                tool_resources={"file_search": {"vector_store_ids": [vector_store_id]}}
+            )
+        logging.info(f"Asistente existente configurado: {assistant.id}")
+        return AssistantStatus.READY, assistant.id
+
+    vector_store_id = knowledge.sync()
+    if not vector_store_id:
+        return AssistantStatus.FILES_MISSING, None
+
+    # Crear asistente con nueva API
+    assistant = client.beta.assistants.create(
+        name=config.assistant_name,
+        instructions=ASSISTANT_INSTRUCTIONS,
+        tools=[{"type": "file_search"}],
+        tool_resources={
+            "file_search": {
+                "vector_store_ids": [vector_store_id]
+            }
+        },
+        model=config.model
+    )
+    knowledge.record_assistant(assistant.id)
+    logging.info(f"IMPORTANTE: Nuevo asistente creado con ID: {assistant.id}")
+    logging.info("Guarda este ID en tu configuración OPENAI_ASSISTANT_ID")
+    return AssistantStatus.READY, assistant.id
+
+
+def next_polling_interval(current: float, config: AssistantConfig) -> float:
+    """Backoff del polling: crece por `polling_backoff` hasta `max_polling_interval`"""
+    return min(current * config.polling_backoff, config.max_polling_interval)
+
+
+def extract_message_text(message) -> str:
+    """Concatena las partes de texto de un mensaje del thread"""
+    return "".join(
+        part.text.value for part in message.content
+        if getattr(part, "type", None) == "text"
+    )
+
+
+def extract_delta_text(delta) -> str:
+    """Texto incremental de un evento thread.message.delta"""
+    return "".join(
+        part.text.value for part in (delta.content or [])
+        if getattr(part, "type", None) == "text" and part.text and part.text.value
+    )
+
+
+def completed_future(value: Any) -> Future:
+    """Future ya resuelto (respuestas que no esperan a un run en curso)"""
+    future: Future = Future()
+    future.set_result(value)
+    return future
+
+
+def map_future(future: Future, fn: Callable[[Any], Any],
+               on_error: Optional[Callable[[BaseException], Any]] = None) -> Future:
+    """
+    Future con fn(resultado) de `future`. fn corre en el hilo que resuelve
+    `future` (el que llama, si ya estaba resuelto), así que debe ser rápida.
+    `on_error` convierte una excepción en resultado (o la vuelve a lanzar).
+    """
+    mapped: Future = Future()
+
+    def _done(done: Future):
+        try:
+            try:
+                value = done.result()
+            except Exception as e:
+                if on_error is None:
+                    raise
+                mapped.set_result(on_error(e))
+                return
+            mapped.set_result(fn(value))
+        except BaseException as e:
+            mapped.set_exception(e)
+
+    future.add_done_callback(_done)
+    return mapped
+
+
 class AssistantManager:
     def __init__(self, config: Optional[AssistantConfig] = None):
-        """Inicializa el AssistantManager con configuración opcional"""
+        """
+        Crea el manager sin llamadas de red. El cliente OpenAI y el asistente
+        se configuran en el primer uso (ensure_initialized) o con warm_up().
+        """
         self.status = AssistantStatus.NOT_INITIALIZED
         self.client = None
         self.assistant_id = None
         self.config = config or self._load_config_from_env()
+        self._init_lock = threading.Lock()
+        self._init_pid: Optional[int] = None
+        self._last_init_attempt = float("-inf")
+        self._run_tracker = None
+        self._run_tracker_lock = threading.Lock()
+        self._history_executor: Optional[ThreadPoolExecutor] = None
+        self._history_lock = threading.Lock()
+        self.thread_cache = ThreadCache(
+            max_size=self.config.thread_cache_size,
+            verify_ttl_seconds=self.config.thread_cache_ttl
+        )
+        register_metrics_provider("thread_cache", self.thread_cache.stats)
+        self.response_cache = self._create_response_cache()
+        self.rate_limiter = self._create_rate_limiter()
+        self.priorities = ConversationPriority(obtener_conexion, max_size=self.config.thread_cache_size)
+        # contexto_conversaciones solo se usa con el resumen activo (CONTEXT_SUMMARY_ENABLED)
+        self.context = ConversationContext(
+            lambda: self.client,
+            session_factory=obtener_conexion if self.config.context_summary_enabled else None,
+            window_messages=self.config.context_window_messages,
+            summary_batch=self.config.context_summary_batch,
+            summary_enabled=self.config.context_summary_enabled,
+            summary_model=self.config.context_summary_model or self.config.model,
+            max_conversations=self.config.thread_cache_size,
+            rate_limiter=self.rate_limiter
+        )
+        register_metrics_provider("conversation_context", self.context.stats)
+        self.knowledge_index = KnowledgeIndex(
+            get_knowledge_file_paths(self.config),
+            index_path=self.config.knowledge_index_path,
+            session_factory=obtener_conexion,
+            refresh_seconds=self.config.knowledge_index_refresh,
+            top_k=self.config.knowledge_index_top_k,
+            max_chars=self.config.knowledge_max_chars,
+            min_score=self.config.knowledge_index_min_score
+        )
+        register_metrics_provider("knowledge_index", self.knowledge_index.stats)
+        self.engine = self._create_engine()
         
         # Configurar encoding solo en Windows si es necesario
         self._setup_system_encoding()
-        
-        # Inicializar cliente OpenAI
-        self._initialize_openai_client()
-        
-        # Verificar y configurar asistente
-        self._setup_assistant()
+
+        # En servidores pre-fork el hijo no hereda hilos ni conexiones útiles
+        if hasattr(os, "register_at_fork"):
+            reset = weakref.WeakMethod(self._reset_after_fork)
+            os.register_at_fork(after_in_child=lambda: reset() and reset()())
+
+    def ensure_initialized(self) -> bool:
+        """
+        Configura cliente y asistente una sola vez por proceso (idempotente).
+        Tras un fallo se reintenta como máximo cada `init_retry_seconds`.
+        """
+        if self._init_pid == os.getpid() and self.status == AssistantStatus.READY:
+            return True
+
+        with self._init_lock:
+            if self._init_pid != os.getpid():
+                # Primer uso o proceso hijo: descartar el estado heredado
+                self._reset_state()
+            elif self.status == AssistantStatus.READY:
+                return True
+            elif time.monotonic() - self._last_init_attempt < self.config.init_retry_seconds:
+                return False
+
+            self._last_init_attempt = time.monotonic()
+            started_at = time.perf_counter()
+            try:
+                self._initialize_openai_client()
+                self._setup_assistant()
+            except Exception as e:
+                self.status = AssistantStatus.ERROR
+                logging.error(f"Error inicializando asistente: {e}")
+            logging.info(
+                f"Inicialización del asistente: {self.status.value} "
+                f"en {time.perf_counter() - started_at:.2f}s (pid {os.getpid()})"
+            )
+            return self.is_ready()
+
+    def warm_up(self) -> threading.Thread:
+        """Inicializa en segundo plano para que el primer mensaje no espere"""
+        thread = threading.Thread(target=self.ensure_initialized, name="assistant-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def _reset_after_fork(self):
+        """En el hijo de un fork: locks nuevos (un lock tomado por otro hilo quedaría bloqueado)"""
+        self._init_lock = threading.Lock()
+        self._run_tracker_lock = threading.Lock()
+        self._history_lock = threading.Lock()
+        self._history_executor = None
+        self.context.reset_after_fork()
+        self.knowledge_index.reset_after_fork()
+        if self.rate_limiter is not None:
+            self.rate_limiter.reset_after_fork()
+        self._reset_state()
+
+    def _reset_state(self):
+        """Estado limpio en el proceso actual (cliente y RunTracker nuevos)"""
+        self._run_tracker = None
+        self.client = None
+        self.assistant_id = None
+        self.status = AssistantStatus.NOT_INITIALIZED
+        self._last_init_attempt = float("-inf")
+        self._init_pid = os.getpid()
 
     def _load_config_from_env(self) -> AssistantConfig:
         """Carga configuración desde variables de entorno"""
-        load_dotenv()
-        
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY no configurada en el entorno")
-        
-        return AssistantConfig(
-            openai_api_key=api_key,
-            assistant_id=os.getenv("OPENAI_ASSISTANT_ID"),
-            model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-            prompts_file_path=os.getenv("PROMPTS_FILE_PATH")
+        return load_assistant_config_from_env()
+
+    def _create_response_cache(self) -> Optional[ResponseCache]:
+        """Cache de preguntas frecuentes invalidado por prompts.md y el catálogo"""
+        if not self.config.response_cache_enabled:
+            return None
+        knowledge_version = KnowledgeVersion(
+            tuple(get_knowledge_file_paths(self.config)), session_factory=obtener_conexion
+        )
+        cache = ResponseCache(
+            knowledge_version.current,
+            max_size=self.config.response_cache_size,
+            ttl_seconds=self.config.response_cache_ttl,
+            context_opt_out_seconds=self.config.response_cache_context_opt_out
         )
+        register_metrics_provider("response_cache", cache.stats)
+        return cache
+
+    def _create_rate_limiter(self) -> Optional[OpenAIRateLimiter]:
+        """Limitador de solicitudes y tokens con carriles de prioridad"""
+        if not self.config.rate_limit_enabled:
+            return None
+        limiter = OpenAIRateLimiter(
+            requests_per_minute=self.config.rate_limit_rpm,
+            tokens_per_minute=self.config.rate_limit_tpm,
+            max_wait_seconds=self.config.rate_limit_max_wait
+        )
+        register_metrics_provider("openai_rate_limiter", limiter.stats)
+        return limiter
+
+    def _create_engine(self):
+        """Motor de respuesta según RESPONSE_ENGINE (Assistants o chat completions)"""
+        from app.services.response_engine import create_response_engine
+
+        engine = create_response_engine(self)
+        logging.info(f"Motor de respuesta: {engine.name}")
+        return engine
 
     def _setup_system_encoding(self):
         """Configura encoding del sistema si es necesario"""
@@ -81,161 +526,45 @@ class AssistantManager:
             logging.warning(f"No se pudo configurar encoding: {e}")
 
     def _initialize_openai_client(self):
-        """Inicializa cliente OpenAI con manejo de errores"""
+        """
+        Crea el cliente OpenAI (sin llamadas de red: la API key y la
+        conectividad se validan con la verificación del asistente)
+        """
         try:
-            self.client = openai.OpenAI(api_key=self.config.openai_api_key)
-            # Verificar conectividad básica
-            self.client.models.list()
+            # El limitador descuenta cada llamada y lee los headers x-ratelimit-*
+            http_client = None
+            if self.rate_limiter is not None:
+                http_client = openai.DefaultHttpxClient(event_hooks=self.rate_limiter.event_hooks())
+            self.client = openai.OpenAI(
+                api_key=self.config.openai_api_key,
+                timeout=httpx.Timeout(self.config.request_timeout, connect=self.config.connect_timeout),
+                max_retries=self.config.max_retries,
+                http_client=http_client
+            )
             logging.info("Cliente OpenAI inicializado correctamente")
-        except openai.AuthenticationError:
-            raise ValueError("API Key de OpenAI inválida")
-        except openai.APIConnectionError:
-            raise ConnectionError("No se pudo conectar a la API de OpenAI")
         except Exception as e:
             raise RuntimeError(f"Error inicializando cliente OpenAI: {e}")
 
     def _setup_assistant(self):
-        """Configura el asistente verificando o creando uno nuevo"""
+        """Prepara el motor: verifica o crea el asistente, o carga el conocimiento local"""
         self.status = AssistantStatus.INITIALIZING
-        
-        try:
-            if self.config.assistant_id and self._verify_existing_assistant():
-                self.assistant_id = self.config.assistant_id
-                self.status = AssistantStatus.READY
-                logging.info(f"Asistente existente configurado: {self.assistant_id}")
-            else:
-                if self._create_new_assistant():
-                    self.status = AssistantStatus.READY
-                    logging.info(f"Nuevo asistente creado: {self.assistant_id}")
-                else:
-                    self.status = AssistantStatus.ERROR
-                    logging.error("No se pudo configurar el asistente")
-        except Exception as e:
-            self.status = AssistantStatus.ERROR
-            logging.error(f"Error configurando asistente: {e}")
-
-    def _verify_existing_assistant(self) -> bool:
-        """Verifica si el asistente existente es válido"""
-        try:
-            assistant = self.client.beta.assistants.retrieve(self.config.assistant_id)
-            logging.info(f"Asistente válido: {assistant.name}")
-            
-            # Verificar si tiene herramientas de búsqueda de archivos
-            has_file_search = any(
-                tool.type == "file_search" 
-                for tool in assistant.tools
-            )
-            
-            if not has_file_search:
-                logging.warning("Asistente no tiene herramientas de búsqueda de archivos")
-                return False
-                
-            return True
-        except openai.NotFoundError:
-            logging.warning(f"Asistente {self.config.assistant_id} no encontrado")
-            return False
-        except Exception as e:
-            logging.error(f"Error verificando asistente: {e}")
-            return False
-
-    def _create_new_assistant(self) -> bool:
-        """Crea un nuevo asistente con archivos"""
-        try:
-            # Cargar archivo de prompts
-            file_id = self._upload_prompts_file()
-            if not file_id:
-                self.status = AssistantStatus.FILES_MISSING
-                return False
-
-            # Crear vector store y añadir archivo
-            vector_store = self.client.beta.vector_stores.create(
-                name=f"{self.config.assistant_name}_knowledge"
-            )
-            
-            self.client.beta.vector_stores.files.create(
-                vector_store_id=vector_store.id,
-                file_id=file_id
-            )
-
-            # Crear asistente con nueva API
-            assistant = self.client.beta.assistants.create(
-                name=self.config.assistant_name,
-                instructions=self._get_assistant_instructions(),
-                tools=[{"type": "file_search"}],  # Nueva API
-                tool_resources={
-                    "file_search": {
-                        "vector_store_ids": [vector_store.id]
-                    }
-                },
-                model=self.config.model
-            )
-
-            self.assistant_id = assistant.id
-            
-            logging.info(f"IMPORTANTE: Nuevo asistente creado con ID: {assistant.id}")
-            logging.info("Guarda este ID en tu configuración OPENAI_ASSISTANT_ID")
-            
-            return True
-            
-        except Exception as e:
-            logging.error(f"Error creando asistente: {e}")
-            return False
-
-    def _get_assistant_instructions(self) -> str:
-        """Retorna las instrucciones del asistente"""
-        return (
-            "Eres un asistente especializado en ayudar a emprendimientos. "
-            "Debes responder preguntas sobre productos, precios, stock y políticas "
-            "de la empresa. Usa EXCLUSIVAMENTE la información proporcionada en los archivos cargados. "
-            "Si no encuentras información específica, indica claramente que no tienes esa información "
-            "y sugiere contactar directamente con el equipo de soporte."
-        )
-
-    def _get_prompts_file_path(self) -> Optional[str]:
-        """Obtiene la ruta del archivo de prompts"""
-        if self.config.prompts_file_path:
-            return self.config.prompts_file_path
-            
-        # Ruta por defecto
-        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-        default_path = os.path.join(base_dir, "app", "services", "prompts", "prompts.md")
-        
-        return default_path if os.path.exists(default_path) else None
-
-    def _upload_prompts_file(self) -> Optional[str]:
-        """Sube el archivo de prompts y retorna el file_id"""
-        try:
-            file_path = self._get_prompts_file_path()
-            if not file_path or not os.path.exists(file_path):
-                logging.error("Archivo de prompts no encontrado")
-                logging.error("Crea el archivo con:")
-                logging.error("- Preguntas frecuentes (FAQ)")
-                logging.error("- Información sobre productos y servicios")
-                logging.error("- Políticas de envío, pago y devoluciones")
-                return None
-
-            with open(file_path, 'rb') as f:
-                file = self.client.files.create(file=f, purpose="assistants")
-                logging.info(f"Archivo de conocimiento cargado: {file.id}")
-                return file.id
-                
-        except Exception as e:
-            logging.error(f"Error cargando archivo de prompts: {e}")
-            return None
+        self.status = self.engine.setup()
 
     def _get_or_create_thread(self, wa_id: str) -> Optional[str]:
-        """Obtiene thread existente o crea uno nuevo"""
+        """
+        Obtiene thread existente o crea uno nuevo.
+        Sin verificación previa en OpenAI: un thread inexistente se detecta
+        por el NotFoundError del run (ver AssistantsEngine.generate).
+        """
         try:
-            # Verificar thread existente
+            thread_id = self.thread_cache.get(wa_id)
+            if thread_id:
+                return thread_id
+
             thread_id = self._get_thread_from_db(wa_id)
             if thread_id:
-                try:
-                    # Verificar que el thread existe en OpenAI
-                    self.client.beta.threads.retrieve(thread_id)
-                    return thread_id
-                except openai.NotFoundError:
-                    logging.warning(f"Thread {thread_id} no existe en OpenAI, creando nuevo")
-                    self._delete_thread_from_db(wa_id)
+                self.thread_cache.put(wa_id, thread_id)
+                return thread_id
 
             # Crear nuevo thread
             thread = self.client.beta.threads.create()
@@ -274,13 +603,16 @@ class AssistantManager:
                     {"wa_id": wa_id, "thread_id": thread_id}
                 )
                 session.commit()
-                return True
+            # Solo se cachea lo que quedó en la tabla (la fuente de verdad)
+            self.thread_cache.put(wa_id, thread_id)
+            return True
         except SQLAlchemyError as e:
             logging.error(f"Error guardando thread en DB: {e}")
             return False
 
     def _delete_thread_from_db(self, wa_id: str) -> bool:
         """Elimina thread de la base de datos"""
+        self.thread_cache.invalidate(wa_id)
         try:
             with get_db_connection() as session:
                 session.execute(
@@ -293,46 +625,140 @@ class AssistantManager:
             logging.error(f"Error eliminando thread de DB: {e}")
             return False
 
-    def _run_assistant_with_timeout(self, thread_id: str, user_name: str) -> Optional[str]:
-        """Ejecuta el asistente con timeout configurable"""
+    def _start_assistant_run(self, thread_id: str, user_name: str,
+                             messages: Optional[List[str]] = None,
+                             on_delta: Optional[Callable[[str], None]] = None,
+                             additional_instructions: Optional[str] = None,
+                             on_usage: Optional[Callable[[Any], None]] = None,
+                             tools: Optional[List[Dict[str, Any]]] = None) -> Future:
+        """
+        Ejecuta el asistente con timeout configurable y retorna un Future con
+        el texto. En modo stream el run se consume en el hilo que llama (el
+        Future llega resuelto); en modo poll el Future se resuelve desde el
+        RunTracker sin ocupar ese hilo.
+        `on_delta` recibe los fragmentos de texto a medida que llegan (solo modo stream)
+        y `on_usage` el uso de tokens del run completado. `tools` reemplaza las
+        herramientas del asistente solo para este run.
+        """
+        run_params = {
+            "thread_id": thread_id,
+            "assistant_id": self.assistant_id,
+            "instructions": f"Estás conversando con {user_name}, cliente de un emprendimiento.",
+            # Los mensajes del usuario se añaden al thread en la misma llamada que crea el run
+            "additional_messages": [
+                {"role": "user", "content": message} for message in messages or []
+            ],
+            # El modelo solo lee los últimos mensajes del thread; lo anterior llega resumido
+            "truncation_strategy": {
+                "type": "last_messages", "last_messages": self.config.context_window_messages
+            },
+        }
+        if additional_instructions:
+            run_params["additional_instructions"] = additional_instructions
+        if tools is not None:
+            run_params["tools"] = tools
         try:
-            run = self.client.beta.threads.runs.create(
-                thread_id=thread_id,
-                assistant_id=self.assistant_id,
-                instructions=f"Estás conversando con {user_name}, cliente de un emprendimiento."
-            )
-
-            # Polling con timeout configurable
-            for attempt in range(self.config.max_polling_attempts):
-                time.sleep(self.config.polling_interval)
-                
-                run = self.client.beta.threads.runs.retrieve(
-                    thread_id=thread_id, 
-                    run_id=run.id
-                )
-                
-                logging.debug(f"Estado del run: {run.status} (intento {attempt + 1})")
-                
-                if run.status == "completed":
-                    messages = self.client.beta.threads.messages.list(thread_id=thread_id)
-                    return messages.data[0].content[0].text.value
-                elif run.status == "failed":
-                    logging.error(f"Run falló: {run.last_error}")
-                    return "Ocurrió un error al procesar tu mensaje. Por favor intenta nuevamente."
-                elif run.status in ["cancelled", "expired"]:
-                    return "La solicitud fue cancelada o expiró. Por favor intenta nuevamente."
-
-            # Timeout alcanzado
-            logging.warning(f"Timeout ejecutando asistente después de {self.config.max_polling_attempts} intentos")
-            return "La solicitud tardó demasiado tiempo. Por favor intenta más tarde."
-            
+            if self.config.run_mode == "stream":
+                return completed_future(self._run_streaming(run_params, on_delta, on_usage))
+            return self._start_polling(run_params, on_usage)
+
+        except (openai.RateLimitError, openai.APIConnectionError, openai.NotFoundError):
+            # Se propagan para que generate_response dé el mensaje específico
+            # (NotFoundError: el thread ya no existe y se recrea)
+            raise
         except Exception as e:
             logging.error(f"Error ejecutando asistente: {e}")
-            return "Hubo un problema técnico. Por favor intenta nuevamente."
+            return completed_future(RUN_TECHNICAL_ERROR_MESSAGE)
+
+    def _run_streaming(self, run_params: Dict[str, Any],
+                       on_delta: Optional[Callable[[str], None]] = None,
+                       on_usage: Optional[Callable[[Any], None]] = None) -> Optional[str]:
+        """Crea el run en modo stream y retorna el texto final en cuanto se produce"""
+        deadline = time.monotonic() + self.config.run_timeout
+        thread_id = run_params["thread_id"]
+        run_id = None
+        final_text = None
+
+        # El timeout del cliente evita quedar bloqueado leyendo un stream sin eventos
+        client = self.client.with_options(timeout=self.config.run_timeout)
+        try:
+            with client.beta.threads.runs.create(stream=True, **run_params) as stream:
+                for event in stream:
+                    if event.event == "thread.run.created":
+                        run_id = event.data.id
+                    elif event.event == "thread.message.delta" and on_delta is not None:
+                        fragment = extract_delta_text(event.data.delta)
+                        if fragment:
+                            on_delta(fragment)
+                    elif event.event == "thread.message.completed":
+                        final_text = extract_message_text(event.data)
+                    elif event.event == "thread.run.completed":
+                        if on_usage is not None and event.data.usage is not None:
+                            on_usage(event.data.usage)
+                        return final_text
+                    elif event.event == "thread.run.failed":
+                        logging.error(f"Run falló: {event.data.last_error}")
+                        return RUN_FAILED_MESSAGE
+                    elif event.event in ("thread.run.cancelled", "thread.run.expired"):
+                        return RUN_CANCELLED_MESSAGE
+                    elif event.event == "error":
+                        logging.error(f"Error en el stream del run: {event.data}")
+                        return RUN_FAILED_MESSAGE
+
+                    if time.monotonic() > deadline:
+                        break
+        except (openai.APITimeoutError, httpx.TimeoutException):
+            # Sin eventos durante run_timeout segundos
+            pass
+
+        # Timeout o stream cerrado sin estado terminal: cancelar para no seguir gastando tokens
+        logging.warning(f"Timeout ejecutando asistente después de {self.config.run_timeout}s (stream)")
+        self._cancel_run(thread_id, run_id)
+        return final_text or RUN_TIMEOUT_MESSAGE
+
+    def _start_polling(self, run_params: Dict[str, Any],
+                       on_usage: Optional[Callable[[Any], None]] = None) -> Future:
+        """
+        Crea el run y lo registra en el RunTracker compartido: un solo hilo
+        consulta todos los runs en curso con backoff y cancela los que expiran.
+        Retorna el Future del run sin esperarlo.
+        """
+        run = self.client.beta.threads.runs.create(**run_params)
+        future = self._get_run_tracker().track(run_params["thread_id"], run.id, on_usage=on_usage)
+        return map_future(future, lambda text: text, on_error=self._run_error_message)
+
+    @staticmethod
+    def _run_error_message(error: BaseException) -> str:
+        """Error de un run en el RunTracker, tratado igual que en modo stream"""
+        if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.NotFoundError)):
+            raise error
+        logging.error(f"Error ejecutando asistente: {error}")
+        return RUN_TECHNICAL_ERROR_MESSAGE
+
+    def _get_run_tracker(self):
+        """Crea el RunTracker en el primer run en modo poll"""
+        if self._run_tracker is None:
+            with self._run_tracker_lock:
+                if self._run_tracker is None:
+                    from app.services.run_tracker import RunTracker
+
+                    self._run_tracker = RunTracker(self.client, self.config, io_workers=self.config.run_poll_workers)
+                    register_metrics_provider("assistant_runs", self._run_tracker.stats)
+        return self._run_tracker
+
+    def _cancel_run(self, thread_id: str, run_id: Optional[str]):
+        """Cancela un run que superó el timeout"""
+        if not run_id:
+            return
+        try:
+            self.client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+            logging.info(f"Run {run_id} cancelado por timeout")
+        except Exception as e:
+            logging.warning(f"No se pudo cancelar el run {run_id}: {e}")
 
     def is_ready(self) -> bool:
         """Verifica si el asistente está listo para procesar mensajes"""
-        return self.status == AssistantStatus.READY and self.assistant_id is not None
+        return self.status == AssistantStatus.READY
 
     def get_status(self) -> AssistantStatus:
         """Retorna el estado actual del asistente"""
@@ -340,49 +766,137 @@ class AssistantManager:
 
     def generate_response(self, message_body: str, wa_id: str, name: str) -> str:
         """Genera respuesta del asistente con manejo robusto de errores"""
-        if not self.is_ready():
+        return self.generate_response_for_messages([message_body], wa_id, name)
+
+    def generate_response_for_messages(self, messages: List[str], wa_id: str, name: str,
+                                       on_delta: Optional[Callable[[str], None]] = None,
+                                       priority: Optional[int] = None) -> str:
+        """
+        Genera una sola respuesta para uno o varios mensajes consecutivos del
+        cliente: todos se añaden juntos al thread y se responden con un único run.
+        `on_delta` recibe el texto parcial en modo stream. `priority` es el
+        carril del limitador (None: según los pedidos y el registro del cliente).
+        """
+        return self.submit_response_for_messages(messages, wa_id, name, on_delta, priority).result()
+
+    def submit_response_for_messages(self, messages: List[str], wa_id: str, name: str,
+                                     on_delta: Optional[Callable[[str], None]] = None,
+                                     priority: Optional[int] = None) -> Future:
+        """
+        Como generate_response_for_messages, pero retorna un Future con la
+        respuesta (nunca con una excepción). Con el motor Assistants en modo
+        poll el Future se resuelve cuando el RunTracker ve terminar el run y
+        el hilo que llama queda libre mientras tanto; en los demás casos la
+        respuesta se genera en el hilo que llama y el Future llega resuelto.
+        """
+        if not self.ensure_initialized():
             error_msg = self._get_error_message_for_status()
             logging.error(f"Asistente no está listo: {self.status}")
-            return error_msg
+            return completed_future(error_msg)
+
+        messages = [message for message in messages if message and message.strip()]
+        if not messages:
+            return completed_future("Por favor envía un mensaje con contenido.")
+
+        # Preguntas frecuentes: la respuesta cacheada evita el run completo;
+        # el intercambio queda en el historial del cliente en segundo plano
+        cache_key = self.response_cache.cache_key(wa_id, messages) if self.response_cache else None
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key, name)
+            if cached is not None:
+                self.record_exchange(messages, wa_id, name, cached)
+                return completed_future(cached)
+
+        if self.rate_limiter is None:
+            return self._start_with_engine(messages, wa_id, name, on_delta, cache_key)
+
+        # Turno en el limitador: pedidos abiertos y compras en curso primero.
+        # El turno cubre la creación del run; las consultas del RunTracker se descuentan aparte
+        if priority is None:
+            priority = self.priorities.get(wa_id)
+        with self.rate_limiter.reserve(priority, self.context.estimated_tokens(wa_id)) as admitted:
+            if not admitted:
+                logging.warning(f"Sin cupo de OpenAI para {wa_id} (carril {priority})")
+                return completed_future(RATE_LIMITED_MESSAGE)
+            return self._start_with_engine(messages, wa_id, name, on_delta, cache_key)
+
+    def _start_with_engine(self, messages: List[str], wa_id: str, name: str,
+                           on_delta: Optional[Callable[[str], None]],
+                           cache_key: Optional[Tuple[str, str]]) -> Future:
+        """Respuesta del motor detrás del circuito de OpenAI; se cachea si corresponde"""
+        # Con OpenAI caído la respuesta de respaldo sale sin esperar ningún timeout
+        breaker = get_endpoint(OPENAI_ENDPOINT).breaker
+        if not breaker.allow():
+            logging.warning(f"Circuito de OpenAI abierto: respuesta de respaldo para {wa_id}")
+            return completed_future(OPENAI_UNAVAILABLE_MESSAGE)
+        started_at = time.monotonic()
+
+        def _completed(response: Optional[str]) -> str:
+            if response in OPENAI_OUTAGE_MESSAGES:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if cache_key is not None and response and response not in RUN_ERROR_MESSAGES:
+                self.response_cache.put(cache_key, response, time.monotonic() - started_at, name)
+            return response or "No pude generar una respuesta. Por favor intenta nuevamente."
 
-        if not message_body.strip():
-            return "Por favor envía un mensaje con contenido."
+        def _failed(error: BaseException) -> str:
+            breaker.record_failure()
+            if isinstance(error, openai.RateLimitError):
+                return RATE_LIMITED_MESSAGE
+            if isinstance(error, openai.APIConnectionError):
+                return "Problemas de conexión con el servicio. Por favor intenta más tarde."
+            logging.error(f"Error en generate_response: {error}")
+            return "Ocurrió un error inesperado. Por favor intenta nuevamente."
 
         try:
-            # Obtener o crear thread
-            thread_id = self._get_or_create_thread(wa_id)
-            if not thread_id:
-                return "Error técnico creando conversación. Por favor intenta nuevamente."
-
-            # Añadir mensaje del usuario
-            self.client.beta.threads.messages.create(
-                thread_id=thread_id,
-                role="user",
-                content=message_body
-            )
-
-            # Ejecutar asistente
-            response = self._run_assistant_with_timeout(thread_id, name)
-            return response or "No pude generar una respuesta. Por favor intenta nuevamente."
-
-        except openai.RateLimitError:
-            return "Estoy procesando muchas solicitudes. Por favor espera un momento e intenta nuevamente."
-        except openai.APIConnectionError:
-            return "Problemas de conexión con el servicio. Por favor intenta más tarde."
+            future = self.engine.start(messages, wa_id, name, on_delta)
         except Exception as e:
-            logging.error(f"Error en generate_response: {e}")
-            return "Ocurrió un error inesperado. Por favor intenta nuevamente."
+            return completed_future(_failed(e))
+        return map_future(future, _completed, on_error=_failed)
+
+    def record_exchange(self, messages: List[str], wa_id: str, name: str, response: str):
+        """
+        Registra en segundo plano un intercambio que no pasó por el modelo
+        (cache, router). Con el scheduler va en la cola de la conversación,
+        así que queda escrito antes de atender el siguiente mensaje del cliente.
+        """
+        scheduler = get_conversation_scheduler()
+        if scheduler is not None:
+            try:
+                scheduler.submit(wa_id, self._record_exchange, messages, wa_id, name, response)
+                return
+            except Exception as e:
+                logging.warning(f"Historial de {wa_id} fuera de la cola de la conversación: {e}")
+        with self._history_lock:
+            if self._history_executor is None:
+                self._history_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="assistant-history")
+            self._history_executor.submit(self._record_exchange, messages, wa_id, name, response)
+
+    def _record_exchange(self, messages: List[str], wa_id: str, name: str, response: str):
+        """Escribe el intercambio con el motor; los errores solo se registran"""
+        try:
+            if self.ensure_initialized():
+                self.engine.record_exchange(messages, wa_id, name, response)
+        except Exception as e:
+            logging.warning(f"No se pudo registrar el intercambio de {wa_id}: {e}")
+
+    def call_openai_in_background(self, fn: Callable, *args, **kwargs):
+        """
+        Llamada a OpenAI sin cliente esperando: turno en el carril de fondo del
+        limitador y paso por el circuito de OpenAI (CircuitOpenError si está abierto).
+        """
+        endpoint = get_endpoint(OPENAI_ENDPOINT)
+        if self.rate_limiter is None:
+            return endpoint.call(fn, *args, is_failure=is_openai_failure, **kwargs)
+        with self.rate_limiter.reserve(PRIORITY_BACKGROUND, timeout=HISTORY_RATE_LIMIT_WAIT) as admitted:
+            if not admitted:
+                raise TimeoutError("sin cupo de OpenAI para tareas en segundo plano")
+            return endpoint.call(fn, *args, is_failure=is_openai_failure, **kwargs)
 
     def _get_error_message_for_status(self) -> str:
         """Retorna mensaje de error apropiado según el estado"""
-        status_messages = {
-            AssistantStatus.NOT_INITIALIZED: "El asistente no está inicializado.",
-            AssistantStatus.INITIALIZING: "El asistente se está inicializando. Por favor espera.",
-            AssistantStatus.ERROR: "Error en la configuración del asistente.",
-            AssistantStatus.FILES_MISSING: "Faltan archivos de configuración del asistente."
-        }
-        
-        return status_messages.get(
+        return STATUS_ERROR_MESSAGES.get(
             self.status, 
             "El asistente no está disponible en este momento."
         )
@@ -393,31 +907,29 @@ class AssistantManager:
             "status": self.status.value,
             "ready": self.is_ready(),
             "assistant_id": self.assistant_id,
+            "engine": self.engine.name,
+            "openai_circuit": get_endpoint(OPENAI_ENDPOINT).breaker.state,
             "client_initialized": self.client is not None,
             "timestamp": time.time()
         }
 
 
-# Instancia global del manager (para compatibilidad con código existente)
-assistant_manager_instance = None
+# Instancia global del manager: se crea en el primer uso y sin llamadas de red
+assistant_manager_instance: Optional[AssistantManager] = None
+_instance_lock = threading.Lock()
 
 def initialize_assistant_manager(config: Optional[AssistantConfig] = None) -> AssistantManager:
-    """Inicializa la instancia global del assistant manager"""
+    """Reemplaza la instancia global del assistant manager"""
     global assistant_manager_instance
-    assistant_manager_instance = AssistantManager(config)
+    with _instance_lock:
+        assistant_manager_instance = AssistantManager(config)
     return assistant_manager_instance
 
 def get_assistant_manager() -> AssistantManager:
-    """Obtiene la instancia del assistant manager, inicializándola si es necesario"""
+    """Obtiene la instancia compartida del assistant manager, creándola si es necesario"""
     global assistant_manager_instance
     if assistant_manager_instance is None:
-        assistant_manager_instance = AssistantManager()
+        with _instance_lock:
+            if assistant_manager_instance is None:
+                assistant_manager_instance = AssistantManager()
     return assistant_manager_instance
-
-# Para compatibilidad con el código existente
-if assistant_manager_instance is None:
-    try:
-        assistant_manager_instance = AssistantManager()
-    except Exception as e:
-        logging.error(f"Error inicializando assistant manager: {e}")
-        assistant_manager_instance = None
\ No newline at end of file
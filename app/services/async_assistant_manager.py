@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import openai
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.database.async_db_connection import get_async_db_session
+from app.services.thread_cache import ThreadCache
+from app.utils.metrics import register_metrics_provider
+from app.services.assistant_manager import (
+    RUN_CANCELLED_MESSAGE,
+    RUN_FAILED_MESSAGE,
+    RUN_TIMEOUT_MESSAGE,
+    STATUS_ERROR_MESSAGES,
+    AssistantConfig,
+    AssistantStatus,
+    extract_message_text,
+    load_assistant_config_from_env,
+    next_polling_interval,
+    setup_assistant,
+)
+
+
+class AsyncAssistantManager:
+    """
+    Variante asíncrona de AssistantManager para la app ASGI.
+
+    Usa openai.AsyncOpenAI y sesiones asíncronas de base de datos, de modo que
+    cada conversación en espera de OpenAI es una corrutina y no un hilo.
+    """
+
+    def __init__(self, config: Optional[AssistantConfig] = None):
+        """Crea el manager sin llamadas de red; usar `await initialize()`"""
+        self.status = AssistantStatus.NOT_INITIALIZED
+        self.client: Optional[openai.AsyncOpenAI] = None
+        self.assistant_id = None
+        self.config = config or load_assistant_config_from_env()
+        self._init_lock = asyncio.Lock()
+        self.thread_cache = ThreadCache(
+            max_size=self.config.thread_cache_size,
+            verify_ttl_seconds=self.config.thread_cache_ttl
+        )
+        register_metrics_provider("thread_cache", self.thread_cache.stats)
+        if self.config.response_engine != "assistants":
+            logging.warning("RESPONSE_ENGINE solo aplica a la app Flask; la app ASGI usa la Assistants API")
+
+    async def initialize(self):
+        """Inicializa el cliente y verifica o crea el asistente (idempotente)"""
+        async with self._init_lock:
+            if self.status == AssistantStatus.READY:
+                return
+
+            self.client = openai.AsyncOpenAI(api_key=self.config.openai_api_key)
+            self.status = AssistantStatus.INITIALIZING
+
+            try:
+                # La sincronización de conocimiento (hash, subida de archivos e
+                # indexación) es bloqueante: se ejecuta fuera del event loop
+                bootstrap_client = openai.OpenAI(api_key=self.config.openai_api_key)
+                try:
+                    self.status, self.assistant_id = await asyncio.to_thread(
+                        setup_assistant, bootstrap_client, self.config
+                    )
+                finally:
+                    bootstrap_client.close()
+                if self.status != AssistantStatus.READY:
+                    logging.error(f"No se pudo configurar el asistente: {self.status.value}")
+            except openai.AuthenticationError:
+                self.status = AssistantStatus.ERROR
+                logging.error("API Key de OpenAI inválida")
+            except Exception as e:
+                self.status = AssistantStatus.ERROR
+                logging.error(f"Error configurando asistente: {e}")
+
+    async def close(self):
+        """Cierra el cliente HTTP de OpenAI"""
+        if self.client is not None:
+            await self.client.close()
+
+    async def _get_or_create_thread(self, wa_id: str) -> Optional[str]:
+        """Obtiene thread existente o crea uno nuevo"""
+        try:
+            thread_id = self.thread_cache.get(wa_id)
+            if thread_id:
+                return thread_id
+
+            # Sin verificación previa en OpenAI (ver generate_response)
+            thread_id = await self._get_thread_from_db(wa_id)
+            if thread_id:
+                self.thread_cache.put(wa_id, thread_id)
+                return thread_id
+
+            thread = await self.client.beta.threads.create()
+            await self._store_thread_in_db(wa_id, thread.id)
+            logging.info(f"Nuevo thread creado: {thread.id}")
+            return thread.id
+
+        except Exception as e:
+            logging.error(f"Error manejando thread: {e}")
+            return None
+
+    async def _get_thread_from_db(self, wa_id: str) -> Optional[str]:
+        """Obtiene thread_id desde la base de datos"""
+        try:
+            async with get_async_db_session() as session:
+                result = await session.execute(
+                    text("SELECT thread_id FROM threads WHERE wa_id = :wa_id"),
+                    {"wa_id": wa_id}
+                )
+                row = result.fetchone()
+                return row[0] if row else None
+        except SQLAlchemyError as e:
+            logging.error(f"Error consultando thread en DB: {e}")
+            return None
+
+    async def _store_thread_in_db(self, wa_id: str, thread_id: str) -> bool:
+        """Almacena thread en la base de datos"""
+        try:
+            async with get_async_db_session() as session:
+                await session.execute(
+                    text("""
+                        INSERT INTO threads (wa_id, thread_id)
+                        VALUES (:wa_id, :thread_id)
+                        ON DUPLICATE KEY UPDATE thread_id = VALUES(thread_id)
+                    """),
+                    {"wa_id": wa_id, "thread_id": thread_id}
+                )
+                await session.commit()
+            # Solo se cachea lo que quedó en la tabla (la fuente de verdad)
+            self.thread_cache.put(wa_id, thread_id)
+            return True
+        except SQLAlchemyError as e:
+            logging.error(f"Error guardando thread en DB: {e}")
+            return False
+
+    async def _delete_thread_from_db(self, wa_id: str) -> bool:
+        """Elimina thread de la base de datos"""
+        self.thread_cache.invalidate(wa_id)
+        try:
+            async with get_async_db_session() as session:
+                await session.execute(
+                    text("DELETE FROM threads WHERE wa_id = :wa_id"),
+                    {"wa_id": wa_id}
+                )
+                await session.commit()
+                return True
+        except SQLAlchemyError as e:
+            logging.error(f"Error eliminando thread de DB: {e}")
+            return False
+
+    async def _run_assistant_with_timeout(self, thread_id: str, user_name: str) -> Optional[str]:
+        """Ejecuta el asistente con timeout configurable (modo stream o poll)"""
+        run_params = {
+            "thread_id": thread_id,
+            "assistant_id": self.assistant_id,
+            "instructions": f"Estás conversando con {user_name}, cliente de un emprendimiento.",
+            # Misma ventana acotada que la app Flask (sin resumen de lo anterior)
+            "truncation_strategy": {
+                "type": "last_messages", "last_messages": self.config.context_window_messages
+            },
+        }
+        try:
+            if self.config.run_mode == "stream":
+                return await asyncio.wait_for(
+                    self._run_streaming(run_params), timeout=self.config.run_timeout
+                )
+            return await self._run_polling(run_params)
+
+        except asyncio.TimeoutError:
+            logging.warning(f"Timeout ejecutando asistente después de {self.config.run_timeout}s (stream)")
+            return RUN_TIMEOUT_MESSAGE
+        except Exception as e:
+            logging.error(f"Error ejecutando asistente: {e}")
+            return "Hubo un problema técnico. Por favor intenta nuevamente."
+
+    async def _run_streaming(self, run_params: Dict[str, Any]) -> Optional[str]:
+        """Crea el run en modo stream y retorna el texto final en cuanto se produce"""
+        run_id = None
+        final_text = None
+        try:
+            stream = await self.client.beta.threads.runs.create(stream=True, **run_params)
+            async with stream:
+                async for event in stream:
+                    if event.event == "thread.run.created":
+                        run_id = event.data.id
+                    elif event.event == "thread.message.completed":
+                        final_text = extract_message_text(event.data)
+                    elif event.event == "thread.run.completed":
+                        return final_text
+                    elif event.event == "thread.run.failed":
+                        logging.error(f"Run falló: {event.data.last_error}")
+                        return RUN_FAILED_MESSAGE
+                    elif event.event in ("thread.run.cancelled", "thread.run.expired"):
+                        return RUN_CANCELLED_MESSAGE
+                    elif event.event == "error":
+                        logging.error(f"Error en el stream del run: {event.data}")
+                        return RUN_FAILED_MESSAGE
+            return final_text
+        except asyncio.CancelledError:
+            # wait_for canceló por timeout: cancelar el run para no seguir gastando tokens
+            await self._cancel_run(run_params["thread_id"], run_id)
+            raise
+
+    async def _run_polling(self, run_params: Dict[str, Any]) -> Optional[str]:
+        """Crea el run y consulta su estado con backoff adaptativo"""
+        thread_id = run_params["thread_id"]
+        run = await self.client.beta.threads.runs.create(**run_params)
+
+        deadline = time.monotonic() + self.config.run_timeout
+        interval = self.config.polling_interval
+        for attempt in range(self.config.max_polling_attempts):
+            await asyncio.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+            interval = next_polling_interval(interval, self.config)
+
+            run = await self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+            logging.debug(f"Estado del run: {run.status} (intento {attempt + 1})")
+
+            if run.status == "completed":
+                thread_messages = await self.client.beta.threads.messages.list(
+                    thread_id=thread_id, run_id=run.id, order="desc", limit=1
+                )
+                return extract_message_text(thread_messages.data[0]) if thread_messages.data else None
+            elif run.status == "failed":
+                logging.error(f"Run falló: {run.last_error}")
+                return RUN_FAILED_MESSAGE
+            elif run.status in ["cancelled", "expired"]:
+                return RUN_CANCELLED_MESSAGE
+
+            if time.monotonic() >= deadline:
+                break
+
+        logging.warning(f"Timeout ejecutando asistente después de {attempt + 1} consultas")
+        await self._cancel_run(thread_id, run.id)
+        return RUN_TIMEOUT_MESSAGE
+
+    async def _cancel_run(self, thread_id: str, run_id: Optional[str]):
+        """Cancela un run que superó el timeout"""
+        if not run_id:
+            return
+        try:
+            await self.client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+            logging.info(f"Run {run_id} cancelado por timeout")
+        except Exception as e:
+            logging.warning(f"No se pudo cancelar el run {run_id}: {e}")
+
+    def is_ready(self) -> bool:
+        """Verifica si el asistente está listo para procesar mensajes"""
+        return self.status == AssistantStatus.READY and self.assistant_id is not None
+
+    def get_status(self) -> AssistantStatus:
+        """Retorna el estado actual del asistente"""
+        return self.status
+
+    async def generate_response(self, message_body: str, wa_id: str, name: str) -> str:
+        """Genera respuesta del asistente con manejo robusto de errores"""
+        if not self.is_ready():
+            logging.error(f"Asistente no está listo: {self.status}")
+            return STATUS_ERROR_MESSAGES.get(
+                self.status,
+                "El asistente no está disponible en este momento."
+            )
+
+        if not message_body.strip():
+            return "Por favor envía un mensaje con contenido."
+
+        try:
+            thread_id = await self._get_or_create_thread(wa_id)
+            if not thread_id:
+                return "Error técnico creando conversación. Por favor intenta nuevamente."
+
+            try:
+                await self.client.beta.threads.messages.create(
+                    thread_id=thread_id,
+                    role="user",
+                    content=message_body
+                )
+            except openai.NotFoundError:
+                # Thread en cache/DB borrado en OpenAI: recrear y reintentar una vez
+                logging.warning(f"Thread {thread_id} no existe en OpenAI, creando nuevo")
+                await self._delete_thread_from_db(wa_id)
+                thread_id = await self._get_or_create_thread(wa_id)
+                if not thread_id:
+                    return "Error técnico creando conversación. Por favor intenta nuevamente."
+                await self.client.beta.threads.messages.create(
+                    thread_id=thread_id,
+                    role="user",
+                    content=message_body
+                )
+
+            response = await self._run_assistant_with_timeout(thread_id, name)
+            return response or "No pude generar una respuesta. Por favor intenta nuevamente."
+
+        except openai.RateLimitError:
+            return "Estoy procesando muchas solicitudes. Por favor espera un momento e intenta nuevamente."
+        except openai.APIConnectionError:
+            return "Problemas de conexión con el servicio. Por favor intenta más tarde."
+        except Exception as e:
+            logging.error(f"Error en generate_response: {e}")
+            return "Ocurrió un error inesperado. Por favor intenta nuevamente."
+
+    def health_check(self) -> Dict[str, Any]:
+        """Verifica el estado de salud del asistente"""
+        return {
+            "status": self.status.value,
+            "ready": self.is_ready(),
+            "assistant_id": self.assistant_id,
+            "client_initialized": self.client is not None,
+            "timestamp": time.time()
+        }
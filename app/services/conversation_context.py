@@ -0,0 +1,339 @@
+import logging
+import statistics
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.services.openai_rate_limiter import PRIORITY_BACKGROUND, OpenAIRateLimiter
+
+# Mensajes recientes leídos para resumir (máximo de la API de threads)
+SUMMARY_FETCH_LIMIT = 100
+
+SUMMARY_INSTRUCTIONS = (
+    "Resumes conversaciones de WhatsApp entre un cliente y el asistente de un emprendimiento. "
+    "Actualiza el resumen con los mensajes nuevos conservando solo lo útil para seguir atendiendo: "
+    "datos del cliente (nombre, dirección, preferencias), productos y cantidades de interés, "
+    "pedidos en curso y compromisos pendientes. Máximo 8 líneas, en español, sin saludos."
+)
+
+SUMMARY_PREFIX = "Resumen de la conversación anterior con este cliente:"
+
+# Tokens supuestos de una respuesta a un cliente sin consumo registrado
+DEFAULT_ESTIMATED_TOKENS = 2000
+
+# Espera máxima por un turno del limitador para resumir (en segundo plano)
+SUMMARY_RATE_LIMIT_WAIT = 30.0
+
+# Mensaje de la fuente de historial: (id, rol "user"/"assistant", contenido)
+HistoryMessage = Tuple[str, str, str]
+
+
+@dataclass
+class ConversationState:
+    """Resumen y contadores de una conversación"""
+    wa_id: str
+    origin: Optional[str] = None  # thread_id de OpenAI o "mensajes" (motor chat)
+    summary: Optional[str] = None
+    cursor: Optional[str] = None  # Último mensaje incluido en el resumen
+    total_messages: int = 0
+    summarized_messages: int = 0
+    replies: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    last_input_tokens: int = 0
+    summarizing: bool = False
+
+
+class ConversationContext:
+    """
+    Contexto acotado por conversación.
+
+    Al modelo solo llegan los últimos `window_messages` mensajes; los turnos
+    que quedan fuera de la ventana se comprimen en un resumen guardado en
+    `contexto_conversaciones`, que se actualiza de forma incremental (resumen
+    anterior + mensajes nuevos) en segundo plano cada `summary_batch` mensajes.
+    También registra los tokens de entrada y salida de cada respuesta.
+    Sin `session_factory` todo queda en memoria.
+    """
+
+    def __init__(self, client_provider: Callable[[], Any], session_factory: Optional[Callable] = None,
+                 window_messages: int = 20, summary_batch: int = 10, summary_enabled: bool = True,
+                 summary_model: str = "gpt-4o-mini", summary_max_tokens: int = 300,
+                 max_conversations: int = 5000, sample_size: int = 1000,
+                 rate_limiter: Optional[OpenAIRateLimiter] = None):
+        self.client_provider = client_provider
+        self.session_factory = session_factory
+        self.window_messages = max(1, window_messages)
+        self.summary_batch = max(1, summary_batch)
+        self.summary_enabled = summary_enabled
+        self.summary_model = summary_model
+        self.summary_max_tokens = summary_max_tokens
+        self.max_conversations = max(1, max_conversations)
+        self.rate_limiter = rate_limiter
+
+        self._states: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self._input_samples: deque = deque(maxlen=sample_size)
+        self._total_input_tokens = 0
+        self._total_output_tokens = 0
+        self._replies_with_usage = 0
+        self._replies_without_usage = 0
+        self._summaries = 0
+        self._summary_failures = 0
+        self._summary_tokens = 0
+
+    def reset_after_fork(self):
+        """En el hijo de un fork: los hilos del executor no sobreviven"""
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _submit(self, fn, *args):
+        """Trabajo de fondo (escrituras y resúmenes) fuera del camino de la respuesta"""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="conversation-context")
+        return self._executor.submit(fn, *args)
+
+    def _state(self, wa_id: str) -> ConversationState:
+        """Estado en memoria (LRU); en el primer uso se lee de la DB"""
+        with self._lock:
+            state = self._states.get(wa_id)
+            if state is not None:
+                self._states.move_to_end(wa_id)
+                return state
+
+        state = self._load_state(wa_id)
+        with self._lock:
+            state = self._states.setdefault(wa_id, state)
+            self._states.move_to_end(wa_id)
+            while len(self._states) > self.max_conversations:
+                self._states.popitem(last=False)
+        return state
+
+    def _load_state(self, wa_id: str) -> ConversationState:
+        state = ConversationState(wa_id=wa_id)
+        if self.session_factory is None:
+            return state
+        try:
+            session = self.session_factory()
+        except Exception as e:
+            logging.warning(f"Contexto de {wa_id} sin base de datos: {e}")
+            return state
+        try:
+            row = session.execute(
+                text("""
+                    SELECT origen, resumen, ultimo_mensaje_resumido, mensajes_totales, mensajes_resumidos,
+                           respuestas, tokens_entrada, tokens_salida, ultimo_tokens_entrada
+                    FROM contexto_conversaciones WHERE wa_id = :wa_id
+                """),
+                {"wa_id": wa_id}
+            ).fetchone()
+            if row:
+                state.origin, state.summary, state.cursor = row[0], row[1], row[2]
+                state.total_messages, state.summarized_messages = row[3] or 0, row[4] or 0
+                # Consumo acumulado: estimated_tokens lo usa desde la primera respuesta tras reiniciar
+                state.replies, state.input_tokens, state.output_tokens = row[5] or 0, row[6] or 0, row[7] or 0
+                state.last_input_tokens = row[8] or 0
+        except Exception as e:
+            logging.warning(f"No se pudo leer el contexto de {wa_id}: {e}")
+        finally:
+            session.close()
+        return state
+
+    def summary_instructions(self, wa_id: str) -> Optional[str]:
+        """Resumen de los turnos que quedaron fuera de la ventana, listo para el prompt"""
+        summary = self._state(wa_id).summary
+        return f"{SUMMARY_PREFIX}\n{summary}" if summary else None
+
+    def estimated_tokens(self, wa_id: str) -> int:
+        """Tokens esperados de la próxima respuesta (entrada + salida), para el limitador"""
+        state = self._state(wa_id)
+        if not state.last_input_tokens:
+            return DEFAULT_ESTIMATED_TOKENS
+        return state.last_input_tokens + state.output_tokens // max(1, state.replies)
+
+    def record_turn(self, wa_id: str, new_messages: int, usage: Any, origin: str,
+                    fetch_recent: Callable[[int], List[HistoryMessage]]):
+        """
+        Registra una respuesta: `new_messages` mensajes del cliente más la
+        respuesta, y el uso de tokens (None si la API no lo informó).
+        `fetch_recent(limite)` retorna los mensajes más recientes, del más
+        nuevo al más antiguo; se usa para resumir lo que salió de la ventana.
+        """
+        state = self._state(wa_id)
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+
+        with self._lock:
+            if state.origin != origin:
+                # Thread nuevo: el resumen sigue valiendo, pero el cursor no
+                state.origin, state.cursor = origin, None
+                state.total_messages = state.summarized_messages = 0
+            added = new_messages + 1
+            state.total_messages += added
+            state.replies += 1
+            if usage is not None:
+                state.input_tokens += prompt_tokens
+                state.output_tokens += completion_tokens
+                state.last_input_tokens = prompt_tokens
+                self._input_samples.append(prompt_tokens)
+                self._replies_with_usage += 1
+                self._total_input_tokens += prompt_tokens
+                self._total_output_tokens += completion_tokens
+            else:
+                self._replies_without_usage += 1
+
+            due = (
+                self.summary_enabled
+                and not state.summarizing
+                and state.total_messages - state.summarized_messages - self.window_messages >= self.summary_batch
+            )
+            if due:
+                state.summarizing = True
+                summarized_target = state.total_messages - self.window_messages
+
+        self._submit(self._persist_turn, state, added, prompt_tokens, completion_tokens)
+        if due:
+            self._submit(self._summarize, state, fetch_recent, summarized_target)
+
+    def _persist_turn(self, state: ConversationState, added: int, prompt_tokens: int, completion_tokens: int):
+        """Incrementos (no valores absolutos): varios procesos pueden atender al mismo cliente"""
+        if self.session_factory is None:
+            return
+        try:
+            session = self.session_factory()
+        except Exception:
+            return
+        try:
+            session.execute(
+                text("""
+                    INSERT INTO contexto_conversaciones
+                        (wa_id, origen, mensajes_totales, respuestas, tokens_entrada, tokens_salida, ultimo_tokens_entrada)
+                    VALUES (:wa_id, :origen, :mensajes, 1, :entrada, :salida, :entrada)
+                    ON DUPLICATE KEY UPDATE
+                        mensajes_totales = IF(origen <=> VALUES(origen), mensajes_totales + VALUES(mensajes_totales), VALUES(mensajes_totales)),
+                        mensajes_resumidos = IF(origen <=> VALUES(origen), mensajes_resumidos, 0),
+                        ultimo_mensaje_resumido = IF(origen <=> VALUES(origen), ultimo_mensaje_resumido, NULL),
+                        origen = VALUES(origen),
+                        respuestas = respuestas + 1,
+                        tokens_entrada = tokens_entrada + VALUES(tokens_entrada),
+                        tokens_salida = tokens_salida + VALUES(tokens_salida),
+                        ultimo_tokens_entrada = VALUES(ultimo_tokens_entrada)
+                """),
+                {
+                    "wa_id": state.wa_id, "origen": state.origin, "mensajes": added,
+                    "entrada": prompt_tokens, "salida": completion_tokens,
+                }
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logging.warning(f"No se pudo guardar el consumo de tokens de {state.wa_id}: {e}")
+        finally:
+            session.close()
+
+    def _summarize(self, state: ConversationState, fetch_recent: Callable[[int], List[HistoryMessage]],
+                   summarized_target: int):
+        """Integra en el resumen los mensajes que quedaron fuera de la ventana"""
+        try:
+            recent = fetch_recent(SUMMARY_FETCH_LIMIT)
+            outside_window = []
+            for message in recent[self.window_messages:]:
+                if message[0] == state.cursor:
+                    break
+                outside_window.append(message)
+            outside_window.reverse()
+
+            if outside_window:
+                state.summary = self._build_summary_with_limit(state.summary, outside_window)
+                state.cursor = outside_window[-1][0]
+            with self._lock:
+                state.summarized_messages = max(state.summarized_messages, summarized_target)
+                self._summaries += 1
+            self._save_summary(state)
+        except Exception as e:
+            with self._lock:
+                self._summary_failures += 1
+            logging.warning(f"No se pudo resumir la conversación de {state.wa_id}: {e}")
+        finally:
+            state.summarizing = False
+
+    def _build_summary_with_limit(self, previous: Optional[str], messages: List[HistoryMessage]) -> str:
+        """El resumen usa el carril de menor prioridad del limitador (si lo hay)"""
+        if self.rate_limiter is None:
+            return self._build_summary(previous, messages)
+        tokens = sum(len(content) for _, _, content in messages) // 4 + self.summary_max_tokens
+        with self.rate_limiter.reserve(PRIORITY_BACKGROUND, tokens, timeout=SUMMARY_RATE_LIMIT_WAIT) as admitted:
+            if not admitted:
+                raise RuntimeError("sin cupo en el limitador de OpenAI")
+            return self._build_summary(previous, messages)
+
+    def _build_summary(self, previous: Optional[str], messages: List[HistoryMessage]) -> str:
+        transcript = "\n".join(
+            f"{'Cliente' if role == 'user' else 'Asistente'}: {content}" for _, role, content in messages
+        )
+        response = self.client_provider().chat.completions.create(
+            model=self.summary_model,
+            max_tokens=self.summary_max_tokens,
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": (
+                    f"Resumen actual:\n{previous or '(sin resumen)'}\n\nMensajes nuevos:\n{transcript}"
+                )},
+            ],
+        )
+        if response.usage is not None:
+            with self._lock:
+                self._summary_tokens += response.usage.total_tokens
+        return (response.choices[0].message.content or previous or "").strip()
+
+    def _save_summary(self, state: ConversationState):
+        if self.session_factory is None:
+            return
+        session = self.session_factory()
+        try:
+            session.execute(
+                text("""
+                    UPDATE contexto_conversaciones
+                    SET resumen = :resumen, ultimo_mensaje_resumido = :cursor, mensajes_resumidos = :resumidos
+                    WHERE wa_id = :wa_id AND origen <=> :origen
+                """),
+                {
+                    "wa_id": state.wa_id, "origen": state.origin, "resumen": state.summary,
+                    "cursor": state.cursor, "resumidos": state.summarized_messages,
+                }
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Distribución de tokens de entrada por respuesta y actividad de resúmenes"""
+        with self._lock:
+            samples = sorted(self._input_samples)
+            result = {
+                "window_messages": self.window_messages,
+                "conversations_cached": len(self._states),
+                "replies_with_usage": self._replies_with_usage,
+                "replies_without_usage": self._replies_without_usage,
+                "total_input_tokens": self._total_input_tokens,
+                "total_output_tokens": self._total_output_tokens,
+                "summaries": self._summaries,
+                "summary_failures": self._summary_failures,
+                "summary_tokens": self._summary_tokens,
+            }
+        if samples:
+            result["input_tokens_p50"] = statistics.median(samples)
+            result["input_tokens_p95"] = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            result["input_tokens_max"] = samples[-1]
+        return result
@@ -0,0 +1,194 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional, Set, Tuple
+
+from app.utils.metrics import register_metrics_provider
+
+
+class ConversationQueueFullError(RuntimeError):
+    """La cola de una conversación alcanzó su límite de tareas pendientes"""
+
+
+_Task = Tuple[Callable[..., Any], tuple, dict, Future]
+
+
+@dataclass
+class Deferred:
+    """
+    Resultado de una tarea que sigue esperando algo fuera del pool (p. ej. un
+    run en el RunTracker). Cuando `future` termina, `then(future)` se ejecuta
+    en el pool y retorna el valor final u otro Deferred.
+    """
+    future: Future
+    then: Callable[[Future], Any]
+
+
+def chain(outcome: Any, fn: Callable[[Any], Any]) -> Any:
+    """fn(valor) en cuanto `outcome` (un valor o un Deferred) tenga su valor final"""
+    if isinstance(outcome, Deferred):
+        return Deferred(outcome.future, lambda done: chain(outcome.then(done), fn))
+    return fn(outcome)
+
+
+def resolve(outcome: Any) -> Any:
+    """Valor final de `outcome`, esperando en el hilo actual si es un Deferred"""
+    while isinstance(outcome, Deferred):
+        wait([outcome.future])
+        outcome = outcome.then(outcome.future)
+    return outcome
+
+
+class ConversationScheduler:
+    """
+    Ejecuta tareas en orden por conversación y en paralelo entre conversaciones.
+
+    Cada clave (wa_id) tiene como máximo una tarea en ejecución o en la cola
+    del pool; al terminar, la siguiente tarea de esa clave vuelve al final de
+    la cola global. Así un cliente muy activo no monopoliza los workers y
+    OpenAI nunca recibe dos runs simultáneos sobre el mismo thread.
+
+    Una tarea que retorna un Deferred libera su worker mientras espera: la
+    conversación sigue ocupada y la continuación vuelve al pool al resolverse.
+    """
+
+    def __init__(self, app=None, max_concurrency: int = 8, max_pending_per_key: int = 20):
+        self.app = app
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_pending_per_key = max(1, max_pending_per_key)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="conversation")
+        self._queues: Dict[str, Deque[_Task]] = {}
+        self._active_keys: Set[str] = set()
+        self._lock = threading.Lock()
+
+        self._running_tasks = 0
+        self._deferred_tasks = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def submit(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Programa fn(*args, **kwargs) detrás de las tareas previas de la misma clave"""
+        future: Future = Future()
+        task = (fn, args, kwargs, future)
+
+        with self._lock:
+            if key in self._active_keys:
+                queue = self._queues.setdefault(key, deque())
+                if len(queue) >= self.max_pending_per_key:
+                    self._rejected += 1
+                    future.set_exception(ConversationQueueFullError(
+                        f"Demasiados mensajes pendientes para {key}"
+                    ))
+                    return future
+                queue.append(task)
+                return future
+            self._active_keys.add(key)
+
+        self._executor.submit(self._run, key, task)
+        return future
+
+    def _run(self, key: str, task: _Task):
+        """Ejecuta una tarea y encadena la siguiente de la misma clave"""
+        fn, args, kwargs, future = task
+        if future.set_running_or_notify_cancel():
+            self._step(key, future, fn, args, kwargs)
+        else:
+            self._finish(key)
+
+    def _step(self, key: str, future: Future, fn: Callable[..., Any], args: tuple, kwargs: dict):
+        """Ejecuta una parte de la tarea; si retorna un Deferred, espera sin ocupar el worker"""
+        with self._lock:
+            self._running_tasks += 1
+
+        outcome = None
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    outcome = fn(*args, **kwargs)
+            else:
+                outcome = fn(*args, **kwargs)
+            if not isinstance(outcome, Deferred):
+                future.set_result(outcome)
+        except Exception as e:
+            logging.error(f"Error en tarea de la conversación {key}: {e}", exc_info=True)
+            future.set_exception(e)
+            outcome = None
+        finally:
+            with self._lock:
+                self._running_tasks -= 1
+                if isinstance(outcome, Deferred):
+                    self._deferred_tasks += 1
+
+        if isinstance(outcome, Deferred):
+            outcome.future.add_done_callback(lambda done: self._resume(key, future, outcome))
+        else:
+            self._finish(key)
+
+    def _resume(self, key: str, future: Future, deferred: Deferred):
+        """La espera terminó (en el hilo que la resolvió): la continuación vuelve al pool"""
+        with self._lock:
+            self._deferred_tasks -= 1
+        self._executor.submit(self._step, key, future, deferred.then, (deferred.future,), {})
+
+    def _finish(self, key: str):
+        """Libera la conversación o programa su siguiente tarea"""
+        with self._lock:
+            self._completed += 1
+            queue = self._queues.get(key)
+            next_task = queue.popleft() if queue else None
+            if queue is not None and not queue:
+                del self._queues[key]
+            if next_task is None:
+                self._active_keys.discard(key)
+
+        if next_task is not None:
+            self._executor.submit(self._run, key, next_task)
+
+    def queue_length(self, key: str) -> int:
+        """Tareas en espera (sin contar la que está en curso) para una clave"""
+        with self._lock:
+            return len(self._queues.get(key, ()))
+
+    def shutdown(self, wait: bool = True):
+        """Detiene el pool de ejecución"""
+        self._executor.shutdown(wait=wait)
+
+    def stats(self, top: int = 20) -> Dict[str, Any]:
+        """Concurrencia en uso y longitud de las colas por conversación"""
+        with self._lock:
+            lengths = {key: len(queue) for key, queue in self._queues.items()}
+            busiest = sorted(lengths.items(), key=lambda item: item[1], reverse=True)[:top]
+            return {
+                "max_concurrency": self.max_concurrency,
+                "running": self._running_tasks,
+                "deferred": self._deferred_tasks,
+                "active_conversations": len(self._active_keys),
+                "queued_tasks": sum(lengths.values()),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "queued_by_conversation": dict(busiest),
+            }
+
+
+# Instancia global del scheduler
+conversation_scheduler: Optional[ConversationScheduler] = None
+
+
+def init_conversation_scheduler(app) -> ConversationScheduler:
+    """Crea el scheduler global a partir de app.config"""
+    global conversation_scheduler
+    if conversation_scheduler is None:
+        conversation_scheduler = ConversationScheduler(
+            app,
+            max_concurrency=app.config.get("CONVERSATION_MAX_CONCURRENCY", 8),
+            max_pending_per_key=app.config.get("CONVERSATION_MAX_PENDING", 20),
+        )
+        register_metrics_provider("conversations", conversation_scheduler.stats)
+    return conversation_scheduler
+
+
+def get_conversation_scheduler() -> Optional[ConversationScheduler]:
+    """Retorna el scheduler global o None si no fue inicializado"""
+    return conversation_scheduler
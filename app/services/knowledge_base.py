@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import openai
+
+from app.services.knowledge_version import file_sha256
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+DEFAULT_MANIFEST_PATH = os.path.join(BASE_DIR, "app", "services", "prompts", ".knowledge_manifest.json")
+
+
+class KnowledgeBaseSync:
+    """
+    Sincroniza los archivos de conocimiento (catálogo, políticas, FAQ...) con
+    un vector store de OpenAI por contenido.
+
+    Un manifiesto local guarda, por archivo, su sha256 y el file_id subido,
+    además del vector_store_id y el assistant_id. En cada arranque solo se
+    suben los archivos cuyo hash cambió; la versión anterior se quita del
+    vector store y se borra, de modo que no quedan archivos huérfanos.
+    """
+
+    def __init__(self, client, file_paths: Sequence[str], manifest_path: Optional[str] = None,
+                 vector_store_name: str = "knowledge"):
+        self.client = client
+        self.file_paths = [path for path in file_paths if path]
+        self.manifest_path = manifest_path or DEFAULT_MANIFEST_PATH
+        self.vector_store_name = vector_store_name
+        self.manifest = self._load_manifest()
+        self.last_sync: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        """Lee el manifiesto; si no existe o está corrupto se empieza de cero"""
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            manifest.setdefault("files", {})
+            return manifest
+        except FileNotFoundError:
+            return {"files": {}}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Manifiesto de conocimiento ilegible ({e}); se reconstruye")
+            return {"files": {}}
+
+    def _save_manifest(self):
+        """Escritura atómica del manifiesto"""
+        directory = os.path.dirname(self.manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Temporal único: varios procesos pueden guardar el manifiesto a la vez
+        fd, temp_path = tempfile.mkstemp(dir=directory or ".", suffix=".tmp",
+                                         prefix=f"{os.path.basename(self.manifest_path)}.")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f, indent=2, sort_keys=True)
+            os.replace(temp_path, self.manifest_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    @staticmethod
+    def _manifest_key(path: str) -> str:
+        """Ruta relativa a la raíz del proyecto (manifiesto portable entre máquinas)"""
+        absolute = os.path.abspath(path)
+        if absolute.startswith(BASE_DIR + os.sep):
+            return os.path.relpath(absolute, BASE_DIR).replace(os.sep, "/")
+        return absolute
+
+    @property
+    def assistant_id(self) -> Optional[str]:
+        """Asistente creado en un arranque anterior (si lo hubo)"""
+        return self.manifest.get("assistant_id")
+
+    def record_assistant(self, assistant_id: str):
+        """Recuerda el asistente creado para no crear otro en el próximo arranque"""
+        with self._lock:
+            self.manifest["assistant_id"] = assistant_id
+            self._save_manifest()
+
+    def _ensure_vector_store(self, preferred_id: Optional[str]) -> str:
+        """Usa el vector store indicado o el del manifiesto; lo crea si ya no existe"""
+        for vector_store_id in (preferred_id, self.manifest.get("vector_store_id")):
+            if not vector_store_id:
+                continue
+            try:
+                self.client.vector_stores.retrieve(vector_store_id)
+                return vector_store_id
+            except openai.NotFoundError:
+                logging.warning(f"Vector store {vector_store_id} no existe en OpenAI")
+
+        vector_store = self.client.vector_stores.create(name=self.vector_store_name)
+        logging.info(f"Vector store creado: {vector_store.id}")
+        return vector_store.id
+
+    def sync(self, vector_store_id: Optional[str] = None) -> Optional[str]:
+        """
+        Deja el vector store con la versión actual de cada archivo.
+        Retorna el vector_store_id, o None si no hay ningún archivo de conocimiento.
+        """
+        with self._lock:
+            available = [path for path in self.file_paths if os.path.exists(path)]
+            for path in set(self.file_paths) - set(available):
+                logging.error(f"Archivo de conocimiento no encontrado: {path}")
+            if not available:
+                logging.error("Crea al menos un archivo con FAQ, productos/servicios o políticas de envío, pago y devoluciones")
+                return None
+
+            vector_store_id = self._ensure_vector_store(vector_store_id)
+            store_changed = vector_store_id != self.manifest.get("vector_store_id")
+            self.manifest["vector_store_id"] = vector_store_id
+            files = self.manifest["files"]
+            summary = {"uploaded": [], "attached": [], "unchanged": [], "removed": []}
+
+            for path in available:
+                key = self._manifest_key(path)
+                digest = file_sha256(path)
+                entry = files.get(key)
+
+                if entry and entry.get("sha256") == digest:
+                    if store_changed:
+                        # Mismo contenido, otro vector store: se adjunta sin volver a subir
+                        self._attach(vector_store_id, entry["file_id"])
+                        summary["attached"].append(key)
+                    else:
+                        summary["unchanged"].append(key)
+                    continue
+
+                with open(path, "rb") as f:
+                    uploaded = self.client.files.create(file=f, purpose="assistants")
+                self._attach(vector_store_id, uploaded.id)
+                if entry:
+                    self._discard(vector_store_id, entry["file_id"])
+                files[key] = {"sha256": digest, "file_id": uploaded.id}
+                self._save_manifest()
+                summary["uploaded"].append(key)
+                logging.info(f"Archivo de conocimiento actualizado: {key} → {uploaded.id}")
+
+            # Archivos que ya no forman parte de la configuración
+            configured = {self._manifest_key(path) for path in self.file_paths}
+            for key in [key for key in files if key not in configured]:
+                self._discard(vector_store_id, files.pop(key)["file_id"])
+                summary["removed"].append(key)
+
+            self._save_manifest()
+            self.last_sync = summary
+            logging.info(
+                "Sincronización de conocimiento: "
+                + ", ".join(f"{name}={len(keys)}" for name, keys in summary.items())
+            )
+            return vector_store_id
+
+    def _attach(self, vector_store_id: str, file_id: str):
+        """Adjunta un archivo al vector store y espera su indexación"""
+        self.client.vector_stores.files.create_and_poll(file_id=file_id, vector_store_id=vector_store_id)
+
+    def _discard(self, vector_store_id: str, file_id: str):
+        """Quita un archivo del vector store y lo borra de OpenAI"""
+        try:
+            self.client.vector_stores.files.delete(file_id=file_id, vector_store_id=vector_store_id)
+        except openai.NotFoundError:
+            pass
+        try:
+            self.client.files.delete(file_id)
+        except openai.NotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f"No se pudo borrar el archivo {file_id}: {e}")
@@ -0,0 +1,496 @@
+import hashlib
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.services.knowledge_version import FileHashCache, PRODUCTS_VERSION_SQL, PROMOTIONS_VERSION_SQL
+from app.services.response_cache import normalize_question, stem_token
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+DEFAULT_INDEX_PATH = os.path.join(BASE_DIR, "app", "services", "prompts", ".knowledge_index.bin")
+
+# Archivos de conocimiento que se indexan como texto
+TEXT_KNOWLEDGE_EXTENSIONS = (".md", ".txt", ".csv", ".json")
+
+# Fuentes de la base de datos (exportación del catálogo)
+SOURCE_PRODUCTS = "db:productos"
+SOURCE_PROMOTIONS = "db:promociones"
+
+STOPWORDS = frozenset({
+    "a", "al", "algo", "como", "con", "cual", "de", "del", "donde", "el", "en", "es", "esta", "hay",
+    "la", "las", "lo", "los", "me", "mi", "muy", "no", "o", "para", "por", "que", "se", "si", "sin",
+    "su", "sus", "te", "tu", "un", "una", "uno", "y", "ya", "yo",
+    # Palabras de pregunta y cortesía: aparecen en casi toda consulta y no identifican el tema
+    "cuanto", "cuanta", "cuantos", "cuantas", "cuales", "cuando", "quien", "porque", "ustedes", "usted",
+    "tienen", "tiene", "tienes", "tengo", "quiero", "quisiera", "puedo", "puede", "pueden", "podria",
+    "hacen", "hace", "son", "estan", "le", "les", "nos", "favor", "hola", "buenas", "gracias",
+})
+
+# Parámetros de BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Formato binario: cabecera, metadatos JSON, tabla de documentos, tabla de
+# términos (hash ordenado → postings), postings y texto de los documentos
+INDEX_MAGIC = b"SMJBM25\x02"
+HEADER = struct.Struct("<8sIIQQQQQQQ")  # magic, docs, términos, largo total, offsets y largos de secciones
+DOC_ENTRY = struct.Struct("<QII")  # offset del texto, bytes de texto, largo en tokens
+TERM_ENTRY = struct.Struct("<QII")  # hash del término, primer posting, cantidad de postings (df)
+POSTING = struct.Struct("<IH")  # documento, frecuencia del término
+
+
+def tokenize(content: str) -> List[str]:
+    """Palabras normalizadas (sin acentos ni stopwords, plural simplificado)"""
+    return [
+        stem_token(token) for token in normalize_question(content).split()
+        if token not in STOPWORDS and (len(token) > 1 or token.isdigit())
+    ]
+
+
+# Documento a indexar: (texto que se inyecta, texto que se tokeniza)
+Document = Tuple[str, str]
+
+
+def term_hash(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def split_sections(content: str) -> List[str]:
+    """Párrafos separados por líneas en blanco, con el título vigente como prefijo"""
+    sections = []
+    heading = ""
+    for block in content.split("\n\n"):
+        block = block.strip()
+        if not block:
+            continue
+        if block.startswith("#"):
+            lines = block.splitlines()
+            heading = lines[0]
+            block = "\n".join(lines[1:]).strip()
+            if not block:
+                continue
+        sections.append(f"{heading}\n{block}" if heading else block)
+    return sections
+
+
+def format_snippets(snippets: List[str]) -> str:
+    """Bloque de conocimiento para las instrucciones del modelo"""
+    if not snippets:
+        return "Información de la empresa: no se encontró información relevante para esta consulta."
+    return "Información de la empresa relevante para esta consulta:\n\n" + "\n\n".join(snippets)
+
+
+class _IndexView:
+    """Índice mapeado en memoria (solo lectura); se reemplaza entero al reconstruir"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.doc_count, self.term_count, total_length, meta_offset, meta_length,
+         self.docs_offset, self.terms_offset, self.postings_offset, self.text_offset) = HEADER.unpack_from(self.mm, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError("formato de índice desconocido")
+        self.meta = json.loads(self.mm[meta_offset:meta_offset + meta_length])
+        self.avg_length = total_length / self.doc_count if self.doc_count else 0.0
+        self.size_bytes = len(self.mm)
+        # Largos de documento en memoria: se leen en cada posting al puntuar
+        self.doc_lengths = [
+            length for _, _, length in
+            DOC_ENTRY.iter_unpack(self.mm[self.docs_offset:self.docs_offset + self.doc_count * DOC_ENTRY.size])
+        ]
+
+    def lookup(self, term: str) -> Optional[Tuple[int, int]]:
+        """(primer posting, df) del término; búsqueda binaria sobre la tabla ordenada"""
+        target = term_hash(term)
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            key, start, count = TERM_ENTRY.unpack_from(self.mm, self.terms_offset + middle * TERM_ENTRY.size)
+            if key < target:
+                low = middle + 1
+            elif key > target:
+                high = middle
+            else:
+                return start, count
+        return None
+
+    def postings(self, start: int, count: int):
+        begin = self.postings_offset + start * POSTING.size
+        return POSTING.iter_unpack(self.mm[begin:begin + count * POSTING.size])
+
+    def text(self, doc_id: int) -> str:
+        offset, length, _ = DOC_ENTRY.unpack_from(self.mm, self.docs_offset + doc_id * DOC_ENTRY.size)
+        begin = self.text_offset + offset
+        return self.mm[begin:begin + length].decode("utf-8")
+
+    def terms(self):
+        """(hash, primer posting, df) de cada término, en orden"""
+        end = self.terms_offset + self.term_count * TERM_ENTRY.size
+        return TERM_ENTRY.iter_unpack(self.mm[self.terms_offset:end])
+
+    def source_range(self, name: str) -> Optional[range]:
+        """Documentos de una fuente, para reutilizarlos si no cambió"""
+        for source in self.meta["sources"]:
+            if source["name"] == name:
+                return range(source["first_doc"], source["first_doc"] + source["doc_count"])
+        return None
+
+
+class KnowledgeIndex:
+    """
+    Índice BM25 local sobre los archivos de conocimiento y una exportación
+    del catálogo (`productos` y `promociones` vigentes).
+
+    Se guarda en un archivo binario que se abre con mmap: al arrancar no se
+    parsea ni se reconstruye nada si las fuentes no cambiaron. Cada fuente
+    lleva su huella (sha256 del archivo o consulta agregada de la tabla) y al
+    reconstruir solo se vuelven a leer las que cambiaron; las demás se copian
+    del índice anterior. La revisión de huellas se hace como máximo cada
+    `refresh_seconds`, en un hilo aparte (las consultas siguen con el índice
+    vigente), y el archivo se reemplaza de forma atómica.
+    """
+
+    def __init__(self, file_paths: Sequence[str], index_path: Optional[str] = None,
+                 session_factory: Optional[Callable] = None, refresh_seconds: float = 60.0,
+                 top_k: int = 5, max_chars: int = 12000, min_score: float = 1.0):
+        self.file_paths = [os.path.abspath(path) for path in file_paths if path]
+        self.index_path = index_path or DEFAULT_INDEX_PATH
+        self.session_factory = session_factory
+        self.refresh_seconds = refresh_seconds
+        self.top_k = top_k
+        self.max_chars = max_chars
+        self.min_score = min_score
+
+        self._view: Optional[_IndexView] = None
+        self._file_hashes = FileHashCache()
+        self._checked_at = float("-inf")
+        self._refresh_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+
+        self._builds = 0
+        self._sources_rebuilt = 0
+        self._source_failures = 0
+        self._last_build_ms = 0.0
+        self._queries = 0
+        self._query_seconds = 0.0
+
+    def reset_after_fork(self):
+        """En el hijo de un fork: el lock pudo quedar tomado por un hilo del padre"""
+        self._refresh_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._refresh_thread = None
+
+    @property
+    def doc_count(self) -> int:
+        return self._view.doc_count if self._view else 0
+
+    def load(self) -> bool:
+        """Mapea el índice guardado (sin reconstruir); False si no existe o es inválido"""
+        try:
+            self._view = _IndexView(self.index_path)
+            return True
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, struct.error) as e:
+            logging.warning(f"Índice de conocimiento inválido ({e}); se reconstruye")
+            return False
+
+    def _source_names(self) -> List[str]:
+        names = [f"file:{path}" for path in self.file_paths]
+        if self.session_factory is not None:
+            names += [SOURCE_PRODUCTS, SOURCE_PROMOTIONS]
+        return names
+
+    def _fingerprints(self) -> Dict[str, Optional[str]]:
+        """Huella actual de cada fuente (None: no disponible, se conserva lo indexado)"""
+        fingerprints: Dict[str, Optional[str]] = {
+            f"file:{path}": self._file_hashes.get(path) for path in self.file_paths
+        }
+        if self.session_factory is None:
+            return fingerprints
+
+        fingerprints[SOURCE_PRODUCTS] = fingerprints[SOURCE_PROMOTIONS] = None
+        try:
+            session = self.session_factory()
+        except RuntimeError as e:
+            logging.warning(f"Catálogo no disponible para el índice de conocimiento: {e}")
+            return fingerprints
+        try:
+            fingerprints[SOURCE_PRODUCTS] = str(tuple(session.execute(text(PRODUCTS_VERSION_SQL)).fetchone()))
+            fingerprints[SOURCE_PROMOTIONS] = str(tuple(session.execute(text(PROMOTIONS_VERSION_SQL)).fetchone()))
+        except SQLAlchemyError as e:
+            logging.warning(f"No se pudo leer la versión del catálogo para el índice: {e}")
+        finally:
+            session.close()
+        return fingerprints
+
+    def _read_source(self, name: str) -> List[Document]:
+        """Documentos actuales de una fuente"""
+        if name.startswith("file:"):
+            path = name[len("file:"):]
+            if not path.lower().endswith(TEXT_KNOWLEDGE_EXTENSIONS):
+                logging.warning(f"El índice solo lee archivos de texto; se omite {path}")
+                return []
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                return [(section, section) for section in split_sections(f.read())]
+
+        # Del catálogo solo se indexan nombre y descripción: precio, stock y
+        # fechas van en el fragmento pero como texto harían coincidir a todas
+        # las filas con "precio", "stock" o cualquier número de la consulta
+        session = self.session_factory()
+        try:
+            if name == SOURCE_PRODUCTS:
+                rows = session.execute(
+                    text("SELECT nombre, descripcion, precio, stock FROM productos ORDER BY id_producto")
+                ).fetchall()
+                return [
+                    (
+                        f"Producto: {nombre}. {descripcion or ''} Precio: {float(precio):.2f}. "
+                        + (f"Stock: {stock} unidades disponibles." if stock else "Sin stock por ahora."),
+                        f"{nombre}. {descripcion or ''}",
+                    )
+                    for nombre, descripcion, precio, stock in rows
+                ]
+            rows = session.execute(
+                text("""
+                    SELECT titulo, descripcion, descuento, fecha_inicio, fecha_fin
+                    FROM promociones
+                    WHERE activa = TRUE AND CURDATE() BETWEEN fecha_inicio AND fecha_fin
+                    ORDER BY id_promocion
+                """)
+            ).fetchall()
+            return [
+                (
+                    f"Promoción: {titulo}. {descripcion or ''} Descuento: {float(descuento or 0):g}%. "
+                    f"Vigente del {inicio:%d/%m/%Y} al {fin:%d/%m/%Y}.",
+                    f"Promoción {titulo}. {descripcion or ''}",
+                )
+                for titulo, descripcion, descuento, inicio, fin in rows
+            ]
+        finally:
+            session.close()
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Reconstruye el índice si alguna fuente cambió (o si `force`).
+        Retorna True si se escribió un índice nuevo.
+        """
+        with self._refresh_lock:
+            self._checked_at = time.monotonic()
+            if self._view is None:
+                self.load()
+            view = self._view
+            fingerprints = self._fingerprints()
+            previous = {source["name"]: source for source in view.meta["sources"]} if view else {}
+
+            changed = [
+                name for name in self._source_names()
+                if force or name not in previous
+                or (fingerprints.get(name) is not None and fingerprints[name] != previous[name]["fingerprint"])
+            ]
+            removed = set(previous) - set(self._source_names())
+            if not changed and not removed:
+                return False
+
+            started_at = time.perf_counter()
+            sources: List[Tuple[str, Optional[str], Union[List[Document], range]]] = []
+            for name in self._source_names():
+                documents = None
+                if name not in changed and view is not None:
+                    documents = view.source_range(name)
+                fingerprint = fingerprints.get(name) or previous.get(name, {}).get("fingerprint")
+                if documents is None:
+                    try:
+                        documents = self._read_source(name)
+                    except Exception as e:
+                        logging.error(f"No se pudo leer la fuente de conocimiento {name}: {e}")
+                        # Documentos y huella anteriores: la próxima revisión vuelve a intentarlo
+                        documents = (view.source_range(name) if view is not None else None) or []
+                        fingerprint = previous.get(name, {}).get("fingerprint")
+                        with self._stats_lock:
+                            self._source_failures += 1
+                sources.append((name, fingerprint, documents))
+
+            self._write(sources, view)
+            self._view = _IndexView(self.index_path)
+            elapsed_ms = (time.perf_counter() - started_at) * 1000
+            with self._stats_lock:
+                self._builds += 1
+                self._sources_rebuilt += len(changed)
+                self._last_build_ms = elapsed_ms
+            logging.info(
+                f"Índice de conocimiento reconstruido en {elapsed_ms:.1f} ms: "
+                f"{self._view.doc_count} documentos, fuentes actualizadas: {', '.join(changed) or '-'}"
+            )
+            return True
+
+    def _write(self, sources: List[Tuple[str, Optional[str], Union[List[Document], range]]],
+               previous: Optional[_IndexView]):
+        """
+        Serializa el índice en un archivo temporal y lo reemplaza de forma
+        atómica. Las fuentes sin cambios llegan como rango de documentos de
+        `previous`: se copian texto y postings sin volver a tokenizar.
+        """
+        meta = {"sources": [], "built_at": time.time()}
+        text_blob = bytearray()
+        doc_entries = bytearray()
+        postings: Dict[int, List[Tuple[int, int]]] = {}
+        reused: Dict[int, int] = {}  # documento en previous → documento nuevo
+        doc_id = 0
+        total_length = 0
+
+        for name, fingerprint, documents in sources:
+            meta["sources"].append({"name": name, "fingerprint": fingerprint, "first_doc": doc_id, "doc_count": len(documents)})
+            for document in documents:
+                if isinstance(documents, range):
+                    encoded = previous.text(document).encode("utf-8")
+                    length = previous.doc_lengths[document]
+                    reused[document] = doc_id
+                else:
+                    content, indexed = document
+                    encoded = content.encode("utf-8")
+                    terms = Counter(tokenize(indexed))
+                    length = sum(terms.values())
+                    for term, frequency in terms.items():
+                        postings.setdefault(term_hash(term), []).append((doc_id, min(frequency, 0xFFFF)))
+                doc_entries += DOC_ENTRY.pack(len(text_blob), len(encoded), length)
+                text_blob += encoded
+                total_length += length
+                doc_id += 1
+
+        if reused:
+            for key, start, count in previous.terms():
+                for old_doc, frequency in previous.postings(start, count):
+                    new_doc = reused.get(old_doc)
+                    if new_doc is not None:
+                        postings.setdefault(key, []).append((new_doc, frequency))
+
+        term_entries = bytearray()
+        posting_entries = bytearray()
+        posting_count = 0
+        for key in sorted(postings):
+            entries = postings[key]
+            term_entries += TERM_ENTRY.pack(key, posting_count, len(entries))
+            for entry in entries:
+                posting_entries += POSTING.pack(*entry)
+            posting_count += len(entries)
+
+        meta_bytes = json.dumps(meta).encode("utf-8")
+        meta_offset = HEADER.size
+        docs_offset = meta_offset + len(meta_bytes)
+        terms_offset = docs_offset + len(doc_entries)
+        postings_offset = terms_offset + len(term_entries)
+        text_offset = postings_offset + len(posting_entries)
+        header = HEADER.pack(
+            INDEX_MAGIC, doc_id, len(postings), total_length, meta_offset, len(meta_bytes),
+            docs_offset, terms_offset, postings_offset, text_offset
+        )
+
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Temporal único: varios procesos pueden reconstruir el índice a la vez
+        fd, temp_path = tempfile.mkstemp(dir=directory or ".", suffix=".tmp",
+                                         prefix=f"{os.path.basename(self.index_path)}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for part in (header, meta_bytes, doc_entries, term_entries, posting_entries, text_blob):
+                    f.write(part)
+            os.replace(temp_path, self.index_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def _maybe_refresh(self):
+        """
+        Programa la revisión de las fuentes como máximo cada refresh_seconds.
+        Las huellas (consultas a la DB) y la reconstrucción corren en otro hilo.
+        """
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_seconds:
+            return
+        with self._stats_lock:
+            if now - self._checked_at < self.refresh_seconds:
+                return
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._checked_at = now
+            self._refresh_thread = threading.Thread(
+                target=self._refresh_in_background, name="knowledge-index-refresh", daemon=True
+            )
+            self._refresh_thread.start()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logging.error(f"Error actualizando el índice de conocimiento: {e}")
+
+    def search(self, query: str, top_k: Optional[int] = None) -> List[Tuple[float, str]]:
+        """Documentos más relevantes para la consulta como (puntaje BM25, texto)"""
+        self._maybe_refresh()
+        view = self._view
+        if view is None or view.doc_count == 0:
+            return []
+
+        started_at = time.perf_counter()
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            entry = view.lookup(term)
+            if entry is None:
+                continue
+            start, document_frequency = entry
+            idf = math.log(1 + (view.doc_count - document_frequency + 0.5) / (document_frequency + 0.5))
+            for doc_id, frequency in view.postings(start, document_frequency):
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * view.doc_lengths[doc_id] / view.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        best = heapq.nlargest(top_k or self.top_k, scores.items(), key=lambda item: item[1])
+        results = [(score, view.text(doc_id)) for doc_id, score in best]
+        with self._stats_lock:
+            self._queries += 1
+            self._query_seconds += time.perf_counter() - started_at
+        return results
+
+    def relevant(self, query: str) -> List[str]:
+        """Fragmentos a inyectar: top-k con puntaje mínimo, dentro de max_chars"""
+        return self.relevant_with_score(query)[0]
+
+    def relevant_with_score(self, query: str) -> Tuple[List[str], float]:
+        """Fragmentos a inyectar y el puntaje del mejor de ellos (0 si no hay)"""
+        snippets, used, top_score = [], 0, 0.0
+        for score, snippet in self.search(query):
+            if score < self.min_score or used + len(snippet) > self.max_chars:
+                continue
+            snippets.append(snippet)
+            used += len(snippet)
+            top_score = max(top_score, score)
+        return snippets, top_score
+
+    def stats(self) -> Dict[str, Any]:
+        view = self._view
+        with self._stats_lock:
+            return {
+                "documents": view.doc_count if view else 0,
+                "terms": view.term_count if view else 0,
+                "size_bytes": view.size_bytes if view else 0,
+                "builds": self._builds,
+                "sources_rebuilt": self._sources_rebuilt,
+                "source_failures": self._source_failures,
+                "last_build_ms": round(self._last_build_ms, 1),
+                "queries": self._queries,
+                "avg_query_microseconds": round(self._query_seconds / self._queries * 1e6, 1) if self._queries else 0.0,
+            }
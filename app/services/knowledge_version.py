@@ -0,0 +1,104 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hash sha256 del contenido de un archivo, leído por bloques"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Huellas baratas de las tablas que forman parte del conocimiento. Las
+# promociones no tienen fecha de actualización: se usa un CRC de sus columnas
+# y solo cuentan las vigentes hoy.
+PRODUCTS_VERSION_SQL = "SELECT COUNT(*), MAX(fecha_actualizacion) FROM productos"
+PROMOTIONS_VERSION_SQL = """
+    SELECT COUNT(*), COALESCE(SUM(CRC32(CONCAT_WS('|', id_promocion, titulo, descripcion,
+                                                   descuento, fecha_inicio, fecha_fin))), 0)
+    FROM promociones
+    WHERE activa = TRUE AND CURDATE() BETWEEN fecha_inicio AND fecha_fin
+"""
+
+
+class FileHashCache:
+    """sha256 de archivos, recalculado solo cuando cambian su mtime o tamaño"""
+
+    def __init__(self):
+        self._hashes: Dict[str, Tuple[Tuple[int, int], str]] = {}
+
+    def get(self, path: str) -> Optional[str]:
+        """Hash actual del archivo, o None si no existe"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._hashes.get(path)
+        if cached is None or cached[0] != signature:
+            cached = (signature, file_sha256(path))
+            self._hashes[path] = cached
+        return cached[1]
+
+
+class KnowledgeVersion:
+    """
+    Versión del conocimiento del asistente: hash de los archivos de
+    conocimiento (prompts.md) más la versión de `productos` y de las
+    `promociones` vigentes.
+
+    Los archivos solo se vuelven a hashear cuando cambian su mtime o tamaño;
+    el catálogo se consulta como máximo cada `catalog_refresh_seconds`.
+    """
+
+    def __init__(self, file_paths: Tuple[str, ...] = (), session_factory: Optional[Callable] = None,
+                 catalog_refresh_seconds: float = 30.0):
+        self.file_paths = tuple(path for path in file_paths if path)
+        self.session_factory = session_factory
+        self.catalog_refresh_seconds = catalog_refresh_seconds
+        self._file_hashes = FileHashCache()
+        self._catalog_version = ""
+        self._catalog_checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def _files_version(self) -> str:
+        """Hash combinado de los archivos (recalculado solo si cambian)"""
+        return "|".join(self._file_hashes.get(path) or f"{path}:missing" for path in self.file_paths)
+
+    def _catalog(self) -> str:
+        """Huella de productos y promociones vigentes"""
+        now = time.monotonic()
+        if self.session_factory is None or now - self._catalog_checked_at < self.catalog_refresh_seconds:
+            return self._catalog_version
+
+        self._catalog_checked_at = now
+        try:
+            session = self.session_factory()
+        except RuntimeError as e:
+            # Motor de base de datos aún no inicializado
+            logging.warning(f"No se pudo leer la versión del catálogo: {e}")
+            return self._catalog_version
+        try:
+            products = session.execute(text(PRODUCTS_VERSION_SQL)).fetchone()
+            promotions = session.execute(text(PROMOTIONS_VERSION_SQL)).fetchone()
+            self._catalog_version = f"{tuple(products)}:{tuple(promotions)}"
+        except SQLAlchemyError as e:
+            logging.warning(f"No se pudo leer la versión del catálogo: {e}")
+        finally:
+            session.close()
+        return self._catalog_version
+
+    def current(self) -> str:
+        """Identificador corto de la versión actual del conocimiento"""
+        with self._lock:
+            raw = f"{self._files_version()}#{self._catalog()}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
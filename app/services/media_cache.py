@@ -0,0 +1,262 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.services.knowledge_version import file_sha256
+from app.utils.metrics import register_metrics_provider
+
+# Meta conserva la media subida 30 días; se deja un día de margen
+DEFAULT_TTL_SECONDS = 29 * 86400
+
+_Key = Tuple[str, str]
+
+
+class DatabaseMediaStore:
+    """
+    Nivel persistente en la tabla `media_whatsapp`: sobrevive a reinicios y
+    se comparte entre workers. Las filas vencidas no se leen y se reemplazan
+    al volver a subir el archivo.
+    """
+
+    def __init__(self, session_factory: Callable, ttl_seconds: int):
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, sha256: str, phone_number_id: str) -> Optional[Tuple[str, int]]:
+        """Retorna (media_id, segundos de vigencia restantes) o None"""
+        with self.session_factory() as session:
+            row = session.execute(
+                text("""
+                    SELECT media_id, TIMESTAMPDIFF(SECOND, NOW(), fecha_expiracion)
+                    FROM media_whatsapp
+                    WHERE sha256 = :sha256 AND phone_number_id = :phone_number_id
+                      AND fecha_expiracion > NOW()
+                """),
+                {"sha256": sha256, "phone_number_id": phone_number_id}
+            ).fetchone()
+        return (row[0], int(row[1])) if row else None
+
+    def put(self, sha256: str, phone_number_id: str, media_id: str, mime_type: str, size: int):
+        with self.session_factory() as session:
+            session.execute(
+                text("""
+                    INSERT INTO media_whatsapp
+                        (sha256, phone_number_id, media_id, mime_type, tamano, fecha_subida, fecha_expiracion)
+                    VALUES (:sha256, :phone_number_id, :media_id, :mime_type, :tamano,
+                            NOW(), NOW() + INTERVAL :ttl SECOND)
+                    ON DUPLICATE KEY UPDATE
+                        media_id = VALUES(media_id),
+                        mime_type = VALUES(mime_type),
+                        tamano = VALUES(tamano),
+                        fecha_subida = VALUES(fecha_subida),
+                        fecha_expiracion = VALUES(fecha_expiracion)
+                """),
+                {"sha256": sha256, "phone_number_id": phone_number_id, "media_id": media_id,
+                 "mime_type": mime_type, "tamano": size, "ttl": self.ttl_seconds}
+            )
+            session.commit()
+
+
+class MediaCache:
+    """
+    Reutiliza el media ID de WhatsApp de archivos ya subidos.
+
+    La clave es el SHA-256 del contenido y el número emisor (los ids de media
+    son por número). Nivel 1: LRU en memoria; nivel 2 (opcional): tabla
+    `media_whatsapp`. Las entradas vencen antes que la media en Meta. Si
+    varios hilos piden el mismo archivo a la vez, solo uno lo sube y el
+    resto espera su resultado.
+    """
+
+    def __init__(self, ttl_seconds: int = DEFAULT_TTL_SECONDS, max_entries: int = 1000,
+                 persistent_store: Optional[DatabaseMediaStore] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.persistent_store = persistent_store
+
+        self._entries: "OrderedDict[_Key, Tuple[str, float]]" = OrderedDict()
+        # Hash memorizado por ruta mientras no cambien mtime ni tamaño
+        self._hashes: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+        self._in_flight: Dict[_Key, Future] = {}
+        self._lock = threading.Lock()
+
+        self._memory_hits = 0
+        self._persistent_hits = 0
+        self._shared_uploads = 0
+        self._uploads = 0
+        self._failed_uploads = 0
+        self._persistent_errors = 0
+        self._hashed_bytes = 0
+
+    def content_hash(self, filepath: str) -> Tuple[str, int]:
+        """Retorna (sha256, tamaño); solo se vuelve a leer el archivo si cambió"""
+        stat = os.stat(filepath)
+        path = os.path.abspath(filepath)
+        with self._lock:
+            memo = self._hashes.get(path)
+            if memo and memo[0] == stat.st_mtime_ns and memo[1] == stat.st_size:
+                self._hashes.move_to_end(path)
+                return memo[2], stat.st_size
+
+        sha256 = file_sha256(filepath)
+        with self._lock:
+            self._hashed_bytes += stat.st_size
+            self._hashes[path] = (stat.st_mtime_ns, stat.st_size, sha256)
+            self._hashes.move_to_end(path)
+            while len(self._hashes) > self.max_entries:
+                self._hashes.popitem(last=False)
+        return sha256, stat.st_size
+
+    def get_or_upload(self, filepath: str, mime_type: str, phone_number_id: str,
+                      upload: Callable[[], Optional[str]]) -> Optional[str]:
+        """Media ID del archivo; `upload` solo se llama si no hay uno vigente"""
+        sha256, size = self.content_hash(filepath)
+        key = (sha256, phone_number_id)
+
+        with self._lock:
+            media_id = self._lookup_memory(key)
+            if media_id:
+                self._memory_hits += 1
+                return media_id
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self._shared_uploads += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            media_id = self._lookup_persistent(key)
+            if not media_id:
+                media_id = self._upload(key, mime_type, size, upload)
+            future.set_result(media_id)
+            return media_id
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _lookup_memory(self, key: _Key) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _remember(self, key: _Key, media_id: str, ttl_seconds: float):
+        with self._lock:
+            self._entries[key] = (media_id, time.monotonic() + ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _lookup_persistent(self, key: _Key) -> Optional[str]:
+        if self.persistent_store is None:
+            return None
+        try:
+            found = self.persistent_store.get(*key)
+        except SQLAlchemyError as e:
+            # Sin la tabla se sigue con la caché en memoria
+            logging.error(f"Error consultando la caché de media: {e}")
+            with self._lock:
+                self._persistent_errors += 1
+            return None
+        if not found:
+            return None
+        with self._lock:
+            self._persistent_hits += 1
+        self._remember(key, found[0], found[1])
+        return found[0]
+
+    def _upload(self, key: _Key, mime_type: str, size: int,
+                upload: Callable[[], Optional[str]]) -> Optional[str]:
+        try:
+            media_id = upload()
+        except Exception:
+            with self._lock:
+                self._failed_uploads += 1
+            raise
+        with self._lock:
+            if media_id:
+                self._uploads += 1
+            else:
+                self._failed_uploads += 1
+        if not media_id:
+            return None
+
+        self._remember(key, media_id, self.ttl_seconds)
+        if self.persistent_store is not None:
+            try:
+                self.persistent_store.put(key[0], key[1], media_id, mime_type, size)
+            except SQLAlchemyError as e:
+                logging.error(f"Error guardando media en caché: {e}")
+                with self._lock:
+                    self._persistent_errors += 1
+        return media_id
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._memory_hits + self._persistent_hits + self._shared_uploads
+            total = hits + self._uploads + self._failed_uploads
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "persistent": self.persistent_store is not None,
+                "uploads": self._uploads,
+                "failed_uploads": self._failed_uploads,
+                "memory_hits": self._memory_hits,
+                "persistent_hits": self._persistent_hits,
+                "shared_uploads": self._shared_uploads,
+                "in_flight": len(self._in_flight),
+                "hashed_bytes": self._hashed_bytes,
+                "persistent_errors": self._persistent_errors,
+                "hit_ratio": round(hits / total, 4) if total else 0.0,
+            }
+
+
+# Instancia global (None cuando la caché está desactivada)
+media_cache: Optional[MediaCache] = None
+
+
+def init_media_cache(config: Dict[str, Any], session_factory: Optional[Callable] = None) -> Optional[MediaCache]:
+    """Crea la caché de media global a partir de la configuración"""
+    global media_cache
+    if not config.get("MEDIA_CACHE_ENABLED", True):
+        return None
+
+    if media_cache is None:
+        ttl_seconds = config.get("MEDIA_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)
+        persistent_store = None
+        if config.get("MEDIA_CACHE_PERSISTENT") and session_factory is not None:
+            persistent_store = DatabaseMediaStore(session_factory, ttl_seconds)
+        elif config.get("MEDIA_CACHE_PERSISTENT"):
+            logging.warning("MEDIA_CACHE_PERSISTENT activo sin sesión de base de datos; solo se usará memoria")
+
+        media_cache = MediaCache(
+            ttl_seconds=ttl_seconds,
+            max_entries=config.get("MEDIA_CACHE_MAX_ENTRIES", 1000),
+            persistent_store=persistent_store,
+        )
+        register_metrics_provider("media_cache", media_cache.stats)
+    return media_cache
+
+
+def get_media_cache() -> Optional[MediaCache]:
+    """Retorna la caché de media global o None si no está activa"""
+    return media_cache
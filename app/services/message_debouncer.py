@@ -0,0 +1,168 @@
+import heapq
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.utils.metrics import register_metrics_provider
+
+
+@dataclass
+class _PendingBurst:
+    """Mensajes de un cliente que esperan a que termine la ráfaga"""
+    events: List[Any] = field(default_factory=list)
+    first_at: float = field(default_factory=time.monotonic)
+    deadline: float = 0.0
+
+
+class MessageDebouncer:
+    """
+    Agrupa por wa_id los mensajes que llegan dentro de una ventana de tiempo.
+
+    Cada mensaje nuevo reinicia la ventana del cliente (sin superar
+    `max_wait_seconds` desde el primero); al vencer, `flush_handler` recibe
+    todos los mensajes juntos para responderlos con un único run. El handler
+    se invoca desde el hilo temporizador, por lo que solo debe encolar el
+    trabajo (p. ej. en el ConversationScheduler).
+    """
+
+    def __init__(self, flush_handler: Callable[[str, List[Any]], Any],
+                 window_seconds: float = 2.0, max_wait_seconds: float = 8.0,
+                 max_messages: int = 10):
+        self.flush_handler = flush_handler
+        self.window_seconds = window_seconds
+        self.max_wait_seconds = max(window_seconds, max_wait_seconds)
+        self.max_messages = max(1, max_messages)
+
+        self._pending: Dict[str, _PendingBurst] = {}
+        self._deadlines = []  # heap de (deadline, wa_id)
+        self._condition = threading.Condition()
+        self._running = True
+
+        self._received = 0
+        self._flushes = 0
+
+        self._timer_thread = threading.Thread(target=self._timer_loop, name="debounce-timer", daemon=True)
+        self._timer_thread.start()
+
+    def submit(self, event: Any):
+        """Añade un mensaje a la ráfaga de su cliente"""
+        now = time.monotonic()
+        flush_now = None
+        with self._condition:
+            self._received += 1
+            burst = self._pending.get(event.wa_id)
+            if burst is None:
+                burst = _PendingBurst(first_at=now)
+                self._pending[event.wa_id] = burst
+            burst.events.append(event)
+
+            if len(burst.events) >= self.max_messages:
+                flush_now = self._pending.pop(event.wa_id)
+            else:
+                burst.deadline = min(now + self.window_seconds, burst.first_at + self.max_wait_seconds)
+                heapq.heappush(self._deadlines, (burst.deadline, event.wa_id))
+                self._condition.notify()
+
+        if flush_now is not None:
+            self._dispatch(event.wa_id, flush_now.events)
+
+    def _timer_loop(self):
+        """Hilo único que vence las ventanas de todos los clientes"""
+        while True:
+            with self._condition:
+                expired = self._wait_for_expired()
+            if expired is None:
+                return
+            # El handler corre sin el lock, como en flush_all: submit no se bloquea mientras tanto
+            for wa_id, burst in expired:
+                self._dispatch(wa_id, burst.events)
+
+    def _wait_for_expired(self) -> Optional[List[Tuple[str, _PendingBurst]]]:
+        """Espera (con el lock tomado) a que venzan ventanas y las retira; None al detenerse"""
+        while self._running:
+            if not self._deadlines:
+                self._condition.wait()
+                continue
+
+            now = time.monotonic()
+            if self._deadlines[0][0] > now:
+                self._condition.wait(timeout=self._deadlines[0][0] - now)
+                continue
+
+            expired = []
+            while self._deadlines and self._deadlines[0][0] <= now:
+                deadline, wa_id = heapq.heappop(self._deadlines)
+                burst = self._pending.get(wa_id)
+                # Entradas obsoletas: la ventana se extendió o ya se despachó
+                if burst is not None and burst.deadline == deadline:
+                    del self._pending[wa_id]
+                    expired.append((wa_id, burst))
+            if expired:
+                return expired
+        return None
+
+    def _dispatch(self, wa_id: str, events: List[Any]):
+        """Entrega la ráfaga completa al handler"""
+        with self._condition:
+            self._flushes += 1
+        logging.info(f"Respondiendo {len(events)} mensaje(s) agrupados de {wa_id}")
+        try:
+            self.flush_handler(wa_id, events)
+        except Exception as e:
+            logging.error(f"Error respondiendo mensajes agrupados de {wa_id}: {e}", exc_info=True)
+
+    def flush_all(self):
+        """Despacha de inmediato todas las ráfagas pendientes"""
+        with self._condition:
+            pending, self._pending = self._pending, {}
+            self._deadlines.clear()
+        for wa_id, burst in pending.items():
+            self._dispatch(wa_id, burst.events)
+
+    def stop(self):
+        """Despacha lo pendiente y detiene el temporizador"""
+        self.flush_all()
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Mensajes recibidos frente a runs disparados"""
+        with self._condition:
+            return {
+                "window_seconds": self.window_seconds,
+                "pending_customers": len(self._pending),
+                "pending_messages": sum(len(b.events) for b in self._pending.values()),
+                "received_messages": self._received,
+                "flushes": self._flushes,
+                "messages_per_flush": round(self._received / self._flushes, 2) if self._flushes else 0.0,
+            }
+
+
+# Instancia global (None cuando la ventana es 0)
+message_debouncer: Optional[MessageDebouncer] = None
+
+
+def init_message_debouncer(app, flush_handler: Callable[[str, List[Any]], Any]) -> Optional[MessageDebouncer]:
+    """Crea el debouncer global si DEBOUNCE_WINDOW_SECONDS > 0"""
+    global message_debouncer
+    window = app.config.get("DEBOUNCE_WINDOW_SECONDS", 0)
+    if not window or window <= 0:
+        return None
+
+    if message_debouncer is None:
+        message_debouncer = MessageDebouncer(
+            flush_handler,
+            window_seconds=window,
+            max_wait_seconds=app.config.get("DEBOUNCE_MAX_WAIT_SECONDS", 8.0),
+            max_messages=app.config.get("DEBOUNCE_MAX_MESSAGES", 10),
+        )
+        register_metrics_provider("debounce", message_debouncer.stats)
+    return message_debouncer
+
+
+def get_message_debouncer() -> Optional[MessageDebouncer]:
+    """Retorna el debouncer global o None si no está activo"""
+    return message_debouncer
@@ -0,0 +1,241 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.utils.metrics import register_metrics_provider
+
+
+class DatabaseDedupStore:
+    """
+    Nivel persistente compartido entre workers/procesos.
+
+    Usa la clave primaria de `mensajes_procesados`: el INSERT IGNORE solo
+    afecta una fila la primera vez que se ve un id de mensaje.
+    """
+
+    def __init__(self, session_factory: Callable, ttl_seconds: int, purge_every: int = 1000):
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds
+        self.purge_every = purge_every
+        self._inserts = 0
+        self._lock = threading.Lock()
+
+    def mark_if_new(self, message_id: str) -> bool:
+        """Registra el id; retorna True si no existía"""
+        with self.session_factory() as session:
+            result = session.execute(
+                text("INSERT IGNORE INTO mensajes_procesados (wa_message_id) VALUES (:id)"),
+                {"id": message_id}
+            )
+            session.commit()
+            is_new = result.rowcount == 1
+
+        with self._lock:
+            self._inserts += 1
+            should_purge = self._inserts % self.purge_every == 0
+        if should_purge:
+            self.purge_expired()
+        return is_new
+
+    def forget(self, message_id: str):
+        """Elimina el id para que un reintento de Meta vuelva a procesarse"""
+        with self.session_factory() as session:
+            session.execute(
+                text("DELETE FROM mensajes_procesados WHERE wa_message_id = :id"),
+                {"id": message_id}
+            )
+            session.commit()
+
+    def purge_expired(self):
+        """Elimina ids más antiguos que el TTL"""
+        try:
+            with self.session_factory() as session:
+                session.execute(
+                    text("""
+                        DELETE FROM mensajes_procesados
+                        WHERE fecha_recepcion < NOW() - INTERVAL :ttl SECOND
+                    """),
+                    {"ttl": self.ttl_seconds}
+                )
+                session.commit()
+        except SQLAlchemyError as e:
+            logging.error(f"Error purgando mensajes procesados: {e}")
+
+
+class MessageDeduplicator:
+    """
+    Descarta reintentos del webhook por id de mensaje de WhatsApp.
+
+    Nivel 1: LRU en memoria con TTL. Nivel 2 (opcional): almacén persistente
+    compartido para despliegues con varios workers.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: int = 86400,
+                 persistent_store: Optional[DatabaseDedupStore] = None):
+        self.max_size = max(1, max_size)
+        self.ttl_seconds = ttl_seconds
+        self.persistent_store = persistent_store
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._memory_hits = 0
+        self._persistent_hits = 0
+        self._misses = 0
+        self._forgotten = 0
+        self._persistent_errors = 0
+
+    def _purge_expired(self, now: float):
+        """Elimina de la cabeza del LRU las entradas vencidas"""
+        while self._seen:
+            _, expires_at = next(iter(self._seen.items()))
+            if expires_at > now:
+                break
+            self._seen.popitem(last=False)
+
+    def _remember(self, message_id: str, now: float):
+        """Guarda el id en memoria respetando el tamaño máximo"""
+        self._seen[message_id] = now + self.ttl_seconds
+        self._seen.move_to_end(message_id)
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+    def is_duplicate(self, message_id: Optional[str]) -> bool:
+        """Retorna True si el mensaje ya fue recibido; si no, lo marca como visto"""
+        if not message_id:
+            return False
+
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            if message_id in self._seen:
+                self._memory_hits += 1
+                return True
+            # Se marca antes de consultar el nivel persistente para que un
+            # reintento concurrente en este proceso también se descarte
+            self._remember(message_id, now)
+
+        if self.persistent_store is not None:
+            try:
+                if not self.persistent_store.mark_if_new(message_id):
+                    with self._lock:
+                        self._persistent_hits += 1
+                    return True
+            except SQLAlchemyError as e:
+                # Si la base de datos falla es preferible procesar a perder el mensaje
+                logging.error(f"Error consultando deduplicación persistente: {e}")
+                with self._lock:
+                    self._persistent_errors += 1
+
+        with self._lock:
+            self._misses += 1
+        return False
+
+    def forget(self, message_id: Optional[str]):
+        """
+        Desmarca un mensaje que se aceptó pero no se llegó a procesar (p. ej.
+        cola de la conversación llena), para que el reintento de Meta no se
+        descarte como duplicado
+        """
+        if not message_id:
+            return
+        with self._lock:
+            self._seen.pop(message_id, None)
+            self._forgotten += 1
+
+        if self.persistent_store is not None:
+            try:
+                self.persistent_store.forget(message_id)
+            except SQLAlchemyError as e:
+                logging.error(f"Error desmarcando mensaje procesado {message_id}: {e}")
+                with self._lock:
+                    self._persistent_errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos/fallos para medir el tráfico de reintentos"""
+        with self._lock:
+            hits = self._memory_hits + self._persistent_hits
+            total = hits + self._misses
+            return {
+                "size": len(self._seen),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "persistent": self.persistent_store is not None,
+                "hits": hits,
+                "memory_hits": self._memory_hits,
+                "persistent_hits": self._persistent_hits,
+                "misses": self._misses,
+                "forgotten": self._forgotten,
+                "persistent_errors": self._persistent_errors,
+                "hit_ratio": round(hits / total, 4) if total else 0.0,
+            }
+
+
+# Instancia global (None cuando la deduplicación está desactivada)
+message_deduplicator: Optional[MessageDeduplicator] = None
+
+
+def init_message_deduplicator(config: Dict[str, Any], session_factory: Optional[Callable] = None) -> Optional[MessageDeduplicator]:
+    """Crea el deduplicador global a partir de la configuración"""
+    global message_deduplicator
+    if not config.get("DEDUP_ENABLED", True):
+        return None
+
+    if message_deduplicator is None:
+        ttl_seconds = config.get("DEDUP_TTL_SECONDS", 86400)
+        persistent_store = None
+        if config.get("DEDUP_PERSISTENT") and session_factory is not None:
+            persistent_store = DatabaseDedupStore(session_factory, ttl_seconds)
+        elif config.get("DEDUP_PERSISTENT"):
+            logging.warning("DEDUP_PERSISTENT activo sin sesión de base de datos; solo se usará memoria")
+
+        message_deduplicator = MessageDeduplicator(
+            max_size=config.get("DEDUP_MAX_SIZE", 10000),
+            ttl_seconds=ttl_seconds,
+            persistent_store=persistent_store,
+        )
+        register_metrics_provider("deduplication", message_deduplicator.stats)
+    return message_deduplicator
+
+
+def get_message_deduplicator() -> Optional[MessageDeduplicator]:
+    """Retorna el deduplicador global o None si no está activo"""
+    return message_deduplicator
+
+
+def discard_duplicate_events(events: List[Any]) -> Tuple[List[Any], List[Dict[str, Any]]]:
+    """
+    Separa los eventos nuevos de los reintentos ya recibidos.
+
+    Retorna (eventos nuevos, estados de los duplicados). Sin deduplicador
+    activo todos los eventos se consideran nuevos.
+    """
+    deduplicator = get_message_deduplicator()
+    if deduplicator is None:
+        return list(events), []
+
+    fresh, duplicates = [], []
+    for event in events:
+        if deduplicator.is_duplicate(event.message_id):
+            logging.info(f"Mensaje duplicado descartado: {event.message_id}")
+            duplicates.append({
+                "message_id": event.message_id,
+                "wa_id": event.wa_id,
+                "status": "duplicate",
+            })
+        else:
+            fresh.append(event)
+    return fresh, duplicates
+
+
+def forget_events(events: List[Any]):
+    """Desmarca eventos rechazados sin procesar para que su reintento se atienda"""
+    deduplicator = get_message_deduplicator()
+    if deduplicator is None:
+        return
+    for event in events:
+        deduplicator.forget(event.message_id)
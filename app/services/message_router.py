@@ -0,0 +1,357 @@
+import logging
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.services.openai_rate_limiter import PRIORITY_ORDER, ConversationPriority
+from app.services.response_cache import normalize_question, stem_token
+from app.utils.metrics import register_metrics_provider
+
+# Rutas posibles de un mensaje
+ROUTE_GREETING = "greeting"    # Saludo sin más contenido: respuesta fija
+ROUTE_CATALOG = "catalog"      # Precio o stock: respuesta desde la tabla productos
+ROUTE_CANNED = "canned"        # Charla sin intención de compra: respuesta fija
+ROUTE_ASSISTANT = "assistant"  # Compra, soporte o dudas: se envía al asistente
+
+# Intención → ruta
+INTENT_ROUTES = {
+    "price": ROUTE_CATALOG,
+    "stock": ROUTE_CATALOG,
+    "chitchat": ROUTE_CANNED,
+    "purchase": ROUTE_ASSISTANT,
+    "support": ROUTE_ASSISTANT,
+}
+
+# Un mensaje formado solo por estas palabras es un saludo
+GREETING_WORDS = frozenset({
+    "hola", "holas", "holi", "buenas", "buenos", "buen", "dia", "dias", "tarde", "tardes",
+    "noche", "noches", "saludos", "hey", "ola", "que", "tal",
+})
+# Palabras de saludo que se quitan antes de clasificar el resto del mensaje
+GREETING_PREFIX_WORDS = frozenset({
+    "hola", "holas", "holi", "buenas", "buenos", "buen", "dias", "tardes", "noches", "saludos", "hey", "ola",
+})
+
+# Ejemplos etiquetados con los que se construyen los centroides TF-IDF
+TRAINING_SAMPLES: Dict[str, Tuple[str, ...]] = {
+    "price": (
+        "cuanto cuesta", "cual es el precio", "precio del garrafon", "a cuanto esta el agua",
+        "que precio tiene", "cuanto vale", "cuanto sale el bidon", "precios por favor",
+        "lista de precios", "cuanto cobran", "costo del producto", "cuanto es el botellon",
+        "que precio tienen los garrafones", "cuanto cuestan las botellas", "valor del agua",
+    ),
+    "stock": (
+        "tienen stock", "hay disponible", "les queda", "tienen garrafones",
+        "hay agua de 20 litros", "todavia tienen", "cuantas unidades hay", "esta disponible",
+        "tienen en existencia", "les quedan botellas", "hay stock de", "disponibilidad",
+        "tienen bidones disponibles", "queda algo de", "hay existencias",
+    ),
+    "chitchat": (
+        "gracias", "muchas gracias", "ok", "vale", "perfecto", "jaja", "genial", "bueno",
+        "de nada", "como estas", "que tal tu dia", "excelente gracias", "listo", "chau",
+        "adios", "hasta luego", "bendiciones", "ok gracias", "jajaja que bien", "entendido",
+    ),
+    "purchase": (
+        "quiero comprar", "quiero 2 garrafones", "me puedes enviar", "hago un pedido",
+        "quiero pedir", "necesito 3 botellas", "me mandas", "lo quiero", "como hago para comprar",
+        "quiero ordenar", "envienme", "me llevo dos", "separame uno",
+        "quiero hacer un pedido para manana", "como pago", "aceptan transferencia",
+        "delivery a mi casa", "me lo traen hoy", "quiero 5 bidones", "mandame agua",
+    ),
+    "support": (
+        "mi pedido no llego", "tengo un problema", "quiero hacer un reclamo",
+        "el producto llego roto", "quiero devolver", "no me llego", "cancelar mi pedido",
+        "hablar con un asesor", "necesito ayuda", "me cobraron mal", "necesito factura",
+        "cambiar mi direccion de entrega", "donde esta mi pedido", "el agua vino sucia",
+        "quiero hablar con una persona",
+    ),
+}
+
+GREETING_REPLY = "¡Hola{name}! ¿En qué te puedo ayudar? Puedo darte precios, stock o tomar tu pedido."
+CANNED_REPLY = "¡Gracias por escribirnos! Si necesitas precios, stock o hacer un pedido, aquí estoy."
+
+
+def extract_features(normalized: str) -> Counter:
+    """Palabras (con plural simplificado) y trigramas de caracteres por palabra"""
+    features: Counter = Counter()
+    for token in normalized.split():
+        stem = stem_token(token)
+        features["w:" + stem] += 1
+        padded = f"^{stem}$"
+        for i in range(len(padded) - 2):
+            features["c:" + padded[i:i + 3]] += 1
+    return features
+
+
+@dataclass(slots=True)
+class Product:
+    """Fila de la tabla productos usada por la ruta de catálogo"""
+    id_producto: int
+    nombre: str
+    precio: float
+    stock: int
+    tokens: frozenset
+
+
+class ProductCatalog:
+    """Copia en memoria de `productos`, refrescada cada `refresh_seconds`"""
+
+    def __init__(self, session_factory: Optional[Callable] = None, refresh_seconds: float = 60.0,
+                 rows: Optional[List[Tuple[int, str, float, int]]] = None):
+        self.session_factory = session_factory
+        self.refresh_seconds = refresh_seconds
+        self._products: List[Product] = self._build(rows or [])
+        self._loaded_at = time.monotonic() if rows is not None else float("-inf")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _build(rows) -> List[Product]:
+        return [
+            Product(
+                id_producto=row[0],
+                nombre=row[1],
+                precio=float(row[2]),
+                stock=int(row[3] or 0),
+                tokens=frozenset(stem_token(token) for token in normalize_question(row[1]).split() if len(token) > 2),
+            )
+            for row in rows
+        ]
+
+    def products(self) -> List[Product]:
+        """Productos actuales (recarga si la copia venció)"""
+        if self.session_factory is None or time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return self._products
+
+        with self._lock:
+            if time.monotonic() - self._loaded_at < self.refresh_seconds:
+                return self._products
+            self._loaded_at = time.monotonic()
+            try:
+                session = self.session_factory()
+            except RuntimeError as e:
+                logging.warning(f"Catálogo no disponible para el router: {e}")
+                return self._products
+            try:
+                rows = session.execute(
+                    text("SELECT id_producto, nombre, precio, stock FROM productos")
+                ).fetchall()
+                self._products = self._build(rows)
+            except SQLAlchemyError as e:
+                logging.error(f"Error cargando productos para el router: {e}")
+            finally:
+                session.close()
+        return self._products
+
+    def match(self, normalized: str) -> Optional[Product]:
+        """
+        Producto cuyo nombre comparte más palabras con el mensaje.
+        Retorna None si ninguno coincide o si hay empate (mensaje ambiguo).
+        """
+        tokens = {stem_token(token) for token in normalized.split() if len(token) > 2}
+        best, best_overlap, tied = None, 0, False
+        for product in self.products():
+            overlap = len(tokens & product.tokens)
+            if overlap > best_overlap:
+                best, best_overlap, tied = product, overlap, False
+            elif overlap == best_overlap and overlap > 0:
+                tied = True
+        return None if tied else best
+
+
+@dataclass(slots=True)
+class RouteDecision:
+    """Resultado del router: ruta, intención, confianza y respuesta directa (si aplica)"""
+    route: str
+    intent: str
+    confidence: float
+    response: Optional[str] = None
+
+
+class MessageRouter:
+    """
+    Clasificador local (sin red) delante del asistente.
+
+    Saludos por palabras clave; el resto por similitud coseno TF-IDF contra
+    el centroide de cada intención. Saludos, precios, stock y charla se
+    responden sin OpenAI; compra, soporte y todo lo que no se clasifica con
+    suficiente confianza se envía al asistente.
+
+    Con un pedido abierto (según `priorities`) o una conversación con el
+    asistente en los últimos `assistant_window_seconds`, precios, stock y
+    charla también van al asistente: "ok", "¿y el de 10 litros?" son parte
+    de esa conversación.
+    """
+
+    def __init__(self, catalog: Optional[ProductCatalog] = None, min_confidence: float = 0.2,
+                 samples: Dict[str, Tuple[str, ...]] = TRAINING_SAMPLES,
+                 priorities: Optional[ConversationPriority] = None,
+                 assistant_window_seconds: float = 600, max_conversations: int = 5000):
+        self.catalog = catalog or ProductCatalog()
+        self.min_confidence = min_confidence
+        self.priorities = priorities or ConversationPriority()
+        self.assistant_window_seconds = assistant_window_seconds
+        self.max_conversations = max(1, max_conversations)
+        self._idf, self._centroids = self._train(samples)
+        self._lock = threading.Lock()
+        # wa_id → instante del último mensaje enviado al asistente
+        self._with_assistant: "OrderedDict[str, float]" = OrderedDict()
+        self._routes: Counter = Counter()
+        self._held_for_assistant = 0
+        self._total_seconds = 0.0
+
+    @staticmethod
+    def _train(samples: Dict[str, Tuple[str, ...]]):
+        """IDF sobre todos los ejemplos y centroide normalizado por intención"""
+        documents = [
+            (intent, extract_features(normalize_question(sample)))
+            for intent, intent_samples in samples.items()
+            for sample in intent_samples
+        ]
+        document_frequency: Counter = Counter()
+        for _, features in documents:
+            document_frequency.update(features.keys())
+        total = len(documents)
+        idf = {feature: math.log((1 + total) / (1 + count)) + 1 for feature, count in document_frequency.items()}
+
+        centroids: Dict[str, Dict[str, float]] = {}
+        for intent in samples:
+            centroid: Counter = Counter()
+            for doc_intent, features in documents:
+                if doc_intent == intent:
+                    for feature, weight in MessageRouter._vectorize(features, idf).items():
+                        centroid[feature] += weight
+            norm = math.sqrt(sum(weight * weight for weight in centroid.values())) or 1.0
+            centroids[intent] = {feature: weight / norm for feature, weight in centroid.items()}
+        return idf, centroids
+
+    @staticmethod
+    def _vectorize(features: Counter, idf: Dict[str, float]) -> Dict[str, float]:
+        """Vector TF-IDF normalizado (las características desconocidas se ignoran)"""
+        vector = {
+            feature: (1 + math.log(count)) * idf[feature]
+            for feature, count in features.items() if feature in idf
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        return {feature: weight / norm for feature, weight in vector.items()}
+
+    def classify(self, normalized: str) -> Tuple[str, float]:
+        """Intención más probable y su similitud coseno"""
+        vector = self._vectorize(extract_features(normalized), self._idf)
+        best_intent, best_score = "purchase", 0.0
+        for intent, centroid in self._centroids.items():
+            score = sum(weight * centroid.get(feature, 0.0) for feature, weight in vector.items())
+            if score > best_score:
+                best_intent, best_score = intent, score
+        return best_intent, best_score
+
+    def route(self, messages: List[str], name: str = "", wa_id: Optional[str] = None) -> RouteDecision:
+        """Decide la ruta para uno o varios mensajes consecutivos del cliente"""
+        started_at = time.perf_counter()
+        decision = self._decide(normalize_question(" ".join(messages)), name)
+        if decision.route in (ROUTE_CANNED, ROUTE_CATALOG) and wa_id and self._in_conversation(wa_id):
+            decision = RouteDecision(ROUTE_ASSISTANT, decision.intent, decision.confidence)
+            with self._lock:
+                self._held_for_assistant += 1
+        if decision.route == ROUTE_ASSISTANT and wa_id:
+            self._remember_assistant(wa_id)
+        with self._lock:
+            self._routes[decision.route] += 1
+            self._total_seconds += time.perf_counter() - started_at
+        return decision
+
+    def _in_conversation(self, wa_id: str) -> bool:
+        """Pedido abierto o intercambio reciente con el asistente"""
+        with self._lock:
+            last = self._with_assistant.get(wa_id)
+            if last is not None and time.monotonic() - last >= self.assistant_window_seconds:
+                del self._with_assistant[wa_id]
+                last = None
+        return last is not None or self.priorities.get(wa_id) == PRIORITY_ORDER
+
+    def _remember_assistant(self, wa_id: str):
+        with self._lock:
+            self._with_assistant[wa_id] = time.monotonic()
+            self._with_assistant.move_to_end(wa_id)
+            while len(self._with_assistant) > self.max_conversations:
+                self._with_assistant.popitem(last=False)
+
+    def _decide(self, normalized: str, name: str) -> RouteDecision:
+        words = normalized.split()
+        if not words:
+            return RouteDecision(ROUTE_ASSISTANT, "empty", 0.0)
+
+        # Saludo puro ("hola", "buenas tardes"); si hay más contenido se clasifica el resto
+        if all(word in GREETING_WORDS for word in words):
+            greeting_name = f" {name.split()[0]}" if name else ""
+            return RouteDecision(ROUTE_GREETING, "greeting", 1.0, GREETING_REPLY.format(name=greeting_name))
+        content = [word for word in words if word not in GREETING_PREFIX_WORDS] or words
+
+        intent, confidence = self.classify(" ".join(content))
+        if confidence < self.min_confidence:
+            return RouteDecision(ROUTE_ASSISTANT, intent, confidence)
+
+        route = INTENT_ROUTES[intent]
+        if route == ROUTE_CANNED:
+            return RouteDecision(ROUTE_CANNED, intent, confidence, CANNED_REPLY)
+        if route == ROUTE_CATALOG:
+            response = self._catalog_response(intent, normalized)
+            if response is None:
+                # Producto no identificado: el asistente pide la aclaración
+                return RouteDecision(ROUTE_ASSISTANT, intent, confidence)
+            return RouteDecision(ROUTE_CATALOG, intent, confidence, response)
+        return RouteDecision(ROUTE_ASSISTANT, intent, confidence)
+
+    def _catalog_response(self, intent: str, normalized: str) -> Optional[str]:
+        """Precio o stock del producto mencionado, leído del catálogo"""
+        product = self.catalog.match(normalized)
+        if product is None:
+            return None
+        if intent == "price":
+            return f"El precio de *{product.nombre}* es {product.precio:.2f}. ¿Te gustaría hacer un pedido?"
+        if product.stock > 0:
+            return f"Sí, tenemos {product.stock} unidades de *{product.nombre}* disponibles. ¿Cuántas necesitas?"
+        return f"Por ahora no tenemos stock de *{product.nombre}*. ¿Te interesa otro producto?"
+
+    def stats(self) -> Dict[str, Any]:
+        """Mensajes por ruta y latencia media de clasificación"""
+        with self._lock:
+            total = sum(self._routes.values())
+            return {
+                "routed": dict(self._routes),
+                "answered_locally": total - self._routes[ROUTE_ASSISTANT],
+                "held_for_assistant": self._held_for_assistant,
+                "avg_route_microseconds": round(self._total_seconds / total * 1e6, 1) if total else 0.0,
+            }
+
+
+# Instancia global del router (None si está desactivado)
+message_router: Optional[MessageRouter] = None
+
+
+def init_message_router(config: Dict[str, Any], session_factory: Optional[Callable] = None) -> Optional[MessageRouter]:
+    """Crea el router global a partir de la configuración"""
+    global message_router
+    if not config.get("MESSAGE_ROUTER_ENABLED", False):
+        return None
+
+    if message_router is None:
+        catalog = ProductCatalog(session_factory, refresh_seconds=config.get("MESSAGE_ROUTER_CATALOG_REFRESH_SECONDS", 60.0))
+        message_router = MessageRouter(
+            catalog,
+            min_confidence=config.get("MESSAGE_ROUTER_MIN_CONFIDENCE", 0.2),
+            priorities=ConversationPriority(session_factory),
+            assistant_window_seconds=config.get("MESSAGE_ROUTER_ASSISTANT_WINDOW_SECONDS", 600.0),
+        )
+        register_metrics_provider("message_router", message_router.stats)
+    return message_router
+
+
+def get_message_router() -> Optional[MessageRouter]:
+    """Retorna el router global o None si no está activo"""
+    return message_router
@@ -0,0 +1,289 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+# Carriles de prioridad (menor valor = se atiende antes)
+PRIORITY_ORDER = 0       # Pedido abierto o compra en curso
+PRIORITY_CUSTOMER = 1    # Cliente registrado sin pedido abierto
+PRIORITY_NEW = 2         # Contacto nuevo o consulta general
+PRIORITY_BACKGROUND = 3  # Resúmenes y otras tareas sin cliente esperando
+
+PRIORITY_NAMES = {
+    PRIORITY_ORDER: "order",
+    PRIORITY_CUSTOMER: "customer",
+    PRIORITY_NEW: "new",
+    PRIORITY_BACKGROUND: "background",
+}
+
+# Segundos de recarga de cada cubeta que un carril no puede usar: quedan
+# para los carriles de mayor prioridad que lleguen después
+LANE_RESERVE_SECONDS = {
+    PRIORITY_ORDER: 0.0,
+    PRIORITY_CUSTOMER: 1.0,
+    PRIORITY_NEW: 3.0,
+    PRIORITY_BACKGROUND: 6.0,
+}
+
+
+class TokenBucket:
+    """Cubeta que se recarga a `capacity` por minuto; el nivel puede quedar negativo"""
+
+    def __init__(self, capacity: float):
+        self.capacity = float(capacity)
+        self.level = float(capacity)
+        self._updated_at = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / 60.0
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def seconds_until(self, level: float) -> float:
+        return max(0.0, (level - self.level) / self.rate) if self.rate else float("inf")
+
+
+def _header_number(headers: httpx.Headers, name: str) -> Optional[float]:
+    value = headers.get(name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class OpenAIRateLimiter:
+    """
+    Limitador del lado del cliente para la API de OpenAI: una cubeta de
+    solicitudes (RPM) y otra de tokens (TPM).
+
+    Las respuestas del asistente piden turno con `reserve()` según su carril:
+    se atiende primero el carril de mayor prioridad y cada carril deja libre
+    unos segundos de recarga (LANE_RESERVE_SECONDS) para los de arriba. Las demás
+    llamadas (polling, threads, cancelaciones) se descuentan sin esperar
+    desde el hook de httpx del cliente OpenAI.
+
+    Los headers x-ratelimit-* de cada respuesta ajustan el límite y bajan el
+    nivel local al que informa OpenAI, que también cuenta lo consumido por
+    otros procesos con la misma API key.
+    """
+
+    def __init__(self, requests_per_minute: float = 500, tokens_per_minute: float = 200000,
+                 max_wait_seconds: float = 10.0):
+        self.max_wait_seconds = max_wait_seconds
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._cond = threading.Condition()
+        self._waiters: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._local = threading.local()
+
+        self._admitted = {priority: 0 for priority in PRIORITY_NAMES}
+        self._rejected = {priority: 0 for priority in PRIORITY_NAMES}
+        self._wait_seconds = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self._untracked_requests = 0
+        self._header_updates = 0
+        self._throttled_responses = 0
+
+    def reset_after_fork(self):
+        """En el hijo de un fork: condición nueva y sin esperas heredadas"""
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._local = threading.local()
+
+    def _required_levels(self, priority: int, tokens: float) -> Tuple[float, float]:
+        """Nivel mínimo de cada cubeta para admitir la llamada en el carril"""
+        reserve = LANE_RESERVE_SECONDS.get(priority, 0.0)
+        requests = min(self._requests.capacity, 1 + reserve * self._requests.rate)
+        tokens = min(self._tokens.capacity, tokens + reserve * self._tokens.rate)
+        return requests, tokens
+
+    def _has_capacity(self, priority: int, tokens: float) -> bool:
+        requests_needed, tokens_needed = self._required_levels(priority, tokens)
+        return self._requests.level >= requests_needed and self._tokens.level >= tokens_needed
+
+    def _seconds_until_capacity(self, priority: int, tokens: float) -> float:
+        requests_needed, tokens_needed = self._required_levels(priority, tokens)
+        return max(self._requests.seconds_until(requests_needed), self._tokens.seconds_until(tokens_needed))
+
+    def acquire(self, priority: int, tokens: float = 0, timeout: Optional[float] = None) -> bool:
+        """
+        Espera turno (una solicitud y `tokens` estimados) como máximo
+        `timeout` segundos; False si no lo consiguió a tiempo.
+        """
+        timeout = self.max_wait_seconds if timeout is None else timeout
+        started_at = time.monotonic()
+        deadline = started_at + timeout
+        ticket = (priority, next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._requests.refill(now)
+                    self._tokens.refill(now)
+                    if self._waiters[0] == ticket and self._has_capacity(priority, tokens):
+                        self._requests.level -= 1
+                        self._tokens.level -= tokens
+                        self._admitted[priority] += 1
+                        self._wait_seconds[priority] += now - started_at
+                        return True
+                    if now >= deadline:
+                        self._rejected[priority] += 1
+                        return False
+                    wait = self._seconds_until_capacity(priority, tokens) if self._waiters[0] == ticket else 0.05
+                    self._cond.wait(min(deadline - now, max(wait, 0.005)))
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, priority: int, tokens: float = 0, timeout: Optional[float] = None) -> Iterator[bool]:
+        """
+        `acquire` para una respuesta completa: la primera llamada HTTP del
+        hilo dentro del bloque usa la solicitud ya descontada.
+        """
+        admitted = self.acquire(priority, tokens, timeout)
+        self._local.prepaid = 1 if admitted else 0
+        try:
+            yield admitted
+        finally:
+            self._local.prepaid = 0
+
+    def on_request(self, request: httpx.Request):
+        """Hook de httpx: descuenta las llamadas que no pasaron por `reserve`"""
+        if getattr(self._local, "prepaid", 0):
+            self._local.prepaid -= 1
+            return
+        with self._cond:
+            self._requests.refill(time.monotonic())
+            self._requests.level -= 1
+            self._untracked_requests += 1
+
+    def on_response(self, response: httpx.Response):
+        """Hook de httpx: adapta límites y niveles a los headers x-ratelimit-*"""
+        headers = response.headers
+        limit_requests = _header_number(headers, "x-ratelimit-limit-requests")
+        limit_tokens = _header_number(headers, "x-ratelimit-limit-tokens")
+        remaining_requests = _header_number(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _header_number(headers, "x-ratelimit-remaining-tokens")
+        if response.status_code == 429 and remaining_requests is None:
+            # 429 sin headers: esperar a que la cubeta se recargue
+            remaining_requests = 0
+        if limit_requests is None and limit_tokens is None and remaining_requests is None and remaining_tokens is None:
+            return
+
+        with self._cond:
+            now = time.monotonic()
+            for bucket, limit, remaining in (
+                (self._requests, limit_requests, remaining_requests),
+                (self._tokens, limit_tokens, remaining_tokens),
+            ):
+                bucket.refill(now)
+                if limit:
+                    bucket.capacity = limit
+                if remaining is not None:
+                    bucket.level = min(bucket.level, remaining)
+            self._header_updates += 1
+            if response.status_code == 429:
+                self._throttled_responses += 1
+            self._cond.notify_all()
+
+    def event_hooks(self) -> Dict[str, List[Callable]]:
+        """Hooks para el httpx.Client del cliente OpenAI"""
+        return {"request": [self.on_request], "response": [self.on_response]}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            lanes = {
+                name: {
+                    "admitted": self._admitted[priority],
+                    "rejected": self._rejected[priority],
+                    "avg_wait_ms": round(self._wait_seconds[priority] / self._admitted[priority] * 1000, 1)
+                    if self._admitted[priority] else 0.0,
+                }
+                for priority, name in PRIORITY_NAMES.items()
+            }
+            return {
+                "requests_per_minute": self._requests.capacity,
+                "tokens_per_minute": self._tokens.capacity,
+                "requests_available": round(self._requests.level, 1),
+                "tokens_available": round(self._tokens.level),
+                "waiting": len(self._waiters),
+                "untracked_requests": self._untracked_requests,
+                "header_updates": self._header_updates,
+                "throttled_responses": self._throttled_responses,
+                "lanes": lanes,
+            }
+
+
+class ConversationPriority:
+    """
+    Carril de cada cliente según la base de datos: pedido abierto en
+    `pedidos` (pendiente o enviado), cliente registrado o contacto nuevo. Se cachea por
+    `ttl_seconds`; sin base de datos todos quedan como contacto nuevo.
+    """
+
+    def __init__(self, session_factory: Optional[Callable] = None, ttl_seconds: float = 60.0,
+                 max_size: int = 5000):
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max(1, max_size)
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, wa_id: str) -> int:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(wa_id)
+            if entry is not None and now - entry[1] < self.ttl_seconds:
+                self._entries.move_to_end(wa_id)
+                return entry[0]
+
+        priority = self._load(wa_id)
+        with self._lock:
+            self._entries[wa_id] = (priority, now)
+            self._entries.move_to_end(wa_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return priority
+
+    def _load(self, wa_id: str) -> int:
+        if self.session_factory is None:
+            return PRIORITY_NEW
+        try:
+            session = self.session_factory()
+        except RuntimeError:
+            return PRIORITY_NEW
+        try:
+            row = session.execute(
+                text("""
+                    SELECT c.id_cliente,
+                           EXISTS(SELECT 1 FROM pedidos p
+                                  WHERE p.id_cliente = c.id_cliente AND p.estado IN ('pendiente', 'enviado'))
+                    FROM clientes c WHERE c.telefono = :telefono
+                """),
+                {"telefono": wa_id}
+            ).fetchone()
+        except SQLAlchemyError as e:
+            logging.warning(f"No se pudo leer la prioridad de {wa_id}: {e}")
+            return PRIORITY_NEW
+        finally:
+            session.close()
+        if row is None:
+            return PRIORITY_NEW
+        return PRIORITY_ORDER if row[1] else PRIORITY_CUSTOMER
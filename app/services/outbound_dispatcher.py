@@ -0,0 +1,334 @@
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.utils.metrics import register_metrics_provider
+from app.utils.resilience import retry_after_seconds
+
+# Prioridades de envío (menor valor = sale antes)
+SEND_PRIORITY_REPLY = 0  # Respuestas a un cliente que está conversando
+SEND_PRIORITY_BULK = 1   # Difusiones y otros envíos masivos
+
+SEND_PRIORITY_NAMES = {SEND_PRIORITY_REPLY: "reply", SEND_PRIORITY_BULK: "bulk"}
+
+# Códigos de error de Meta por exceso de envíos del número emisor
+THROTTLING_ERROR_CODES = frozenset({4, 80007, 130429})
+
+
+class OutboundQueueFullError(RuntimeError):
+    """La cola de envíos masivos alcanzó su límite"""
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """429 o error de Meta por límite de throughput del número emisor"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return False
+    if response.status_code == 429:
+        return True
+    try:
+        code = response.json().get("error", {}).get("code")
+    except (ValueError, AttributeError):
+        return False
+    return code in THROTTLING_ERROR_CODES
+
+
+@dataclass
+class OutboundMessage:
+    """Envío pendiente: POST a `path` del número emisor con los argumentos de `request`"""
+    phone_number_id: str
+    path: str
+    request: Dict[str, Any]
+    priority: int = SEND_PRIORITY_REPLY
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+
+class _PhoneLane:
+    """Cubeta de envíos por segundo, cola por prioridad y backoff de un número emisor"""
+
+    def __init__(self, messages_per_second: float, burst: float):
+        self.rate = messages_per_second
+        self.burst = max(1.0, burst)
+        self.level = self.burst
+        self.updated_at = time.monotonic()
+        self.heap: List[Tuple[int, int, OutboundMessage]] = []
+        self.backoff_until = 0.0
+        self.consecutive_throttles = 0
+        self.sent_at: Deque[float] = deque(maxlen=10000)
+        self.throttled = 0
+
+    def refill(self, now: float):
+        self.level = min(self.burst, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def seconds_until_ready(self, now: float) -> float:
+        wait = max(0.0, self.backoff_until - now)
+        if self.level < 1:
+            wait = max(wait, (1 - self.level) / self.rate)
+        return wait
+
+
+class OutboundDispatcher:
+    """
+    Cola de salida hacia la Graph API por la que pasan todos los mensajes.
+
+    Cada número emisor (PHONE_NUMBER_ID) tiene su cubeta de mensajes por
+    segundo y su cola: las respuestas conversacionales salen antes que los
+    envíos masivos. `num_workers` hilos envían en paralelo sobre el pool
+    keep-alive del GraphClient. Si Meta responde 429 o un error de
+    throughput, el número entero espera (backoff exponencial o Retry-After)
+    y el mensaje vuelve a la cola con su turno original.
+    """
+
+    def __init__(self, sender: Callable[[OutboundMessage], Any], default_phone_number_id: Optional[str] = None,
+                 num_workers: int = 8, messages_per_second: float = 80.0, burst: Optional[float] = None,
+                 max_bulk_queue: int = 10000, max_attempts: int = 5, max_backoff_seconds: float = 60.0,
+                 stats_window: int = 1000):
+        self.sender = sender
+        self.default_phone_number_id = default_phone_number_id
+        self.num_workers = max(1, num_workers)
+        self.messages_per_second = max(0.1, messages_per_second)
+        self.burst = burst if burst is not None else self.messages_per_second
+        self.max_bulk_queue = max(1, max_bulk_queue)
+        self.max_attempts = max(1, max_attempts)
+        self.max_backoff_seconds = max_backoff_seconds
+
+        self._lanes: Dict[str, _PhoneLane] = {}
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._pid: Optional[int] = None
+        self._stopping = False
+
+        self._queued = {priority: 0 for priority in SEND_PRIORITY_NAMES}
+        self._wait_times = {priority: deque(maxlen=stats_window) for priority in SEND_PRIORITY_NAMES}
+        self._in_flight = 0
+        self._sent = 0
+        self._failed = 0
+        self._rejected = 0
+
+    def submit(self, request: Dict[str, Any], priority: int = SEND_PRIORITY_REPLY,
+               phone_number_id: Optional[str] = None, path: str = "messages") -> Future:
+        """
+        Encola un envío; el Future recibe la respuesta HTTP o la excepción.
+        Los envíos masivos se rechazan (OutboundQueueFullError) con la cola
+        llena; las respuestas siempre se aceptan.
+        """
+        message = OutboundMessage(
+            phone_number_id=phone_number_id or self.default_phone_number_id,
+            path=path,
+            request=request,
+            priority=priority,
+        )
+        self._ensure_started()
+        with self._cond:
+            if priority != SEND_PRIORITY_REPLY and self._queued[priority] >= self.max_bulk_queue:
+                self._rejected += 1
+                message.future.set_exception(OutboundQueueFullError("Cola de envíos masivos llena"))
+                return message.future
+            self._push(message, next(self._sequence))
+            self._cond.notify()
+        return message.future
+
+    def _push(self, message: OutboundMessage, sequence: int):
+        lane = self._lanes.get(message.phone_number_id)
+        if lane is None:
+            lane = self._lanes[message.phone_number_id] = _PhoneLane(self.messages_per_second, self.burst)
+        heapq.heappush(lane.heap, (message.priority, sequence, message))
+        self._queued[message.priority] += 1
+
+    def _ensure_started(self):
+        """Arranca los hilos en el primer envío de cada proceso (los hilos no sobreviven a un fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Hijo de un fork: la cola heredada pertenece al padre
+                self._cond = threading.Condition()
+                self._lanes = {}
+                self._queued = {priority: 0 for priority in SEND_PRIORITY_NAMES}
+                self._in_flight = 0
+            self._pid = os.getpid()
+            self._stopping = False
+            self._threads = [
+                threading.Thread(target=self._worker_loop, name=f"outbound-{i}", daemon=True)
+                for i in range(self.num_workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+        logging.info(f"Despachador de salida iniciado con {self.num_workers} hilos")
+
+    def stop(self, timeout: float = 5.0):
+        """Envía lo pendiente (hasta `timeout` segundos) y detiene los hilos"""
+        with self._cond:
+            self._stopping = True
+            threads, self._threads = self._threads, []
+            self._cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+
+    def _next_message(self) -> Optional[Tuple[_PhoneLane, int, OutboundMessage]]:
+        """Bloquea hasta que algún número tenga cupo; None al detenerse sin pendientes"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                best = None
+                wait = None
+                for lane in self._lanes.values():
+                    if not lane.heap:
+                        continue
+                    lane.refill(now)
+                    lane_wait = lane.seconds_until_ready(now)
+                    if lane_wait > 0:
+                        wait = lane_wait if wait is None else min(wait, lane_wait)
+                    elif best is None or lane.heap[0][:2] < best.heap[0][:2]:
+                        best = lane
+                if best is not None:
+                    _, sequence, message = heapq.heappop(best.heap)
+                    best.level -= 1
+                    self._queued[message.priority] -= 1
+                    self._in_flight += 1
+                    return best, sequence, message
+                if self._stopping and wait is None:
+                    return None
+                self._cond.wait(wait)
+
+    def _worker_loop(self):
+        while True:
+            next_message = self._next_message()
+            if next_message is None:
+                break
+            lane, sequence, message = next_message
+            self._deliver(lane, sequence, message)
+
+    def _deliver(self, lane: _PhoneLane, sequence: int, message: OutboundMessage):
+        # Un envío cancelado antes de salir (p. ej. difusión interrumpida) se descarta
+        if message.attempts == 0 and not message.future.set_running_or_notify_cancel():
+            with self._cond:
+                self._in_flight -= 1
+            return
+        started_at = time.monotonic()
+        message.attempts += 1
+        try:
+            response = self.sender(message)
+        except Exception as error:
+            throttled = is_throttling_error(error)
+            with self._cond:
+                self._in_flight -= 1
+                if throttled:
+                    self._throttle(lane, error)
+                if throttled and message.attempts < self.max_attempts:
+                    # Mantiene su turno original dentro de la cola del número
+                    self._push(message, sequence)
+                    self._cond.notify_all()
+                    return
+                self._failed += 1
+            message.future.set_exception(error)
+            return
+
+        with self._cond:
+            self._in_flight -= 1
+            self._sent += 1
+            lane.consecutive_throttles = 0
+            lane.sent_at.append(time.monotonic())
+            self._wait_times[message.priority].append(started_at - message.enqueued_at)
+        message.future.set_result(response)
+
+    def _throttle(self, lane: _PhoneLane, error: BaseException):
+        """Backoff del número emisor tras un 429 (se llama con el lock tomado)"""
+        lane.throttled += 1
+        lane.consecutive_throttles += 1
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = min(self.max_backoff_seconds, 2 ** (lane.consecutive_throttles - 1))
+            delay = random.uniform(delay / 2, delay)
+        lane.level = min(lane.level, 0.0)
+        lane.backoff_until = max(lane.backoff_until, time.monotonic() + delay)
+        logging.warning(f"Throughput de Meta excedido, envíos pausados {delay:.1f}s: {error}")
+
+    @staticmethod
+    def _summarize(samples) -> Dict[str, float]:
+        """Resume una ventana de tiempos (segundos) en promedio, p95 y máximo"""
+        if not samples:
+            return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+        ordered = sorted(samples)
+        p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+        return {
+            "avg": round(sum(ordered) / len(ordered), 4),
+            "p95": round(ordered[p95_index], 4),
+            "max": round(ordered[-1], 4),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidad de la cola, envíos por segundo (últimos 10 s) y estado de cada número"""
+        with self._cond:
+            now = time.monotonic()
+            phones = {}
+            for phone_number_id, lane in self._lanes.items():
+                lane.refill(now)
+                recent = sum(1 for sent_at in lane.sent_at if now - sent_at <= 10)
+                phones[phone_number_id] = {
+                    "queue_depth": len(lane.heap),
+                    "sends_per_second": round(recent / 10, 2),
+                    "limit_per_second": lane.rate,
+                    "tokens": round(lane.level, 2),
+                    "backoff_seconds": round(max(0.0, lane.backoff_until - now), 2),
+                    "throttled": lane.throttled,
+                }
+            return {
+                "workers": self.num_workers,
+                "queue_depth": sum(self._queued.values()),
+                "queue_by_priority": {SEND_PRIORITY_NAMES[p]: n for p, n in self._queued.items()},
+                "in_flight": self._in_flight,
+                "sent": self._sent,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "sends_per_second": round(sum(phone["sends_per_second"] for phone in phones.values()), 2),
+                "wait_seconds": {
+                    SEND_PRIORITY_NAMES[p]: self._summarize(list(samples)) for p, samples in self._wait_times.items()
+                },
+                "phones": phones,
+            }
+
+
+# Instancia global (None si OUTBOUND_ENABLED está desactivado)
+outbound_dispatcher: Optional[OutboundDispatcher] = None
+
+
+def init_outbound_dispatcher(config: Dict[str, Any],
+                             sender: Callable[[OutboundMessage], Any]) -> Optional[OutboundDispatcher]:
+    """Crea el despachador global a partir de la configuración"""
+    global outbound_dispatcher
+    if not config.get("OUTBOUND_ENABLED", True):
+        return None
+    if outbound_dispatcher is None:
+        outbound_dispatcher = OutboundDispatcher(
+            sender,
+            default_phone_number_id=config.get("PHONE_NUMBER_ID"),
+            num_workers=config.get("OUTBOUND_WORKERS", 8),
+            messages_per_second=config.get("OUTBOUND_MESSAGES_PER_SECOND", 80.0),
+            burst=config.get("OUTBOUND_BURST") or None,
+            max_bulk_queue=config.get("OUTBOUND_MAX_BULK_QUEUE", 10000),
+            max_attempts=config.get("OUTBOUND_MAX_ATTEMPTS", 5),
+            max_backoff_seconds=config.get("OUTBOUND_MAX_BACKOFF_SECONDS", 60.0),
+        )
+        register_metrics_provider("outbound", outbound_dispatcher.stats)
+    return outbound_dispatcher
+
+
+def get_outbound_dispatcher() -> Optional[OutboundDispatcher]:
+    """Retorna el despachador global o None si no está activo"""
+    return outbound_dispatcher
@@ -0,0 +1,216 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.database.db_connection import obtener_conexion
+from app.database.promotions import (
+    guardar_punto_control,
+    obtener_clientes_pendientes,
+    obtener_promocion,
+    obtener_punto_control,
+    registrar_envios_promocion,
+)
+from app.services.outbound_dispatcher import SEND_PRIORITY_BULK, OutboundDispatcher, get_outbound_dispatcher
+from app.utils.metrics import register_metrics_provider
+from app.utils.whatsapp_payload import get_text_message_input, process_text_for_whatsapp
+
+BROADCAST_IN_PROGRESS = "en_curso"
+BROADCAST_COMPLETED = "completada"
+
+# Lotes enviados a la vez: mientras se confirma uno, el siguiente ya está en la cola
+CHUNKS_IN_FLIGHT = 2
+
+_Chunk = Tuple[int, List[Tuple[int, Future]]]
+
+
+def promotion_text(titulo: str, descripcion: Optional[str], descuento: Optional[float]) -> str:
+    """Texto del mensaje de una promoción"""
+    lines = [f"**{titulo}**"]
+    if descripcion:
+        lines.append(descripcion)
+    if descuento:
+        lines.append(f"Descuento: {float(descuento):g}%")
+    return "\n".join(lines)
+
+
+class PromotionBroadcast:
+    """
+    Difusión de una promoción a todos los clientes, por lotes y reanudable.
+
+    Los clientes se leen por id_cliente creciente en lotes de `chunk_size`
+    (cursor del lado del servidor) y se omiten los que ya están en
+    `clientes_promociones`. Cada lote se encola en el despachador de salida
+    como envío masivo; al confirmarse, los envíos exitosos se registran con
+    un INSERT multi-fila y el punto de control avanza en el mismo commit.
+    Si el proceso se detiene, `run()` retoma desde el último lote
+    confirmado: solo se repiten los mensajes de los lotes en vuelo.
+    """
+
+    def __init__(self, id_promocion: int, build_request: Optional[Callable[[str], Dict[str, Any]]] = None,
+                 session_factory: Callable = obtener_conexion, dispatcher: Optional[OutboundDispatcher] = None,
+                 chunk_size: int = 500, send_timeout: float = 600.0):
+        self.id_promocion = id_promocion
+        self.build_request = build_request
+        self.session_factory = session_factory
+        self.dispatcher = dispatcher
+        self.chunk_size = max(1, chunk_size)
+        self.send_timeout = send_timeout
+
+        self._lock = threading.Lock()
+        self._state = "pendiente"
+        self._last_id = 0
+        self._sent = 0
+        self._failed = 0
+        self._chunks = 0
+        self._started_at: Optional[float] = None
+
+    def run(self, restart: bool = False) -> Dict[str, Any]:
+        """Envía la promoción a los clientes pendientes; con `restart` ignora el punto de control"""
+        self._started_at = time.monotonic()
+        build_request = self.build_request or self._default_request_builder()
+        dispatcher, owned = self._resolve_dispatcher()
+
+        session = self.session_factory()
+        try:
+            checkpoint = None if restart else obtener_punto_control(session, self.id_promocion)
+        finally:
+            session.close()
+        if checkpoint is not None:
+            self._last_id, self._sent, self._failed = checkpoint[0], checkpoint[1] or 0, checkpoint[2] or 0
+            if checkpoint[3] == BROADCAST_COMPLETED:
+                self._set_state(BROADCAST_COMPLETED)
+                return self.stats()
+            logging.info(f"Difusión de la promoción {self.id_promocion} retomada desde el cliente {self._last_id}")
+
+        self._set_state(BROADCAST_IN_PROGRESS)
+        in_flight: Deque[_Chunk] = deque()
+        cursor = self._last_id
+        try:
+            while True:
+                clients = self._next_chunk(cursor)
+                if clients:
+                    cursor = clients[-1][0]
+                    futures = [
+                        (id_cliente, dispatcher.submit(build_request(telefono), priority=SEND_PRIORITY_BULK))
+                        for id_cliente, telefono in clients
+                    ]
+                    in_flight.append((cursor, futures))
+                # El lote más antiguo se confirma cuando ya hay otro encolado detrás
+                if in_flight and (len(in_flight) >= CHUNKS_IN_FLIGHT or not clients):
+                    self._commit_chunk(*in_flight.popleft())
+                if not clients and not in_flight:
+                    break
+            self._save_checkpoint([], BROADCAST_COMPLETED)
+            self._set_state(BROADCAST_COMPLETED)
+        except BaseException:
+            # Lo que aún no salió se cancela; al retomar se vuelve a leer desde el punto de control
+            for _, futures in in_flight:
+                for _, future in futures:
+                    future.cancel()
+            self._set_state("interrumpida")
+            raise
+        finally:
+            if owned:
+                dispatcher.stop()
+
+        logging.info(
+            f"Difusión de la promoción {self.id_promocion} completada: "
+            f"{self._sent} enviados, {self._failed} fallidos"
+        )
+        return self.stats()
+
+    def _default_request_builder(self) -> Callable[[str], Dict[str, Any]]:
+        """Mensaje de texto con el título, la descripción y el descuento de la promoción"""
+        session = self.session_factory()
+        try:
+            promotion = obtener_promocion(session, self.id_promocion)
+        finally:
+            session.close()
+        if promotion is None:
+            raise ValueError(f"Promoción {self.id_promocion} no encontrada")
+        body = process_text_for_whatsapp(promotion_text(*promotion))
+
+        def build(telefono: str) -> Dict[str, Any]:
+            return {"data": get_text_message_input(telefono, body), "headers": {"Content-type": "application/json"}}
+
+        return build
+
+    def _resolve_dispatcher(self) -> Tuple[OutboundDispatcher, bool]:
+        """Despachador global; si está desactivado se usa uno propio mientras dura la difusión"""
+        dispatcher = self.dispatcher or get_outbound_dispatcher()
+        if dispatcher is not None:
+            return dispatcher, False
+        from app.utils.graph_client import get_graph_client
+        from app.utils.whatsapp_utils import deliver_outbound
+
+        return OutboundDispatcher(deliver_outbound, get_graph_client().phone_number_id), True
+
+    def _next_chunk(self, after_id: int) -> List[Tuple[int, str]]:
+        session = self.session_factory()
+        try:
+            return [(row[0], row[1]) for row in
+                    obtener_clientes_pendientes(session, self.id_promocion, after_id, self.chunk_size)]
+        finally:
+            session.close()
+
+    def _commit_chunk(self, last_id: int, futures: List[Tuple[int, Future]]):
+        """Espera los envíos del lote y registra los exitosos junto con el punto de control"""
+        delivered = []
+        failed = 0
+        for id_cliente, future in futures:
+            try:
+                future.result(timeout=self.send_timeout)
+                delivered.append(id_cliente)
+            except Exception as e:
+                failed += 1
+                logging.warning(f"Promoción {self.id_promocion} no enviada al cliente {id_cliente}: {e}")
+
+        with self._lock:
+            self._last_id = last_id
+            self._sent += len(delivered)
+            self._failed += failed
+            self._chunks += 1
+        self._save_checkpoint(delivered, BROADCAST_IN_PROGRESS)
+
+    def _save_checkpoint(self, delivered: List[int], state: str):
+        """Registros de envío y punto de control en un solo commit"""
+        session = self.session_factory()
+        try:
+            registrar_envios_promocion(session, self.id_promocion, delivered)
+            with self._lock:
+                guardar_punto_control(session, self.id_promocion, self._last_id, self._sent, self._failed, state)
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _set_state(self, state: str):
+        with self._lock:
+            self._state = state
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+            return {
+                "id_promocion": self.id_promocion,
+                "state": self._state,
+                "last_client_id": self._last_id,
+                "sent": self._sent,
+                "failed": self._failed,
+                "chunks": self._chunks,
+                "sends_per_second": round(self._sent / elapsed, 2) if elapsed else 0.0,
+            }
+
+
+def broadcast_promotion(id_promocion: int, restart: bool = False, **kwargs) -> Dict[str, Any]:
+    """Ejecuta (o retoma) la difusión de una promoción; su progreso se publica en /metrics"""
+    broadcast = PromotionBroadcast(id_promocion, **kwargs)
+    register_metrics_provider("promotion_broadcast", broadcast.stats)
+    return broadcast.run(restart=restart)
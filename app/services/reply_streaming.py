@@ -0,0 +1,194 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.utils.metrics import register_metrics_provider
+
+# Límite de caracteres del cuerpo de un mensaje de texto de WhatsApp
+WHATSAPP_TEXT_LIMIT = 4096
+
+# Cortes preferidos al dividir un texto largo: párrafo, línea, oración, palabra
+_SPLIT_SEPARATORS = ("\n\n", "\n", ". ", "? ", "! ", " ")
+
+
+def _split_point(text: str, limit: int) -> int:
+    """Posición de corte dentro de los primeros `limit` caracteres"""
+    for separator in _SPLIT_SEPARATORS:
+        index = text.rfind(separator, 0, limit - len(separator) + 1)
+        # Un corte muy temprano dejaría trozos diminutos
+        if index >= limit // 2:
+            return index + len(separator)
+    return limit
+
+
+def split_message(text: str, limit: int = WHATSAPP_TEXT_LIMIT) -> List[str]:
+    """Divide el texto en trozos de hasta `limit` caracteres sin cortar palabras si se puede"""
+    chunks = []
+    text = text.strip()
+    while len(text) > limit:
+        cut = _split_point(text, limit)
+        chunks.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+class ProgressiveReply:
+    """
+    Respuesta a un cliente que se envía a medida que se genera.
+
+    `on_delta` acumula los fragmentos del motor y envía los párrafos ya
+    terminados en cuanto suman `min_chars`; `finish` envía lo que falta de la
+    respuesta final. Todos los trozos respetan el límite de WhatsApp. `send`
+    recibe el texto sin formato de cada trozo y retorna si se envió; se
+    llama en orden desde el hilo que genera la respuesta.
+    """
+
+    def __init__(self, send: Callable[[str], bool], progressive: bool = True,
+                 min_chars: int = 300, limit: int = WHATSAPP_TEXT_LIMIT):
+        self.send = send
+        self.progressive = progressive
+        self.min_chars = min_chars
+        self.limit = limit
+
+        self._streamed: List[str] = []
+        self._buffer = ""
+        self._consumed = 0  # caracteres de la respuesta ya enviados
+        self._chunks = 0
+        self._failed = 0
+
+    def on_delta(self, fragment: str):
+        """Fragmento de texto del motor (modo stream)"""
+        if not self.progressive or not fragment:
+            return
+        self._streamed.append(fragment)
+        self._buffer += fragment
+        while len(self._buffer) > self.limit:
+            # Texto sin saltos de párrafo: se corta en el mejor punto dentro del límite
+            self._emit(self._buffer[:_split_point(self._buffer, self.limit)])
+        end = self._buffer.rfind("\n\n")
+        if end >= self.min_chars:
+            self._emit(self._buffer[:end])
+
+    def finish(self, response: str) -> bool:
+        """Envía el resto de la respuesta final; retorna si todos los trozos se enviaron"""
+        streamed = "".join(self._streamed)[:self._consumed]
+        if streamed and response.startswith(streamed):
+            rest = response[self._consumed:]
+        else:
+            # Sin texto enviado, o la respuesta final no es la que se transmitía
+            # (p. ej. mensaje de error tras un timeout): se envía completa
+            rest = response
+        for chunk in split_message(rest, self.limit):
+            self._send(chunk)
+        return self._chunks > 0 and self._failed == 0
+
+    def _emit(self, text: str):
+        self._buffer = self._buffer[len(text):]
+        self._consumed += len(text)
+        if text.strip():
+            self._send(text.strip())
+
+    def _send(self, chunk: str):
+        if self.send(chunk):
+            self._chunks += 1
+        else:
+            self._failed += 1
+
+
+class ReplyStreamer:
+    """
+    Acuse de lectura y entrega progresiva de las respuestas.
+
+    `acknowledge` marca el mensaje del cliente como leído y muestra
+    "escribiendo…" en cuanto se acepta; `start` crea la ProgressiveReply de
+    una respuesta. Publica cuánto tarda en salir el primer trozo desde que
+    empieza la generación.
+    """
+
+    def __init__(self, send_receipt: Callable[[str], None], read_receipts: bool = True,
+                 progressive: bool = True, min_chars: int = 300):
+        self.send_receipt = send_receipt
+        self.read_receipts = read_receipts
+        self.progressive = progressive
+        self.min_chars = max(0, min_chars)
+
+        self._lock = threading.Lock()
+        self._receipts = 0
+        self._receipt_errors = 0
+        self._replies = 0
+        self._chunks = 0
+        self._first_chunks = 0
+        self._first_chunk_seconds_total = 0.0
+
+    def acknowledge(self, message_id: Optional[str]):
+        """Acuse de lectura con indicador de escritura (no espera la respuesta de Meta)"""
+        if not self.read_receipts or not message_id:
+            return
+        try:
+            self.send_receipt(message_id)
+            with self._lock:
+                self._receipts += 1
+        except Exception as e:
+            logging.warning(f"No se pudo enviar el acuse de lectura de {message_id}: {e}")
+            with self._lock:
+                self._receipt_errors += 1
+
+    def start(self, send: Callable[[str], bool]) -> ProgressiveReply:
+        """Respuesta nueva cuyos trozos salen por `send`"""
+        started_at = time.monotonic()
+        first = True
+
+        def _send(chunk: str) -> bool:
+            nonlocal first
+            sent = send(chunk)
+            with self._lock:
+                self._chunks += sent
+                if sent and first:
+                    first = False
+                    self._first_chunks += 1
+                    self._first_chunk_seconds_total += time.monotonic() - started_at
+            return sent
+
+        with self._lock:
+            self._replies += 1
+        return ProgressiveReply(_send, progressive=self.progressive, min_chars=self.min_chars)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "read_receipts": self.read_receipts,
+                "progressive": self.progressive,
+                "receipts_sent": self._receipts,
+                "receipt_errors": self._receipt_errors,
+                "replies": self._replies,
+                "chunks_sent": self._chunks,
+                "avg_first_chunk_seconds": (
+                    round(self._first_chunk_seconds_total / self._first_chunks, 3) if self._first_chunks else 0.0
+                ),
+            }
+
+
+# Instancia global (None si create_app no la inicializó)
+reply_streamer: Optional[ReplyStreamer] = None
+
+
+def init_reply_streamer(config: Dict[str, Any], send_receipt: Callable[[str], None]) -> ReplyStreamer:
+    """Crea el ReplyStreamer global a partir de la configuración"""
+    global reply_streamer
+    if reply_streamer is None:
+        reply_streamer = ReplyStreamer(
+            send_receipt,
+            read_receipts=config.get("REPLY_READ_RECEIPTS", True),
+            progressive=config.get("REPLY_PROGRESSIVE", True),
+            min_chars=config.get("REPLY_MIN_CHUNK_CHARS", 300),
+        )
+        register_metrics_provider("reply_streaming", reply_streamer.stats)
+    return reply_streamer
+
+
+def get_reply_streamer() -> Optional[ReplyStreamer]:
+    """Retorna el ReplyStreamer global o None si no está activo"""
+    return reply_streamer
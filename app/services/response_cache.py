@@ -0,0 +1,206 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_PUNCTUATION = re.compile(r"[^\w\s]", re.UNICODE)
+_WHITESPACE = re.compile(r"\s+")
+
+# Palabras que indican que la pregunta depende de turnos anteriores o de
+# datos propios del cliente; esas respuestas no se comparten entre clientes
+CONTEXT_MARKERS = frozenset({
+    "ese", "esa", "eso", "esos", "esas", "este", "esto", "estos",
+    "mismo", "misma", "anterior", "entonces", "tambien", "otro", "otra", "ademas",
+    "mi", "mis", "pedido", "pedidos", "orden", "pedi", "compre",
+})
+CONTEXT_PREFIXES = ("y ", "pero ", "o sea", "entonces ")
+
+# Marcadores del nombre del cliente en las respuestas guardadas
+NAME_PLACEHOLDER = "{nombre}"
+FIRST_NAME_PLACEHOLDER = "{primer_nombre}"
+# Nombres más cortos no se reemplazan (coincidirían con palabras comunes)
+MIN_NAME_LENGTH = 3
+
+
+def normalize_question(message: str) -> str:
+    """Minúsculas, sin acentos, sin puntuación y con espacios colapsados"""
+    decomposed = unicodedata.normalize("NFKD", message.lower())
+    without_accents = "".join(char for char in decomposed if not unicodedata.combining(char))
+    without_punctuation = _PUNCTUATION.sub(" ", without_accents)
+    return _WHITESPACE.sub(" ", without_punctuation).strip()
+
+
+def stem_token(token: str) -> str:
+    """Plural simple: garrafones → garrafon, botellas → botella"""
+    if len(token) > 4 and token.endswith("es"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def _name_variants(name: Optional[str]) -> List[Tuple[str, str]]:
+    """(texto, marcador) del nombre completo y del primer nombre del cliente"""
+    full_name = _WHITESPACE.sub(" ", (name or "").strip())
+    if len(full_name) < MIN_NAME_LENGTH:
+        return []
+    variants = [(full_name, NAME_PLACEHOLDER)]
+    first_name = full_name.split(" ")[0]
+    if first_name != full_name and len(first_name) >= MIN_NAME_LENGTH:
+        variants.append((first_name, FIRST_NAME_PLACEHOLDER))
+    return variants
+
+
+def to_template(response: str, name: Optional[str]) -> str:
+    """Reemplaza el nombre del cliente en la respuesta por sus marcadores"""
+    for text, placeholder in _name_variants(name):
+        response = re.sub(rf"(?<!\w){re.escape(text)}(?!\w)", placeholder, response)
+    return response
+
+
+def fill_template(template: str, name: Optional[str]) -> Optional[str]:
+    """Respuesta para otro cliente; None si la plantilla lleva nombre y el cliente no tiene"""
+    if NAME_PLACEHOLDER not in template and FIRST_NAME_PLACEHOLDER not in template:
+        return template
+    variants = _name_variants(name)
+    if not variants:
+        return None
+    full_name = variants[0][0]
+    first_name = variants[1][0] if len(variants) > 1 else full_name
+    return template.replace(NAME_PLACEHOLDER, full_name).replace(FIRST_NAME_PLACEHOLDER, first_name)
+
+
+def is_context_dependent(normalized: str) -> bool:
+    """Heurística: referencias a mensajes previos o a datos del cliente"""
+    if normalized.startswith(CONTEXT_PREFIXES):
+        return True
+    return any(word in CONTEXT_MARKERS for word in normalized.split())
+
+
+class ResponseCache:
+    """
+    Cache de respuestas para preguntas frecuentes (precios, zonas de entrega,
+    horarios).
+
+    La clave es la pregunta normalizada más la versión del conocimiento
+    (archivo de prompts + catálogo de productos), así que un cambio en
+    cualquiera de ellos invalida las respuestas anteriores sin intervención.
+    Las respuestas se comparten entre clientes: se guardan como plantilla,
+    con el nombre del cliente que la originó reemplazado por un marcador,
+    y se sirven con el nombre de quien pregunta.
+    Las preguntas que dependen del contexto no se cachean, y el cliente que
+    las hace queda excluido del cache durante `context_opt_out_seconds`.
+    """
+
+    def __init__(self, version_provider: Callable[[], str], max_size: int = 1000,
+                 ttl_seconds: float = 86400, max_question_length: int = 200,
+                 context_opt_out_seconds: float = 600):
+        self.version_provider = version_provider
+        self.max_size = max(1, max_size)
+        self.ttl_seconds = ttl_seconds
+        self.max_question_length = max_question_length
+        self.context_opt_out_seconds = context_opt_out_seconds
+
+        # clave → (plantilla de la respuesta, expira_en, segundos que costó generarla)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, float, float]]" = OrderedDict()
+        self._opted_out: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._bypassed = 0
+        self._evictions = 0
+        self._saved_seconds = 0.0
+
+    def opt_out(self, wa_id: str, seconds: Optional[float] = None):
+        """Excluye a un cliente del cache (por defecto `context_opt_out_seconds`)"""
+        with self._lock:
+            self._opted_out[wa_id] = time.monotonic() + (seconds or self.context_opt_out_seconds)
+
+    def opt_in(self, wa_id: str):
+        """Vuelve a habilitar el cache para un cliente"""
+        with self._lock:
+            self._opted_out.pop(wa_id, None)
+
+    def cache_key(self, wa_id: str, messages: List[str]) -> Optional[Tuple[str, str]]:
+        """
+        Clave de cache para los mensajes, o None si no se deben cachear
+        (varios mensajes, pregunta larga, dependiente del contexto u opt-out).
+        """
+        now = time.monotonic()
+        with self._lock:
+            opted_out_until = self._opted_out.get(wa_id)
+            if opted_out_until is not None and opted_out_until <= now:
+                del self._opted_out[wa_id]
+                opted_out_until = None
+
+        if opted_out_until is not None or len(messages) != 1:
+            self._count_bypass()
+            return None
+
+        normalized = normalize_question(messages[0])
+        if not normalized or len(normalized) > self.max_question_length:
+            self._count_bypass()
+            return None
+        if is_context_dependent(normalized):
+            self.opt_out(wa_id)
+            self._count_bypass()
+            return None
+
+        return self.version_provider(), normalized
+
+    def _count_bypass(self):
+        with self._lock:
+            self._bypassed += 1
+
+    def get(self, key: Tuple[str, str], name: Optional[str] = None) -> Optional[str]:
+        """Respuesta cacheada vigente para la clave, con el nombre de quien pregunta"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            response = None
+            if entry is not None and entry[1] > now:
+                response = fill_template(entry[0], name)
+            elif entry is not None:
+                del self._entries[key]
+            if response is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            self._saved_seconds += entry[2]
+            return response
+
+    def put(self, key: Tuple[str, str], response: str, generation_seconds: float,
+            name: Optional[str] = None):
+        """Guarda la respuesta (sin el nombre de `name`) respetando el tamaño máximo"""
+        template = to_template(response, name)
+        with self._lock:
+            self._entries[key] = (template, time.monotonic() + self.ttl_seconds, generation_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        """Vacía el cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Tasa de aciertos y latencia ahorrada"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "bypassed": self._bypassed,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "saved_seconds": round(self._saved_seconds, 2),
+                "opted_out_conversations": len(self._opted_out),
+            }
@@ -0,0 +1,294 @@
+import logging
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+
+from app.database.message import guardar_intercambio, obtener_historial_conversacion
+from app.services.assistant_manager import (
+    ASSISTANT_INSTRUCTIONS,
+    RUN_ERROR_MESSAGES,
+    RUN_TECHNICAL_ERROR_MESSAGE,
+    RUN_TIMEOUT_MESSAGE,
+    THREAD_ERROR_MESSAGE,
+    AssistantStatus,
+    completed_future,
+    extract_message_text,
+    map_future,
+    setup_assistant,
+)
+from app.services.conversation_context import HistoryMessage
+from app.services.knowledge_index import format_snippets
+
+
+class ResponseEngine:
+    """
+    Interfaz de los motores que generan la respuesta del asistente.
+    El AssistantManager conserva el ciclo de vida (cliente, cache, errores)
+    y delega en el motor la preparación y la generación.
+    """
+
+    name = "base"
+
+    def setup(self) -> AssistantStatus:
+        """Prepara el motor una vez creado el cliente OpenAI"""
+        raise NotImplementedError
+
+    def generate(self, messages: List[str], wa_id: str, name: str,
+                 on_delta: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """
+        Genera la respuesta a los mensajes del cliente. RateLimitError y
+        APIConnectionError se propagan para que el manager dé el mensaje específico.
+        """
+        raise NotImplementedError
+
+    def start(self, messages: List[str], wa_id: str, name: str,
+              on_delta: Optional[Callable[[str], None]] = None) -> Future:
+        """
+        Como generate, pero retorna un Future con la respuesta. Por defecto
+        genera en el hilo que llama; un motor puede esperar al modelo fuera
+        de ese hilo.
+        """
+        return completed_future(self.generate(messages, wa_id, name, on_delta))
+
+    def record_exchange(self, messages: List[str], wa_id: str, name: str, response: str):
+        """
+        Registra en el historial del cliente una respuesta que no pasó por
+        el modelo (cache de respuestas o router local), para que los turnos
+        siguientes la vean.
+        """
+        raise NotImplementedError
+
+
+class AssistantsEngine(ResponseEngine):
+    """Assistants API: thread por cliente en OpenAI y un run por respuesta"""
+
+    name = "assistants"
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def setup(self) -> AssistantStatus:
+        status, self.manager.assistant_id = setup_assistant(self.manager.client, self.manager.config)
+        if self.manager.config.knowledge_index_enabled:
+            try:
+                self.manager.knowledge_index.refresh()
+            except Exception as e:
+                # Sin índice local los runs siguen usando file_search
+                logging.error(f"No se pudo preparar el índice de conocimiento: {e}")
+        return status
+
+    def generate(self, messages: List[str], wa_id: str, name: str,
+                 on_delta: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        return self.start(messages, wa_id, name, on_delta).result()
+
+    def start(self, messages: List[str], wa_id: str, name: str,
+              on_delta: Optional[Callable[[str], None]] = None) -> Future:
+        """Crea el run; en modo poll el Future lo resuelve el RunTracker"""
+        manager = self.manager
+        thread_id = manager._get_or_create_thread(wa_id)
+        if not thread_id:
+            return completed_future(THREAD_ERROR_MESSAGE)
+
+        try:
+            future, usage = self._run(thread_id, wa_id, name, messages, on_delta)
+        except openai.NotFoundError:
+            # Thread en cache/DB borrado en OpenAI: recrear y reintentar una vez
+            logging.warning(f"Thread {thread_id} no existe en OpenAI, creando nuevo")
+            manager._delete_thread_from_db(wa_id)
+            thread_id = manager._get_or_create_thread(wa_id)
+            if not thread_id:
+                return completed_future(THREAD_ERROR_MESSAGE)
+            future, usage = self._run(thread_id, wa_id, name, messages, on_delta)
+
+        def _completed(response: Optional[str]) -> Optional[str]:
+            if response and response not in RUN_ERROR_MESSAGES:
+                self._record_turn(wa_id, thread_id, len(messages), usage[0] if usage else None)
+            return response
+
+        return map_future(future, _completed)
+
+    def record_exchange(self, messages: List[str], wa_id: str, name: str, response: str):
+        """
+        Añade al thread los mensajes del cliente y la respuesta, sin crear un
+        run. Cada llamada pasa por el carril de fondo del limitador y el
+        circuito de OpenAI; los errores se propagan al que llama.
+        """
+        manager = self.manager
+        thread_id = manager._get_or_create_thread(wa_id)
+        if not thread_id:
+            return
+        create = manager.client.beta.threads.messages.create
+        for message in messages:
+            manager.call_openai_in_background(create, thread_id=thread_id, role="user", content=message)
+        manager.call_openai_in_background(create, thread_id=thread_id, role="assistant", content=response)
+        self._record_turn(wa_id, thread_id, len(messages), None)
+
+    def _record_turn(self, wa_id: str, thread_id: str, new_messages: int, usage: Any):
+        self.manager.context.record_turn(
+            wa_id, new_messages, usage, origin=thread_id,
+            fetch_recent=lambda limit: self._thread_messages(thread_id, limit)
+        )
+
+    def _run(self, thread_id: str, wa_id: str, name: str, messages: List[str],
+             on_delta: Optional[Callable[[str], None]]) -> Tuple[Future, List[Any]]:
+        """
+        Run con la ventana acotada, el resumen de lo anterior y los fragmentos
+        del índice local; retorna (Future con el texto, lista donde llega el
+        uso de tokens al completarse el run).
+        """
+        manager = self.manager
+        instructions = [manager.context.summary_instructions(wa_id)]
+        tools = None
+        if manager.config.knowledge_index_enabled:
+            snippets, top_score = manager.knowledge_index.relevant_with_score(" ".join(messages))
+            if snippets:
+                instructions.append(format_snippets(snippets))
+                # Solo con una coincidencia clara el run prescinde de file_search;
+                # con fragmentos dudosos el modelo puede seguir buscando
+                if top_score >= manager.config.knowledge_index_confident_score:
+                    tools = []
+
+        usage: List[Any] = []
+        future = manager._start_assistant_run(
+            thread_id, name, messages, on_delta,
+            additional_instructions="\n\n".join(part for part in instructions if part) or None,
+            on_usage=usage.append,
+            tools=tools
+        )
+        return future, usage
+
+    def _thread_messages(self, thread_id: str, limit: int) -> List[HistoryMessage]:
+        """Mensajes más recientes del thread (fuente del resumen)"""
+        page = self.manager.client.beta.threads.messages.list(thread_id=thread_id, order="desc", limit=limit)
+        return [(message.id, message.role, extract_message_text(message)) for message in page.data]
+
+
+class ChatCompletionsEngine(ResponseEngine):
+    """
+    Motor sin estado en OpenAI: el prompt se arma localmente con el historial
+    reciente de la tabla `mensajes` y los fragmentos del índice local, y la
+    respuesta sale de una sola llamada de chat completions en streaming.
+    """
+
+    name = "chat"
+
+    def __init__(self, manager,
+                 history_loader: Callable = obtener_historial_conversacion,
+                 exchange_writer: Callable = guardar_intercambio):
+        self.manager = manager
+        self.history_loader = history_loader
+        self.exchange_writer = exchange_writer
+
+    def setup(self) -> AssistantStatus:
+        index = self.manager.knowledge_index
+        index.refresh()
+        if index.doc_count == 0:
+            logging.error("El motor chat no encontró conocimiento para indexar")
+            return AssistantStatus.FILES_MISSING
+        logging.info(f"Motor chat listo con {index.doc_count} documentos de conocimiento")
+        return AssistantStatus.READY
+
+    def _recent_messages(self, wa_id: str, limit: int) -> List[HistoryMessage]:
+        """Mensajes más recientes de la tabla mensajes como (id, rol, contenido)"""
+        return [
+            (id_mensaje, "assistant" if tipo == "salida" else "user", contenido)
+            for id_mensaje, contenido, tipo in self.history_loader(wa_id, limit)
+        ]
+
+    def _load_history(self, wa_id: str) -> List[Dict[str, str]]:
+        """Ventana de turnos previos como mensajes de chat (vacía si la DB falla)"""
+        try:
+            recent = self._recent_messages(wa_id, self.manager.config.context_window_messages)
+        except Exception as e:
+            logging.warning(f"No se pudo leer el historial de {wa_id}: {e}")
+            return []
+        return [{"role": role, "content": content} for _, role, content in reversed(recent)]
+
+    def build_messages(self, messages: List[str], name: str, history: List[Dict[str, str]],
+                       summary: Optional[str] = None) -> List[Dict[str, str]]:
+        """Prompt completo: instrucciones + conocimiento (+ resumen), historial y mensajes nuevos"""
+        snippets = self.manager.knowledge_index.relevant(" ".join(messages))
+        system_prompt = (
+            f"{ASSISTANT_INSTRUCTIONS}\n"
+            f"Estás conversando con {name}, cliente de un emprendimiento.\n\n"
+            f"{format_snippets(snippets)}"
+        )
+        if summary:
+            system_prompt += f"\n\n{summary}"
+        return (
+            [{"role": "system", "content": system_prompt}]
+            + history
+            + [{"role": "user", "content": message} for message in messages]
+        )
+
+    def generate(self, messages: List[str], wa_id: str, name: str,
+                 on_delta: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        context = self.manager.context
+        prompt = self.build_messages(
+            messages, name, self._load_history(wa_id), context.summary_instructions(wa_id)
+        )
+        try:
+            response, completed, usage = self._stream(prompt, on_delta)
+        except (openai.RateLimitError, openai.APIConnectionError):
+            raise
+        except Exception as e:
+            logging.error(f"Error en chat completions: {e}")
+            return RUN_TECHNICAL_ERROR_MESSAGE
+
+        if completed and response and response not in RUN_ERROR_MESSAGES:
+            self.record_exchange(messages, wa_id, name, response, usage)
+        return response
+
+    def record_exchange(self, messages: List[str], wa_id: str, name: str, response: str,
+                        usage: Any = None):
+        """Guarda el intercambio en la tabla mensajes (el historial de este motor)"""
+        try:
+            self.exchange_writer(wa_id, name, messages, response)
+        except Exception as e:
+            logging.warning(f"No se pudo guardar el intercambio de {wa_id}: {e}")
+            return
+        self.manager.context.record_turn(
+            wa_id, len(messages), usage, origin="mensajes",
+            fetch_recent=lambda limit: self._recent_messages(wa_id, limit)
+        )
+
+    def _stream(self, prompt: List[Dict[str, str]],
+                on_delta: Optional[Callable[[str], None]]) -> Tuple[Optional[str], bool, Any]:
+        """Retorna (texto, completado, uso de tokens); ante timeout, el texto parcial si lo hay"""
+        config = self.manager.config
+        deadline = time.monotonic() + config.run_timeout
+        client = self.manager.client.with_options(timeout=config.run_timeout)
+        parts: List[str] = []
+        usage = None
+        try:
+            with client.chat.completions.create(
+                model=config.model, messages=prompt, stream=True, stream_options={"include_usage": True}
+            ) as stream:
+                for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.choices:
+                        fragment = chunk.choices[0].delta.content
+                        if fragment:
+                            parts.append(fragment)
+                            if on_delta is not None:
+                                on_delta(fragment)
+                    if time.monotonic() > deadline:
+                        break
+                else:
+                    return "".join(parts) or None, True, usage
+        except (openai.APITimeoutError, httpx.TimeoutException):
+            pass
+
+        logging.warning(f"Timeout en chat completions después de {config.run_timeout}s")
+        return "".join(parts) or RUN_TIMEOUT_MESSAGE, False, usage
+
+
+def create_response_engine(manager) -> ResponseEngine:
+    """Motor configurado en RESPONSE_ENGINE"""
+    if manager.config.response_engine == ChatCompletionsEngine.name:
+        return ChatCompletionsEngine(manager)
+    return AssistantsEngine(manager)
@@ -0,0 +1,203 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import openai
+
+from app.services.assistant_manager import (
+    RUN_CANCELLED_MESSAGE,
+    RUN_FAILED_MESSAGE,
+    RUN_TIMEOUT_MESSAGE,
+    AssistantConfig,
+    extract_message_text,
+    next_polling_interval,
+)
+
+
+@dataclass
+class TrackedRun:
+    """Run en curso registrado en el tracker"""
+    thread_id: str
+    run_id: str
+    deadline: float
+    interval: float
+    future: Future = field(default_factory=Future)
+    started_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+    on_usage: Optional[Callable[[Any], None]] = None
+
+
+class RunTracker:
+    """
+    Consulta todos los runs en curso desde un único hilo planificador.
+
+    Cada run registrado se revisa según su propio backoff (polling_interval →
+    max_polling_interval); las llamadas a OpenAI se hacen en un pool pequeño
+    de I/O y el resultado se entrega en un Future por run. Los runs que
+    superan run_timeout se cancelan en OpenAI en lugar de abandonarse.
+    Quien registra el run no necesita esperarlo: el envío de la respuesta
+    se encadena al Future (ver Deferred en conversation_scheduler).
+    """
+
+    def __init__(self, client, config: AssistantConfig, io_workers: int = 4):
+        self.client = client
+        self.config = config
+        self._executor = ThreadPoolExecutor(max_workers=max(1, io_workers), thread_name_prefix="run-poll")
+        self._heap: List[tuple] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._running = True
+
+        self._tracked = 0
+        self._completed = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._polls = 0
+        self._total_run_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._schedule_loop, name="run-tracker", daemon=True)
+        self._thread.start()
+
+    def track(self, thread_id: str, run_id: str, timeout: Optional[float] = None,
+              on_usage: Optional[Callable[[Any], None]] = None) -> Future:
+        """
+        Registra un run y retorna un Future con el texto de la respuesta.
+        `on_usage` recibe el uso de tokens del run completado.
+        """
+        now = time.monotonic()
+        run = TrackedRun(
+            thread_id=thread_id,
+            run_id=run_id,
+            deadline=now + (timeout or self.config.run_timeout),
+            interval=self.config.polling_interval,
+            on_usage=on_usage,
+        )
+        with self._condition:
+            self._tracked += 1
+        self._schedule(run, now + run.interval)
+        return run.future
+
+    def _schedule(self, run: TrackedRun, when: float):
+        """Programa la próxima revisión del run (nunca después de su deadline)"""
+        with self._condition:
+            heapq.heappush(self._heap, (min(when, run.deadline), next(self._sequence), run))
+            self._condition.notify()
+
+    def _schedule_loop(self):
+        """Despacha al pool de I/O los runs cuya revisión ya venció"""
+        while True:
+            with self._condition:
+                while self._running and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    wait = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout=wait)
+                if not self._running:
+                    return
+                now = time.monotonic()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[2])
+
+            for run in due:
+                self._executor.submit(self._poll, run)
+
+    def _poll(self, run: TrackedRun):
+        """Consulta el estado de un run y lo resuelve o lo reprograma"""
+        if run.future.done():
+            return
+        if time.monotonic() >= run.deadline or run.attempts >= self.config.max_polling_attempts:
+            self._expire(run)
+            return
+
+        run.attempts += 1
+        try:
+            current = self.client.beta.threads.runs.retrieve(thread_id=run.thread_id, run_id=run.run_id)
+        except openai.RateLimitError:
+            # Sin cupo: esperar el intervalo máximo antes de volver a consultar
+            run.interval = self.config.max_polling_interval
+            self._schedule(run, time.monotonic() + run.interval)
+            return
+        except Exception as e:
+            self._finish(run, exception=e)
+            return
+        finally:
+            with self._condition:
+                self._polls += 1
+
+        logging.debug(f"Estado del run {run.run_id}: {current.status} (intento {run.attempts})")
+
+        if current.status == "completed":
+            if run.on_usage is not None and current.usage is not None:
+                run.on_usage(current.usage)
+            try:
+                thread_messages = self.client.beta.threads.messages.list(
+                    thread_id=run.thread_id, run_id=run.run_id, order="desc", limit=1
+                )
+                text = extract_message_text(thread_messages.data[0]) if thread_messages.data else None
+                self._finish(run, result=text)
+            except Exception as e:
+                self._finish(run, exception=e)
+        elif current.status == "failed":
+            logging.error(f"Run falló: {current.last_error}")
+            self._finish(run, result=RUN_FAILED_MESSAGE, failed=True)
+        elif current.status in ("cancelled", "expired"):
+            self._finish(run, result=RUN_CANCELLED_MESSAGE, failed=True)
+        else:
+            run.interval = next_polling_interval(run.interval, self.config)
+            self._schedule(run, time.monotonic() + run.interval)
+
+    def _expire(self, run: TrackedRun):
+        """Cancela en OpenAI un run que superó el timeout"""
+        logging.warning(f"Timeout del run {run.run_id} después de {run.attempts} consultas; se cancela")
+        try:
+            self.client.beta.threads.runs.cancel(thread_id=run.thread_id, run_id=run.run_id)
+        except Exception as e:
+            logging.warning(f"No se pudo cancelar el run {run.run_id}: {e}")
+        with self._condition:
+            self._timed_out += 1
+        self._finish(run, result=RUN_TIMEOUT_MESSAGE, failed=True)
+
+    def _finish(self, run: TrackedRun, result: Optional[str] = None,
+                exception: Optional[BaseException] = None, failed: bool = False):
+        """Resuelve el Future del run y actualiza contadores"""
+        with self._condition:
+            self._total_run_seconds += time.monotonic() - run.started_at
+            if exception is not None or failed:
+                self._failed += 1
+            else:
+                self._completed += 1
+        if exception is not None:
+            run.future.set_exception(exception)
+        else:
+            run.future.set_result(result)
+
+    def stop(self):
+        """Detiene el planificador; los runs pendientes reciben el mensaje de timeout"""
+        with self._condition:
+            self._running = False
+            pending = [entry[2] for entry in self._heap]
+            self._heap.clear()
+            self._condition.notify_all()
+        for run in pending:
+            if not run.future.done():
+                run.future.set_result(RUN_TIMEOUT_MESSAGE)
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Runs en curso y resultados acumulados"""
+        with self._condition:
+            finished = self._completed + self._failed
+            return {
+                "in_flight": self._tracked - finished,
+                "tracked": self._tracked,
+                "completed": self._completed,
+                "failed": self._failed,
+                "timed_out": self._timed_out,
+                "polls": self._polls,
+                "polls_per_run": round(self._polls / finished, 2) if finished else 0.0,
+                "avg_run_seconds": round(self._total_run_seconds / finished, 3) if finished else 0.0,
+            }
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class ThreadCache:
+    """
+    Cache LRU en memoria de wa_id → thread_id.
+
+    La tabla `threads` sigue siendo la fuente de verdad: una entrada con más
+    de `verify_ttl_seconds` se vuelve a leer de la base de datos. No se
+    verifica el thread en OpenAI por adelantado; si ya no existe, la llamada
+    real devuelve NotFoundError y el AssistantManager lo recrea en ese momento.
+    """
+
+    def __init__(self, max_size: int = 5000, verify_ttl_seconds: float = 3600):
+        self.max_size = max(1, max_size)
+        self.verify_ttl_seconds = verify_ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, wa_id: str) -> Optional[str]:
+        """Retorna el thread_id si está en cache y no requiere revalidación"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(wa_id)
+            if entry is None:
+                self._misses += 1
+                return None
+            thread_id, verified_at = entry
+            if now - verified_at > self.verify_ttl_seconds:
+                del self._entries[wa_id]
+                self._expired += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(wa_id)
+            self._hits += 1
+            return thread_id
+
+    def put(self, wa_id: str, thread_id: str):
+        """Guarda o reemplaza el mapeo respetando el tamaño máximo"""
+        with self._lock:
+            self._entries[wa_id] = (thread_id, time.monotonic())
+            self._entries.move_to_end(wa_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, wa_id: str):
+        """Elimina el mapeo de un cliente (thread borrado o inexistente)"""
+        with self._lock:
+            if self._entries.pop(wa_id, None) is not None:
+                self._invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Tamaño y tasa de aciertos"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "expired": self._expired,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
@@ -0,0 +1,174 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from app.utils.metrics import register_metrics_provider
+
+
+@dataclass
+class QueuedWebhookEvent:
+    """Evento del webhook (ya parseado) pendiente de procesar"""
+    event: Any
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class WebhookWorkerPool:
+    """
+    Pool de workers que procesa los eventos del webhook fuera del request HTTP.
+
+    El webhook solo valida la firma y encola el evento; los workers ejecutan
+    la generación de la respuesta y el envío por WhatsApp dentro de un
+    contexto de aplicación Flask propio.
+    """
+
+    def __init__(self, app, handler: Callable[[Any], Any],
+                 num_workers: int = 4, max_queue_size: int = 100,
+                 stats_window: int = 1000):
+        self.app = app
+        self.handler = handler
+        self.num_workers = max(1, num_workers)
+        self.queue: "queue.Queue[Optional[QueuedWebhookEvent]]" = queue.Queue(maxsize=max(1, max_queue_size))
+        self._threads = []
+        self._lock = threading.Lock()
+        self._running = False
+
+        # Estadísticas para dimensionar el pool
+        self._wait_times = deque(maxlen=stats_window)
+        self._processing_times = deque(maxlen=stats_window)
+        self._enqueued = 0
+        self._rejected = 0
+        self._processed = 0
+        self._failed = 0
+        self._busy_workers = 0
+
+    def start(self):
+        """Arranca los workers (idempotente)"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            for i in range(self.num_workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"webhook-worker-{i}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        logging.info(f"Pool de webhook iniciado con {self.num_workers} workers")
+
+    def stop(self, timeout: float = 5.0):
+        """Detiene los workers después de vaciar la cola"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            threads, self._threads = self._threads, []
+
+        for _ in threads:
+            self.queue.put(None)
+        for thread in threads:
+            thread.join(timeout=timeout)
+        logging.info("Pool de webhook detenido")
+
+    def submit(self, event: Any) -> bool:
+        """Encola un evento; retorna False si la cola está llena"""
+        try:
+            self.queue.put_nowait(QueuedWebhookEvent(event=event))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            logging.warning("Cola del webhook llena, evento rechazado")
+            return False
+
+        with self._lock:
+            self._enqueued += 1
+        return True
+
+    def _worker_loop(self):
+        """Consume eventos de la cola hasta recibir la señal de parada"""
+        while True:
+            queued = self.queue.get()
+            if queued is None:
+                self.queue.task_done()
+                break
+
+            started_at = time.monotonic()
+            with self._lock:
+                self._busy_workers += 1
+                self._wait_times.append(started_at - queued.enqueued_at)
+
+            failed = False
+            try:
+                with self.app.app_context():
+                    self.handler(queued.event)
+            except Exception as e:
+                failed = True
+                logging.error(f"Error procesando evento del webhook en segundo plano: {e}", exc_info=True)
+            finally:
+                with self._lock:
+                    self._busy_workers -= 1
+                    self._processed += 1
+                    if failed:
+                        self._failed += 1
+                    self._processing_times.append(time.monotonic() - started_at)
+                self.queue.task_done()
+
+    @staticmethod
+    def _summarize(samples) -> Dict[str, float]:
+        """Resume una ventana de tiempos (segundos) en promedio, p95 y máximo"""
+        if not samples:
+            return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+        ordered = sorted(samples)
+        p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+        return {
+            "avg": round(sum(ordered) / len(ordered), 4),
+            "p95": round(ordered[p95_index], 4),
+            "max": round(ordered[-1], 4),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna profundidad de la cola, tiempos de espera y contadores"""
+        with self._lock:
+            wait_times = list(self._wait_times)
+            processing_times = list(self._processing_times)
+            return {
+                "workers": self.num_workers,
+                "busy_workers": self._busy_workers,
+                "queue_depth": self.queue.qsize(),
+                "queue_capacity": self.queue.maxsize,
+                "enqueued": self._enqueued,
+                "rejected": self._rejected,
+                "processed": self._processed,
+                "failed": self._failed,
+                "wait_seconds": self._summarize(wait_times),
+                "processing_seconds": self._summarize(processing_times),
+            }
+
+
+# Instancia global del pool (None cuando el modo asíncrono está desactivado)
+webhook_worker_pool: Optional[WebhookWorkerPool] = None
+
+
+def init_webhook_worker_pool(app, handler: Callable[[Any], Any]) -> WebhookWorkerPool:
+    """Crea y arranca el pool global a partir de app.config"""
+    global webhook_worker_pool
+    if webhook_worker_pool is None:
+        webhook_worker_pool = WebhookWorkerPool(
+            app,
+            handler,
+            num_workers=app.config.get("WEBHOOK_WORKERS", 4),
+            max_queue_size=app.config.get("WEBHOOK_QUEUE_SIZE", 100),
+        )
+        webhook_worker_pool.start()
+        register_metrics_provider("webhook_queue", webhook_worker_pool.stats)
+    return webhook_worker_pool
+
+
+def get_webhook_worker_pool() -> Optional[WebhookWorkerPool]:
+    """Retorna el pool global o None si no está activo"""
+    return webhook_worker_pool
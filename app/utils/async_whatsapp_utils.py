@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import mimetypes
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.services.message_deduplicator import discard_duplicate_events
+from app.services.message_router import get_message_router
+from app.utils.whatsapp_payload import (
+    WebhookEvent,
+    WhatsAppMessageEvent,
+    get_text_message_input,
+    group_events_by_wa_id,
+    parse_webhook_body,
+    process_text_for_whatsapp,
+)
+
+GRAPH_API_BASE_URL = "https://graph.facebook.com"
+
+
+class AsyncWhatsAppClient:
+    """Cliente asíncrono (httpx) para la Graph API de WhatsApp"""
+
+    def __init__(self, access_token: str, version: str, phone_number_id: str,
+                 timeout: float = 10.0, max_connections: int = 100):
+        if not access_token or not version or not phone_number_id:
+            raise ValueError("ACCESS_TOKEN, VERSION y PHONE_NUMBER_ID son requeridos")
+
+        self._client = httpx.AsyncClient(
+            base_url=f"{GRAPH_API_BASE_URL}/{version}/{phone_number_id}",
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections),
+        )
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "AsyncWhatsAppClient":
+        """Construye el cliente a partir del diccionario de configuración"""
+        return cls(
+            access_token=config.get("ACCESS_TOKEN"),
+            version=config.get("VERSION"),
+            phone_number_id=config.get("PHONE_NUMBER_ID"),
+        )
+
+    async def aclose(self):
+        """Cierra las conexiones del cliente"""
+        await self._client.aclose()
+
+    async def send_message(self, data: str) -> Optional[httpx.Response]:
+        """Envía un mensaje ya serializado en JSON"""
+        try:
+            response = await self._client.post(
+                "/messages",
+                content=data,
+                headers={"Content-type": "application/json"},
+            )
+            response.raise_for_status()
+            logging.info(f"Status: {response.status_code}")
+            return response
+        except httpx.HTTPError as e:
+            logging.error(f"Error al enviar mensaje: {e}")
+            return None
+        except Exception as e:
+            logging.error(f"Error inesperado enviando mensaje: {e}")
+            return None
+
+    async def send_image_message(self, recipient: str, image_url: str, caption: str = "") -> Optional[Dict]:
+        """Envía mensaje de imagen con validación"""
+        if not recipient or not image_url:
+            logging.error("Recipient e image_url son requeridos")
+            return None
+
+        payload = {
+            "messaging_product": "whatsapp",
+            "to": recipient,
+            "type": "image",
+            "image": {"link": image_url, "caption": caption}
+        }
+        try:
+            response = await self._client.post("/messages", json=payload)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logging.error(f"Error al enviar imagen: {e}")
+            return None
+
+    async def upload_media(self, filepath: str) -> Optional[str]:
+        """Sube media con detección automática de tipo y validación"""
+        if not filepath or not os.path.exists(filepath):
+            logging.error(f"Archivo no encontrado: {filepath}")
+            return None
+
+        mime_type, _ = mimetypes.guess_type(filepath)
+        if not mime_type:
+            mime_type = "application/octet-stream"
+
+        try:
+            # La lectura del disco se hace fuera del event loop
+            content = await asyncio.to_thread(_read_file_bytes, filepath)
+            files = {"file": (os.path.basename(filepath), content, mime_type)}
+            response = await self._client.post(
+                "/media",
+                files=files,
+                data={"messaging_product": "whatsapp"},
+                timeout=30,
+            )
+            response.raise_for_status()
+            return response.json().get("id")
+        except Exception as e:
+            logging.error(f"Error al subir media: {e}")
+            return None
+
+
+def _read_file_bytes(path: str) -> bytes:
+    """Lee un archivo completo en binario"""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def process_message_event_async(event: WhatsAppMessageEvent, assistant, whatsapp_client: AsyncWhatsAppClient) -> Dict[str, Any]:
+    """Genera y envía la respuesta a un mensaje; retorna su estado individual"""
+    result = {"message_id": event.message_id, "wa_id": event.wa_id}
+
+    if event.message_type != "text":
+        logging.info(f"Tipo de mensaje no soportado: {event.message_type}")
+        return {**result, "status": "ignored", "message": "Tipo no soportado"}
+
+    if not event.text:
+        logging.warning("Mensaje vacío recibido")
+        return {**result, "status": "ignored", "message": "Mensaje vacío"}
+
+    try:
+        # Saludos, precios, stock y charla se responden sin llegar al asistente
+        router = get_message_router()
+        decision = router.route([event.text], event.name, event.wa_id) if router is not None else None
+        if decision is not None and decision.response:
+            response = decision.response
+        else:
+            response = await assistant.generate_response(
+                message_body=event.text,
+                wa_id=event.wa_id,
+                name=event.name
+            )
+    except Exception as e:
+        logging.error(f"Error generando respuesta del asistente: {e}")
+        response = "Lo siento, ocurrió un error procesando tu mensaje."
+
+    if not response:
+        logging.warning("Assistant devolvió respuesta vacía")
+        response = "Lo siento, no pude generar una respuesta."
+
+    formatted_response = process_text_for_whatsapp(response)
+    if await whatsapp_client.send_message(get_text_message_input(event.wa_id, formatted_response)):
+        return {**result, "status": "success"}
+    return {**result, "status": "error", "message": "Error enviando mensaje"}
+
+
+async def _process_conversation_async(events: List[WhatsAppMessageEvent], assistant, whatsapp_client) -> List[Dict[str, Any]]:
+    """Procesa en orden los mensajes de un mismo cliente"""
+    results = []
+    for event in events:
+        try:
+            results.append(await process_message_event_async(event, assistant, whatsapp_client))
+        except Exception as e:
+            logging.error(f"Error procesando mensaje {event.message_id}: {e}", exc_info=True)
+            results.append({
+                "message_id": event.message_id,
+                "wa_id": event.wa_id,
+                "status": "error",
+                "message": "Error interno del servidor",
+            })
+    return results
+
+
+async def process_webhook_event_async(event: WebhookEvent, assistant, whatsapp_client: AsyncWhatsAppClient) -> Tuple[Dict[str, Any], int]:
+    """Versión asíncrona de process_webhook_event; retorna (cuerpo, código HTTP)"""
+    if not event.is_valid_message_event:
+        return {"status": "error", "message": "Mensaje no válido"}, 400
+
+    if not assistant:
+        logging.error("Assistant no disponible")
+        return {"status": "error", "message": "Servicio no disponible"}, 503
+
+    try:
+        # Los reintentos de Meta se descartan antes de cualquier trabajo con OpenAI o la DB
+        events, results = discard_duplicate_events(event.messages)
+        groups = group_events_by_wa_id(events)
+        # Un cliente por corrutina: en orden dentro del cliente, en paralelo entre clientes
+        per_conversation = await asyncio.gather(*(
+            _process_conversation_async(conversation, assistant, whatsapp_client)
+            for conversation in groups.values()
+        ))
+        results += [result for conversation in per_conversation for result in conversation]
+        for result in results:
+            logging.info(f"Mensaje {result.get('message_id')} de {result.get('wa_id')}: {result.get('status')}")
+
+        if results and all(result["status"] == "error" for result in results):
+            return {"status": "error", "results": results}, 500
+        return {"status": "success", "results": results}, 200
+
+    except Exception as e:
+        logging.error(f"Error en process_webhook_event_async: {str(e)}", exc_info=True)
+        return {"status": "error", "message": "Error interno del servidor"}, 500
+
+
+async def process_whatsapp_message_async(body: Dict[Any, Any], assistant, whatsapp_client: AsyncWhatsAppClient) -> Tuple[Dict[str, Any], int]:
+    """Versión asíncrona de process_whatsapp_message; retorna (cuerpo, código HTTP)"""
+    return await process_webhook_event_async(parse_webhook_body(body), assistant, whatsapp_client)
@@ -4,19 +4,24 @@ import logging
 import hashlib
 import hmac
 
-def validacion_firma(payload, firma):
+def validacion_firma(payload, firma, app_secret=None):
     """
     Valida la firma HMAC-SHA256 del payload contra la firma recibida.
     
     Args:
-        payload (str): Cuerpo de la solicitud en formato string.
+        payload (bytes | str): Cuerpo crudo de la solicitud; se recomienda
+            pasar los bytes tal como llegaron para evitar decodificar y
+            volver a codificar.
         firma (str): Firma recibida en el header (sin el prefijo 'sha256=').
+        app_secret (str, optional): Secreto de la app; por defecto se toma
+            de current_app.config.
     
     Returns:
         bool: True si la firma es válida, False en caso contrario.
     """
     # Verificar que APP_SECRET esté configurada
-    app_secret = current_app.config.get("APP_SECRET")
+    if app_secret is None:
+        app_secret = current_app.config.get("APP_SECRET")
     if not app_secret:
         logging.error("APP_SECRET no está configurada")
         return False
@@ -25,7 +30,7 @@ def validacion_firma(payload, firma):
         # Generar la firma esperada
         firma_esperada = hmac.new(
             app_secret.encode('latin-1'),  # Codificación explícita a bytes
-            msg=payload.encode('utf-8'),    # Payload como bytes
+            msg=payload if isinstance(payload, bytes) else payload.encode('utf-8'),
             digestmod=hashlib.sha256
         ).hexdigest()
 
@@ -35,6 +40,76 @@ def validacion_firma(payload, firma):
         logging.error(f"Error en validación de firma: {str(e)}")
         return False
 
+def verificar_solicitud_firmada(raw_body: bytes, firma_header: str, app_secret=None):
+    """
+    Verifica la firma de una solicitud del webhook sin depender del framework.
+    
+    Args:
+        raw_body (bytes): Cuerpo crudo de la solicitud.
+        firma_header (str): Valor del header X-Hub-Signature-256.
+        app_secret (str, optional): Secreto de la app.
+    
+    Returns:
+        tuple | None: None si la firma es válida; en caso contrario
+        (dict de error, código HTTP).
+    """
+    # Extraer firma del header (quitando 'sha256=')
+    firma_header = firma_header or ""
+    firma = firma_header[7:] if firma_header.startswith('sha256=') else ""
+    
+    if not firma:
+        logging.warning("Header X-Hub-Signature-256 faltante o mal formado")
+        return {"status": "error", "message": "Firma no proporcionada"}, 403
+    
+    # El HMAC se calcula directamente sobre los bytes recibidos
+    if not validacion_firma(raw_body, firma, app_secret):
+        logging.warning(f"Firma inválida. Header: {firma_header}")
+        return {"status": "error", "message": "Firma inválida"}, 403
+
+    return None
+
+def verificar_token_metricas(authorization_header: str, token=None):
+    """
+    Verifica el token de /metrics sin depender del framework.
+    
+    Args:
+        authorization_header (str): Valor del header Authorization ("Bearer <token>").
+        token (str, optional): METRICS_TOKEN configurado; por defecto se toma
+            de current_app.config. Sin token el endpoint queda cerrado.
+    
+    Returns:
+        tuple | None: None si el token es válido; en caso contrario
+        (dict de error, código HTTP).
+    """
+    if token is None:
+        token = current_app.config.get("METRICS_TOKEN")
+    if not token:
+        return {"status": "error", "message": "Métricas desactivadas (METRICS_TOKEN no configurado)"}, 403
+
+    authorization_header = authorization_header or ""
+    recibido = authorization_header[7:] if authorization_header.startswith("Bearer ") else ""
+    if not recibido or not hmac.compare_digest(recibido.encode("utf-8"), token.encode("utf-8")):
+        logging.warning("Solicitud a /metrics con token inválido")
+        return {"status": "error", "message": "No autorizado"}, 401
+
+    return None
+
+def token_metricas_requerido(f):
+    """
+    Decorador para /metrics: exige "Authorization: Bearer <METRICS_TOKEN>".
+    Si falla, retorna 401 (o 403 si no hay token configurado).
+    """
+    @wraps(f)
+    def funcion_decorada(*args, **kwargs):
+        error = verificar_token_metricas(request.headers.get("Authorization", ""))
+        if error is not None:
+            cuerpo, codigo = error
+            return jsonify(cuerpo), codigo
+
+        return f(*args, **kwargs)
+
+    return funcion_decorada
+
 def firma_requerida(f):
     """
     Decorador para validar solicitudes entrantes al webhook.
@@ -44,23 +119,13 @@ def firma_requerida(f):
     """
     @wraps(f)
     def funcion_decorada(*args, **kwargs):
-        # Extraer firma del header (quitando 'sha256=')
-        firma_header = request.headers.get("X-Hub-Signature-256", "")
-        firma = firma_header[7:] if firma_header.startswith('sha256=') else ""
-        
-        if not firma:
-            logging.warning("Header X-Hub-Signature-256 faltante o mal formado")
-            return jsonify({"status": "error", "message": "Firma no proporcionada"}), 403
-        
-        try:
-            payload = request.data.decode('utf-8')
-        except UnicodeDecodeError:
-            logging.warning("Payload no es UTF-8 válido")
-            return jsonify({"status": "error", "message": "Payload inválido"}), 400
-
-        if not validacion_firma(payload, firma):
-            logging.warning(f"Firma inválida. Header: {firma_header}")
-            return jsonify({"status": "error", "message": "Firma inválida"}), 403
+        error = verificar_solicitud_firmada(
+            request.data,
+            request.headers.get("X-Hub-Signature-256", "")
+        )
+        if error is not None:
+            cuerpo, codigo = error
+            return jsonify(cuerpo), codigo
             
         return f(*args, **kwargs)
     
@@ -0,0 +1,206 @@
+import os
+import threading
+import uuid
+from typing import Any, BinaryIO, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.utils.metrics import register_metrics_provider
+
+GRAPH_API_BASE_URL = "https://graph.facebook.com"
+
+
+class MultipartFileStream:
+    """
+    Cuerpo multipart/form-data que lee el archivo del disco por bloques.
+    requests lo envía tal cual (con Content-Length, sin cargarlo en memoria),
+    a diferencia de `files=`, que arma el cuerpo completo antes de enviarlo.
+    """
+
+    block_size = 64 * 1024
+
+    def __init__(self, filepath: str, mime_type: str, fields: Optional[Dict[str, str]] = None,
+                 file_field: str = "file"):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        preamble = b"".join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8")
+            for name, value in (fields or {}).items()
+        )
+        preamble += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+            f'filename="{os.path.basename(filepath)}"\r\nContent-Type: {mime_type}\r\n\r\n'
+        ).encode("utf-8")
+        epilogue = f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+        self._file: BinaryIO = open(filepath, "rb")
+        self._length = len(preamble) + os.fstat(self._file.fileno()).st_size + len(epilogue)
+        self._parts = [preamble, None, epilogue]  # None = contenido del archivo
+        self._part = 0
+        self._offset = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._length
+        chunks = []
+        while size > 0 and self._part < len(self._parts):
+            part = self._parts[self._part]
+            if part is None:
+                chunk = self._file.read(size)
+            else:
+                chunk = part[self._offset:self._offset + size]
+                self._offset += len(chunk)
+            if not chunk:
+                self._part += 1
+                self._offset = 0
+                continue
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(self.block_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "MultipartFileStream":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GraphClient:
+    """
+    Cliente compartido de la Graph API: una requests.Session con pool de
+    conexiones keep-alive, headers de autenticación y URL base armados una
+    sola vez. No depende del contexto de Flask, así que sirve también desde
+    hilos en segundo plano.
+    """
+
+    def __init__(self, access_token: str, version: str, phone_number_id: str,
+                 base_url: str = GRAPH_API_BASE_URL, pool_size: int = 20,
+                 connect_timeout: float = 3.05, read_timeout: float = 10.0,
+                 upload_timeout: float = 30.0):
+        if not access_token or not version or not phone_number_id:
+            raise ValueError("ACCESS_TOKEN, VERSION y PHONE_NUMBER_ID son requeridos")
+
+        self.phone_number_id = phone_number_id
+        self.base_url = f"{base_url.rstrip('/')}/{version}"
+        self.timeout = (connect_timeout, read_timeout)
+        self.upload_timeout = (connect_timeout, upload_timeout)
+        self.pool_size = max(1, pool_size)
+
+        # Un pool por host; pool_size conexiones reutilizables hacia graph.facebook.com
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {access_token}"})
+
+        self._lock = threading.Lock()
+        self._requests = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "GraphClient":
+        """Construye el cliente a partir del diccionario de configuración"""
+        return cls(
+            access_token=config.get("ACCESS_TOKEN"),
+            version=config.get("VERSION"),
+            phone_number_id=config.get("PHONE_NUMBER_ID"),
+            base_url=config.get("GRAPH_API_BASE_URL") or GRAPH_API_BASE_URL,
+            pool_size=config.get("GRAPH_POOL_SIZE", 20),
+            connect_timeout=config.get("GRAPH_CONNECT_TIMEOUT", 3.05),
+            read_timeout=config.get("GRAPH_READ_TIMEOUT", 10.0),
+            upload_timeout=config.get("GRAPH_UPLOAD_TIMEOUT", 30.0),
+        )
+
+    def url(self, path: str, phone_number_id: Optional[str] = None) -> str:
+        """URL de un recurso del número emisor ("messages", "media", ...)"""
+        return f"{self.base_url}/{phone_number_id or self.phone_number_id}/{path}"
+
+    def post(self, path: str, phone_number_id: Optional[str] = None, **kwargs) -> requests.Response:
+        """POST a un recurso del número emisor; no revisa el status de la respuesta"""
+        kwargs.setdefault("timeout", self.timeout)
+        with self._lock:
+            self._requests += 1
+        return self.session.post(self.url(path, phone_number_id), **kwargs)
+
+    def upload(self, filepath: str, mime_type: str, phone_number_id: Optional[str] = None) -> requests.Response:
+        """Sube un archivo a /media en streaming desde el disco"""
+        with MultipartFileStream(filepath, mime_type, {"messaging_product": "whatsapp", "type": mime_type}) as body:
+            return self.post("media", phone_number_id, data=body, timeout=self.upload_timeout,
+                             headers={"Content-Type": body.content_type})
+
+    def close(self):
+        """Cierra las conexiones del pool"""
+        self.session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"requests": self._requests, "pool_size": self.pool_size}
+
+
+# Cliente del proceso; se crea en create_app o en el primer uso
+_graph_client: Optional[GraphClient] = None
+_graph_client_lock = threading.Lock()
+
+
+def init_graph_client(config: Dict[str, Any]) -> GraphClient:
+    """Crea (o reemplaza) el cliente compartido a partir de la configuración"""
+    global _graph_client
+    client = GraphClient.from_config(config)
+    with _graph_client_lock:
+        previous, _graph_client = _graph_client, client
+    if previous is not None:
+        previous.close()
+    register_metrics_provider("graph_client", client.stats)
+    return client
+
+
+def get_graph_client() -> GraphClient:
+    """
+    Cliente compartido. Si create_app no lo inicializó (scripts, workers
+    sueltos) se crea con la configuración de Flask si hay contexto, o con
+    las variables de entorno. ValueError si faltan credenciales.
+    """
+    global _graph_client
+    client = _graph_client
+    if client is not None:
+        return client
+    try:
+        from flask import current_app
+        config = dict(current_app.config)
+    except RuntimeError:
+        config = {
+            "ACCESS_TOKEN": os.getenv("ACCESS_TOKEN"),
+            "VERSION": os.getenv("VERSION"),
+            "PHONE_NUMBER_ID": os.getenv("PHONE_NUMBER_ID") or os.getenv("TEST_NUMBER_ID"),
+            "GRAPH_API_BASE_URL": os.getenv("GRAPH_API_BASE_URL"),
+        }
+    with _graph_client_lock:
+        if _graph_client is None:
+            _graph_client = GraphClient.from_config(config)
+        client = _graph_client
+    register_metrics_provider("graph_client", client.stats)
+    return client
+
+
+def _reset_after_fork():
+    """Los sockets del pool no se comparten entre procesos: el hijo crea su cliente"""
+    global _graph_client, _graph_client_lock
+    _graph_client_lock = threading.Lock()
+    _graph_client = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
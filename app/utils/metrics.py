@@ -0,0 +1,34 @@
+import logging
+import threading
+from typing import Any, Callable, Dict
+
+# Registro de proveedores de métricas: nombre -> función que retorna un dict
+_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+_lock = threading.Lock()
+
+
+def register_metrics_provider(name: str, provider: Callable[[], Dict[str, Any]]):
+    """Registra (o reemplaza) un proveedor de métricas bajo un nombre"""
+    with _lock:
+        _providers[name] = provider
+
+
+def unregister_metrics_provider(name: str):
+    """Elimina un proveedor de métricas registrado"""
+    with _lock:
+        _providers.pop(name, None)
+
+
+def collect_metrics() -> Dict[str, Any]:
+    """Recolecta las métricas de todos los proveedores registrados"""
+    with _lock:
+        providers = dict(_providers)
+
+    metrics = {}
+    for name, provider in providers.items():
+        try:
+            metrics[name] = provider()
+        except Exception as e:
+            logging.error(f"Error obteniendo métricas de {name}: {e}")
+            metrics[name] = {"error": str(e)}
+    return metrics
@@ -0,0 +1,321 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from app.utils.metrics import register_metrics_provider
+
+# Estados del circuito
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """El circuito del endpoint está abierto: la llamada se rechaza sin salir a la red"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuito {name} abierto (reintento en {retry_in:.1f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Circuito por endpoint. Tras `failure_threshold` fallos consecutivos se
+    abre y rechaza las llamadas durante `open_seconds`; luego deja pasar una
+    sola llamada de prueba (half_open): si responde se cierra, si falla se
+    vuelve a abrir.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, open_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self._state = CIRCUIT_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+        self._trips = 0
+        self._rejected = 0
+        self._successes = 0
+        self._failures = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """True si la llamada puede salir; en half_open solo pasa la prueba"""
+        with self._lock:
+            if self._state == CIRCUIT_OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._state = CIRCUIT_HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == CIRCUIT_CLOSED:
+                return True
+            if self._state == CIRCUIT_HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._rejected += 1
+            return False
+
+    def retry_in(self) -> float:
+        """Segundos hasta la próxima llamada de prueba"""
+        with self._lock:
+            if self._state != CIRCUIT_OPEN:
+                return 0.0
+            return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self._successes += 1
+            self._consecutive_failures = 0
+            if self._state != CIRCUIT_CLOSED:
+                logging.info(f"Circuito {self.name} cerrado")
+            self._state = CIRCUIT_CLOSED
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._consecutive_failures += 1
+            if self._state == CIRCUIT_HALF_OPEN or (
+                self._state == CIRCUIT_CLOSED and self._consecutive_failures >= self.failure_threshold
+            ):
+                self._state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+                self._trips += 1
+                logging.warning(
+                    f"Circuito {self.name} abierto tras {self._consecutive_failures} fallos consecutivos; "
+                    f"se reintenta en {self.open_seconds:.0f}s"
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._state,
+                "trips": self._trips,
+                "rejected": self._rejected,
+                "successes": self._successes,
+                "failures": self._failures,
+                "consecutive_failures": self._consecutive_failures,
+            }
+
+
+class RetryBudget:
+    """
+    Limita los reintentos a `ratio` por cada llamada original dentro de una
+    ventana de `window_seconds`, más `min_per_second` fijos. Cuando un
+    servicio se degrada, los reintentos no multiplican la carga.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, window_seconds: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window_seconds = window_seconds
+        self._requests: deque = deque()
+        self._retries: deque = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        limit = now - self.window_seconds
+        for events in (self._requests, self._retries):
+            while events and events[0] < limit:
+                events.popleft()
+
+    def record_request(self):
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            self._requests.append(now)
+
+    def try_retry(self) -> bool:
+        """Consume un reintento si hay presupuesto"""
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            allowed = self.min_per_second * self.window_seconds + self.ratio * len(self._requests)
+            if len(self._retries) >= allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+
+@dataclass
+class RetryPolicy:
+    """Backoff exponencial con jitter completo entre intentos"""
+    max_attempts: int = 3
+    base_delay: float = 0.2
+    max_delay: float = 2.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Espera antes del intento `attempt + 1` (attempt empieza en 1)"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Header Retry-After (en segundos) de la respuesta HTTP asociada al error, si la hay"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class ResilientEndpoint:
+    """
+    Circuito, presupuesto de reintentos y política de backoff de un endpoint.
+
+    `call` clasifica cada excepción con dos funciones: `is_failure` (cuenta
+    para el circuito; p. ej. timeouts y 5xx, no un 400) e `is_retryable`
+    (se puede repetir sin efectos duplicados).
+    """
+
+    def __init__(self, name: str, breaker: CircuitBreaker, budget: RetryBudget, policy: RetryPolicy):
+        self.name = name
+        self.breaker = breaker
+        self.budget = budget
+        self.policy = policy
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._retries = 0
+        self._retries_denied = 0
+
+    def call(self, fn: Callable, *args,
+             is_failure: Callable[[BaseException], bool] = lambda error: True,
+             is_retryable: Callable[[BaseException], bool] = lambda error: False,
+             **kwargs):
+        """Ejecuta `fn` con reintentos; CircuitOpenError si el circuito no deja pasar la llamada"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.name, self.breaker.retry_in())
+        self.budget.record_request()
+        with self._lock:
+            self._calls += 1
+
+        attempt = 1
+        while True:
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as error:
+                if not is_failure(error):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                retry_after = retry_after_seconds(error)
+                # Un Retry-After mayor que max_delay no se espera: se falla enseguida
+                if (not is_retryable(error) or (retry_after or 0) > self.policy.max_delay
+                        or not self._can_retry(attempt)):
+                    raise
+                delay = self.policy.delay(attempt, retry_after)
+                logging.info(f"Reintento {attempt} de {self.name} en {delay:.2f}s: {error}")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _can_retry(self, attempt: int) -> bool:
+        if attempt >= self.policy.max_attempts:
+            return False
+        if not self.breaker.allow():
+            # El circuito se abrió con este fallo: no insistir
+            return False
+        if not self.budget.try_retry():
+            with self._lock:
+                self._retries_denied += 1
+            return False
+        with self._lock:
+            self._retries += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {"calls": self._calls, "retries": self._retries, "retries_denied": self._retries_denied}
+        return {**self.breaker.stats(), **counters}
+
+
+
+@dataclass
+class ResilienceSettings:
+    """Parámetros compartidos por los endpoints (RESILIENCE_* en la configuración)"""
+    failure_threshold: int = 5
+    open_seconds: float = 30.0
+    max_attempts: int = 3
+    base_delay: float = 0.2
+    max_delay: float = 2.0
+    retry_budget_ratio: float = 0.2
+    retry_budget_min_per_second: float = 1.0
+
+
+# Endpoints por nombre ("openai", "graph.messages", ...), creados en el primer uso
+_settings = ResilienceSettings()
+_endpoints: Dict[str, ResilientEndpoint] = {}
+_endpoints_lock = threading.Lock()
+
+
+def init_resilience(config: Dict[str, Any]) -> ResilienceSettings:
+    """Configura los parámetros de los endpoints; descarta los creados antes"""
+    global _settings
+    with _endpoints_lock:
+        _settings = ResilienceSettings(
+            failure_threshold=config.get("RESILIENCE_FAILURE_THRESHOLD", 5),
+            open_seconds=config.get("RESILIENCE_OPEN_SECONDS", 30.0),
+            max_attempts=config.get("RESILIENCE_MAX_ATTEMPTS", 3),
+            base_delay=config.get("RESILIENCE_BASE_DELAY_SECONDS", 0.2),
+            max_delay=config.get("RESILIENCE_MAX_DELAY_SECONDS", 2.0),
+            retry_budget_ratio=config.get("RESILIENCE_RETRY_BUDGET_RATIO", 0.2),
+        )
+        _endpoints.clear()
+    register_metrics_provider("resilience", resilience_stats)
+    return _settings
+
+
+def get_endpoint(name: str) -> ResilientEndpoint:
+    """Endpoint compartido por todos los hilos del proceso"""
+    endpoint = _endpoints.get(name)
+    if endpoint is not None:
+        return endpoint
+    with _endpoints_lock:
+        endpoint = _endpoints.get(name)
+        if endpoint is None:
+            settings = _settings
+            endpoint = ResilientEndpoint(
+                name,
+                CircuitBreaker(name, settings.failure_threshold, settings.open_seconds),
+                RetryBudget(settings.retry_budget_ratio, settings.retry_budget_min_per_second),
+                RetryPolicy(settings.max_attempts, settings.base_delay, settings.max_delay),
+            )
+            _endpoints[name] = endpoint
+    register_metrics_provider("resilience", resilience_stats)
+    return endpoint
+
+
+def resilience_stats() -> Dict[str, Any]:
+    """Estado del circuito y contadores de cada endpoint"""
+    with _endpoints_lock:
+        endpoints = dict(_endpoints)
+    return {name: endpoint.stats() for name, endpoint in endpoints.items()}
+
+
+def _reset_after_fork():
+    """Cada proceso lleva su propio estado (y un lock tomado en el padre no se hereda tomado)"""
+    global _endpoints_lock
+    _endpoints_lock = threading.Lock()
+    _endpoints.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,229 @@
+import json
+import logging
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# Claves buscadas sobre los bytes crudos en el pre-chequeo de estados
+_STATUSES_KEY = re.compile(rb'"statuses"\s*:')
+_MESSAGES_KEY = re.compile(rb'"messages"\s*:')
+
+# Funciones puras sobre los payloads de WhatsApp (sin dependencias de Flask ni
+# de OpenAI) para compartirlas entre la app Flask y la app asíncrona.
+
+def get_text_message_input(recipient: str, text: str) -> str:
+    """Genera el JSON para mensaje de texto con validación"""
+    if not recipient or not text:
+        raise ValueError("Recipient y text son requeridos")
+    
+    return json.dumps({
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": recipient,
+        "type": "text",
+        "text": {"preview_url": False, "body": text}
+    })
+
+def get_read_receipt_input(message_id: str, typing_indicator: bool = True) -> str:
+    """Genera el JSON que marca un mensaje como leído (y muestra 'escribiendo…')"""
+    if not message_id:
+        raise ValueError("message_id es requerido")
+
+    payload = {"messaging_product": "whatsapp", "status": "read", "message_id": message_id}
+    if typing_indicator:
+        # Meta lo oculta al enviar la respuesta o a los 25 segundos
+        payload["typing_indicator"] = {"type": "text"}
+    return json.dumps(payload)
+
+def process_text_for_whatsapp(text: str) -> str:
+    """Procesa texto para WhatsApp con validación de entrada"""
+    if not isinstance(text, str):
+        text = str(text) if text is not None else ""
+    
+    # Eliminar caracteres Unicode problemáticos de manera más segura
+    text = re.sub(r"[\uff3b\uff3d]", "", text).strip()
+    
+    # Formato de markdown a WhatsApp
+    text = re.sub(r"\*\*(.*?)\*\*", r"*\1*", text)
+    
+    return text
+
+def safe_get_nested_value(data: Dict[Any, Any], path: list, default=None):
+    """Obtiene valores anidados de manera segura"""
+    try:
+        current = data
+        for key in path:
+            if isinstance(current, dict) and key in current:
+                current = current[key]
+            elif isinstance(current, list) and isinstance(key, int) and 0 <= key < len(current):
+                current = current[key]
+            else:
+                return default
+        return current
+    except (TypeError, KeyError, IndexError):
+        return default
+
+@dataclass(slots=True)
+class WhatsAppMessageEvent:
+    """Un mensaje entrante junto con el contacto que lo envió"""
+    wa_id: str
+    name: str
+    message_id: Optional[str]
+    message_type: Optional[str]
+    text: str = ""
+    timestamp: Optional[str] = None
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+
+@dataclass(slots=True)
+class StatusEvent:
+    """Actualización de estado de un mensaje saliente (sent/delivered/read/failed)"""
+    message_id: Optional[str]
+    recipient_id: Optional[str]
+    status: Optional[str]
+    timestamp: Optional[str] = None
+    error_code: Optional[int] = None
+    error_title: Optional[str] = None
+
+
+@dataclass(slots=True)
+class WebhookEvent:
+    """Resultado de parsear una sola vez el cuerpo del webhook"""
+    object: Optional[str]
+    messages: List[WhatsAppMessageEvent] = field(default_factory=list)
+    statuses: List[StatusEvent] = field(default_factory=list)
+
+    @property
+    def is_valid_message_event(self) -> bool:
+        """Tiene `object` y al menos un mensaje con remitente identificable"""
+        return self.object is not None and bool(self.messages)
+
+
+def _iter_change_values(body: Dict[Any, Any]):
+    """Recorre los `value` de todas las entradas y cambios del webhook"""
+    for entry in body.get("entry") or []:
+        if not isinstance(entry, dict):
+            continue
+        for change in entry.get("changes") or []:
+            if isinstance(change, dict) and isinstance(change.get("value"), dict):
+                yield change["value"]
+
+
+def _parse_status(status: Dict[str, Any]) -> StatusEvent:
+    """Convierte un elemento de `statuses` en StatusEvent"""
+    errors = status.get("errors") or [{}]
+    error = errors[0] if isinstance(errors[0], dict) else {}
+    return StatusEvent(
+        message_id=status.get("id"),
+        recipient_id=status.get("recipient_id"),
+        status=status.get("status"),
+        timestamp=status.get("timestamp"),
+        error_code=error.get("code"),
+        error_title=error.get("title"),
+    )
+
+
+def parse_webhook_body(body: Dict[Any, Any]) -> WebhookEvent:
+    """
+    Recorre una sola vez el cuerpo ya decodificado y extrae todos los pares
+    (contacto, mensaje) y todas las actualizaciones de estado.
+
+    Meta puede agrupar varios mensajes, e incluso varios usuarios, en un mismo
+    POST; cada mensaje se asocia a su contacto por `from` == `wa_id`.
+    """
+    if not isinstance(body, dict):
+        return WebhookEvent(object=None)
+
+    event = WebhookEvent(object=body.get("object"))
+    for value in _iter_change_values(body):
+        for status in value.get("statuses") or []:
+            if isinstance(status, dict):
+                event.statuses.append(_parse_status(status))
+
+        messages = value.get("messages")
+        if not messages:
+            continue
+
+        contacts = [c for c in value.get("contacts") or [] if isinstance(c, dict)]
+        contacts_by_wa_id = {c.get("wa_id"): c for c in contacts if c.get("wa_id")}
+
+        for message in messages:
+            if not isinstance(message, dict):
+                continue
+
+            wa_id = message.get("from")
+            if not wa_id and len(contacts) == 1:
+                # Sin `from`: solo es seguro asumir el contacto si es único
+                wa_id = contacts[0].get("wa_id")
+            if not wa_id:
+                logging.warning(f"Mensaje sin remitente identificable: {message.get('id')}")
+                continue
+
+            contact = contacts_by_wa_id.get(wa_id, {})
+            event.messages.append(WhatsAppMessageEvent(
+                wa_id=wa_id,
+                name=safe_get_nested_value(contact, ["profile", "name"], "Cliente"),
+                message_id=message.get("id"),
+                message_type=message.get("type"),
+                text=safe_get_nested_value(message, ["text", "body"], "") or "",
+                timestamp=message.get("timestamp"),
+                raw=message,
+            ))
+
+    return event
+
+
+def parse_webhook_payload(raw_body: bytes) -> WebhookEvent:
+    """
+    Decodifica el JSON directamente desde los bytes del request (una sola vez).
+
+    Raises:
+        ValueError: si el cuerpo no es JSON válido (incluye UTF-8 inválido).
+    """
+    return parse_webhook_body(json.loads(raw_body))
+
+
+def is_status_only_payload(raw_body: bytes) -> bool:
+    """
+    Pre-chequeo barato sobre los bytes: el webhook solo trae `statuses`.
+
+    Permite descartar sin parsear el JSON la mayor parte del tráfico entrante
+    (sent/delivered/read), que no requiere respuesta.
+    """
+    # Se buscan las claves (seguidas de ':'), ya que "messages" también aparece
+    # como valor de "field" en los eventos de estado
+    return (
+        _STATUSES_KEY.search(raw_body) is not None
+        and _MESSAGES_KEY.search(raw_body) is None
+    )
+
+
+def extract_message_events(body: Dict[Any, Any]) -> List[WhatsAppMessageEvent]:
+    """Extrae todos los pares (contacto, mensaje) del webhook ya decodificado"""
+    return parse_webhook_body(body).messages
+
+
+def group_events_by_wa_id(events: List[WhatsAppMessageEvent]) -> "OrderedDict[str, List[WhatsAppMessageEvent]]":
+    """Agrupa los eventos por cliente conservando el orden de llegada"""
+    groups: "OrderedDict[str, List[WhatsAppMessageEvent]]" = OrderedDict()
+    for event in events:
+        groups.setdefault(event.wa_id, []).append(event)
+    return groups
+
+
+def is_valid_whatsapp_message(body: Dict[Any, Any]) -> bool:
+    """Validación robusta de estructura de mensaje WhatsApp"""
+    if not isinstance(body, dict):
+        return False
+    
+    event = parse_webhook_body(body)
+    if event.object is None:
+        logging.warning("Estructura de mensaje inválida: falta object")
+        return False
+
+    if not event.messages:
+        logging.warning("Estructura de mensaje inválida: no hay mensajes con wa_id")
+        return False
+    
+    return True
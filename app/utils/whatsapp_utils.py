@@ -1,17 +1,50 @@
-from flask import current_app, jsonify
-import json
+from flask import jsonify
 import os
 import requests
-import re
 import logging
 import mimetypes
-from typing import Optional, Dict, Any
+from concurrent.futures import Future
+from functools import partial
+from typing import Callable, Optional, Dict, Any, List, Union
 
-try:
-    from app.services.assistant_instance import assistant_manager_instance as assistant
-except ImportError as e:
-    logging.error(f"Error importando assistant_manager_instance: {e}")
-    assistant = None
+from app.services.assistant_manager import get_assistant_manager
+from app.services.conversation_scheduler import (
+    ConversationQueueFullError,
+    Deferred,
+    chain,
+    get_conversation_scheduler,
+    resolve,
+)
+from app.services.media_cache import get_media_cache
+from app.services.message_debouncer import get_message_debouncer
+from app.services.message_deduplicator import discard_duplicate_events, forget_events
+from app.services.message_router import get_message_router
+from app.services.openai_rate_limiter import PRIORITY_ORDER
+from app.services.outbound_dispatcher import (
+    SEND_PRIORITY_REPLY,
+    OutboundMessage,
+    get_outbound_dispatcher,
+    is_throttling_error,
+)
+from app.services.reply_streaming import ProgressiveReply, get_reply_streamer
+from app.utils.graph_client import get_graph_client
+from app.utils.resilience import CircuitOpenError, get_endpoint
+from app.utils.whatsapp_payload import (
+    WebhookEvent,
+    WhatsAppMessageEvent,
+    get_read_receipt_input,
+    get_text_message_input,
+    group_events_by_wa_id,
+    parse_webhook_body,
+    process_text_for_whatsapp,
+)
+
+# Espera máxima por la confirmación de un envío que pasa por el despachador
+OUTBOUND_RESULT_TIMEOUT = 60.0
+
+# Respuestas al cliente cuando la generación falla o queda vacía
+GENERATION_ERROR_MESSAGE = "Lo siento, ocurrió un error procesando tu mensaje."
+EMPTY_RESPONSE_MESSAGE = "Lo siento, no pude generar una respuesta."
 
 # Configuración de logging
 logging.basicConfig(
@@ -19,6 +52,75 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Endpoints de la Graph API en app.utils.resilience
+GRAPH_MESSAGES_ENDPOINT = "graph.messages"
+GRAPH_MEDIA_ENDPOINT = "graph.media"
+
+# Estados que se reintentan solo en llamadas idempotentes (subida de media)
+IDEMPOTENT_RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+def is_graph_failure(error: BaseException) -> bool:
+    """Fallos del servicio (cuentan para el circuito): red, timeouts, 429 y 5xx"""
+    if isinstance(error, requests.exceptions.HTTPError):
+        status = error.response.status_code if error.response is not None else 0
+        return status == 429 or status >= 500
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+def is_graph_retryable(error: BaseException) -> bool:
+    """
+    Reintentos de /messages (no idempotente): solo lo que no llegó a Meta
+    (error de conexión) o lo que Meta rechazó por throttling. Tras un
+    timeout de lectura o un 5xx el mensaje pudo haberse enviado.
+    """
+    if isinstance(error, requests.exceptions.HTTPError):
+        return is_throttling_error(error)
+    return isinstance(error, requests.exceptions.ConnectionError)
+
+def is_graph_idempotent_retryable(error: BaseException) -> bool:
+    """Reintentos de llamadas sin efectos duplicados: además de la red, 429 y 5xx"""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code in IDEMPOTENT_RETRYABLE_STATUS_CODES
+    return isinstance(error, requests.exceptions.ConnectionError)
+
+def graph_post(endpoint: str, path: str,
+               is_failure: Callable[[BaseException], bool] = is_graph_failure,
+               is_retryable: Callable[[BaseException], bool] = is_graph_retryable,
+               **kwargs) -> requests.Response:
+    """
+    POST a un recurso del número emisor ("messages", "media") con el cliente
+    compartido, circuito y reintentos (CircuitOpenError si está abierto)
+    """
+    client = get_graph_client()
+
+    def _post():
+        response = client.post(path, **kwargs)
+        response.raise_for_status()
+        return response
+
+    return get_endpoint(endpoint).call(_post, is_failure=is_failure, is_retryable=is_retryable)
+
+def deliver_outbound(message: OutboundMessage) -> requests.Response:
+    """
+    Envío real del despachador de salida. El throttling de Meta no cuenta
+    para el circuito ni se reintenta aquí: el despachador pausa el número
+    emisor y reencola el mensaje.
+    """
+    return graph_post(
+        GRAPH_MESSAGES_ENDPOINT,
+        message.path,
+        is_failure=lambda error: is_graph_failure(error) and not is_throttling_error(error),
+        is_retryable=lambda error: is_graph_retryable(error) and not is_throttling_error(error),
+        phone_number_id=message.phone_number_id,
+        **message.request
+    )
+
+def post_message(request: Dict[str, Any], priority: int = SEND_PRIORITY_REPLY) -> requests.Response:
+    """POST a /messages por el despachador de salida (o directo si está desactivado)"""
+    dispatcher = get_outbound_dispatcher()
+    if dispatcher is None:
+        return graph_post(GRAPH_MESSAGES_ENDPOINT, "messages", **request)
+    return dispatcher.submit(request, priority=priority).result(timeout=OUTBOUND_RESULT_TIMEOUT)
+
 def log_http_response(response):
     """Log de respuesta HTTP con manejo seguro de contenido"""
     try:
@@ -30,46 +132,16 @@ def log_http_response(response):
     except Exception as e:
         logging.error(f"Error logging response: {e}")
 
-def get_text_message_input(recipient: str, text: str) -> str:
-    """Genera el JSON para mensaje de texto con validación"""
-    if not recipient or not text:
-        raise ValueError("Recipient y text son requeridos")
-    
-    return json.dumps({
-        "messaging_product": "whatsapp",
-        "recipient_type": "individual",
-        "to": recipient,
-        "type": "text",
-        "text": {"preview_url": False, "body": text}
-    })
-
-def get_required_config(key: str) -> str:
-    """Obtiene configuración requerida con manejo de errores"""
-    try:
-        value = current_app.config.get(key)
-        if not value:
-            raise ValueError(f"Configuración {key} no encontrada o vacía")
-        return value
-    except RuntimeError:
-        raise RuntimeError(f"No hay contexto de aplicación Flask para obtener {key}")
-
-def send_message(data: str) -> Optional[requests.Response]:
+def send_message(data: str, priority: int = SEND_PRIORITY_REPLY) -> Optional[requests.Response]:
     """Envía mensaje con manejo robusto de errores y configuración"""
     try:
-        headers = {
-            "Content-type": "application/json",
-            "Authorization": f"Bearer {get_required_config('ACCESS_TOKEN')}"
-        }
-
-        version = get_required_config('VERSION')
-        phone_id = get_required_config('PHONE_NUMBER_ID')
-        url = f"https://graph.facebook.com/{version}/{phone_id}/messages"
-
-        response = requests.post(url, data=data, headers=headers, timeout=10)
-        response.raise_for_status()
+        response = post_message({"data": data, "headers": {"Content-type": "application/json"}}, priority)
         log_http_response(response)
         return response
         
+    except CircuitOpenError as e:
+        logging.warning(f"Mensaje no enviado: {e}")
+        return None
     except ValueError as e:
         logging.error(f"Error de configuración: {e}")
         return None
@@ -80,117 +152,274 @@ def send_message(data: str) -> Optional[requests.Response]:
         logging.error(f"Error inesperado enviando mensaje: {e}")
         return None
 
-def process_text_for_whatsapp(text: str) -> str:
-    """Procesa texto para WhatsApp con validación de entrada"""
-    if not isinstance(text, str):
-        text = str(text) if text is not None else ""
-    
-    # Eliminar caracteres Unicode problemáticos de manera más segura
-    text = re.sub(r"[\uff3b\uff3d]", "", text).strip()
-    
-    # Formato de markdown a WhatsApp
-    text = re.sub(r"\*\*(.*?)\*\*", r"*\1*", text)
-    
-    return text
+def send_text_message(wa_id: str, text: str) -> bool:
+    """Envía un trozo de respuesta con formato de WhatsApp; retorna si se envió"""
+    formatted = process_text_for_whatsapp(text)
+    if not formatted:
+        return True
+    return bool(send_message(get_text_message_input(wa_id, formatted)))
 
-def safe_get_nested_value(data: Dict[Any, Any], path: list, default=None):
-    """Obtiene valores anidados de manera segura"""
-    try:
-        current = data
-        for key in path:
-            if isinstance(current, dict) and key in current:
-                current = current[key]
-            elif isinstance(current, list) and isinstance(key, int) and 0 <= key < len(current):
-                current = current[key]
-            else:
-                return default
-        return current
-    except (TypeError, KeyError, IndexError):
-        return default
+def send_read_receipt(message_id: str):
+    """
+    Acuse de lectura con "escribiendo…" por la cola de salida, sin esperar
+    a Meta: si falla solo se registra, la respuesta sale igual
+    """
+    request = {"data": get_read_receipt_input(message_id), "headers": {"Content-type": "application/json"}}
+    dispatcher = get_outbound_dispatcher()
+    if dispatcher is None:
+        graph_post(GRAPH_MESSAGES_ENDPOINT, "messages", **request)
+        return
 
-def process_whatsapp_message(body: Dict[Any, Any]):
-    """Procesa mensaje de WhatsApp con validación robusta"""
-    if not is_valid_whatsapp_message(body):
-        return jsonify({"status": "error", "message": "Mensaje no válido"}), 400
+    def _log_failure(future):
+        if not future.cancelled() and future.exception() is not None:
+            logging.warning(f"Acuse de lectura de {message_id} no enviado: {future.exception()}")
 
-    if not assistant:
-        logging.error("Assistant no disponible")
-        return jsonify({"status": "error", "message": "Servicio no disponible"}), 503
+    dispatcher.submit(request, priority=SEND_PRIORITY_REPLY).add_done_callback(_log_failure)
+
+def acknowledge_messages(groups: Dict[str, List[WhatsAppMessageEvent]]):
+    """Marca como leído el último mensaje de texto de cada cliente (y los anteriores con él)"""
+    streamer = get_reply_streamer()
+    if streamer is None:
+        return
+    for conversation in groups.values():
+        texts = [event for event in conversation if event.message_type == "text" and event.text]
+        if texts:
+            streamer.acknowledge(texts[-1].message_id)
 
+def reply_to_messages(wa_id: str, name: str, texts: List[str]) -> Union[bool, Deferred]:
+    """
+    Genera una respuesta para los textos del cliente y la envía; retorna si
+    se envió. En modo stream los párrafos terminados salen mientras se genera
+    el resto, y toda respuesta se divide según el límite de WhatsApp.
+    Si el run queda en el RunTracker (modo poll) retorna un Deferred: la
+    respuesta se envía cuando el run termina, sin ocupar este hilo mientras tanto.
+    """
+    def send(chunk: str) -> bool:
+        return send_text_message(wa_id, chunk)
+
+    streamer = get_reply_streamer()
+    reply = streamer.start(send) if streamer is not None else ProgressiveReply(send, progressive=False)
     try:
-        # Extracción segura de datos usando helper function
-        contacts_path = ["entry", 0, "changes", 0, "value", "contacts", 0]
-        messages_path = ["entry", 0, "changes", 0, "value", "messages", 0]
-        
-        contact = safe_get_nested_value(body, contacts_path, {})
-        message = safe_get_nested_value(body, messages_path, {})
-        
-        wa_id = contact.get("wa_id")
-        name = safe_get_nested_value(contact, ["profile", "name"], "Cliente")
-        
-        if not wa_id:
-            logging.error("wa_id no encontrado en el mensaje")
-            return jsonify({"status": "error", "message": "ID de usuario no válido"}), 400
+        # Saludos, precios, stock y charla se responden sin llegar al asistente
+        router = get_message_router()
+        decision = router.route(texts, name, wa_id) if router is not None else None
+        if decision is not None and decision.response:
+            logging.info(f"Mensaje de {wa_id} resuelto localmente ({decision.route}/{decision.intent})")
+            response = decision.response
+            # El asistente ve el turno en el historial; se escribe fuera del camino de la respuesta
+            get_assistant_manager().record_exchange(texts, wa_id, name, response)
+        else:
+            # Una compra en curso pasa por el carril de pedidos del limitador de OpenAI
+            purchasing = (
+                decision is not None and decision.intent == "purchase"
+                and decision.confidence >= router.min_confidence
+            )
+            future = get_assistant_manager().submit_response_for_messages(
+                messages=texts,
+                wa_id=wa_id,
+                name=name,
+                on_delta=reply.on_delta if reply.progressive else None,
+                priority=PRIORITY_ORDER if purchasing else None
+            )
+            if not future.done():
+                return Deferred(future, partial(_finish_pending_reply, reply))
+            response = future.result()
+    except Exception as e:
+        logging.error(f"Error generando respuesta del asistente: {e}")
+        response = GENERATION_ERROR_MESSAGE
 
-        if message.get("type") != "text":
-            logging.info(f"Tipo de mensaje no soportado: {message.get('type')}")
-            return jsonify({"status": "ignored", "message": "Tipo no soportado"}), 200
+    return _finish_reply(reply, response)
 
-        message_body = safe_get_nested_value(message, ["text", "body"], "")
-        
-        if not message_body:
-            logging.warning("Mensaje vacío recibido")
-            return jsonify({"status": "ignored", "message": "Mensaje vacío"}), 200
+def _finish_pending_reply(reply: ProgressiveReply, done: Future) -> bool:
+    """Continuación de reply_to_messages cuando el run termina"""
+    try:
+        response = done.result()
+    except Exception as e:
+        logging.error(f"Error generando respuesta del asistente: {e}")
+        response = GENERATION_ERROR_MESSAGE
+    return _finish_reply(reply, response)
+
+def _finish_reply(reply: ProgressiveReply, response: Optional[str]) -> bool:
+    """Envía lo que falta de la respuesta; retorna si se envió"""
+    if not response:
+        logging.warning("Assistant devolvió respuesta vacía")
+        response = EMPTY_RESPONSE_MESSAGE
+    return reply.finish(response)
+
+def respond_to_burst(wa_id: str, events: List[WhatsAppMessageEvent]) -> Union[None, Deferred]:
+    """Handler del debouncer: responde con un solo run a la ráfaga del cliente"""
+    def _log_failure(sent: bool):
+        if not sent:
+            logging.error(f"No se pudo enviar la respuesta agrupada a {wa_id}")
+
+    return chain(reply_to_messages(wa_id, events[-1].name, [event.text for event in events]), _log_failure)
+
+def process_message_event(event: WhatsAppMessageEvent) -> Union[Dict[str, Any], Deferred]:
+    """Genera y envía la respuesta a un mensaje; retorna su estado individual"""
+    result = {"message_id": event.message_id, "wa_id": event.wa_id}
+
+    if event.message_type != "text":
+        logging.info(f"Tipo de mensaje no soportado: {event.message_type}")
+        return {**result, "status": "ignored", "message": "Tipo no soportado"}
+
+    if not event.text:
+        logging.warning("Mensaje vacío recibido")
+        return {**result, "status": "ignored", "message": "Mensaje vacío"}
 
-        # Generar respuesta del asistente
+    # Con ventana de agrupación activa, la respuesta sale cuando termina la ráfaga
+    debouncer = get_message_debouncer()
+    if debouncer is not None:
+        debouncer.submit(event)
+        return {**result, "status": "debounced"}
+
+    def _status(sent: bool) -> Dict[str, Any]:
+        if sent:
+            return {**result, "status": "success"}
+        return {**result, "status": "error", "message": "Error enviando mensaje"}
+
+    return chain(reply_to_messages(event.wa_id, event.name, [event.text]), _status)
+
+def _process_conversation(events: List[WhatsAppMessageEvent],
+                          results: Optional[List[Dict[str, Any]]] = None) -> Union[List[Dict[str, Any]], Deferred]:
+    """
+    Procesa en orden los mensajes de un mismo cliente. Si un mensaje espera
+    a su run, el resto continúa cuando ese run termina (Deferred).
+    """
+    results = [] if results is None else results
+    for index, event in enumerate(events):
         try:
-            response = assistant.generate_response(
-                message_body=message_body,
-                wa_id=wa_id,
-                name=name
-            )
+            outcome = process_message_event(event)
         except Exception as e:
-            logging.error(f"Error generando respuesta del asistente: {e}")
-            response = "Lo siento, ocurrió un error procesando tu mensaje."
+            logging.error(f"Error procesando mensaje {event.message_id}: {e}", exc_info=True)
+            outcome = {
+                "message_id": event.message_id,
+                "wa_id": event.wa_id,
+                "status": "error",
+                "message": "Error interno del servidor",
+            }
+        if isinstance(outcome, Deferred):
+            remaining = events[index + 1:]
+            return chain(outcome, lambda result: _process_conversation(remaining, results + [result]))
+        results.append(outcome)
+    return results
 
-        if not response:
-            logging.warning("Assistant devolvió respuesta vacía")
-            response = "Lo siento, no pude generar una respuesta."
+def schedule_burst_response(wa_id: str, events: List[WhatsAppMessageEvent]):
+    """Handler del debouncer: encola la respuesta de la ráfaga en la conversación"""
+    scheduler = get_conversation_scheduler()
+    if scheduler is None:
+        resolve(respond_to_burst(wa_id, events))
+        return
 
-        formatted_response = process_text_for_whatsapp(response)
-        message_data = get_text_message_input(wa_id, formatted_response)
-        
-        send_result = send_message(message_data)
-        
-        if send_result:
-            return jsonify({"status": "success"}), 200
-        else:
-            return jsonify({"status": "error", "message": "Error enviando mensaje"}), 500
+    def _log_failure(future):
+        if future.exception() is not None:
+            logging.error(f"Ráfaga de {wa_id} no procesada: {future.exception()}")
+
+    scheduler.submit(wa_id, respond_to_burst, wa_id, events).add_done_callback(_log_failure)
+
+def _conversation_results(conversation: List[WhatsAppMessageEvent], status: str,
+                          message: Optional[str] = None) -> List[Dict[str, Any]]:
+    """El mismo estado para todos los mensajes de una conversación"""
+    return [
+        {"message_id": event.message_id, "wa_id": event.wa_id, "status": status,
+         **({"message": message} if message else {})}
+        for event in conversation
+    ]
+
+def _log_conversation_outcome(wa_id: str, future: Future):
+    """Registra los estados de una conversación que el webhook no esperó"""
+    if future.exception() is not None:
+        logging.error(f"Conversación de {wa_id} no procesada: {future.exception()}")
+        return
+    for result in future.result():
+        logging.info(f"Mensaje {result.get('message_id')} de {result.get('wa_id')}: {result.get('status')}")
+
+def process_message_events(events: List[WhatsAppMessageEvent], wait: bool = True) -> List[Dict[str, Any]]:
+    """
+    Procesa todos los mensajes del webhook, no solo el primero.
+
+    Los mensajes se agrupan por wa_id y se ejecutan en el scheduler de
+    conversaciones: cada cliente se atiende en orden (también entre webhooks
+    concurrentes) y clientes distintos en paralelo. Retorna un estado por
+    mensaje; con `wait=False` no espera las respuestas (estado "scheduled")
+    y los estados finales solo se registran en el log.
+    """
+    # Los reintentos de Meta se descartan antes de cualquier trabajo con OpenAI o la DB
+    events, results = discard_duplicate_events(events)
+    groups = group_events_by_wa_id(events)
+    if not groups:
+        return results
+
+    # El cliente ve "leído" y "escribiendo…" mientras se genera la respuesta
+    acknowledge_messages(groups)
+
+    scheduler = get_conversation_scheduler()
+    if scheduler is None:
+        for conversation in groups.values():
+            results.extend(resolve(_process_conversation(conversation)))
+        return results
+
+    futures = [
+        (scheduler.submit(wa_id, _process_conversation, conversation), conversation)
+        for wa_id, conversation in groups.items()
+    ]
+
+    for future, conversation in futures:
+        if not wait and not future.done():
+            future.add_done_callback(partial(_log_conversation_outcome, conversation[0].wa_id))
+            results.extend(_conversation_results(conversation, "scheduled"))
+            continue
+        try:
+            results.extend(future.result())
+        except ConversationQueueFullError as e:
+            logging.warning(str(e))
+            # No se procesaron: el reintento de Meta no debe descartarse como duplicado
+            forget_events(conversation)
+            results.extend(_conversation_results(conversation, "rejected", "Demasiados mensajes pendientes"))
+        except Exception as e:
+            logging.error(f"Error procesando conversación de {conversation[0].wa_id}: {e}", exc_info=True)
+            results.extend(_conversation_results(conversation, "error", "Error interno del servidor"))
+    return results
+
+def process_webhook_event(event: WebhookEvent, wait: bool = True):
+    """Procesa todos los mensajes de un webhook ya parseado"""
+    if not event.is_valid_message_event:
+        return jsonify({"status": "error", "message": "Mensaje no válido"}), 400
+
+    try:
+        get_assistant_manager()
+    except ValueError as e:
+        logging.error(f"Assistant no disponible: {e}")
+        return jsonify({"status": "error", "message": "Servicio no disponible"}), 503
+
+    try:
+        results = process_message_events(event.messages, wait=wait)
+        for result in results:
+            logging.info(f"Mensaje {result.get('message_id')} de {result.get('wa_id')}: {result.get('status')}")
+
+        if any(result["status"] == "rejected" for result in results):
+            # Meta reintenta el webhook; los mensajes ya atendidos se descartan como duplicados
+            return jsonify({"status": "error", "results": results}), 503
+        if results and all(result["status"] == "error" for result in results):
+            return jsonify({"status": "error", "results": results}), 500
+        return jsonify({"status": "success", "results": results}), 200
 
     except Exception as e:
-        logging.error(f"Error en process_whatsapp_message: {str(e)}", exc_info=True)
+        logging.error(f"Error en process_webhook_event: {str(e)}", exc_info=True)
         return jsonify({"status": "error", "message": "Error interno del servidor"}), 500
 
-def is_valid_whatsapp_message(body: Dict[Any, Any]) -> bool:
-    """Validación robusta de estructura de mensaje WhatsApp"""
-    if not isinstance(body, dict):
-        return False
-    
-    required_paths = [
-        ["object"],
-        ["entry", 0, "changes", 0, "value", "messages", 0],
-        ["entry", 0, "changes", 0, "value", "contacts", 0, "wa_id"]
-    ]
-    
-    for path in required_paths:
-        if safe_get_nested_value(body, path) is None:
-            logging.warning(f"Estructura de mensaje inválida: falta {' -> '.join(map(str, path))}")
-            return False
-    
-    return True
+def dispatch_webhook_event(event: WebhookEvent):
+    """
+    Handler del pool del webhook: programa las conversaciones sin esperar
+    sus respuestas, así un run largo no retiene al worker del pool
+    """
+    return process_webhook_event(event, wait=False)
+
+def process_whatsapp_message(body: Dict[Any, Any]):
+    """Procesa todos los mensajes de WhatsApp del webhook con validación robusta"""
+    return process_webhook_event(parse_webhook_body(body))
 
 def upload_media(filepath: str) -> Optional[str]:
-    """Sube media con detección automática de tipo y validación"""
+    """Sube media (o reutiliza la ya subida) con detección automática de tipo y validación"""
     if not filepath or not os.path.exists(filepath):
         logging.error(f"Archivo no encontrado: {filepath}")
         return None
@@ -201,42 +430,41 @@ def upload_media(filepath: str) -> Optional[str]:
         mime_type = "application/octet-stream"
     
     try:
-        version = get_required_config('VERSION')
-        phone_id = get_required_config('PHONE_NUMBER_ID')
-        access_token = get_required_config('ACCESS_TOKEN')
-        
-        url = f"https://graph.facebook.com/{version}/{phone_id}/media"
-        headers = {"Authorization": f"Bearer {access_token}"}
-        
-        with open(filepath, "rb") as file:
-            files = {"file": (os.path.basename(filepath), file, mime_type)}
-            response = requests.post(url, headers=headers, files=files, timeout=30)
+        client = get_graph_client()
+
+        def _upload():
+            # Cada intento abre un cuerpo nuevo que lee el archivo desde el inicio
+            response = client.upload(filepath, mime_type)
             response.raise_for_status()
-            
-            result = response.json()
-            return result.get("id")
-            
+            return response
+
+        def _upload_with_resilience() -> Optional[str]:
+            response = get_endpoint(GRAPH_MEDIA_ENDPOINT).call(
+                _upload, is_failure=is_graph_failure, is_retryable=is_graph_idempotent_retryable
+            )
+            return response.json().get("id")
+
+        # Un archivo ya subido (mismo contenido) reutiliza su media ID
+        cache = get_media_cache()
+        if cache is None:
+            return _upload_with_resilience()
+        return cache.get_or_upload(filepath, mime_type, client.phone_number_id, _upload_with_resilience)
+
+    except CircuitOpenError as e:
+        logging.warning(f"Media no subida: {e}")
+        return None
     except Exception as e:
         logging.error(f"Error al subir media: {e}")
         return None
 
-def send_image_message(recipient: str, image_url: str, caption: str = "") -> Optional[Dict]:
+def send_image_message(recipient: str, image_url: str, caption: str = "",
+                       priority: int = SEND_PRIORITY_REPLY) -> Optional[Dict]:
     """Envía mensaje de imagen con validación"""
     if not recipient or not image_url:
         logging.error("Recipient e image_url son requeridos")
         return None
     
     try:
-        version = get_required_config('VERSION')
-        phone_id = get_required_config('PHONE_NUMBER_ID')
-        access_token = get_required_config('ACCESS_TOKEN')
-        
-        url = f"https://graph.facebook.com/{version}/{phone_id}/messages"
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-
         payload = {
             "messaging_product": "whatsapp",
             "to": recipient,
@@ -244,10 +472,12 @@ def send_image_message(recipient: str, image_url: str, caption: str = "") -> Opt
             "image": {"link": image_url, "caption": caption}
         }
 
-        response = requests.post(url, headers=headers, json=payload, timeout=10)
-        response.raise_for_status()
+        response = post_message({"json": payload}, priority)
         return response.json()
         
+    except CircuitOpenError as e:
+        logging.warning(f"Imagen no enviada: {e}")
+        return None
     except Exception as e:
         logging.error(f"Error al enviar imagen: {e}")
         return None
\ No newline at end of file
@@ -0,0 +1,13 @@
+from flask import Blueprint, jsonify
+
+from app.utils.decorators import token_metricas_requerido
+from app.utils.metrics import collect_metrics
+
+metrics_blueprint = Blueprint("metrics", __name__)
+
+
+# GET: Métricas internas (colas, cachés, etc.) para dimensionar el servicio; requiere METRICS_TOKEN
+@metrics_blueprint.route("/metrics", methods=["GET"])
+@token_metricas_requerido
+def metrics_get():
+    return jsonify(collect_metrics()), 200
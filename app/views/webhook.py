@@ -1,47 +1,73 @@
 import logging
-import json
 
 from flask import Blueprint, request, jsonify, current_app
 
+from app.database.message_status import get_status_batch_writer
+from app.services.webhook_worker_pool import get_webhook_worker_pool
 from app.utils.decorators import firma_requerida
-from app.utils.whatsapp_utils import (
-    process_whatsapp_message,
-    is_valid_whatsapp_message,
-)
+from app.utils.whatsapp_payload import is_status_only_payload, parse_webhook_payload
+from app.utils.whatsapp_utils import process_webhook_event
 
 webhook_blueprint = Blueprint("webhook", __name__)
 
 
 def handle_message():
 
-    body = request.get_json()
-    # logging.info(f"request body: {body}")
+    # Mismos bytes sobre los que firma_requerida calculó el HMAC (sin copiar ni decodificar)
+    raw_body = request.get_data(cache=True)
 
-    # Verifica si el evento es un mensaje de WhatsApp
-    if (
-        body.get("entry", [{}])[0]
-        .get("changes", [{}])[0]
-        .get("value", {})
-        .get("statuses")
-    ):
+    status_writer = get_status_batch_writer()
+
+    # Pre-chequeo barato: los eventos de solo estado no requieren respuesta
+    status_only = is_status_only_payload(raw_body)
+    if status_only and status_writer is None:
         logging.info("Reciví un evento/actualización de estado de WhatsApp")
         return jsonify({"status": "ok"}), 200
 
     try:
-        if is_valid_whatsapp_message(body):
-            process_whatsapp_message(body)
-            return jsonify({"status": "ok"}), 200
-        else:
-            # Si la solicitud no es un mensaje de WhatsApp válido, devuelve un error 404
-            return (
-                jsonify({"status": "error", "message": "No es un evento de WhatsApp válido"}),
-                404,
-            )
-    except json.JSONDecodeError:
+        # Único parseo del JSON a un evento tipado
+        event = parse_webhook_payload(raw_body)
+    except ValueError:
         logging.error("Fallo al decodificar el JSON")
         # Si la carga útil no es un JSON válido, devuelve un error 400
         return jsonify({"status": "error", "message": "JSON proporcionado no válido"}), 400
 
+    # Los estados solo se añaden al buffer; el INSERT ocurre en lote en segundo plano
+    if event.statuses and status_writer is not None:
+        status_writer.add(event.statuses)
+
+    if status_only:
+        logging.info("Reciví un evento/actualización de estado de WhatsApp")
+        return jsonify({"status": "ok"}), 200
+
+    if event.is_valid_message_event:
+        # Modo asíncrono: encolar y responder de inmediato para evitar reintentos de Meta
+        pool = get_webhook_worker_pool()
+        if pool is not None:
+            if pool.submit(event):
+                return jsonify({"status": "ok"}), 200
+            return (
+                jsonify({"status": "error", "message": "Servicio saturado, intenta más tarde"}),
+                503,
+            )
+
+        response, status = process_webhook_event(event)
+        # Conversación saturada: un 503 hace que Meta reintente los mensajes rechazados
+        if status == 503:
+            return response, status
+        return jsonify({"status": "ok"}), 200
+
+    if event.statuses:
+        logging.info("Reciví un evento/actualización de estado de WhatsApp")
+        return jsonify({"status": "ok"}), 200
+
+    # Si la solicitud no es un mensaje de WhatsApp válido, devuelve un error 404
+    logging.warning("Estructura de mensaje inválida: no hay mensajes con wa_id")
+    return (
+        jsonify({"status": "error", "message": "No es un evento de WhatsApp válido"}),
+        404,
+    )
+
 
 # Requiere el token de verificación para la verificación del webhook
 def verify():
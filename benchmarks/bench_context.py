@@ -0,0 +1,102 @@
+"""
+Benchmark del contexto acotado (CONTEXT_WINDOW_MESSAGES + resumen): tokens
+de entrada por respuesta a lo largo de una conversación larga, con y sin
+ventana, usando el motor chat contra una API de OpenAI simulada.
+
+La API simulada estima los tokens del prompt (4 caracteres por token) y los
+informa en el último chunk del stream, como la API real con
+stream_options.include_usage. El historial se guarda en memoria.
+
+Ejecutar desde la raíz del repositorio:
+
+    python -m benchmarks.bench_context
+"""
+import json
+import os
+import tempfile
+import time
+
+import openai
+
+from app.services.assistant_manager import AssistantConfig, AssistantManager
+from app.services.conversation_context import ConversationContext
+from benchmarks.bench_engines import MemoryHistory
+from benchmarks.stub_server import EventStream, StubServer
+
+TURNS = 120
+REPLY = "Claro, te confirmo el pedido de 2 garrafones de 20 litros para mañana por la tarde en tu dirección de siempre."
+SUMMARY = "Cliente frecuente; pide garrafones de 20 litros para entregas por la tarde."
+
+
+def _prompt_tokens(body: bytes) -> int:
+    messages = json.loads(body)["messages"]
+    return sum(len(message["content"]) for message in messages) // 4
+
+
+def chat_completion(method, path, body):
+    request = json.loads(body)
+    usage = {"prompt_tokens": _prompt_tokens(body), "completion_tokens": len(REPLY) // 4}
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+    if not request.get("stream"):
+        # Llamada de resumen
+        return {
+            "id": "chatcmpl-summary", "object": "chat.completion", "created": 0, "model": request["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": SUMMARY}}],
+            "usage": usage,
+        }
+    chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0, "model": request["model"]}
+    return EventStream([
+        (None, {**chunk, "choices": [{"index": 0, "delta": {"content": REPLY}, "finish_reason": None}]}),
+        (None, {**chunk, "choices": [], "usage": usage}),
+        (None, "[DONE]"),
+    ])
+
+
+def run_conversation(label: str, window: int, summary_enabled: bool, stub: StubServer):
+    config = AssistantConfig(
+        openai_api_key="sk-bench",
+        response_engine="chat",
+        response_cache_enabled=False,
+        context_window_messages=window,
+        knowledge_manifest_path=os.path.join(tempfile.mkdtemp(), "manifest.json"),
+        knowledge_index_path=os.path.join(tempfile.mkdtemp(), "knowledge_index.bin"),
+    )
+    manager = AssistantManager(config)
+    manager.client = openai.OpenAI(api_key="sk-bench", base_url=stub.url + "/v1")
+    manager.context = ConversationContext(
+        lambda: manager.client, window_messages=window, summary_enabled=summary_enabled
+    )
+    history = MemoryHistory()
+    manager.engine.history_loader = history.load
+    manager.engine.exchange_writer = history.save
+    manager._init_pid = os.getpid()
+    manager.status = manager.engine.setup()
+
+    for turn in range(TURNS):
+        manager.generate_response_for_messages(
+            [f"Hola, quiero 2 garrafones de 20 litros para mañana ({turn})"], "59170000001", "Cliente"
+        )
+        # Los resúmenes corren en segundo plano; en producción los turnos están separados por minutos
+        time.sleep(0.01)
+
+    stats = manager.context.stats()
+    print(
+        f"{label:<24} tokens de entrada p50 {stats['input_tokens_p50']:6.0f} | "
+        f"p95 {stats['input_tokens_p95']:6} | máx {stats['input_tokens_max']:6} | "
+        f"total {stats['total_input_tokens']:8} | resúmenes {stats['summaries']:3} "
+        f"({stats['summary_tokens']} tokens)"
+    )
+
+
+def main():
+    stub = StubServer([("POST", r"/v1/chat/completions", chat_completion)]).start()
+    try:
+        print(f"{TURNS} turnos de un mismo cliente")
+        run_conversation("sin ventana", 10_000, False, stub)
+        run_conversation("ventana 20 + resumen", 20, True, stub)
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
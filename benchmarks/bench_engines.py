@@ -0,0 +1,189 @@
+"""
+Benchmark de los motores de respuesta (RESPONSE_ENGINE) contra una API de
+OpenAI simulada: viajes de red por respuesta y latencia p50/p95.
+
+Cada llamada a la API simulada tarda API_LATENCY (ida y vuelta) y el modelo
+tarda GENERATION_SECONDS en producir la respuesta: los runs en modo poll se
+completan ese tiempo después de crearse y los streams lo esperan antes de
+emitir los eventos. Los clientes ya tienen thread (cache caliente) y el
+historial del motor chat se guarda en memoria, así que no hace falta MySQL.
+
+Ejecutar desde la raíz del repositorio:
+
+    python -m benchmarks.bench_engines
+"""
+import itertools
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import openai
+
+from app.services.assistant_manager import AssistantConfig, AssistantManager, AssistantStatus
+from app.services.conversation_context import ConversationContext
+from app.services.response_engine import ChatCompletionsEngine
+from benchmarks.stub_server import EventStream, StubServer
+
+API_LATENCY = 0.05  # segundos por llamada a la API simulada
+GENERATION_SECONDS = 0.6  # tiempo del modelo para generar la respuesta
+CLIENTS = 10
+MESSAGES_PER_CLIENT = 4
+REPLY = "El garrafón de 20 litros cuesta 15 Bs y lo entregamos en 30 a 40 minutos."
+
+_run_ids = itertools.count(1)
+_run_created_at = {}
+_run_lock = threading.Lock()
+
+
+def _message(text: str) -> dict:
+    return {
+        "id": "msg_bench", "object": "thread.message", "role": "assistant",
+        "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+    }
+
+
+def _words(text: str):
+    words = text.split(" ")
+    return [word + (" " if i < len(words) - 1 else "") for i, word in enumerate(words)]
+
+
+def create_run(method, path, body):
+    run_id = f"run_{next(_run_ids)}"
+    with _run_lock:
+        _run_created_at[run_id] = time.monotonic()
+    run = {"id": run_id, "object": "thread.run", "status": "queued"}
+    if not json.loads(body or b"{}").get("stream"):
+        return run
+
+    time.sleep(GENERATION_SECONDS)
+    events = [("thread.run.created", run)]
+    events += [
+        ("thread.message.delta", {
+            "id": "msg_bench", "object": "thread.message.delta",
+            "delta": {"content": [{"index": 0, "type": "text", "text": {"value": word}}]},
+        })
+        for word in _words(REPLY)
+    ]
+    events += [
+        ("thread.message.completed", _message(REPLY)),
+        ("thread.run.completed", {**run, "status": "completed"}),
+        ("done", "[DONE]"),
+    ]
+    return EventStream(events)
+
+
+def retrieve_run(method, path, body):
+    run_id = path.split("?", 1)[0].rsplit("/", 1)[-1]
+    with _run_lock:
+        done = time.monotonic() - _run_created_at[run_id] >= GENERATION_SECONDS
+    return {"id": run_id, "object": "thread.run", "status": "completed" if done else "in_progress"}
+
+
+def list_messages(method, path, body):
+    return {"object": "list", "data": [_message(REPLY)], "has_more": False}
+
+
+def chat_completion(method, path, body):
+    time.sleep(GENERATION_SECONDS)
+    chunks = [
+        (None, {
+            "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+        })
+        for word in _words(REPLY)
+    ]
+    return EventStream(chunks + [(None, "[DONE]")])
+
+
+OPENAI_ROUTES = [
+    ("POST", r"/v1/threads/[^/]+/runs", create_run),
+    ("GET", r"/v1/threads/[^/]+/runs/[^/]+", retrieve_run),
+    ("GET", r"/v1/threads/[^/]+/messages", list_messages),
+    ("POST", r"/v1/chat/completions", chat_completion),
+]
+
+
+class MemoryHistory:
+    """Sustituto en memoria de la tabla mensajes para el motor chat"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def load(self, telefono, limite):
+        rows = self.rows.get(telefono, [])
+        return [(str(i), contenido, tipo) for i, (contenido, tipo) in enumerate(rows)][::-1][:limite]
+
+    def save(self, telefono, nombre, entradas, salida):
+        rows = self.rows.setdefault(telefono, [])
+        rows.extend((contenido, "entrada") for contenido in entradas)
+        rows.append((salida, "salida"))
+
+
+def build_manager(engine: str, run_mode: str, base_url: str) -> AssistantManager:
+    config = AssistantConfig(
+        openai_api_key="sk-bench",
+        assistant_id="asst_bench",
+        response_engine=engine,
+        run_mode=run_mode,
+        response_cache_enabled=False,
+        knowledge_manifest_path=os.path.join(tempfile.mkdtemp(), "manifest.json"),
+        knowledge_index_path=os.path.join(tempfile.mkdtemp(), "knowledge_index.bin"),
+    )
+    manager = AssistantManager(config)
+    manager.context = ConversationContext(lambda: manager.client, summary_enabled=False)
+    manager.client = openai.OpenAI(api_key="sk-bench", base_url=base_url)
+    manager._init_pid = os.getpid()
+
+    if isinstance(manager.engine, ChatCompletionsEngine):
+        history = MemoryHistory()
+        manager.engine.history_loader = history.load
+        manager.engine.exchange_writer = history.save
+        manager.status = manager.engine.setup()
+    else:
+        # Asistente ya verificado y clientes con thread conocido
+        manager.assistant_id = "asst_bench"
+        manager.status = AssistantStatus.READY
+        for client in range(CLIENTS):
+            manager.thread_cache.put(f"5917000{client:04d}", f"thread_{client}")
+    return manager
+
+
+def run_scenario(label: str, engine: str, run_mode: str, stub: StubServer):
+    manager = build_manager(engine, run_mode, stub.url + "/v1")
+    latencies = []
+    before = stub.count()
+    for turn in range(MESSAGES_PER_CLIENT):
+        for client in range(CLIENTS):
+            started_at = time.perf_counter()
+            response = manager.generate_response_for_messages(
+                [f"¿Cuánto cuesta el garrafón? ({turn})"], f"5917000{client:04d}", "Cliente"
+            )
+            latencies.append(time.perf_counter() - started_at)
+            assert response == REPLY, response
+    replies = len(latencies)
+    quantiles = statistics.quantiles(latencies, n=20)
+    print(
+        f"{label:<20} viajes/respuesta {(stub.count() - before) / replies:4.1f} | "
+        f"p50 {statistics.median(latencies) * 1000:6.0f} ms | p95 {quantiles[18] * 1000:6.0f} ms"
+    )
+
+
+def main():
+    stub = StubServer(OPENAI_ROUTES, latency=API_LATENCY).start()
+    try:
+        print(
+            f"Latencia por llamada {API_LATENCY * 1000:.0f} ms, generación {GENERATION_SECONDS * 1000:.0f} ms, "
+            f"{CLIENTS * MESSAGES_PER_CLIENT} respuestas por motor"
+        )
+        run_scenario("assistants (poll)", "assistants", "poll", stub)
+        run_scenario("assistants (stream)", "assistants", "stream", stub)
+        run_scenario("chat", "chat", "stream", stub)
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
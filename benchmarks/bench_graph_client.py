@@ -0,0 +1,113 @@
+"""
+Benchmark del cliente compartido de la Graph API (GRAPH_*): latencia por
+envío con `requests.post` suelto (una conexión TCP + TLS nueva por mensaje,
+como antes) y con GraphClient (pool keep-alive).
+
+El servidor simulado atiende HTTPS con un certificado autofirmado generado
+con openssl, así que cada conexión nueva paga el handshake TLS; sin openssl
+se usa HTTP. Contra graph.facebook.com cada conexión nueva suma además dos
+o tres viajes de red.
+
+Ejecutar desde la raíz del repositorio:
+
+    python -m benchmarks.bench_graph_client
+"""
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+import requests
+
+from app.utils.graph_client import GraphClient
+from app.utils.whatsapp_payload import get_text_message_input
+from benchmarks.stub_server import StubServer
+
+SENDS = 300
+CONCURRENCY = 8
+VERSION = "v19.0"
+PHONE_NUMBER_ID = "123456789"
+
+
+def accepted(method, path, body):
+    return {"messaging_product": "whatsapp", "messages": [{"id": "wamid.bench"}]}
+
+
+def self_signed_cert() -> str:
+    """Certificado y clave en un solo PEM; None si no hay openssl"""
+    if shutil.which("openssl") is None:
+        return None
+    path = os.path.join(tempfile.mkdtemp(), "stub.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+         "-keyout", path, "-out", path],
+        check=True, capture_output=True,
+    )
+    return path
+
+
+def run(label: str, send, stub: StubServer, concurrency: int):
+    data = get_text_message_input("59170000001", "Tu pedido sale hoy por la tarde.")
+    latencies = []
+    lock = threading.Lock()
+    connections_before = stub.connections
+
+    def worker(count: int):
+        for _ in range(count):
+            started_at = time.perf_counter()
+            send(data).raise_for_status()
+            elapsed = time.perf_counter() - started_at
+            with lock:
+                latencies.append(elapsed)
+
+    started_at = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(SENDS // concurrency,)) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total = time.perf_counter() - started_at
+
+    quantiles = statistics.quantiles(latencies, n=20)
+    print(
+        f"{label:<34} p50 {statistics.median(latencies) * 1000:6.2f} ms | p95 {quantiles[18] * 1000:6.2f} ms | "
+        f"{len(latencies) / total:6.0f} envíos/s | conexiones {stub.connections - connections_before}"
+    )
+
+
+def main():
+    certfile = self_signed_cert()
+    stub = StubServer([("POST", r"/v[0-9.]+/[^/]+/messages", accepted)], certfile=certfile).start()
+    verify = certfile or True
+    url = f"{stub.url}/{VERSION}/{PHONE_NUMBER_ID}/messages"
+    headers = {"Content-type": "application/json", "Authorization": "Bearer bench"}
+
+    def send_without_session(data):
+        with requests.Session() as session:
+            session.trust_env = False
+            return session.post(url, data=data, headers=headers, timeout=(3.05, 10), verify=verify)
+
+    client = GraphClient("bench", VERSION, PHONE_NUMBER_ID, base_url=stub.url, pool_size=CONCURRENCY)
+    client.session.verify = verify
+    # REQUESTS_CA_BUNDLE del entorno tendría precedencia sobre session.verify
+    client.session.trust_env = False
+
+    def send_with_client(data):
+        return client.post("messages", data=data, headers={"Content-type": "application/json"})
+
+    try:
+        print(f"{SENDS} envíos contra {stub.scheme.upper()} local")
+        for concurrency in (1, CONCURRENCY):
+            run(f"requests.post ({concurrency} hilos)", send_without_session, stub, concurrency)
+            run(f"GraphClient ({concurrency} hilos)", send_with_client, stub, concurrency)
+    finally:
+        client.close()
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark del índice BM25 local (KNOWLEDGE_INDEX_*): tamaño del archivo,
+tiempo de construcción completa e incremental, apertura con mmap y latencia
+de consulta p50/p95.
+
+Indexa prompts.md y un catálogo sintético de CATALOG_PRODUCTS productos y
+CATALOG_PROMOTIONS promociones servido por una sesión en memoria, así que no
+hace falta MySQL.
+
+Ejecutar desde la raíz del repositorio:
+
+    python -m benchmarks.bench_knowledge_index
+"""
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+from app.services.knowledge_index import KnowledgeIndex
+from app.services.knowledge_version import PRODUCTS_VERSION_SQL, PROMOTIONS_VERSION_SQL
+
+PROMPTS_PATH = os.path.join(os.path.dirname(__file__), "..", "app", "services", "prompts", "prompts.md")
+CATALOG_PRODUCTS = 2000
+CATALOG_PROMOTIONS = 50
+QUERY_ROUNDS = 200
+
+QUERIES = [
+    "¿Cuánto cuesta el garrafón de 20 litros?",
+    "¿Hacen envíos a domicilio? ¿Cuánto tarda?",
+    "Quiero un dispensador de agua, ¿tienen stock?",
+    "¿Qué promociones tienen esta semana?",
+    "¿Aceptan pagos con QR o transferencia?",
+    "horario de atención los domingos",
+    "bidón de 10 litros precio",
+    "hola",
+]
+
+_KINDS = ["Garrafón de agua", "Botella de agua", "Bidón de agua", "Dispensador", "Bomba manual", "Soporte metálico"]
+
+
+class CatalogSession:
+    """Sesión en memoria que responde las consultas del índice sobre productos y promociones"""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.result = {
+            PRODUCTS_VERSION_SQL: [(len(self.catalog.products), self.catalog.products_version)],
+            PROMOTIONS_VERSION_SQL: [(len(self.catalog.promotions), self.catalog.promotions_version)],
+        }.get(sql)
+        if self.result is None:
+            self.result = self.catalog.products if "FROM productos" in sql else self.catalog.promotions
+        return self
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class Catalog:
+    def __init__(self):
+        self.products_version = self.promotions_version = 1
+        self.products = [
+            (f"{_KINDS[i % len(_KINDS)]} modelo {i}", f"Presentación {i % 40 + 1} litros, línea {i % 7}.",
+             5 + (i % 120), i % 15)
+            for i in range(CATALOG_PRODUCTS)
+        ]
+        today = datetime.date.today()
+        self.promotions = [
+            (f"Promo {i}", f"{_KINDS[i % len(_KINDS)]} con envío gratis", 10 + i % 30,
+             today - datetime.timedelta(days=3), today + datetime.timedelta(days=10))
+            for i in range(CATALOG_PROMOTIONS)
+        ]
+
+    def session(self):
+        return CatalogSession(self)
+
+
+def build_index(path: str, catalog: Catalog) -> KnowledgeIndex:
+    return KnowledgeIndex([PROMPTS_PATH], index_path=path, session_factory=catalog.session,
+                          refresh_seconds=3600)
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "knowledge_index.bin")
+    catalog = Catalog()
+
+    index = build_index(path, catalog)
+    started_at = time.perf_counter()
+    index.refresh()
+    full_build_ms = (time.perf_counter() - started_at) * 1000
+    stats = index.stats()
+    print(
+        f"Índice: {stats['documents']} documentos, {stats['terms']} términos, "
+        f"{stats['size_bytes'] / 1024:.0f} KiB"
+    )
+    print(f"Construcción completa       {full_build_ms:8.1f} ms")
+
+    # Un proceso nuevo solo mapea el archivo si las fuentes no cambiaron
+    started_at = time.perf_counter()
+    reopened = build_index(path, catalog)
+    rebuilt = reopened.refresh()
+    print(f"Arranque con índice vigente {(time.perf_counter() - started_at) * 1000:8.1f} ms (reconstruido: {rebuilt})")
+
+    # Cambian solo las promociones: prompts.md y los productos se copian del índice anterior
+    catalog.promotions_version += 1
+    catalog.promotions[0] = ("Promo garrafón", "Garrafón de agua 20 litros a mitad de precio", 50,
+                             *catalog.promotions[0][3:])
+    started_at = time.perf_counter()
+    reopened.refresh()
+    print(f"Reconstrucción incremental  {(time.perf_counter() - started_at) * 1000:8.1f} ms (solo promociones)")
+
+    latencies = []
+    for _ in range(QUERY_ROUNDS):
+        for query in QUERIES:
+            started_at = time.perf_counter()
+            reopened.relevant(query)
+            latencies.append(time.perf_counter() - started_at)
+    quantiles = statistics.quantiles(latencies, n=20)
+    print(
+        f"Consulta ({len(latencies)})            p50 {statistics.median(latencies) * 1e6:6.0f} µs | "
+        f"p95 {quantiles[18] * 1e6:6.0f} µs"
+    )
+
+    print()
+    for query in QUERIES:
+        snippets = reopened.relevant(query)
+        first = snippets[0].splitlines()[-1][:70] if snippets else "-"
+        print(f"{query:<45} {len(snippets)} fragmentos | {first}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark de la caché de media (MEDIA_CACHE_*): el mismo archivo enviado
+muchas veces y desde varios hilos a la vez contra una Graph API simulada
+que tarda según el tamaño subido.
+
+- Sin caché: cada envío sube el archivo con `files=` (cuerpo completo en memoria).
+- Con caché: upload_media sube en streaming una sola vez y reutiliza el media ID.
+
+La memoria máxima de una subida se mide con el servidor en otro proceso, para
+no contar el cuerpo que recibe.
+
+Ejecutar desde la raíz del repositorio:
+
+    python -m benchmarks.bench_media_cache
+"""
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from app.services.media_cache import init_media_cache
+from app.utils.graph_client import get_graph_client, init_graph_client
+from app.utils.resilience import init_resilience
+from app.utils.whatsapp_utils import upload_media
+from benchmarks.stub_server import StubServer
+
+FILE_MB = 8
+UPLOAD_MB_PER_SECOND = 40
+SENDS = 60
+THREADS = 12
+
+
+class MediaServer:
+    """Endpoint /media que valida el multipart y simula el tiempo de subida"""
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.uploads = 0
+        self.invalid = 0
+        self.lock = threading.Lock()
+
+    def media(self, method, path, body):
+        time.sleep(len(body) / (UPLOAD_MB_PER_SECOND * 1024 * 1024))
+        valid = b'name="messaging_product"' in body and self.content in body
+        with self.lock:
+            self.uploads += 1
+            self.invalid += not valid
+            media_id = f"media-{self.uploads}"
+        if not valid:
+            return 400, {"error": {"message": "multipart inválido", "code": 100}}
+        return {"id": media_id}
+
+
+def legacy_upload(filepath: str) -> str:
+    """Subida anterior: requests arma el cuerpo multipart completo en memoria"""
+    client = get_graph_client()
+    with open(filepath, "rb") as file:
+        files = {"file": (os.path.basename(filepath), file, "image/jpeg")}
+        response = client.post("media", files=files, data={"messaging_product": "whatsapp"},
+                               timeout=client.upload_timeout)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def _serve_sink(conn):
+    stub = StubServer([("POST", r"/v[0-9.]+/[^/]+/media", lambda method, path, body: {"id": "media-sink"})]).start()
+    conn.send(stub.url)
+    threading.Event().wait()
+
+
+def peak_memory(fn) -> float:
+    """Memoria máxima del cliente al subir un archivo nuevo (servidor en un proceso aparte)"""
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.get_context("fork").Process(target=_serve_sink, args=(child,), daemon=True)
+    process.start()
+    init_graph_client({"ACCESS_TOKEN": "bench", "VERSION": "v19.0", "PHONE_NUMBER_ID": "123456789",
+                       "GRAPH_API_BASE_URL": parent.recv()})
+    filepath = write_file(os.urandom(FILE_MB * 1024 * 1024))
+    try:
+        tracemalloc.start()
+        fn(filepath)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        os.unlink(filepath)
+        process.terminate()
+    return peak / (1024 * 1024)
+
+
+def write_file(content: bytes) -> str:
+    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as file:
+        file.write(content)
+        return file.name
+
+
+def concurrent_sends(fn, filepath: str):
+    media_ids = []
+    lock = threading.Lock()
+
+    def worker(count: int):
+        for _ in range(count):
+            media_id = fn(filepath)
+            with lock:
+                media_ids.append(media_id)
+
+    threads = [threading.Thread(target=worker, args=(SENDS // THREADS,)) for _ in range(THREADS)]
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started_at, media_ids
+
+
+def run(label: str, fn, filepath: str, content: bytes):
+    server = MediaServer(content)
+    stub = StubServer([("POST", r"/v[0-9.]+/[^/]+/media", server.media)]).start()
+    init_resilience({})
+    init_graph_client({"ACCESS_TOKEN": "bench", "VERSION": "v19.0", "PHONE_NUMBER_ID": "123456789",
+                       "GRAPH_API_BASE_URL": stub.url, "GRAPH_POOL_SIZE": THREADS})
+    elapsed, media_ids = concurrent_sends(fn, filepath)
+    stub.stop()
+    peak = peak_memory(fn)
+    print(
+        f"{label:<10} subidas {server.uploads:3} (inválidas {server.invalid}) | "
+        f"{SENDS} envíos en {elapsed:5.2f} s | ids distintos {len(set(media_ids)):3} | "
+        f"memoria máx. por subida {peak:5.1f} MiB"
+    )
+
+
+def main():
+    content = os.urandom(FILE_MB * 1024 * 1024)
+    filepath = write_file(content)
+    try:
+        print(f"Archivo de {FILE_MB} MiB, subida a {UPLOAD_MB_PER_SECOND} MiB/s, "
+              f"{SENDS} envíos desde {THREADS} hilos")
+        run("sin caché", legacy_upload, filepath, content)
+        init_media_cache({"MEDIA_CACHE_PERSISTENT": False})
+        run("con caché", upload_media, filepath, content)
+    finally:
+        os.unlink(filepath)
+
+
+if __name__ == "__main__":
+    main()
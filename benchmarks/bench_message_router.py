@@ -0,0 +1,164 @@
+"""
+Benchmark del router local de mensajes: precisión de la ruta y latencia
+por mensaje. No usa red ni base de datos (catálogo fijo en memoria).
+
+Se evalúan tres conjuntos etiquetados:
+- desarrollo: el que se usó al ajustar los ejemplos de entrenamiento;
+- reservado: mensajes reales de otro estilo (faltas, jerga, ráfagas de
+  varios mensajes) que no se miraron al ajustar el router;
+- negativos: mensajes que nunca deben responderse localmente (reclamos con
+  "gracias", preguntas de precio de envío, temas fuera del catálogo...).
+  Lo que importa aquí es la tasa de respuestas locales indebidas.
+
+Ejecutar desde la raíz del repositorio:
+
+    python -m benchmarks.bench_message_router
+"""
+import statistics
+import time
+from collections import Counter, defaultdict
+
+from app.services.message_router import (
+    ROUTE_ASSISTANT,
+    ROUTE_CANNED,
+    ROUTE_CATALOG,
+    ROUTE_GREETING,
+    MessageRouter,
+    ProductCatalog,
+)
+
+CATALOG_ROWS = [
+    (1, "Garrafón de agua 20 litros", 15.0, 40),
+    (2, "Botella de agua 3 litros", 6.5, 0),
+    (3, "Bidón de agua 10 litros", 9.0, 12),
+    (4, "Dispensador de agua", 120.0, 3),
+]
+
+# (mensaje, ruta esperada): conjunto de desarrollo
+LABELED_MESSAGES = [
+    ("Hola", ROUTE_GREETING),
+    ("Buenas tardes!", ROUTE_GREETING),
+    ("hola, qué tal", ROUTE_GREETING),
+    ("Buenos días", ROUTE_GREETING),
+    ("¿Cuánto cuesta el garrafón?", ROUTE_CATALOG),
+    ("precio del dispensador", ROUTE_CATALOG),
+    ("Hola, ¿a cuánto están los bidones?", ROUTE_CATALOG),
+    ("cuanto vale la botella de 3 litros", ROUTE_CATALOG),
+    ("Qué precio tiene el dispensador?", ROUTE_CATALOG),
+    ("¿Tienen garrafones disponibles?", ROUTE_CATALOG),
+    ("hay stock de botellas?", ROUTE_CATALOG),
+    ("les quedan dispensadores?", ROUTE_CATALOG),
+    ("todavía tienen bidón de 10 litros", ROUTE_CATALOG),
+    ("Muchas gracias!!", ROUTE_CANNED),
+    ("ok perfecto", ROUTE_CANNED),
+    ("jajaja", ROUTE_CANNED),
+    ("dale, gracias", ROUTE_CANNED),
+    ("hasta luego", ROUTE_CANNED),
+    ("Quiero 3 garrafones para mañana", ROUTE_ASSISTANT),
+    ("Hola, quiero hacer un pedido", ROUTE_ASSISTANT),
+    ("me pueden mandar 2 bidones a mi casa?", ROUTE_ASSISTANT),
+    ("como puedo pagar", ROUTE_ASSISTANT),
+    ("aceptan qr o transferencia?", ROUTE_ASSISTANT),
+    ("mi pedido todavía no llegó", ROUTE_ASSISTANT),
+    ("el garrafón llegó roto, quiero un cambio", ROUTE_ASSISTANT),
+    ("quiero hablar con un asesor", ROUTE_ASSISTANT),
+    ("necesito cancelar el pedido de ayer", ROUTE_ASSISTANT),
+    ("¿Cuál es el horario de atención?", ROUTE_ASSISTANT),
+    ("¿Hacen envíos a la zona sur?", ROUTE_ASSISTANT),
+    ("¿cuánto cuesta el agua?", ROUTE_ASSISTANT),  # Ambiguo: varios productos de agua
+]
+
+# (mensajes de la ráfaga, ruta esperada): conjunto reservado, no usado al ajustar
+HELD_OUT_MESSAGES = [
+    (["wenas"], ROUTE_GREETING),
+    (["Hola buenas noches"], ROUTE_GREETING),
+    (["hola", "buen día"], ROUTE_GREETING),
+    (["cuanto sta el garrafon"], ROUTE_CATALOG),
+    (["q precio tiene el bidon de 10"], ROUTE_CATALOG),
+    (["hola", "el dispensador a cuánto?"], ROUTE_CATALOG),
+    (["Disculpe, cuál es el costo del dispensador de agua?"], ROUTE_CATALOG),
+    (["tendrán botellas de 3 litros?"], ROUTE_CATALOG),
+    (["hay garrafon?"], ROUTE_CATALOG),
+    (["ya", "gracias!"], ROUTE_CANNED),
+    (["👍 ok"], ROUTE_CANNED),
+    (["muy amable, saludos"], ROUTE_CANNED),
+    (["mándame 4 garrafones porfa"], ROUTE_ASSISTANT),
+    (["hola", "quisiera pedir agua para la oficina"], ROUTE_ASSISTANT),
+    (["a qué cuenta les deposito?"], ROUTE_ASSISTANT),
+    (["no me trajeron el pedido"], ROUTE_ASSISTANT),
+    (["me llegó un bidón con fuga"], ROUTE_ASSISTANT),
+    (["pueden venir el sábado?"], ROUTE_ASSISTANT),
+]
+
+# Mensajes que nunca deben responderse localmente (ruta esperada: asistente)
+NEGATIVE_MESSAGES = [
+    ["gracias pero el garrafón llegó sucio"],
+    ["ok pero todavía no llega mi pedido"],
+    ["cuánto cuesta el envío a El Alto?"],
+    ["cuánto me cobran por el delivery?"],
+    ["precio por mayor de 50 garrafones"],
+    ["tienen stock para entregar hoy a mi dirección?"],
+    ["hola", "quiero cancelar"],
+    ["¿venden hielo?"],
+    ["cuánto cuesta la recarga del garrafón si llevo el mío?"],
+    ["me pasas el número de un asesor"],
+    ["hola, soy de la empresa de gas, necesito hablar con el dueño"],
+    ["ya les pagué, adjunto comprobante"],
+]
+
+ROUNDS = 200
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def evaluate(router: MessageRouter, label: str, samples):
+    """Precisión de ruta para [(mensajes, ruta esperada)] y los fallos"""
+    correct = 0
+    per_route = defaultdict(Counter)
+    errors = []
+    for messages, expected in samples:
+        decision = router.route(messages, "Cliente Demo")
+        per_route[expected]["total"] += 1
+        if decision.route == expected:
+            correct += 1
+            per_route[expected]["ok"] += 1
+        else:
+            errors.append((messages, expected, decision.route, decision.intent, round(decision.confidence, 3)))
+
+    print(f"{label}: {correct}/{len(samples)} ({correct / len(samples):.1%})")
+    for route, counts in sorted(per_route.items()):
+        print(f"  {route:<10} {counts['ok']}/{counts['total']}")
+    for messages, expected, got, intent, confidence in errors:
+        print(f"  FALLO: {' | '.join(messages)!r} esperado={expected} obtenido={got} ({intent}, {confidence})")
+    return correct, errors
+
+
+def main():
+    router = MessageRouter(ProductCatalog(rows=CATALOG_ROWS))
+
+    evaluate(router, "Precisión de ruta (desarrollo)", [([message], route) for message, route in LABELED_MESSAGES])
+    evaluate(router, "Precisión de ruta (reservado)", HELD_OUT_MESSAGES)
+    _, local_answers = evaluate(
+        router, "Negativos enviados al asistente", [(messages, ROUTE_ASSISTANT) for messages in NEGATIVE_MESSAGES]
+    )
+    print(f"Respuestas locales indebidas: {len(local_answers)}/{len(NEGATIVE_MESSAGES)} "
+          f"({len(local_answers) / len(NEGATIVE_MESSAGES):.1%})")
+
+    latencies = []
+    for _ in range(ROUNDS):
+        for message, _ in LABELED_MESSAGES:
+            started_at = time.perf_counter()
+            router.route([message])
+            latencies.append((time.perf_counter() - started_at) * 1e6)
+
+    print(
+        f"Latencia por mensaje: p50 {statistics.median(latencies):.1f} µs, "
+        f"p95 {percentile(latencies, 0.95):.1f} µs, máx {max(latencies):.1f} µs"
+    )
+
+
+if __name__ == "__main__":
+    main()
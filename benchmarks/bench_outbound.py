@@ -0,0 +1,156 @@
+"""
+Benchmark del despachador de salida (OUTBOUND_*): una difusión masiva y
+respuestas a clientes al mismo tiempo contra una Graph API simulada que
+limita el throughput del número emisor como Meta (429, código 130429).
+
+- En línea: cada envío sale directo desde su hilo, como antes.
+- Despachador: cubeta por número emisor y respuestas antes que la difusión.
+
+Ejecutar desde la raíz del repositorio:
+
+    python -m benchmarks.bench_outbound
+"""
+import statistics
+import threading
+import time
+
+import requests
+
+from app.services.outbound_dispatcher import SEND_PRIORITY_BULK, SEND_PRIORITY_REPLY, OutboundDispatcher
+from app.utils.graph_client import init_graph_client
+from app.utils.resilience import CircuitOpenError, init_resilience
+from app.utils.whatsapp_payload import get_text_message_input
+from app.utils.whatsapp_utils import GRAPH_MESSAGES_ENDPOINT, deliver_outbound, graph_post
+from benchmarks.stub_server import StubServer
+
+PHONE_NUMBER_ID = "123456789"
+SERVER_MPS = 20
+SEND_SECONDS = 0.02
+BULK_MESSAGES = 300
+BULK_THREADS = 8
+REPLIES = 20
+REPLY_INTERVAL = 0.5
+
+
+class ThroughputServer:
+    """Límite de mensajes por segundo del número emisor del lado de Meta"""
+
+    def __init__(self):
+        self.level = float(SERVER_MPS)
+        self.updated_at = time.monotonic()
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def messages(self, method, path, body):
+        with self.lock:
+            now = time.monotonic()
+            self.level = min(SERVER_MPS, self.level + (now - self.updated_at) * SERVER_MPS)
+            self.updated_at = now
+            accepted = self.level >= 1
+            if accepted:
+                self.level -= 1
+            else:
+                self.throttled += 1
+        if not accepted:
+            return 429, {"error": {"message": "(#130429) Rate limit hit", "code": 130429}}
+        time.sleep(SEND_SECONDS)
+        return {"messaging_product": "whatsapp", "messages": [{"id": "wamid.bench"}]}
+
+
+def request_for(index: int) -> dict:
+    data = get_text_message_input(f"5917{index:07d}", "Promoción: 2x1 en garrafones este fin de semana.")
+    return {"data": data, "headers": {"Content-type": "application/json"}}
+
+
+def send_inline(request: dict):
+    return graph_post(GRAPH_MESSAGES_ENDPOINT, "messages", **request)
+
+
+def run(label: str, use_dispatcher: bool):
+    quota = ThroughputServer()
+    stub = StubServer([("POST", r"/v[0-9.]+/[^/]+/messages", quota.messages)]).start()
+    init_resilience({})
+    init_graph_client({"ACCESS_TOKEN": "bench", "VERSION": "v19.0", "PHONE_NUMBER_ID": PHONE_NUMBER_ID,
+                       "GRAPH_API_BASE_URL": stub.url, "GRAPH_POOL_SIZE": BULK_THREADS + 4})
+    dispatcher = None
+    if use_dispatcher:
+        dispatcher = OutboundDispatcher(deliver_outbound, PHONE_NUMBER_ID, num_workers=BULK_THREADS,
+                                        messages_per_second=SERVER_MPS)
+
+    outcomes = {"bulk": [0, 0], "reply": [0, 0]}
+    reply_latencies = []
+    lock = threading.Lock()
+
+    def record(kind: str, ok: bool):
+        with lock:
+            outcomes[kind][0 if ok else 1] += 1
+
+    def send(request: dict, priority: int):
+        if dispatcher is None:
+            return send_inline(request)
+        return dispatcher.submit(request, priority=priority).result(timeout=120)
+
+    def bulk_worker(indexes):
+        for index in indexes:
+            try:
+                send(request_for(index), SEND_PRIORITY_BULK)
+                record("bulk", True)
+            except (requests.exceptions.RequestException, CircuitOpenError):
+                record("bulk", False)
+
+    def bulk_result(future):
+        try:
+            future.result(timeout=120)
+            record("bulk", True)
+        except (requests.exceptions.RequestException, CircuitOpenError):
+            record("bulk", False)
+
+    def reply_worker():
+        for index in range(REPLIES):
+            time.sleep(REPLY_INTERVAL)
+            started_at = time.perf_counter()
+            try:
+                send(request_for(BULK_MESSAGES + index), SEND_PRIORITY_REPLY)
+                record("reply", True)
+                reply_latencies.append(time.perf_counter() - started_at)
+            except (requests.exceptions.RequestException, CircuitOpenError):
+                record("reply", False)
+
+    started_at = time.perf_counter()
+    if dispatcher is None:
+        threads = [threading.Thread(target=bulk_worker, args=(range(i, BULK_MESSAGES, BULK_THREADS),))
+                   for i in range(BULK_THREADS)]
+    else:
+        # La difusión se encola completa; los hilos del despachador la envían
+        futures = [dispatcher.submit(request_for(i), priority=SEND_PRIORITY_BULK) for i in range(BULK_MESSAGES)]
+        threads = [threading.Thread(target=lambda: [bulk_result(future) for future in futures])]
+    threads.append(threading.Thread(target=reply_worker))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total = time.perf_counter() - started_at
+    if dispatcher is not None:
+        dispatcher.stop()
+    stub.stop()
+
+    p50 = statistics.median(reply_latencies) * 1000 if reply_latencies else 0
+    p95 = statistics.quantiles(reply_latencies, n=20)[18] * 1000 if len(reply_latencies) > 1 else p50
+    print(
+        f"{label:<12} 429 {quota.throttled:4} | difusión {outcomes['bulk'][0]:3} ok {outcomes['bulk'][1]:3} fallidos | "
+        f"respuestas {outcomes['reply'][0]:2} ok {outcomes['reply'][1]:2} fallidas, p50 {p50:6.0f} ms "
+        f"p95 {p95:6.0f} ms | {total:5.1f} s"
+    )
+
+
+def main():
+    print(
+        f"Número emisor limitado a {SERVER_MPS} msg/s; difusión de {BULK_MESSAGES} mensajes y "
+        f"{REPLIES} respuestas (una cada {REPLY_INTERVAL:.1f} s)"
+    )
+    run("en línea", use_dispatcher=False)
+    run("despachador", use_dispatcher=True)
+
+
+if __name__ == "__main__":
+    main()
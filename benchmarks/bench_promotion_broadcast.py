@@ -0,0 +1,202 @@
+"""
+Benchmark de la difusión de promociones: el recorrido de promotions.py
+(fetchall de todos los clientes y un commit por envío) contra
+PromotionBroadcast (lotes por keyset, INSERT multi-fila y punto de control).
+
+La base de datos es una sesión en memoria que simula un viaje de red por
+consulta y por commit, así que no hace falta MySQL. Los envíos pasan por un
+sender falso con latencia fija. Se mide tiempo, commits, memoria máxima (sin
+contar la tabla simulada) y mensajes repetidos al relanzar tras una caída a
+mitad de la difusión.
+
+Ejecutar desde la raíz del repositorio:
+
+    python -m benchmarks.bench_promotion_broadcast
+"""
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from sqlalchemy.exc import OperationalError
+
+import app.database.promotions as promotions
+from app.database.promotions import CLIENTES_PENDIENTES_SQL, GUARDAR_PUNTO_CONTROL_SQL, PUNTO_CONTROL_SQL
+from app.services.outbound_dispatcher import OutboundDispatcher
+from app.services.promotion_broadcast import PromotionBroadcast
+
+CLIENTS = 10000
+PROMOTION_ID = 7
+ROUND_TRIP_SECONDS = 0.0005
+SEND_SECONDS = 0.002
+CHUNK_SIZE = 500
+CRASH_AFTER_COMMITS = 8
+
+
+class FakeDatabase:
+    """Tablas clientes, clientes_promociones y difusiones_promociones en memoria"""
+
+    def __init__(self, clients: int = CLIENTS):
+        self.clients = [(i, f"5917{i:07d}") for i in range(1, clients + 1)]
+        self.sent = set()
+        self.checkpoint = None
+        self.commits = 0
+        self.queries = 0
+        self.crash_at_commit = None
+        self.lock = threading.Lock()
+
+    def session(self):
+        return FakeSession(self)
+
+
+class FakeSession:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+        self.pending = []
+        self.result = []
+
+    def execute(self, statement, params=None):
+        time.sleep(ROUND_TRIP_SECONDS)
+        sql = str(statement)
+        params = params or {}
+        db = self.db
+        db.queries += 1
+        if sql == CLIENTES_PENDIENTES_SQL:
+            rows = [row for row in db.clients
+                    if row[0] > params["despues_de"] and row[0] not in db.sent]
+            self.result = rows[:params["limite"]]
+        elif sql == PUNTO_CONTROL_SQL:
+            self.result = [db.checkpoint] if db.checkpoint else []
+        elif sql == GUARDAR_PUNTO_CONTROL_SQL:
+            self.pending.append(("checkpoint", (params["ultimo_id_cliente"], params["enviados"],
+                                                params["fallidos"], params["estado"])))
+        elif sql.startswith("INSERT IGNORE INTO clientes_promociones"):
+            self.pending.append(("sent", [value for key, value in params.items() if key.startswith("c")]))
+        elif "INSERT INTO clientes_promociones" in sql:
+            self.pending.append(("sent", [params["id_cliente"]]))
+        elif "FROM clientes" in sql:
+            self.result = list(db.clients)
+        return self
+
+    def __iter__(self):
+        return iter(self.result)
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+    def commit(self):
+        time.sleep(ROUND_TRIP_SECONDS)
+        db = self.db
+        with db.lock:
+            db.commits += 1
+            if db.crash_at_commit is not None and db.commits >= db.crash_at_commit:
+                db.crash_at_commit = None
+                raise OperationalError("COMMIT", {}, Exception("Lost connection to MySQL server"))
+            for kind, value in self.pending:
+                if kind == "sent":
+                    db.sent.update(value)
+                else:
+                    db.checkpoint = value
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+class Recipients:
+    """Sender falso: cuenta los mensajes recibidos por teléfono"""
+
+    def __init__(self):
+        self.received = Counter()
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        time.sleep(SEND_SECONDS)
+        with self.lock:
+            self.received[message.request["to"]] += 1
+
+
+def build_request(telefono: str):
+    return {"to": telefono}
+
+
+def legacy_broadcast(db: FakeDatabase, recipients: Recipients, crash_after: int = None):
+    """Recorrido de promotions.py: todos los clientes en memoria y un registro (commit) por envío"""
+    promotions.obtener_conexion = db.session
+    for count, (id_cliente, telefono) in enumerate(promotions.obtener_todos_los_clientes()):
+        if crash_after is not None and count == crash_after:
+            raise RuntimeError("caída simulada")
+        recipients.send(type("Message", (), {"request": build_request(telefono)}))
+        promotions.registrar_envio_promocion(id_cliente, PROMOTION_ID)
+
+
+def new_broadcast(db: FakeDatabase, recipients: Recipients):
+    dispatcher = OutboundDispatcher(recipients.send, "123", num_workers=8, messages_per_second=5000)
+    try:
+        return PromotionBroadcast(PROMOTION_ID, build_request=build_request, session_factory=db.session,
+                                  dispatcher=dispatcher, chunk_size=CHUNK_SIZE).run()
+    finally:
+        dispatcher.stop()
+
+
+def measure(label: str, fn, clients: int = CLIENTS):
+    db, recipients = FakeDatabase(clients), Recipients()
+    # El contador de la prueba no debe crecer durante la medición
+    recipients.received.update({telefono: 0 for _, telefono in db.clients})
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    fn(db, recipients)
+    elapsed = time.perf_counter() - started_at
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(
+        f"{label:<28} {elapsed:6.1f} s | commits {db.commits:6} | consultas {db.queries:6} | "
+        f"memoria máx. {peak / 1024:7.0f} KiB | enviados {sum(recipients.received.values())}"
+    )
+
+
+def crash_and_resume(label: str, legacy: bool):
+    db, recipients = FakeDatabase(), Recipients()
+    crash_after = CRASH_AFTER_COMMITS * CHUNK_SIZE
+    try:
+        if legacy:
+            legacy_broadcast(db, recipients, crash_after=crash_after)
+        else:
+            db.crash_at_commit = CRASH_AFTER_COMMITS + 1
+            new_broadcast(db, recipients)
+    except Exception:
+        pass
+    before_restart = sum(recipients.received.values())
+    # El recorrido de promotions.py no tiene punto de control: al relanzarlo empieza de cero
+    if legacy:
+        legacy_broadcast(db, recipients)
+    else:
+        new_broadcast(db, recipients)
+    repeated = sum(count - 1 for count in recipients.received.values() if count > 1)
+    missing = CLIENTS - len(recipients.received)
+    print(
+        f"{label:<28} enviados antes de la caída {before_restart:5} | repetidos al relanzar {repeated:5} | "
+        f"sin recibir {missing}"
+    )
+
+
+def main():
+    print(f"{CLIENTS} clientes, lotes de {CHUNK_SIZE}, {ROUND_TRIP_SECONDS * 1000:.1f} ms por viaje a la DB, "
+          f"{SEND_SECONDS * 1000:.0f} ms por envío")
+    measure("promotions.py", legacy_broadcast)
+    measure("PromotionBroadcast", new_broadcast)
+    # La memoria depende del tamaño de lote, no del número de clientes
+    measure(f"PromotionBroadcast ({CLIENTS * 4})", new_broadcast, CLIENTS * 4)
+    print()
+    crash_and_resume("promotions.py", legacy=True)
+    crash_and_resume("PromotionBroadcast", legacy=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Benchmark del limitador de OpenAI (OPENAI_RATE_LIMIT_*): ráfaga de clientes
+concurrentes contra una API simulada con cuota real, con y sin limitador.
+
+La API simulada tiene una cuota de SERVER_RPM solicitudes por minuto de la
+que otros procesos con la misma API key ya consumieron casi todo (quedan
+SERVER_AVAILABLE); sin cupo responde 429, como OpenAI. Todas las respuestas
+llevan los headers x-ratelimit-*. El limitador arranca con un RPM
+configurado mayor que la cuota real y se ajusta con esos headers.
+
+Cada cliente pertenece a un carril (pedido abierto, cliente registrado o
+contacto nuevo) y envía MESSAGES_PER_CLIENT mensajes seguidos.
+
+Ejecutar desde la raíz del repositorio:
+
+    python -m benchmarks.bench_rate_limiter
+"""
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import openai
+
+from app.services.assistant_manager import RATE_LIMITED_MESSAGE, AssistantConfig, AssistantManager
+from app.services.conversation_context import ConversationContext
+from app.services.openai_rate_limiter import PRIORITY_CUSTOMER, PRIORITY_NAMES, PRIORITY_NEW, PRIORITY_ORDER
+from app.utils.resilience import init_resilience
+from benchmarks.bench_engines import MemoryHistory
+from benchmarks.stub_server import EventStream, StubServer
+
+SERVER_RPM = 300
+SERVER_AVAILABLE = 30
+GENERATION_SECONDS = 0.2
+CLIENTS = 30
+MESSAGES_PER_CLIENT = 3
+REPLY = "Tu pedido de 2 garrafones sale hoy por la tarde."
+LANES = (PRIORITY_ORDER, PRIORITY_CUSTOMER, PRIORITY_NEW)
+
+
+class QuotaServer:
+    """Cuota de solicitudes por minuto del lado del servidor"""
+
+    def __init__(self):
+        self.level = float(SERVER_AVAILABLE)
+        self.updated_at = time.monotonic()
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.level = min(SERVER_RPM, self.level + (now - self.updated_at) * SERVER_RPM / 60)
+            self.updated_at = now
+            if self.level < 1:
+                self.throttled += 1
+                return False, 0
+            self.level -= 1
+            return True, int(self.level)
+
+    def chat_completion(self, method, path, body):
+        accepted, remaining = self.take()
+        headers = {
+            "x-ratelimit-limit-requests": str(SERVER_RPM),
+            "x-ratelimit-remaining-requests": str(remaining),
+            "x-ratelimit-limit-tokens": "2000000",
+            "x-ratelimit-remaining-tokens": "1990000",
+        }
+        if not accepted:
+            return 429, {"error": {"message": "Rate limit reached for requests", "type": "requests"}}, headers
+        time.sleep(GENERATION_SECONDS)
+        chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0,
+                 "model": json.loads(body)["model"]}
+        return 200, EventStream([
+            (None, {**chunk, "choices": [{"index": 0, "delta": {"content": REPLY}, "finish_reason": None}]}),
+            (None, "[DONE]"),
+        ]), headers
+
+
+def build_manager(stub: StubServer, limited: bool) -> AssistantManager:
+    config = AssistantConfig(
+        openai_api_key="sk-bench",
+        response_engine="chat",
+        response_cache_enabled=False,
+        rate_limit_enabled=limited,
+        rate_limit_rpm=SERVER_RPM * 2,
+        rate_limit_max_wait=10.0,
+        knowledge_manifest_path=os.path.join(tempfile.mkdtemp(), "manifest.json"),
+        knowledge_index_path=os.path.join(tempfile.mkdtemp(), "knowledge_index.bin"),
+    )
+    manager = AssistantManager(config)
+    http_client = openai.DefaultHttpxClient(event_hooks=manager.rate_limiter.event_hooks()) if limited else None
+    manager.client = openai.OpenAI(api_key="sk-bench", base_url=stub.url + "/v1", http_client=http_client)
+    manager.context = ConversationContext(lambda: manager.client, summary_enabled=False)
+    history = MemoryHistory()
+    manager.engine.history_loader = history.load
+    manager.engine.exchange_writer = history.save
+    manager._init_pid = os.getpid()
+    manager.status = manager.engine.setup()
+    return manager
+
+
+def run_scenario(label: str, limited: bool):
+    quota = QuotaServer()
+    stub = StubServer([("POST", r"/v1/chat/completions", quota.chat_completion)]).start()
+    # Sin circuito: se mide solo el efecto de la cuota
+    init_resilience({"RESILIENCE_FAILURE_THRESHOLD": 10 ** 6})
+    manager = build_manager(stub, limited)
+    latencies = defaultdict(list)
+    outcomes = defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+
+    def client(index: int):
+        lane = LANES[index % len(LANES)]
+        for turn in range(MESSAGES_PER_CLIENT):
+            started_at = time.perf_counter()
+            response = manager.generate_response_for_messages(
+                [f"¿Cuándo llega mi pedido? ({turn})"], f"5917{index:07d}", "Cliente", priority=lane
+            )
+            elapsed = time.perf_counter() - started_at
+            outcome = "ok" if response == REPLY else ("ocupado" if response == RATE_LIMITED_MESSAGE else "error")
+            with lock:
+                outcomes[lane][outcome] += 1
+                if outcome == "ok":
+                    latencies[lane].append(elapsed)
+
+    started_at = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total = time.perf_counter() - started_at
+    stub.stop()
+
+    print(f"{label}: {stub.count()} llamadas, {quota.throttled} respondidas con 429, {total:.1f} s")
+    for lane in LANES:
+        samples = latencies[lane]
+        p50 = f"{statistics.median(samples) * 1000:6.0f} ms" if samples else "     - ms"
+        counts = outcomes[lane]
+        print(
+            f"  {PRIORITY_NAMES[lane]:<9} respondidas {counts['ok']:3} | ocupado {counts['ocupado']:3} | "
+            f"error {counts['error']:3} | p50 {p50}"
+        )
+    if limited:
+        stats = manager.rate_limiter.stats()
+        print(f"  RPM ajustado por headers: {stats['requests_per_minute']:.0f} ({stats['header_updates']} actualizaciones)")
+
+
+def main():
+    print(
+        f"Cuota simulada {SERVER_RPM} RPM ({SERVER_AVAILABLE} disponibles), {CLIENTS} clientes × "
+        f"{MESSAGES_PER_CLIENT} mensajes, 3 carriles"
+    )
+    run_scenario("sin limitador (reintentos del SDK)", limited=False)
+    run_scenario("con limitador", limited=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark de la entrega de respuestas (REPLY_*): cuánto tarda el cliente en
+ver algo desde que su mensaje se acepta, con un modelo simulado que emite
+la respuesta en stream y una Graph API simulada que, como Meta, rechaza los
+textos de más de 4096 caracteres.
+
+- Antes: la respuesta completa sale en un solo mensaje al terminar de generarse.
+- Ahora: acuse de lectura con "escribiendo…" al aceptar el mensaje, y los
+  párrafos terminados salen mientras se genera el resto.
+
+Ejecutar desde la raíz del repositorio:
+
+    python -m benchmarks.bench_reply_streaming
+"""
+import json
+import threading
+import time
+
+import app.utils.whatsapp_utils as whatsapp_utils
+from app.services.assistant_manager import completed_future
+from app.services.outbound_dispatcher import init_outbound_dispatcher
+from app.services.reply_streaming import WHATSAPP_TEXT_LIMIT, init_reply_streamer
+from app.utils.graph_client import init_graph_client
+from app.utils.resilience import init_resilience
+from app.utils.whatsapp_payload import WhatsAppMessageEvent, get_text_message_input, process_text_for_whatsapp
+from benchmarks.stub_server import StubServer
+
+GRAPH_LATENCY = 0.08
+FIRST_TOKEN_SECONDS = 1.5
+CHARS_PER_SECOND = 600
+PARAGRAPH = (
+    "El garrafón de **20 litros** cuesta 15 Bs y lo entregamos en 30 a 40 minutos dentro de la zona "
+    "central. Para pedidos de más de cinco unidades el envío es gratis y puedes pagar con QR o en efectivo. "
+)
+REPLIES = {
+    "corta": PARAGRAPH,
+    "media": "\n\n".join([PARAGRAPH * 2] * 4),
+    "larga": "\n\n".join([PARAGRAPH * 3] * 10),
+}
+
+
+class GraphRecorder:
+    """Endpoint /messages que guarda cuándo llega cada acuse o texto"""
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def messages(self, method, path, body):
+        payload = json.loads(body)
+        kind = "receipt" if payload.get("status") == "read" else "text"
+        text = payload.get("text", {}).get("body", "")
+        with self.lock:
+            self.events.append((time.perf_counter(), kind, len(text)))
+        if len(text) > WHATSAPP_TEXT_LIMIT:
+            return 400, {"error": {"message": "(#100) Param text['body'] must be at most 4096 characters",
+                                   "code": 100}}
+        return {"messaging_product": "whatsapp", "messages": [{"id": "wamid.bench"}]}
+
+
+class StreamingAssistant:
+    """Modelo simulado: espera el primer token y emite la respuesta a ritmo fijo"""
+
+    def __init__(self, reply: str):
+        self.reply = reply
+
+    def generate_response_for_messages(self, messages, wa_id, name, on_delta=None, priority=None):
+        time.sleep(FIRST_TOKEN_SECONDS)
+        step = 24
+        for start in range(0, len(self.reply), step):
+            time.sleep(step / CHARS_PER_SECOND)
+            if on_delta is not None:
+                on_delta(self.reply[start:start + step])
+        return self.reply
+
+    def submit_response_for_messages(self, messages, wa_id, name, on_delta=None, priority=None):
+        # Como el modo stream: se genera en el hilo que llama
+        return completed_future(self.generate_response_for_messages(messages, wa_id, name, on_delta, priority))
+
+
+def legacy_reply(wa_id: str, name: str, texts):
+    """Camino anterior: un solo mensaje con la respuesta completa"""
+    response = whatsapp_utils.get_assistant_manager().generate_response_for_messages(texts, wa_id, name)
+    return bool(whatsapp_utils.send_message(get_text_message_input(wa_id, process_text_for_whatsapp(response))))
+
+
+def run(label: str, reply: str, legacy: bool, recorder: GraphRecorder):
+    whatsapp_utils.get_assistant_manager = lambda: StreamingAssistant(reply)
+    event = WhatsAppMessageEvent(wa_id="59170000000", name="Ana", message_id="wamid.in", message_type="text",
+                                 text="¿Cuánto cuesta el garrafón?")
+    with recorder.lock:
+        recorder.events.clear()
+
+    accepted_at = time.perf_counter()
+    if legacy:
+        sent = legacy_reply(event.wa_id, event.name, [event.text])
+    else:
+        whatsapp_utils.acknowledge_messages({event.wa_id: [event]})
+        sent = whatsapp_utils.reply_to_messages(event.wa_id, event.name, [event.text])
+    time.sleep(GRAPH_LATENCY * 2)  # el acuse sale en segundo plano
+
+    with recorder.lock:
+        events = list(recorder.events)
+    first_signal = min((at for at, _, _ in events), default=None)
+    texts = [(at, size) for at, kind, size in events if kind == "text"]
+    rejected = sum(1 for _, size in texts if size > WHATSAPP_TEXT_LIMIT)
+
+    def seconds(at):
+        return f"{at - accepted_at:5.2f} s" if at is not None else "    - "
+
+    print(
+        f"{label:<6} {len(reply):5} caracteres | primera señal {seconds(first_signal)} | "
+        f"primer texto {seconds(texts[0][0] if texts else None)} | "
+        f"último texto {seconds(texts[-1][0] if texts else None)} | "
+        f"mensajes {len(texts):2} (rechazados {rejected}) | entregada {'sí' if sent else 'no'}"
+    )
+
+
+def main():
+    recorder = GraphRecorder()
+    stub = StubServer([("POST", r"/v[0-9.]+/[^/]+/messages", recorder.messages)], latency=GRAPH_LATENCY).start()
+    init_resilience({})
+    config = {"ACCESS_TOKEN": "bench", "VERSION": "v19.0", "PHONE_NUMBER_ID": "123456789",
+              "GRAPH_API_BASE_URL": stub.url}
+    init_graph_client(config)
+    dispatcher = init_outbound_dispatcher(config, whatsapp_utils.deliver_outbound)
+    print(f"Primer token a los {FIRST_TOKEN_SECONDS:.1f} s, {CHARS_PER_SECOND} caracteres/s, "
+          f"{GRAPH_LATENCY * 1000:.0f} ms por envío a la Graph API")
+    try:
+        print("Antes (un mensaje al final):")
+        for label, reply in REPLIES.items():
+            run(label, reply, legacy=True, recorder=recorder)
+        init_reply_streamer(config, whatsapp_utils.send_read_receipt)
+        print("Ahora (acuse de lectura y párrafos progresivos):")
+        for label, reply in REPLIES.items():
+            run(label, reply, legacy=False, recorder=recorder)
+    finally:
+        dispatcher.stop()
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark de los circuitos y reintentos (RESILIENCE_*) con OpenAI y la
+Graph API degradados, simulados por un servidor local.
+
+- OpenAI colgado: chat completions nunca responde dentro de OPENAI_RUN_TIMEOUT.
+  Sin circuito cada respuesta espera el timeout completo; con circuito, tras
+  RESILIENCE_FAILURE_THRESHOLD fallos la respuesta de respaldo es inmediata.
+- Graph API con 503 en /media (subida de archivos, idempotente: los 5xx se
+  reintentan con backoff y jitter): llamadas reales por subida con
+  reintentos, presupuesto de reintentos y circuito. /messages no se usa
+  aquí porque un 5xx en un envío no se reintenta (el mensaje pudo salir).
+
+Ejecutar desde la raíz del repositorio:
+
+    python -m benchmarks.bench_resilience
+"""
+import os
+import statistics
+import tempfile
+import time
+
+import openai
+import requests
+
+from app.services.assistant_manager import AssistantConfig, AssistantManager
+from app.services.conversation_context import ConversationContext
+from app.utils.graph_client import init_graph_client
+from app.utils.resilience import CircuitOpenError, get_endpoint, init_resilience
+from app.utils.whatsapp_utils import GRAPH_MEDIA_ENDPOINT, graph_post, is_graph_idempotent_retryable
+from benchmarks.bench_engines import MemoryHistory
+from benchmarks.stub_server import StubServer
+
+RUN_TIMEOUT = 0.5
+REQUESTS = 40
+# Backoff de la Graph API más corto que el de producción para que el escenario dure poco
+GRAPH_BACKOFF = {"RESILIENCE_BASE_DELAY_SECONDS": 0.05, "RESILIENCE_MAX_DELAY_SECONDS": 0.5}
+
+
+def hung_completion(method, path, body):
+    time.sleep(RUN_TIMEOUT * 2)
+    return {"error": {"message": "timeout"}}
+
+
+def graph_unavailable(method, path, body):
+    return 503, {"error": {"message": "Service temporarily unavailable", "code": 2}}
+
+
+def run_openai(label: str, failure_threshold: int, stub: StubServer):
+    init_resilience({"RESILIENCE_FAILURE_THRESHOLD": failure_threshold, "RESILIENCE_OPEN_SECONDS": 30.0})
+    config = AssistantConfig(
+        openai_api_key="sk-bench",
+        response_engine="chat",
+        response_cache_enabled=False,
+        run_timeout=RUN_TIMEOUT,
+        max_retries=0,
+        knowledge_manifest_path=os.path.join(tempfile.mkdtemp(), "manifest.json"),
+        knowledge_index_path=os.path.join(tempfile.mkdtemp(), "knowledge_index.bin"),
+    )
+    manager = AssistantManager(config)
+    manager.client = openai.OpenAI(api_key="sk-bench", base_url=stub.url + "/v1", max_retries=0)
+    manager.context = ConversationContext(lambda: manager.client, summary_enabled=False)
+    history = MemoryHistory()
+    manager.engine.history_loader = history.load
+    manager.engine.exchange_writer = history.save
+    manager._init_pid = os.getpid()
+    manager.status = manager.engine.setup()
+
+    before = stub.count()
+    latencies = []
+    for i in range(REQUESTS):
+        started_at = time.perf_counter()
+        manager.generate_response_for_messages([f"¿Cuánto cuesta el garrafón? ({i})"], "59170000001", "Cliente")
+        latencies.append(time.perf_counter() - started_at)
+    print(
+        f"{label:<28} llamadas {stub.count() - before:3} | p50 {statistics.median(latencies) * 1000:6.0f} ms | "
+        f"total {sum(latencies):5.1f} s"
+    )
+
+
+def run_graph(label: str, settings: dict, stub: StubServer):
+    init_resilience({**GRAPH_BACKOFF, **settings})
+    before = stub.count()
+    started_at = time.perf_counter()
+    rejected = 0
+    for _ in range(REQUESTS):
+        try:
+            graph_post(GRAPH_MEDIA_ENDPOINT, "media", is_retryable=is_graph_idempotent_retryable,
+                       data={}, timeout=(1, 1))
+        except CircuitOpenError:
+            rejected += 1
+        except requests.exceptions.HTTPError:
+            pass
+    stats = get_endpoint(GRAPH_MEDIA_ENDPOINT).stats()
+    print(
+        f"{label:<28} llamadas {stub.count() - before:3} | reintentos {stats['retries']:3} "
+        f"(denegados {stats['retries_denied']:3}) | rechazados sin red {rejected:3} | "
+        f"total {time.perf_counter() - started_at:5.1f} s"
+    )
+
+
+def main():
+    stub = StubServer([
+        ("POST", r"/v1/chat/completions", hung_completion),
+        ("POST", r"/v[0-9.]+/[^/]+/media", graph_unavailable),
+    ]).start()
+    init_graph_client({"ACCESS_TOKEN": "bench", "VERSION": "v19.0", "PHONE_NUMBER_ID": "123",
+                       "GRAPH_API_BASE_URL": stub.url})
+    try:
+        print(f"OpenAI colgado, {REQUESTS} respuestas, timeout {RUN_TIMEOUT * 1000:.0f} ms")
+        run_openai("sin circuito", 10 ** 6, stub)
+        run_openai("circuito (5 fallos)", 5, stub)
+
+        print(f"\nGraph API con 503 en /media, {REQUESTS} subidas")
+        run_graph("1 intento", {"RESILIENCE_FAILURE_THRESHOLD": 10 ** 6, "RESILIENCE_MAX_ATTEMPTS": 1}, stub)
+        run_graph("3 intentos, sin circuito", {"RESILIENCE_FAILURE_THRESHOLD": 10 ** 6, "RESILIENCE_RETRY_BUDGET_RATIO": 10}, stub)
+        run_graph("3 intentos + presupuesto", {"RESILIENCE_FAILURE_THRESHOLD": 10 ** 6}, stub)
+        run_graph("3 intentos + circuito", {"RESILIENCE_FAILURE_THRESHOLD": 5}, stub)
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark de los runs en modo poll (OPENAI_RUN_MODE=poll) bajo el scheduler
+de conversaciones: muchos clientes escriben a la vez y cada run tarda
+GENERATION_SECONDS en completarse en una API de OpenAI simulada.
+
+- Antes: cada conversación espera su run dentro de un worker del scheduler,
+  así que solo CONCURRENCY runs están en curso a la vez.
+- Ahora: el run queda en el RunTracker y el worker se libera (Deferred); la
+  respuesta se termina en el pool cuando el run se completa.
+
+Se muestran los hilos de la aplicación (scheduler y RunTracker) y cuántos
+runs llegaron a estar en curso al mismo tiempo.
+
+Ejecutar desde la raíz del repositorio:
+
+    python -m benchmarks.bench_run_tracker
+"""
+import os
+import tempfile
+import threading
+import time
+
+import openai
+
+from app.services.assistant_manager import AssistantConfig, AssistantManager, AssistantStatus
+from app.services.conversation_context import ConversationContext
+from app.services.conversation_scheduler import ConversationScheduler, Deferred
+from app.utils.resilience import init_resilience
+from benchmarks.bench_engines import GENERATION_SECONDS, OPENAI_ROUTES, REPLY
+from benchmarks.stub_server import StubServer
+
+API_LATENCY = 0.02
+CONVERSATIONS = 120
+CONCURRENCY = 8
+APP_THREAD_PREFIXES = ("conversation", "run-poll", "run-tracker")
+
+
+def build_manager(base_url: str) -> AssistantManager:
+    config = AssistantConfig(
+        openai_api_key="sk-bench",
+        assistant_id="asst_bench",
+        run_mode="poll",
+        rate_limit_enabled=False,
+        response_cache_enabled=False,
+        knowledge_index_enabled=False,
+        knowledge_manifest_path=os.path.join(tempfile.mkdtemp(), "manifest.json"),
+    )
+    manager = AssistantManager(config)
+    manager.context = ConversationContext(lambda: manager.client, summary_enabled=False)
+    manager.client = openai.OpenAI(api_key="sk-bench", base_url=base_url)
+    manager._init_pid = os.getpid()
+    manager.assistant_id = "asst_bench"
+    manager.status = AssistantStatus.READY
+    for conversation in range(CONVERSATIONS):
+        manager.thread_cache.put(wa_id(conversation), f"thread_{conversation}")
+    return manager
+
+
+def wa_id(conversation: int) -> str:
+    return f"5917{conversation:07d}"
+
+
+class Sampler:
+    """Máximo de hilos de la aplicación y de runs en curso mientras corre el escenario"""
+
+    def __init__(self, manager: AssistantManager):
+        self.manager = manager
+        self.max_threads = 0
+        self.max_in_flight = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(0.01):
+            threads = sum(1 for thread in threading.enumerate() if thread.name.startswith(APP_THREAD_PREFIXES))
+            self.max_threads = max(self.max_threads, threads)
+            if self.manager._run_tracker is not None:
+                self.max_in_flight = max(self.max_in_flight, self.manager._run_tracker.stats()["in_flight"])
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def blocking_reply(manager: AssistantManager, conversation: int) -> str:
+    """Camino anterior: el worker espera el resultado del run"""
+    return manager.generate_response_for_messages(["¿Cuánto cuesta el garrafón?"], wa_id(conversation), "Cliente")
+
+
+def deferred_reply(manager: AssistantManager, conversation: int):
+    """Camino actual: el worker se libera y la continuación vuelve al pool"""
+    future = manager.submit_response_for_messages(["¿Cuánto cuesta el garrafón?"], wa_id(conversation), "Cliente")
+    return Deferred(future, lambda done: done.result())
+
+
+def run(label: str, reply, stub: StubServer):
+    manager = build_manager(stub.url + "/v1")
+    scheduler = ConversationScheduler(max_concurrency=CONCURRENCY)
+    with Sampler(manager) as sampler:
+        started_at = time.perf_counter()
+        futures = [scheduler.submit(wa_id(i), reply, manager, i) for i in range(CONVERSATIONS)]
+        replies = [future.result() for future in futures]
+        elapsed = time.perf_counter() - started_at
+    scheduler.shutdown()
+    manager._run_tracker.stop()
+
+    print(
+        f"{label:<7} {CONVERSATIONS} respuestas en {elapsed:5.2f} s | "
+        f"runs en curso a la vez (máx.) {sampler.max_in_flight:3} | "
+        f"hilos de la app (máx.) {sampler.max_threads:3} | "
+        f"correctas {sum(1 for text in replies if text == REPLY)}"
+    )
+
+
+def main():
+    init_resilience({})
+    stub = StubServer(OPENAI_ROUTES, latency=API_LATENCY).start()
+    try:
+        print(
+            f"{CONVERSATIONS} clientes a la vez, CONVERSATION_MAX_CONCURRENCY={CONCURRENCY}, "
+            f"runs de {GENERATION_SECONDS * 1000:.0f} ms, {API_LATENCY * 1000:.0f} ms por llamada a la API"
+        )
+        run("antes", blocking_reply, stub)
+        run("ahora", deferred_reply, stub)
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
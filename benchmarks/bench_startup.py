@@ -0,0 +1,119 @@
+"""
+Benchmark de arranque: tiempo hasta la primera respuesta del webhook y
+llamadas a OpenAI hechas antes de ella, con la API simulada por un servidor
+local con latencia fija por llamada.
+
+Modos (cada uno en un proceso nuevo, como un worker de gunicorn):
+  lazy    ASSISTANT_WARMUP=false: el asistente se inicializa con el primer mensaje
+  warmup  ASSISTANT_WARMUP=true: inicialización en segundo plano
+  eager   inicialización síncrona antes de servir (equivale al arranque anterior,
+          que además repetía las llamadas por la instancia duplicada)
+
+Ejecutar desde la raíz del repositorio:
+
+    python -m benchmarks.bench_startup
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_server import StubServer
+
+API_LATENCY = 0.2  # segundos por llamada a la API simulada
+ROUNDS = 3
+
+CHILD_CODE = r"""
+import json, os, sys, time
+spawned_at = float(os.environ["BENCH_SPAWNED_AT"])
+from app import create_app
+app = create_app()
+if os.environ["BENCH_MODE"] == "eager":
+    from app.services.assistant_manager import get_assistant_manager
+    get_assistant_manager().ensure_initialized()
+client = app.test_client()
+response = client.get("/webhook?hub.mode=subscribe&hub.verify_token=" + app.config["VERIFY_TOKEN"] + "&hub.challenge=1")
+first_request = time.time() - spawned_at
+from app.services.assistant_manager import get_assistant_manager
+manager = get_assistant_manager()
+deadline = time.time() + 10
+while os.environ["BENCH_MODE"] != "lazy" and not manager.is_ready() and time.time() < deadline:
+    time.sleep(0.01)
+# El resultado va a un archivo: stdout también lleva el logging de la app
+with open(os.environ["BENCH_RESULT_PATH"], "w") as result_file:
+    json.dump({"status": response.status_code, "first_request": first_request,
+               "ready": manager.is_ready(), "ready_at": time.time() - spawned_at}, result_file)
+"""
+
+
+def assistant_route(method, path, body):
+    return {
+        "id": "asst_bench", "object": "assistant", "name": "bench", "tools": [{"type": "file_search"}],
+        "tool_resources": {"file_search": {"vector_store_ids": ["vs_bench"]}},
+    }
+
+
+VECTOR_STORE_FILE = {"id": "file-bench", "object": "vector_store.file", "status": "completed"}
+
+OPENAI_ROUTES = [
+    ("GET", r"/v1/assistants/[^/]+", assistant_route),
+    ("GET", r"/v1/vector_stores/[^/]+", lambda method, path, body: {"id": "vs_bench", "object": "vector_store"}),
+    ("POST", r"/v1/files", lambda method, path, body: {"id": "file-bench", "object": "file", "purpose": "assistants"}),
+    ("POST", r"/v1/vector_stores/[^/]+/files", lambda method, path, body: VECTOR_STORE_FILE),
+    ("GET", r"/v1/vector_stores/[^/]+/files/[^/]+", lambda method, path, body: VECTOR_STORE_FILE),
+]
+
+
+def run_child(mode: str, stub: StubServer, manifest_path: str) -> dict:
+    result_fd, result_path = tempfile.mkstemp(suffix=".json")
+    os.close(result_fd)
+    env = {
+        **os.environ,
+        "BENCH_MODE": mode,
+        "BENCH_RESULT_PATH": result_path,
+        "BENCH_SPAWNED_AT": repr(time.time()),
+        "ASSISTANT_WARMUP": "true" if mode == "warmup" else "false",
+        "OPENAI_BASE_URL": stub.url + "/v1",
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_ASSISTANT_ID": "asst_bench",
+        "KNOWLEDGE_MANIFEST_PATH": manifest_path,
+        "ACCESS_TOKEN": os.environ.get("ACCESS_TOKEN", "bench"),
+        "DB_USER": "bench", "DB_PASSWORD": "bench", "DB_HOST": "127.0.0.1", "DB_PORT": "3306", "DB_NAME": "bench",
+        "VERIFY_TOKEN": os.environ.get("VERIFY_TOKEN", "bench"),
+    }
+    before = stub.count()
+    try:
+        subprocess.run([sys.executable, "-c", CHILD_CODE], env=env, capture_output=True, text=True, check=True)
+        with open(result_path) as result_file:
+            result = json.load(result_file)
+    finally:
+        os.remove(result_path)
+    result["api_calls"] = stub.count() - before
+    return result
+
+
+def main():
+    stub = StubServer(OPENAI_ROUTES, latency=API_LATENCY).start()
+    manifest_path = os.path.join(tempfile.mkdtemp(), "knowledge_manifest.json")
+    try:
+        print(f"Latencia simulada por llamada a OpenAI: {API_LATENCY * 1000:.0f} ms")
+        # Primer arranque: sube los archivos de conocimiento y crea el manifiesto
+        first = run_child("eager", stub, manifest_path)
+        print(f"primer arranque (sube conocimiento): {first['api_calls']} llamadas a OpenAI")
+        for mode in ("lazy", "warmup", "eager"):
+            runs = [run_child(mode, stub, manifest_path) for _ in range(ROUNDS)]
+            first = sorted(run["first_request"] for run in runs)[len(runs) // 2]
+            ready = sorted(run["ready_at"] for run in runs)[len(runs) // 2]
+            print(
+                f"{mode:<7} primera respuesta {first * 1000:7.0f} ms | "
+                f"asistente listo {'—' if mode == 'lazy' else f'{ready * 1000:.0f} ms':>8} | "
+                f"llamadas a OpenAI {runs[0]['api_calls']}"
+            )
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Micro-benchmark del ingreso del webhook: CPU por request antes y después
+del parseo único sobre bytes.
+
+Ejecutar desde la raíz del repositorio:
+
+    python -m benchmarks.bench_webhook_ingress
+"""
+import hashlib
+import hmac
+import json
+import timeit
+
+from app.utils.decorators import validacion_firma
+from app.utils.whatsapp_payload import (
+    is_status_only_payload,
+    parse_webhook_payload,
+    safe_get_nested_value,
+)
+
+APP_SECRET = "benchmark-secret"
+ITERATIONS = 20000
+
+MESSAGE_BODY = {
+    "object": "whatsapp_business_account",
+    "entry": [{
+        "id": "1234567890",
+        "changes": [{
+            "field": "messages",
+            "value": {
+                "messaging_product": "whatsapp",
+                "metadata": {"display_phone_number": "59170000000", "phone_number_id": "1111"},
+                "contacts": [{"profile": {"name": "Cliente Demo"}, "wa_id": "59179000000"}],
+                "messages": [{
+                    "from": "59179000000",
+                    "id": "wamid.HBgLNTkxNzkwMDAwMDAVAgASGBQzQTg1RDY2QkE5NEM0RkE1QjFGMgA=",
+                    "timestamp": "1760000000",
+                    "type": "text",
+                    "text": {"body": "Hola, quiero 2 garrafones de agua de 3 litros"},
+                }],
+            },
+        }],
+    }],
+}
+
+STATUS_BODY = {
+    "object": "whatsapp_business_account",
+    "entry": [{
+        "id": "1234567890",
+        "changes": [{
+            "field": "messages",
+            "value": {
+                "messaging_product": "whatsapp",
+                "metadata": {"display_phone_number": "59170000000", "phone_number_id": "1111"},
+                "statuses": [{
+                    "id": "wamid.HBgLNTkxNzkwMDAwMDAVAgARGBI5QTNDQTVCM0Q0Q0Q2RTY3RTcA",
+                    "status": "delivered",
+                    "timestamp": "1760000001",
+                    "recipient_id": "59179000000",
+                    "conversation": {"id": "abc", "origin": {"type": "service"}},
+                    "pricing": {"billable": True, "pricing_model": "CBP", "category": "service"},
+                }],
+            },
+        }],
+    }],
+}
+
+
+def _sign(raw: bytes) -> str:
+    return hmac.new(APP_SECRET.encode("latin-1"), raw, hashlib.sha256).hexdigest()
+
+
+def legacy_ingress(raw: bytes, firma: str):
+    """Ruta anterior: decode -> encode para el HMAC, get_json y recorridos repetidos"""
+    payload = raw.decode("utf-8")
+    firma_esperada = hmac.new(
+        APP_SECRET.encode("latin-1"), msg=payload.encode("utf-8"), digestmod=hashlib.sha256
+    ).hexdigest()
+    if not hmac.compare_digest(firma_esperada, firma):
+        return None
+
+    body = json.loads(raw)
+    if body.get("entry", [{}])[0].get("changes", [{}])[0].get("value", {}).get("statuses"):
+        return "status"
+
+    # is_valid_whatsapp_message (llamado en handle_message y otra vez dentro de process_whatsapp_message)
+    for _ in range(2):
+        for path in (
+            ["object"],
+            ["entry", 0, "changes", 0, "value", "messages", 0],
+            ["entry", 0, "changes", 0, "value", "contacts", 0, "wa_id"],
+        ):
+            if safe_get_nested_value(body, path) is None:
+                return None
+
+    contact = safe_get_nested_value(body, ["entry", 0, "changes", 0, "value", "contacts", 0], {})
+    message = safe_get_nested_value(body, ["entry", 0, "changes", 0, "value", "messages", 0], {})
+    return (
+        contact.get("wa_id"),
+        safe_get_nested_value(contact, ["profile", "name"], "Cliente"),
+        safe_get_nested_value(message, ["text", "body"], ""),
+    )
+
+
+def new_ingress(raw: bytes, firma: str):
+    """Ruta nueva: HMAC sobre bytes, pre-chequeo de estados y un solo parseo tipado"""
+    if not validacion_firma(raw, firma, APP_SECRET):
+        return None
+    if is_status_only_payload(raw):
+        return "status"
+    return parse_webhook_payload(raw)
+
+
+def _measure(func, raw: bytes) -> float:
+    firma = _sign(raw)
+    assert func(raw, firma) is not None
+    seconds = min(timeit.repeat(lambda: func(raw, firma), number=ITERATIONS, repeat=5))
+    return seconds / ITERATIONS * 1e6
+
+
+def main():
+    print(f"{'payload':<10}{'anterior (µs)':>16}{'nuevo (µs)':>14}{'ahorro':>10}")
+    for label, body in (("mensaje", MESSAGE_BODY), ("estado", STATUS_BODY)):
+        raw = json.dumps(body).encode("utf-8")
+        legacy = _measure(legacy_ingress, raw)
+        new = _measure(new_ingress, raw)
+        print(f"{label:<10}{legacy:>16.2f}{new:>14.2f}{(1 - new / legacy):>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Servidor HTTP local para benchmarks: responde JSON (o eventos SSE) fijos por
+ruta con una latencia artificial, sin llamar a servicios externos.
+"""
+import json
+import re
+import ssl
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Tuple, Union
+
+
+
+class EventStream:
+    """Respuesta text/event-stream: lista de (nombre de evento o None, datos)"""
+
+    def __init__(self, events: List[Tuple[Optional[str], Union[dict, str]]]):
+        self.events = events
+
+    def encode(self) -> bytes:
+        lines = []
+        for name, data in self.events:
+            if name:
+                lines.append(f"event: {name}")
+            lines.append(f"data: {data if isinstance(data, str) else json.dumps(data)}")
+            lines.append("")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# Retorna el payload, (status, payload) o (status, payload, headers)
+Handler = Callable[[str, str, bytes], Union[dict, EventStream, tuple]]
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clientes que cortan por timeout o cierran conexiones del pool
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class StubServer:
+    """Rutas (método, regex de path) → función que retorna el JSON de respuesta"""
+
+    def __init__(self, routes: List[Tuple[str, str, Handler]], latency: float = 0.0,
+                 certfile: Optional[str] = None):
+        self.routes = [(method, re.compile(pattern), handler) for method, pattern, handler in routes]
+        self.latency = latency
+        self.requests: List[Tuple[str, str]] = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = _QuietServer(("127.0.0.1", 0), self._handler_class())
+        # Con certfile (certificado y clave en PEM) el servidor atiende HTTPS
+        self.scheme = "http"
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile)
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+            self.scheme = "https"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"{self.scheme}://127.0.0.1:{self._server.server_port}"
+
+    def _handler_class(self):
+        stub = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def _dispatch(self, method: str):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                with stub._lock:
+                    stub.requests.append((method, self.path))
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                path = self.path.split("?", 1)[0]
+                for route_method, pattern, handler in stub.routes:
+                    if route_method == method and pattern.fullmatch(path):
+                        result = handler(method, self.path, body)
+                        if not isinstance(result, tuple):
+                            result = (200, result)
+                        status, payload, headers = (result + ({},))[:3]
+                        break
+                else:
+                    status, payload, headers = 404, {"error": {"message": f"Sin ruta para {method} {path}"}}, {}
+
+                if isinstance(payload, EventStream):
+                    data, content_type = payload.encode(), "text/event-stream"
+                else:
+                    data, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_DELETE(self):
+                self._dispatch("DELETE")
+
+        return _Handler
+
+    def start(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, method: str = None) -> int:
+        with self._lock:
+            return sum(1 for request in self.requests if method is None or request[0] == method)
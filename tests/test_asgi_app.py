@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import hmac
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.services.message_deduplicator as dedup_module
+import app.utils.async_whatsapp_utils as async_whatsapp_utils
+from app.asgi import create_async_app
+from app.services.message_deduplicator import MessageDeduplicator
+from app.utils.whatsapp_payload import parse_webhook_body
+
+APP_SECRET = "secreto"
+
+
+def _payload(*messages):
+    """Entrega del webhook con mensajes de texto (wa_id, id, texto)"""
+    return {"object": "whatsapp_business_account", "entry": [{"changes": [{"value": {
+        "contacts": [{"wa_id": wa_id, "profile": {"name": f"Cliente {wa_id}"}} for wa_id in {m[0] for m in messages}],
+        "messages": [
+            {"id": message_id, "from": wa_id, "type": "text", "text": {"body": body}}
+            for wa_id, message_id, body in messages
+        ],
+    }}]}]}
+
+
+def _signed(body):
+    raw = json.dumps(body).encode()
+    signature = hmac.new(APP_SECRET.encode(), raw, hashlib.sha256).hexdigest()
+    return raw, {"X-Hub-Signature-256": f"sha256={signature}", "Content-Type": "application/json"}
+
+
+class _Assistant:
+    """generate_response asíncrono; "espera" queda bloqueado hasta que responda otro cliente"""
+
+    def __init__(self):
+        self.calls = []
+        self.other_customer_answered = asyncio.Event()
+
+    async def generate_response(self, message_body, wa_id, name):
+        self.calls.append((wa_id, message_body))
+        if message_body == "espera":
+            await asyncio.wait_for(self.other_customer_answered.wait(), timeout=2)
+        elif wa_id == "591702":
+            self.other_customer_answered.set()
+        return f"respuesta a {message_body}"
+
+
+class _WhatsApp:
+    def __init__(self, ok=True):
+        self.ok = ok
+        self.sent = []
+
+    async def send_message(self, data):
+        message = json.loads(data)
+        self.sent.append((message["to"], message["text"]["body"]))
+        return self.ok
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(dedup_module, "message_deduplicator", MessageDeduplicator())
+    monkeypatch.setattr(async_whatsapp_utils, "get_message_router", lambda: None)
+    app = create_async_app()
+    # La configuración se lee del .env (con override); el secreto de la prueba va directo
+    app.state.config["APP_SECRET"] = APP_SECRET
+    # Sin `with` no corre el lifespan: OpenAI y la Graph API se reemplazan aquí
+    app.state.assistant = _Assistant()
+    app.state.whatsapp = _WhatsApp()
+    return TestClient(app)
+
+
+def test_messages_of_a_customer_keep_their_order_and_customers_run_in_parallel(client):
+    raw, headers = _signed(_payload(
+        ("591701", "wamid.a1", "espera"),
+        ("591701", "wamid.a2", "segundo"),
+        ("591702", "wamid.b1", "hola"),
+    ))
+
+    response = client.post("/webhook", content=raw, headers=headers)
+
+    assert response.status_code == 200
+    # "espera" solo termina si el otro cliente se atendió mientras tanto
+    sent = client.app.state.whatsapp.sent
+    assert [text for wa_id, text in sent if wa_id == "591701"] == ["respuesta a espera", "respuesta a segundo"]
+    assert ("591702", "respuesta a hola") in sent
+
+
+def test_meta_retry_is_not_answered_twice(client):
+    raw, headers = _signed(_payload(("591701", "wamid.1", "hola")))
+
+    assert client.post("/webhook", content=raw, headers=headers).status_code == 200
+    assert client.post("/webhook", content=raw, headers=headers).status_code == 200
+
+    assert client.app.state.assistant.calls == [("591701", "hola")]
+    assert len(client.app.state.whatsapp.sent) == 1
+
+
+def test_invalid_signature_is_rejected(client):
+    raw, headers = _signed(_payload(("591701", "wamid.1", "hola")))
+    headers["X-Hub-Signature-256"] = "sha256=" + "0" * 64
+
+    assert client.post("/webhook", content=raw, headers=headers).status_code == 403
+    assert client.app.state.assistant.calls == []
+
+
+def test_status_only_delivery_skips_the_assistant(client):
+    raw, headers = _signed({"object": "whatsapp_business_account", "entry": [{"changes": [{"value": {
+        "statuses": [{"id": "wamid.1", "status": "delivered", "recipient_id": "591701"}],
+    }}]}]})
+
+    assert client.post("/webhook", content=raw, headers=headers).status_code == 200
+    assert client.app.state.assistant.calls == []
+
+
+def test_failed_sends_report_an_error(monkeypatch):
+    monkeypatch.setattr(dedup_module, "message_deduplicator", None)
+    monkeypatch.setattr(async_whatsapp_utils, "get_message_router", lambda: None)
+    event = parse_webhook_body(_payload(("591701", "wamid.1", "hola")))
+
+    body, status = asyncio.run(async_whatsapp_utils.process_webhook_event_async(event, _Assistant(), _WhatsApp(ok=False)))
+
+    assert status == 500
+    assert body["results"][0]["status"] == "error"
@@ -0,0 +1,112 @@
+import threading
+from types import SimpleNamespace
+
+from app.services import assistant_instance, assistant_manager
+from app.services.assistant_manager import AssistantConfig, AssistantManager, AssistantStatus
+
+
+def _manager(**overrides):
+    values = {"openai_api_key": "sk-test", "knowledge_index_enabled": False,
+              "response_cache_enabled": False, "rate_limit_enabled": False}
+    values.update(overrides)
+    manager = AssistantManager(AssistantConfig(**values))
+    manager.setups = []
+    return manager
+
+
+def _setup(manager, results):
+    """Reemplaza la configuración con red: cada intento toma el siguiente resultado"""
+
+    def initialize_client():
+        manager.client = object()
+
+    def setup_assistant():
+        manager.setups.append(threading.get_ident())
+        result = results[min(len(manager.setups), len(results)) - 1]
+        if isinstance(result, BaseException):
+            raise result
+        manager.status = result
+
+    manager._initialize_openai_client = initialize_client
+    manager._setup_assistant = setup_assistant
+
+
+def test_creating_the_manager_makes_no_network_calls():
+    manager = _manager()
+
+    assert manager.status == AssistantStatus.NOT_INITIALIZED
+    assert manager.client is None and manager.assistant_id is None
+
+
+def test_instance_module_creates_the_manager_on_first_access(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(assistant_manager, "_app_options", {"knowledge_index_enabled": False})
+    monkeypatch.setattr(assistant_manager, "assistant_manager_instance", None)
+
+    manager = assistant_instance.assistant_manager_instance
+
+    assert manager is assistant_manager.get_assistant_manager()
+    assert manager.status == AssistantStatus.NOT_INITIALIZED
+
+
+def test_concurrent_first_calls_initialize_once():
+    manager = _manager()
+    _setup(manager, [AssistantStatus.READY])
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.ensure_initialized())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [True] * 8
+    assert len(manager.setups) == 1
+
+
+def test_failed_initialization_waits_before_retrying(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(assistant_manager, "time", SimpleNamespace(
+        monotonic=lambda: clock[0], perf_counter=lambda: clock[0]))
+    manager = _manager(init_retry_seconds=30)
+    _setup(manager, [RuntimeError("OpenAI caído"), AssistantStatus.READY])
+
+    assert manager.ensure_initialized() is False
+    assert manager.status == AssistantStatus.ERROR
+    clock[0] += 10
+    # Dentro del intervalo no se vuelve a llamar a la API
+    assert manager.ensure_initialized() is False
+    assert len(manager.setups) == 1
+
+    clock[0] += 25
+    assert manager.ensure_initialized() is True
+    assert len(manager.setups) == 2
+
+
+def test_forked_child_initializes_its_own_client(monkeypatch):
+    manager = _manager()
+    _setup(manager, [AssistantStatus.READY])
+    assert manager.ensure_initialized() is True
+    parent_client = manager.client
+
+    # Otro pid: el estado heredado del padre se descarta y se inicializa de nuevo
+    monkeypatch.setattr(assistant_manager.os, "getpid", lambda: -1)
+    manager._run_tracker = object()
+    assert manager.ensure_initialized() is True
+
+    assert len(manager.setups) == 2
+    assert manager.client is not parent_client
+    assert manager._run_tracker is None
+
+
+def test_reset_after_fork_replaces_locks_and_state():
+    manager = _manager()
+    _setup(manager, [AssistantStatus.READY])
+    manager.ensure_initialized()
+    # Un lock tomado por otro hilo del padre bloquearía al hijo
+    manager._init_lock.acquire()
+
+    manager._reset_after_fork()
+
+    assert manager.status == AssistantStatus.NOT_INITIALIZED and manager.client is None
+    assert manager.ensure_initialized() is True
+    assert len(manager.setups) == 2
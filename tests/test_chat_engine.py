@@ -0,0 +1,178 @@
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from app.services.assistant_manager import (
+    RUN_TECHNICAL_ERROR_MESSAGE,
+    RUN_TIMEOUT_MESSAGE,
+    AssistantConfig,
+    AssistantStatus,
+)
+from app.services.response_engine import AssistantsEngine, ChatCompletionsEngine, create_response_engine
+
+
+def _chunk(content=None, usage=None):
+    choices = [] if content is None else [SimpleNamespace(delta=SimpleNamespace(content=content))]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class _Stream:
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        yield from self.chunks
+        if self.error is not None:
+            raise self.error
+
+
+class _Completions:
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if isinstance(self.result, BaseException):
+            raise self.result
+        return self.result
+
+
+class _Context:
+    def __init__(self, summary=None):
+        self.summary = summary
+        self.turns = []
+
+    def summary_instructions(self, wa_id):
+        return self.summary
+
+    def record_turn(self, wa_id, count, usage, origin, fetch_recent):
+        self.turns.append((wa_id, count, usage, origin, fetch_recent))
+
+
+class _Index:
+    def __init__(self, doc_count=3):
+        self.doc_count = doc_count
+        self.queries = []
+
+    def refresh(self):
+        pass
+
+    def relevant(self, query):
+        self.queries.append(query)
+        return ["El garrafón de 20 L cuesta 15 Bs."]
+
+
+# Historial de la tabla mensajes: (id, contenido, tipo), del más nuevo al más antiguo
+HISTORY = [(2, "¡Hola Ana! ¿En qué te ayudo?", "salida"), (1, "Hola", "entrada")]
+
+
+def _engine(result, summary=None, history=HISTORY, doc_count=3):
+    completions = _Completions(result)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    client.with_options = lambda timeout: client
+    manager = SimpleNamespace(
+        config=AssistantConfig(openai_api_key="sk-test", model="gpt-4o-mini", run_timeout=5.0),
+        client=client,
+        context=_Context(summary),
+        knowledge_index=_Index(doc_count),
+    )
+    saved = []
+
+    def load_history(wa_id, limit):
+        if isinstance(history, BaseException):
+            raise history
+        return history[:limit]
+
+    engine = ChatCompletionsEngine(manager, history_loader=load_history,
+                                   exchange_writer=lambda *args: saved.append(args))
+    return engine, completions, manager, saved
+
+
+def test_prompt_has_knowledge_history_and_new_messages_in_one_call():
+    stream = _Stream([_chunk("15 "), _chunk("Bs."), _chunk(usage=SimpleNamespace(total_tokens=90))])
+    engine, completions, manager, saved = _engine(stream, summary="Resumen: cliente frecuente")
+    deltas = []
+
+    response = engine.generate(["¿Precio del", "garrafón?"], "591700", "Ana", on_delta=deltas.append)
+
+    assert response == "15 Bs." and deltas == ["15 ", "Bs."]
+    assert len(completions.calls) == 1
+    call = completions.calls[0]
+    assert (call["model"], call["stream"]) == ("gpt-4o-mini", True)
+    system, *rest = call["messages"]
+    assert "Estás conversando con Ana" in system["content"]
+    assert "El garrafón de 20 L cuesta 15 Bs." in system["content"]
+    assert system["content"].endswith("Resumen: cliente frecuente")
+    # El historial va en orden cronológico, antes de los mensajes nuevos
+    assert rest == [
+        {"role": "user", "content": "Hola"},
+        {"role": "assistant", "content": "¡Hola Ana! ¿En qué te ayudo?"},
+        {"role": "user", "content": "¿Precio del"},
+        {"role": "user", "content": "garrafón?"},
+    ]
+    assert manager.knowledge_index.queries == ["¿Precio del garrafón?"]
+
+
+def test_completed_reply_is_saved_and_counted_in_the_context():
+    engine, _, manager, saved = _engine(_Stream([_chunk("Sí, hay stock"), _chunk(usage="uso")]))
+
+    engine.generate(["¿Hay stock?"], "591700", "Ana")
+
+    assert saved == [("591700", "Ana", ["¿Hay stock?"], "Sí, hay stock")]
+    wa_id, count, usage, origin, recent = manager.context.turns[0]
+    assert (wa_id, count, usage, origin) == ("591700", 1, "uso", "mensajes")
+    assert recent(10)[0] == (2, "assistant", "¡Hola Ana! ¿En qué te ayudo?")
+
+
+def test_history_read_failure_still_answers():
+    engine, completions, _, _ = _engine(_Stream([_chunk("Hola")]), history=RuntimeError("DB caída"))
+
+    assert engine.generate(["Hola"], "591700", "Ana") == "Hola"
+    assert [m["role"] for m in completions.calls[0]["messages"]] == ["system", "user"]
+
+
+def test_timeout_returns_the_partial_text_without_saving_it():
+    timeout = openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com"))
+    engine, _, manager, saved = _engine(_Stream([_chunk("Respuesta a me")], error=timeout))
+
+    assert engine.generate(["Hola"], "591700", "Ana") == "Respuesta a me"
+    assert saved == [] and manager.context.turns == []
+
+    engine, _, _, saved = _engine(_Stream([], error=timeout))
+    assert engine.generate(["Hola"], "591700", "Ana") == RUN_TIMEOUT_MESSAGE
+    assert saved == []
+
+
+def test_api_errors_give_a_technical_message_and_rate_limits_propagate():
+    engine, _, _, saved = _engine(ValueError("respuesta inválida"))
+    assert engine.generate(["Hola"], "591700", "Ana") == RUN_TECHNICAL_ERROR_MESSAGE
+    assert saved == []
+
+    request = httpx.Request("POST", "https://api.openai.com")
+    rate_limited = openai.RateLimitError("429", response=httpx.Response(429, request=request), body=None)
+    engine, _, _, _ = _engine(rate_limited)
+    with pytest.raises(openai.RateLimitError):
+        engine.generate(["Hola"], "591700", "Ana")
+
+
+def test_setup_needs_indexed_knowledge():
+    assert _engine(None, doc_count=0)[0].setup() == AssistantStatus.FILES_MISSING
+    assert _engine(None, doc_count=3)[0].setup() == AssistantStatus.READY
+
+
+def test_engine_follows_the_configuration():
+    chat = SimpleNamespace(config=AssistantConfig(openai_api_key="sk-test", response_engine="chat"))
+    assistants = SimpleNamespace(config=AssistantConfig(openai_api_key="sk-test"))
+
+    assert isinstance(create_response_engine(chat), ChatCompletionsEngine)
+    assert isinstance(create_response_engine(assistants), AssistantsEngine)
@@ -0,0 +1,132 @@
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.services import assistant_manager
+from app.services.conversation_context import SUMMARY_PREFIX, ConversationContext
+
+
+class _SummaryClient:
+    """chat.completions.create que resume devolviendo los mensajes recibidos"""
+
+    def __init__(self):
+        self.prompts = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, messages, **kwargs):
+        prompt = messages[-1]["content"]
+        self.prompts.append(prompt)
+        transcript = prompt.split("Mensajes nuevos:\n", 1)[1]
+        message = SimpleNamespace(content=transcript)
+        return SimpleNamespace(usage=None, choices=[SimpleNamespace(message=message)])
+
+
+class _Thread:
+    """Historial de un thread: mensajes m1, m2... del más antiguo al más nuevo"""
+
+    def __init__(self):
+        self.messages = []
+
+    def add_turn(self, texts, reply):
+        for content in texts:
+            self.messages.append((f"m{len(self.messages) + 1}", "user", content))
+        self.messages.append((f"m{len(self.messages) + 1}", "assistant", reply))
+
+    def fetch_recent(self, limit):
+        return list(reversed(self.messages))[:limit]
+
+
+def _context(window=4, batch=2, **kwargs):
+    client = _SummaryClient()
+    context = ConversationContext(lambda: client, window_messages=window, summary_batch=batch, **kwargs)
+    # Escrituras y resúmenes en el mismo hilo para que la prueba sea determinista
+    context._submit = lambda fn, *args: fn(*args)
+    return context, client
+
+
+def _turn(context, thread, number, usage=None):
+    thread.add_turn([f"pregunta {number}"], f"respuesta {number}")
+    context.record_turn("591700", 1, usage, origin="thread_1", fetch_recent=thread.fetch_recent)
+
+
+def test_summary_waits_until_a_batch_leaves_the_window():
+    context, client = _context(window=4, batch=2)
+    thread = _Thread()
+
+    # 3 turnos = 6 mensajes: solo 2 fuera de la ventana de 4, justo un lote
+    _turn(context, thread, 1)
+    _turn(context, thread, 2)
+    assert client.prompts == []
+    _turn(context, thread, 3)
+
+    assert len(client.prompts) == 1
+    assert "Cliente: pregunta 1\nAsistente: respuesta 1" in client.prompts[0]
+    assert "pregunta 2" not in client.prompts[0]
+    state = context._state("591700")
+    assert (state.total_messages, state.summarized_messages, state.cursor) == (6, 2, "m2")
+    assert context.summary_instructions("591700").startswith(SUMMARY_PREFIX)
+
+
+def test_next_summary_only_adds_messages_after_the_cursor():
+    context, client = _context(window=4, batch=2)
+    thread = _Thread()
+    for number in range(1, 5):
+        _turn(context, thread, number)
+
+    assert len(client.prompts) == 2
+    second = client.prompts[1]
+    # Resumen anterior + solo el turno 2 (el 1 ya estaba resumido, 3 y 4 siguen en la ventana)
+    assert second.startswith("Resumen actual:\nCliente: pregunta 1")
+    assert second.split("Mensajes nuevos:\n", 1)[1] == "Cliente: pregunta 2\nAsistente: respuesta 2"
+    assert context._state("591700").cursor == "m4"
+
+
+def test_summary_disabled_never_calls_the_model():
+    context, client = _context(window=2, batch=1, summary_enabled=False)
+    thread = _Thread()
+    for number in range(1, 6):
+        _turn(context, thread, number)
+
+    assert client.prompts == []
+    assert context.summary_instructions("591700") is None
+
+
+def _session_factory():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE contexto_conversaciones (
+                wa_id VARCHAR(20) PRIMARY KEY, origen VARCHAR(64), resumen TEXT,
+                ultimo_mensaje_resumido VARCHAR(64), mensajes_totales INT, mensajes_resumidos INT,
+                respuestas INT, tokens_entrada BIGINT, tokens_salida BIGINT, ultimo_tokens_entrada INT
+            )
+        """))
+        conn.execute(text("""
+            INSERT INTO contexto_conversaciones VALUES
+                ('591700', 'thread_1', 'Cliente frecuente', 'm8', 30, 10, 12, 36000, 2400, 3100)
+        """))
+    return sessionmaker(bind=engine)
+
+
+def test_saved_state_restores_summary_and_token_counters():
+    context = ConversationContext(lambda: None, session_factory=_session_factory())
+
+    state = context._state("591700")
+
+    assert (state.origin, state.summary, state.cursor) == ("thread_1", "Cliente frecuente", "m8")
+    assert (state.total_messages, state.summarized_messages) == (30, 10)
+    assert (state.replies, state.input_tokens, state.output_tokens, state.last_input_tokens) == (12, 36000, 2400, 3100)
+    # Tras reiniciar, el limitador estima con el consumo guardado y no con el valor por defecto
+    assert context.estimated_tokens("591700") == 3100 + 2400 // 12
+
+
+def test_context_table_follows_the_app_option(monkeypatch):
+    monkeypatch.setattr(assistant_manager, "_app_options", {})
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("CONTEXT_SUMMARY_ENABLED", "true")
+
+    # create_app apagó la opción porque falta contexto_conversaciones
+    assistant_manager.apply_app_options({"CONTEXT_SUMMARY_ENABLED": False})
+
+    assert assistant_manager.load_assistant_config_from_env().context_summary_enabled is False
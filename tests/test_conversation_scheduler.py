@@ -0,0 +1,114 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from app.services.conversation_scheduler import (
+    ConversationQueueFullError,
+    ConversationScheduler,
+    Deferred,
+    chain,
+    resolve,
+)
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = ConversationScheduler(max_concurrency=4, max_pending_per_key=3)
+    yield scheduler
+    scheduler.shutdown()
+
+
+def test_tasks_of_one_conversation_never_overlap(scheduler):
+    running = set()
+    overlaps = []
+    order = []
+    lock = threading.Lock()
+
+    def task(i):
+        with lock:
+            if "591700" in running:
+                overlaps.append(i)
+            running.add("591700")
+        time.sleep(0.01)
+        with lock:
+            running.discard("591700")
+            order.append(i)
+        return i
+
+    futures = [scheduler.submit("591700", task, i) for i in range(4)]
+    assert [future.result(2) for future in futures] == [0, 1, 2, 3]
+    assert order == [0, 1, 2, 3]
+    assert overlaps == []
+
+
+def test_conversations_run_in_parallel(scheduler):
+    barrier = threading.Barrier(3, timeout=2)
+    futures = [scheduler.submit(wa_id, barrier.wait) for wa_id in ("a", "b", "c")]
+    # Con ejecución en serie la barrera vencería y wait lanzaría BrokenBarrierError
+    for future in futures:
+        future.result(3)
+
+
+def test_pending_limit_per_conversation(scheduler):
+    release = threading.Event()
+    first = scheduler.submit("591700", release.wait, 2)
+    pending = [scheduler.submit("591700", lambda: None) for _ in range(3)]
+    rejected = scheduler.submit("591700", lambda: None)
+
+    with pytest.raises(ConversationQueueFullError):
+        rejected.result(1)
+    assert scheduler.queue_length("591700") == 3
+    assert scheduler.stats()["rejected"] == 1
+
+    release.set()
+    first.result(2)
+    for future in pending:
+        future.result(2)
+    assert scheduler.queue_length("591700") == 0
+
+
+def test_failed_task_does_not_block_the_conversation(scheduler):
+    def fail():
+        raise ValueError("sin respuesta")
+
+    failed = scheduler.submit("591700", fail)
+    after = scheduler.submit("591700", lambda: "ok")
+    with pytest.raises(ValueError):
+        failed.result(2)
+    assert after.result(2) == "ok"
+    # La clave se libera justo después de resolver el Future
+    deadline = time.monotonic() + 2
+    while scheduler.stats()["active_conversations"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert scheduler.stats()["active_conversations"] == 0
+
+
+def test_deferred_task_frees_its_worker_but_keeps_the_conversation():
+    scheduler = ConversationScheduler(max_concurrency=1)
+    run = Future()
+    order = []
+    try:
+        first = scheduler.submit("591700", lambda: Deferred(run, lambda done: order.append(done.result()) or "enviado"))
+        second = scheduler.submit("591700", lambda: order.append("siguiente"))
+        # Con el único worker libre, otra conversación se atiende mientras el run sigue en curso
+        assert scheduler.submit("591701", lambda: "otro cliente").result(2) == "otro cliente"
+        assert scheduler.stats()["deferred"] == 1
+        assert order == [] and not second.done()
+
+        run.set_result("respuesta")
+        assert first.result(2) == "enviado"
+        second.result(2)
+        assert order == ["respuesta", "siguiente"]
+    finally:
+        scheduler.shutdown()
+
+
+def test_chain_and_resolve_follow_nested_deferreds():
+    inner, outer = Future(), Future()
+    outcome = chain(Deferred(outer, lambda done: Deferred(inner, lambda d: d.result() + 1)), lambda value: value * 10)
+    outer.set_result(None)
+    inner.set_result(4)
+    assert resolve(outcome) == 50
+    assert chain(3, lambda value: value + 1) == 4
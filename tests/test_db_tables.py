@@ -0,0 +1,36 @@
+from sqlalchemy import create_engine, text
+
+import app.database.db_connection as db_connection
+from app.database.db_connection import desactivar_opciones_sin_tabla
+
+
+def _engine_with(*tables):
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        for table in tables:
+            conn.execute(text(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY)"))
+    return engine
+
+
+def test_option_without_table_is_disabled(monkeypatch):
+    monkeypatch.setattr(db_connection, "engine", _engine_with("clientes", "mensajes_procesados"))
+    config = {"STATUS_PERSISTENCE_ENABLED": True, "DEDUP_PERSISTENT": True}
+
+    assert desactivar_opciones_sin_tabla(config) == ["STATUS_PERSISTENCE_ENABLED"]
+    assert config == {"STATUS_PERSISTENCE_ENABLED": False, "DEDUP_PERSISTENT": True}
+
+
+def test_disabled_options_are_not_checked(monkeypatch):
+    monkeypatch.setattr(db_connection, "engine", _engine_with("clientes"))
+    config = {"STATUS_PERSISTENCE_ENABLED": False}
+
+    assert desactivar_opciones_sin_tabla(config) == []
+    assert config == {"STATUS_PERSISTENCE_ENABLED": False}
+
+
+def test_options_kept_when_schema_cannot_be_read(monkeypatch):
+    monkeypatch.setattr(db_connection, "engine", None)
+    config = {"STATUS_PERSISTENCE_ENABLED": True}
+
+    assert desactivar_opciones_sin_tabla(config) == []
+    assert config["STATUS_PERSISTENCE_ENABLED"] is True
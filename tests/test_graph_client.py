@@ -0,0 +1,95 @@
+import re
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from app.utils.graph_client import GraphClient, MultipartFileStream
+
+FIELDS = {"messaging_product": "whatsapp", "type": "image/png"}
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "catálogo.png"
+    # Más grande que un bloque para que el archivo se lea en varias partes
+    path.write_bytes(bytes(range(256)) * 700)
+    return str(path)
+
+
+def _with_boundary(body: bytes, content_type: str) -> bytes:
+    boundary = re.search(r"boundary=(\w+)", content_type).group(1)
+    return body.replace(boundary.encode(), b"BOUNDARY")
+
+
+def test_body_matches_requests_files_encoding(image):
+    with open(image, "rb") as f:
+        expected = requests.Request(
+            "POST", "https://graph.facebook.com/media", data=FIELDS, files={"file": ("catálogo.png", f, "image/png")}
+        ).prepare()
+
+    with MultipartFileStream(image, "image/png", FIELDS) as body:
+        streamed = body.read()
+
+    assert _with_boundary(streamed, body.content_type) == _with_boundary(expected.body, expected.headers["Content-Type"])
+
+
+def test_length_matches_the_bytes_in_any_read_size(image):
+    with MultipartFileStream(image, "image/png", FIELDS) as body:
+        whole = body.read()
+        assert len(whole) == len(body)
+        assert body.read() == b""
+        whole = _with_boundary(whole, body.content_type)
+
+    with MultipartFileStream(image, "image/png", FIELDS) as body:
+        parts = []
+        while True:
+            chunk = body.read(1000)
+            if not chunk:
+                break
+            assert len(chunk) <= 1000
+            parts.append(chunk)
+        assert _with_boundary(b"".join(parts), body.content_type) == whole
+
+    with MultipartFileStream(image, "image/png", FIELDS) as body:
+        blocks = list(body)
+    assert all(len(block) <= MultipartFileStream.block_size for block in blocks)
+    assert len(b"".join(blocks)) == len(body)
+
+
+class _CaptureAdapter(BaseAdapter):
+    """Adaptador que guarda la petición preparada y lee el cuerpo como lo haría el socket"""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        body = b"".join(request.body) if not isinstance(request.body, bytes) else request.body
+        self.requests.append((request, body))
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"id": "media-1"}'
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def test_upload_streams_the_file_with_content_length(image):
+    client = GraphClient("token", "v21.0", "123")
+    adapter = _CaptureAdapter()
+    client.session.mount("https://", adapter)
+
+    response = client.upload(image, "image/png")
+
+    assert response.json() == {"id": "media-1"}
+    request, body = adapter.requests[0]
+    assert request.url == "https://graph.facebook.com/v21.0/123/media"
+    assert request.headers["Authorization"] == "Bearer token"
+    assert request.headers["Content-Type"].startswith("multipart/form-data; boundary=")
+    assert "Transfer-Encoding" not in request.headers
+    assert int(request.headers["Content-Length"]) == len(body)
+    with open(image, "rb") as f:
+        assert f.read() in body
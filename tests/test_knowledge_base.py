@@ -0,0 +1,29 @@
+import json
+import os
+import threading
+
+from app.services.knowledge_base import KnowledgeBaseSync
+
+
+def test_concurrent_manifest_saves_leave_a_valid_file(tmp_path):
+    manifest_path = str(tmp_path / "manifest.json")
+    syncs = [KnowledgeBaseSync(None, [], manifest_path=manifest_path) for _ in range(8)]
+    errors = []
+
+    def save(sync, index):
+        try:
+            for attempt in range(20):
+                sync.record_assistant(f"asst_{index}_{attempt}")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(sync, i)) for i, sync in enumerate(syncs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with open(manifest_path, encoding="utf-8") as f:
+        assert json.load(f)["assistant_id"].startswith("asst_")
+    assert os.listdir(tmp_path) == ["manifest.json"]
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from app.services.knowledge_index import KnowledgeIndex, tokenize
+from app.services.knowledge_version import PRODUCTS_VERSION_SQL, PROMOTIONS_VERSION_SQL
+from app.services.response_engine import AssistantsEngine
+
+FAQ = """# Preguntas frecuentes
+
+## Productos
+
+**Q:** ¿Qué productos tienen y cuánto cuestan?
+**A:** Tenemos agua mineral y refrescos a buen precio.
+
+## Pagos
+
+**Q:** ¿Qué métodos de pago aceptan?
+**A:** Aceptamos pagos con QR y transferencias bancarias.
+"""
+
+PRODUCTS = [
+    ("Garrafón de agua 20 litros", "Agua purificada retornable.", 15, 40),
+    ("Botella de agua 2 litros", "Agua mineral sin gas.", 4.5, 120),
+    ("Refresco cola 3 litros", "Bebida gaseosa.", 15, 0),
+]
+
+
+class _CatalogSession:
+    def __init__(self, products):
+        self.products = products
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        if sql == PRODUCTS_VERSION_SQL:
+            self.rows = [(len(self.products), 1)]
+        elif sql == PROMOTIONS_VERSION_SQL:
+            self.rows = [(0, 1)]
+        elif "FROM productos" in sql:
+            self.rows = self.products
+        else:
+            self.rows = []
+        return self
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+def _index(tmp_path, products=PRODUCTS, **kwargs):
+    faq_path = tmp_path / "faq.md"
+    faq_path.write_text(FAQ, encoding="utf-8")
+    index = KnowledgeIndex([str(faq_path)], index_path=str(tmp_path / "index.bin"),
+                           session_factory=lambda: _CatalogSession(products), **kwargs)
+    index.refresh()
+    return index
+
+
+def test_tokenize_drops_question_words():
+    assert tokenize("¿Cuánto cuesta el garrafón? ¿Tienen stock?") == ["cuesta", "garrafon", "stock"]
+
+
+def test_price_question_ranks_the_named_product_first(tmp_path):
+    index = _index(tmp_path)
+    results = index.search("¿Cuánto cuesta el garrafón de 20 litros?")
+    assert results[0][1].startswith("Producto: Garrafón de agua 20 litros.")
+    assert "Precio: 15.00" in results[0][1]
+
+
+def test_price_and_stock_fields_are_not_indexed(tmp_path):
+    index = _index(tmp_path)
+    assert index.search("15") == []
+    assert index.search("unidades disponibles") == []
+
+
+def test_relevant_applies_min_score_and_reports_top_score(tmp_path):
+    index = _index(tmp_path, min_score=1.0)
+    snippets, top_score = index.relevant_with_score("pagos con QR")
+    assert snippets and "QR" in snippets[0]
+    assert top_score == index.search("pagos con QR")[0][0]
+    assert index.relevant_with_score("hola") == ([], 0.0)
+
+
+def test_unchanged_index_is_reused_and_rebuild_leaves_no_temp_files(tmp_path):
+    index = _index(tmp_path)
+    assert index.refresh() is False
+
+    reopened = KnowledgeIndex([str(tmp_path / "faq.md")], index_path=str(tmp_path / "index.bin"),
+                              session_factory=lambda: _CatalogSession(PRODUCTS))
+    assert reopened.load() and reopened.doc_count == index.doc_count
+    assert reopened.refresh(force=True) is True
+    assert sorted(os.listdir(tmp_path)) == ["faq.md", "index.bin"]
+
+
+def test_search_does_not_wait_for_the_source_check(tmp_path):
+    index = _index(tmp_path, refresh_seconds=0)
+    release = threading.Event()
+    checking = threading.Event()
+
+    class _SlowSession(_CatalogSession):
+        def execute(self, statement, params=None):
+            checking.set()
+            release.wait(5)
+            return super().execute(statement, params)
+
+    index.session_factory = lambda: _SlowSession(PRODUCTS)
+    started_at = time.monotonic()
+    results = index.search("garrafón")
+    assert checking.wait(5)
+    # La consulta respondió con el índice vigente mientras la revisión sigue en curso
+    assert time.monotonic() - started_at < 1
+    assert results and results[0][1].startswith("Producto: Garrafón")
+
+    release.set()
+    index._refresh_thread.join(5)
+    assert not index._refresh_thread.is_alive()
+
+
+def test_failed_source_read_keeps_the_old_fingerprint(tmp_path):
+    index = _index(tmp_path)
+    new_products = PRODUCTS + [("Dispensador eléctrico", "Frío y caliente.", 120, 3)]
+
+    class _BrokenReadSession(_CatalogSession):
+        def execute(self, statement, params=None):
+            if "FROM productos" in str(statement) and "nombre" in str(statement):
+                raise RuntimeError("conexión perdida")
+            return super().execute(statement, params)
+
+    index.session_factory = lambda: _BrokenReadSession(new_products)
+    assert index.refresh() is True
+    assert index.stats()["source_failures"] == 1
+    assert not index.search("dispensador")
+
+    # La huella no avanzó: con la fuente disponible, la siguiente revisión reconstruye
+    index.session_factory = lambda: _CatalogSession(new_products)
+    assert index.refresh() is True
+    assert index.search("dispensador")[0][1].startswith("Producto: Dispensador eléctrico.")
+
+
+def _engine(top_score):
+    calls = []
+    manager = SimpleNamespace(
+        config=SimpleNamespace(knowledge_index_enabled=True, knowledge_index_confident_score=5.0),
+        context=SimpleNamespace(summary_instructions=lambda wa_id: None),
+        knowledge_index=SimpleNamespace(relevant_with_score=lambda query: (["fragmento"], top_score)),
+        _start_assistant_run=lambda *args, **kwargs: calls.append(kwargs) or "respuesta",
+    )
+    return AssistantsEngine(manager), calls
+
+
+def test_run_keeps_file_search_unless_the_match_is_clear():
+    engine, calls = _engine(top_score=2.0)
+    engine._run("thread_1", "591700", "Ana", ["¿hacen envíos?"], None)
+    assert calls[-1]["tools"] is None
+    assert "fragmento" in calls[-1]["additional_instructions"]
+
+    engine, calls = _engine(top_score=9.0)
+    engine._run("thread_1", "591700", "Ana", ["pagos con QR"], None)
+    assert calls[-1]["tools"] == []
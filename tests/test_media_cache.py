@@ -0,0 +1,159 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.services import media_cache as media_cache_module
+from app.services.media_cache import MediaCache
+
+
+class _Uploads:
+    """upload() de prueba: cuenta llamadas y puede bloquearse hasta `release`"""
+
+    def __init__(self, media_id="media-1", block=False):
+        self.media_id = media_id
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if isinstance(self.media_id, BaseException):
+            raise self.media_id
+        return self.media_id
+
+
+class _Store:
+    """Nivel persistente en memoria; `fail` simula la tabla caída"""
+
+    def __init__(self, rows=None, fail=False):
+        self.rows = dict(rows or {})
+        self.fail = fail
+        self.saved = []
+
+    def get(self, sha256, phone_number_id):
+        if self.fail:
+            raise OperationalError("SELECT", {}, Exception("sin tabla"))
+        return self.rows.get((sha256, phone_number_id))
+
+    def put(self, sha256, phone_number_id, media_id, mime_type, size):
+        if self.fail:
+            raise OperationalError("INSERT", {}, Exception("sin tabla"))
+        self.saved.append((sha256, phone_number_id, media_id, mime_type, size))
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "catalogo.png"
+    path.write_bytes(b"\x89PNG" + b"0" * 2048)
+    return str(path)
+
+
+def _concurrent(cache, image, upload, callers=4):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(cache.get_or_upload(image, "image/png", "123", upload))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    threads[0].start()
+    assert upload.started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # Los seguidores quedan esperando el Future del líder
+    deadline = time.monotonic() + 5
+    while cache.stats()["shared_uploads"] < callers - 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    upload.release.set()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def test_concurrent_requests_share_a_single_upload(image):
+    cache = MediaCache()
+    upload = _Uploads(block=True)
+
+    results, errors = _concurrent(cache, image, upload)
+
+    assert upload.calls == 1 and errors == []
+    assert results == ["media-1"] * 4
+    stats = cache.stats()
+    assert (stats["uploads"], stats["shared_uploads"], stats["in_flight"]) == (1, 3, 0)
+    assert cache.get_or_upload(image, "image/png", "123", upload) == "media-1"
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_failed_upload_reaches_followers_and_is_retried(image):
+    cache = MediaCache()
+    upload = _Uploads(media_id=ConnectionError("Graph API caída"), block=True)
+
+    results, errors = _concurrent(cache, image, upload, callers=3)
+
+    assert upload.calls == 1 and results == []
+    assert len(errors) == 3 and all(isinstance(error, ConnectionError) for error in errors)
+    # Nada quedó en caché: la siguiente llamada vuelve a subir
+    assert cache.get_or_upload(image, "image/png", "123", _Uploads("media-2")) == "media-2"
+
+
+def test_entry_expires_after_its_ttl(image, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(media_cache_module, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    cache = MediaCache(ttl_seconds=60)
+
+    assert cache.get_or_upload(image, "image/png", "123", _Uploads("media-1")) == "media-1"
+    clock[0] += 59
+    assert cache.get_or_upload(image, "image/png", "123", _Uploads("media-2")) == "media-1"
+    clock[0] += 2
+    assert cache.get_or_upload(image, "image/png", "123", _Uploads("media-2")) == "media-2"
+    assert cache.stats()["uploads"] == 2
+
+
+def test_media_ids_are_per_sender_number_and_content(image, tmp_path):
+    cache = MediaCache()
+    assert cache.get_or_upload(image, "image/png", "123", _Uploads("media-1")) == "media-1"
+    assert cache.get_or_upload(image, "image/png", "456", _Uploads("media-2")) == "media-2"
+
+    with open(image, "ab") as f:
+        f.write(b"nuevo contenido")
+    assert cache.get_or_upload(image, "image/png", "123", _Uploads("media-3")) == "media-3"
+
+
+def test_persistent_hit_avoids_the_upload(image):
+    sha256, _ = MediaCache().content_hash(image)
+    cache = MediaCache(persistent_store=_Store({(sha256, "123"): ("media-db", 3600)}))
+    upload = _Uploads("media-nuevo")
+
+    assert cache.get_or_upload(image, "image/png", "123", upload) == "media-db"
+    assert cache.get_or_upload(image, "image/png", "123", upload) == "media-db"
+    assert upload.calls == 0
+    stats = cache.stats()
+    assert (stats["persistent_hits"], stats["memory_hits"]) == (1, 1)
+
+
+def test_upload_is_saved_in_the_persistent_store(image):
+    store = _Store()
+    cache = MediaCache(persistent_store=store)
+
+    assert cache.get_or_upload(image, "image/png", "123", _Uploads("media-1")) == "media-1"
+    assert [(row[1], row[2], row[3]) for row in store.saved] == [("123", "media-1", "image/png")]
+
+
+def test_persistent_store_errors_fall_back_to_memory(image):
+    cache = MediaCache(persistent_store=_Store(fail=True))
+    upload = _Uploads("media-1")
+
+    assert cache.get_or_upload(image, "image/png", "123", upload) == "media-1"
+    assert cache.get_or_upload(image, "image/png", "123", upload) == "media-1"
+    assert upload.calls == 1
+    # Falló la lectura y la escritura de la primera llamada; la segunda salió de memoria
+    assert cache.stats()["persistent_errors"] == 2
@@ -0,0 +1,76 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from app.services.message_debouncer import MessageDebouncer
+
+
+def _event(wa_id, text):
+    return SimpleNamespace(wa_id=wa_id, text=text)
+
+
+def _collector():
+    flushed = []
+    done = threading.Event()
+
+    def handler(wa_id, events):
+        flushed.append((wa_id, [event.text for event in events]))
+        done.set()
+
+    return flushed, done, handler
+
+
+def test_burst_is_flushed_once_after_window():
+    flushed, done, handler = _collector()
+    debouncer = MessageDebouncer(handler, window_seconds=0.05, max_wait_seconds=1.0)
+    try:
+        for text in ("hola", "quiero agua", "2 garrafones"):
+            debouncer.submit(_event("591700", text))
+        assert done.wait(2)
+        time.sleep(0.1)
+        assert flushed == [("591700", ["hola", "quiero agua", "2 garrafones"])]
+        assert debouncer.stats()["flushes"] == 1
+    finally:
+        debouncer.stop()
+
+
+def test_max_messages_flushes_without_waiting():
+    flushed, done, handler = _collector()
+    debouncer = MessageDebouncer(handler, window_seconds=30, max_messages=2)
+    try:
+        debouncer.submit(_event("591700", "a"))
+        debouncer.submit(_event("591700", "b"))
+        assert flushed == [("591700", ["a", "b"])]
+    finally:
+        debouncer.stop()
+
+
+def test_stop_flushes_pending_bursts():
+    flushed, done, handler = _collector()
+    debouncer = MessageDebouncer(handler, window_seconds=30)
+    debouncer.submit(_event("591700", "a"))
+    debouncer.submit(_event("591711", "b"))
+    debouncer.stop()
+    assert sorted(flushed) == [("591700", ["a"]), ("591711", ["b"])]
+
+
+def test_submit_is_not_blocked_while_handler_runs():
+    # Regresión: el temporizador llamaba al handler con el lock tomado
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_handler(wa_id, events):
+        entered.set()
+        release.wait(5)
+
+    debouncer = MessageDebouncer(slow_handler, window_seconds=0.02)
+    try:
+        debouncer.submit(_event("591700", "a"))
+        assert entered.wait(2)
+
+        submitted = threading.Event()
+        thread = threading.Thread(target=lambda: (debouncer.submit(_event("591711", "b")), submitted.set()))
+        thread.start()
+        assert submitted.wait(1), "submit quedó bloqueado por el handler"
+    finally:
+        release.set()
+        debouncer.stop()
@@ -0,0 +1,113 @@
+from concurrent.futures import Future
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+import app.services.message_deduplicator as dedup_module
+import app.utils.whatsapp_utils as whatsapp_utils
+from app.services.conversation_scheduler import ConversationQueueFullError
+from app.services.message_deduplicator import MessageDeduplicator
+from app.utils.whatsapp_payload import parse_webhook_body
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_second_delivery_is_duplicate():
+    dedup = MessageDeduplicator(max_size=10, ttl_seconds=60)
+    assert not dedup.is_duplicate("wamid.1")
+    assert dedup.is_duplicate("wamid.1")
+    assert not dedup.is_duplicate("wamid.2")
+    assert not dedup.is_duplicate(None)
+    stats = dedup.stats()
+    assert (stats["memory_hits"], stats["misses"]) == (1, 2)
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(dedup_module.time, "monotonic", clock)
+    dedup = MessageDeduplicator(max_size=10, ttl_seconds=60)
+    assert not dedup.is_duplicate("wamid.1")
+    clock.now += 59
+    assert dedup.is_duplicate("wamid.1")
+    clock.now += 61
+    assert not dedup.is_duplicate("wamid.1")
+
+
+def test_lru_evicts_least_recently_seen():
+    dedup = MessageDeduplicator(max_size=2, ttl_seconds=60)
+    dedup.is_duplicate("a")
+    dedup.is_duplicate("b")
+    dedup.is_duplicate("c")
+    assert dedup.stats()["size"] == 2
+    # "a" ya salió del LRU: vuelve a tratarse como nuevo
+    assert not dedup.is_duplicate("a")
+    assert dedup.is_duplicate("c")
+
+
+class _Store:
+    def __init__(self, seen=(), fail=False):
+        self.seen = set(seen)
+        self.fail = fail
+
+    def mark_if_new(self, message_id):
+        if self.fail:
+            raise OperationalError("INSERT", {}, Exception("db caída"))
+        is_new = message_id not in self.seen
+        self.seen.add(message_id)
+        return is_new
+
+
+def test_persistent_store_catches_retries_from_other_workers():
+    dedup = MessageDeduplicator(persistent_store=_Store(seen={"wamid.otro-worker"}))
+    assert dedup.is_duplicate("wamid.otro-worker")
+    assert dedup.stats()["persistent_hits"] == 1
+
+
+def test_database_failure_processes_the_message():
+    dedup = MessageDeduplicator(persistent_store=_Store(fail=True))
+    assert not dedup.is_duplicate("wamid.1")
+    assert dedup.stats()["persistent_errors"] == 1
+
+
+def test_forgotten_id_is_processed_again():
+    store = _Store()
+    store.forget = store.seen.discard
+    dedup = MessageDeduplicator(persistent_store=store)
+    assert not dedup.is_duplicate("wamid.1")
+    dedup.forget("wamid.1")
+    assert not dedup.is_duplicate("wamid.1")
+    assert dedup.stats()["forgotten"] == 1
+
+
+def _rejecting_scheduler():
+    class Scheduler:
+        def submit(self, key, fn, *args):
+            future = Future()
+            future.set_exception(ConversationQueueFullError(f"Demasiados mensajes pendientes para {key}"))
+            return future
+
+    return Scheduler()
+
+
+def test_rejected_conversation_is_retried_by_meta(monkeypatch):
+    """Regresión: un mensaje rechazado por cola llena no debe quedar marcado como visto"""
+    dedup = MessageDeduplicator()
+    monkeypatch.setattr(dedup_module, "message_deduplicator", dedup)
+    monkeypatch.setattr(whatsapp_utils, "get_conversation_scheduler", _rejecting_scheduler)
+    monkeypatch.setattr(whatsapp_utils, "get_reply_streamer", lambda: None)
+    monkeypatch.setattr(whatsapp_utils, "get_assistant_manager", lambda: None)
+    event = parse_webhook_body({"object": "whatsapp_business_account", "entry": [{"changes": [{"value": {
+        "contacts": [{"wa_id": "591700", "profile": {"name": "Ana"}}],
+        "messages": [{"id": "wamid.1", "from": "591700", "type": "text", "text": {"body": "hola"}}],
+    }}]}]})
+
+    with Flask(__name__).app_context():
+        _, status = whatsapp_utils.process_webhook_event(event)
+    assert status == 503
+    assert not dedup.is_duplicate("wamid.1")
@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+from app.services.message_router import (
+    ROUTE_ASSISTANT,
+    ROUTE_CANNED,
+    ROUTE_CATALOG,
+    ROUTE_GREETING,
+    MessageRouter,
+    ProductCatalog,
+)
+from app.services.openai_rate_limiter import PRIORITY_NEW, PRIORITY_ORDER
+from app.utils import whatsapp_utils
+
+CATALOG_ROWS = [
+    (1, "Garrafón de agua 20 litros", 15.0, 40),
+    (2, "Botella de agua 2 litros", 4.5, 0),
+]
+
+
+class _Priorities:
+    def __init__(self, open_orders=()):
+        self.open_orders = set(open_orders)
+        self.lookups = []
+
+    def get(self, wa_id):
+        self.lookups.append(wa_id)
+        return PRIORITY_ORDER if wa_id in self.open_orders else PRIORITY_NEW
+
+
+def _router(open_orders=(), window=600):
+    return MessageRouter(ProductCatalog(rows=CATALOG_ROWS), priorities=_Priorities(open_orders),
+                         assistant_window_seconds=window)
+
+
+def test_local_routes_for_a_new_contact():
+    router = _router()
+    assert router.route(["Hola"], "Ana Pérez", "591700").response == "¡Hola Ana! ¿En qué te puedo ayudar? " \
+        "Puedo darte precios, stock o tomar tu pedido."
+    catalog = router.route(["¿cuánto cuesta el garrafón?"], "Ana", "591701")
+    assert catalog.route == ROUTE_CATALOG and "15.00" in catalog.response
+    assert router.route(["muchas gracias"], "Ana", "591702").route == ROUTE_CANNED
+
+
+def test_customer_with_open_order_goes_to_the_assistant():
+    router = _router(open_orders={"591700"})
+    decision = router.route(["¿cuánto cuesta el garrafón?"], "Ana", "591700")
+    assert (decision.route, decision.response) == (ROUTE_ASSISTANT, None)
+    assert router.route(["ok gracias"], "Ana", "591700").route == ROUTE_ASSISTANT
+    # Un saludo puro sigue respondiéndose localmente
+    assert router.route(["hola"], "Ana", "591700").route == ROUTE_GREETING
+    assert router.stats()["held_for_assistant"] == 2
+
+
+def test_follow_up_after_assistant_exchange_stays_with_the_assistant():
+    router = _router()
+    assert router.route(["quiero pedir 2 garrafones"], "Ana", "591700").route == ROUTE_ASSISTANT
+    assert router.route(["ok gracias"], "Ana", "591700").route == ROUTE_ASSISTANT
+    # Otro cliente no se ve afectado
+    assert router.route(["ok gracias"], "Luis", "591701").route == ROUTE_CANNED
+
+
+def test_assistant_window_expires():
+    router = _router(window=0)
+    router.route(["quiero pedir 2 garrafones"], "Ana", "591700")
+    assert router.route(["ok gracias"], "Ana", "591700").route == ROUTE_CANNED
+
+
+def test_priority_lookup_only_for_locally_answerable_messages():
+    router = _router()
+    router.route(["quiero pedir 2 garrafones"], "Ana", "591700")
+    router.route(["hola"], "Luis", "591701")
+    assert router.priorities.lookups == []
+
+
+def test_ambiguous_or_unknown_product_goes_to_the_assistant():
+    router = _router()
+    assert router.route(["¿cuánto cuesta el agua?"], "Ana", "591700").route == ROUTE_ASSISTANT
+
+
+def test_local_answer_is_recorded_in_the_assistant_history(monkeypatch):
+    sent, recorded = [], []
+
+    def submit(**kwargs):
+        raise AssertionError("una respuesta local no debe llamar al asistente")
+
+    manager = SimpleNamespace(submit_response_for_messages=submit,
+                              record_exchange=lambda *args: recorded.append(args))
+    monkeypatch.setattr(whatsapp_utils, "get_assistant_manager", lambda: manager)
+    monkeypatch.setattr(whatsapp_utils, "get_message_router", lambda: _router())
+    monkeypatch.setattr(whatsapp_utils, "get_reply_streamer", lambda: None)
+    monkeypatch.setattr(whatsapp_utils, "send_text_message", lambda wa_id, text: sent.append(text) or True)
+
+    assert whatsapp_utils.reply_to_messages("591700", "Ana Pérez", ["¿Cuánto cuesta el garrafón?"]) is True
+    assert len(sent) == 1 and "15.00" in sent[0]
+    assert recorded == [(["¿Cuánto cuesta el garrafón?"], "591700", "Ana Pérez", sent[0])]
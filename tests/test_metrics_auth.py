@@ -0,0 +1,53 @@
+from flask import Flask
+
+from app.utils.decorators import verificar_token_metricas
+from app.utils.metrics import register_metrics_provider, unregister_metrics_provider
+from app.views.metrics import metrics_blueprint
+
+
+def _client(token):
+    app = Flask(__name__)
+    app.config["METRICS_TOKEN"] = token
+    app.register_blueprint(metrics_blueprint)
+    return app.test_client()
+
+
+def test_metrics_closed_without_configured_token():
+    response = _client(None).get("/metrics")
+    assert response.status_code == 403
+
+
+def test_metrics_rejects_missing_or_wrong_token():
+    client = _client("secreto")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer otro"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "secreto"}).status_code == 401
+
+
+def test_metrics_with_valid_token():
+    register_metrics_provider("test_provider", lambda: {"value": 1})
+    try:
+        response = _client("secreto").get("/metrics", headers={"Authorization": "Bearer secreto"})
+    finally:
+        unregister_metrics_provider("test_provider")
+    assert response.status_code == 200
+    assert response.get_json()["test_provider"] == {"value": 1}
+
+
+def test_verificar_token_metricas_without_flask_context():
+    assert verificar_token_metricas("Bearer abc", "abc") is None
+    assert verificar_token_metricas("Bearer abc", "")[1] == 403
+    assert verificar_token_metricas("", "abc")[1] == 401
+
+
+def test_asgi_metrics_requires_token(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app.asgi import create_async_app
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("METRICS_TOKEN", "secreto")
+    # Sin `with` no corre el lifespan (OpenAI, base de datos)
+    client = TestClient(create_async_app())
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer secreto"}).status_code == 200
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import httpx
+
+from app.services.openai_rate_limiter import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_CUSTOMER,
+    PRIORITY_NEW,
+    PRIORITY_ORDER,
+    ConversationPriority,
+    OpenAIRateLimiter,
+)
+
+
+def _response(status=200, **headers):
+    return httpx.Response(status, headers=headers, request=httpx.Request("POST", "https://api.openai.com/v1/x"))
+
+
+def test_admits_while_there_is_capacity_and_rejects_after_timeout():
+    limiter = OpenAIRateLimiter(requests_per_minute=2, tokens_per_minute=1000)
+    assert limiter.acquire(PRIORITY_ORDER, tokens=100, timeout=0)
+    assert limiter.acquire(PRIORITY_ORDER, tokens=100, timeout=0)
+    assert not limiter.acquire(PRIORITY_ORDER, tokens=100, timeout=0)
+    lanes = limiter.stats()["lanes"]
+    assert (lanes["order"]["admitted"], lanes["order"]["rejected"]) == (2, 1)
+
+
+def test_lower_lanes_leave_capacity_for_higher_ones():
+    limiter = OpenAIRateLimiter(requests_per_minute=60, tokens_per_minute=100000)
+    limiter._requests.level = 2
+    # PRIORITY_NEW debe dejar 3 s de recarga (3 solicitudes) para los carriles de arriba
+    assert not limiter.acquire(PRIORITY_NEW, timeout=0)
+    assert limiter.acquire(PRIORITY_ORDER, timeout=0)
+
+
+def test_higher_priority_waiter_is_served_first():
+    limiter = OpenAIRateLimiter(requests_per_minute=6000, tokens_per_minute=10 ** 7)
+    limiter._requests.level = 0
+    results = {}
+
+    def acquire(priority, timeout):
+        results[priority] = limiter.acquire(priority, timeout=timeout)
+
+    background = threading.Thread(target=acquire, args=(PRIORITY_BACKGROUND, 0.5))
+    background.start()
+    time.sleep(0.05)
+    started_at = time.monotonic()
+    acquire(PRIORITY_ORDER, 2.0)
+    waited = time.monotonic() - started_at
+    background.join()
+
+    # El pedido abierto pasa delante del resumen que esperaba desde antes
+    assert results == {PRIORITY_ORDER: True, PRIORITY_BACKGROUND: False}
+    assert waited < 0.5
+
+
+def test_headers_adjust_capacity_and_level():
+    limiter = OpenAIRateLimiter(requests_per_minute=500, tokens_per_minute=200000)
+    limiter.on_response(_response(**{
+        "x-ratelimit-limit-requests": "100", "x-ratelimit-remaining-requests": "3",
+        "x-ratelimit-limit-tokens": "5000", "x-ratelimit-remaining-tokens": "40",
+    }))
+    stats = limiter.stats()
+    assert (stats["requests_per_minute"], stats["tokens_per_minute"]) == (100, 5000)
+    assert stats["requests_available"] < 3.5 and stats["tokens_available"] < 45
+
+    limiter.on_response(_response(429))
+    stats = limiter.stats()
+    assert stats["requests_available"] < 0.5
+    assert stats["throttled_responses"] == 1
+
+
+def test_first_request_inside_reserve_is_prepaid():
+    limiter = OpenAIRateLimiter(requests_per_minute=100, tokens_per_minute=100000)
+    request = httpx.Request("POST", "https://api.openai.com/v1/threads/runs")
+    with limiter.reserve(PRIORITY_CUSTOMER) as admitted:
+        assert admitted
+        limiter.on_request(request)
+        limiter.on_request(request)
+    limiter.on_request(request)
+    assert limiter.stats()["untracked_requests"] == 2
+
+
+class _PrioritySession:
+    def __init__(self, rows, calls):
+        self.rows = rows
+        self.calls = calls
+
+    def execute(self, statement, params):
+        self.calls.append(params["telefono"])
+        self.row = self.rows.get(params["telefono"])
+        return self
+
+    def fetchone(self):
+        return self.row
+
+    def close(self):
+        pass
+
+
+def test_conversation_priority_from_orders_and_customers():
+    calls = []
+    rows = {"591700": (1, 1), "591701": (2, 0)}
+    priorities = ConversationPriority(lambda: _PrioritySession(rows, calls), ttl_seconds=60)
+    assert priorities.get("591700") == PRIORITY_ORDER
+    assert priorities.get("591701") == PRIORITY_CUSTOMER
+    assert priorities.get("591702") == PRIORITY_NEW
+    assert priorities.get("591700") == PRIORITY_ORDER
+    assert calls == ["591700", "591701", "591702"]
+    assert ConversationPriority().get("591700") == PRIORITY_NEW
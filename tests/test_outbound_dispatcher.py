@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from app.services.outbound_dispatcher import (
+    SEND_PRIORITY_BULK,
+    SEND_PRIORITY_REPLY,
+    OutboundDispatcher,
+    OutboundQueueFullError,
+)
+
+
+def _http_error(status: int, retry_after: str = None) -> requests.exceptions.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    response._content = b"{}"
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return requests.exceptions.HTTPError(response=response)
+
+
+class _Sender:
+    """Registra el orden de los envíos; `errors` da los fallos por id de mensaje"""
+
+    def __init__(self, errors=None, gate: threading.Event = None):
+        self.errors = errors or {}
+        self.gate = gate
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def __call__(self, message):
+        message_id = message.request["id"]
+        with self.lock:
+            self.sent.append(message_id)
+            first = len(self.sent) == 1
+        if first and self.gate is not None:
+            self.gate.wait(2)
+        pending = self.errors.get(message_id)
+        if pending:
+            raise pending.pop(0)
+        return f"ok-{message_id}"
+
+
+@pytest.fixture
+def dispatchers():
+    created = []
+    yield created
+    for dispatcher in created:
+        dispatcher.stop(timeout=1)
+
+
+def _dispatcher(dispatchers, sender, **kwargs):
+    options = {"default_phone_number_id": "123", "num_workers": 1, "messages_per_second": 1000.0}
+    options.update(kwargs)
+    dispatcher = OutboundDispatcher(sender, **options)
+    dispatchers.append(dispatcher)
+    return dispatcher
+
+
+def test_replies_overtake_queued_bulk_sends(dispatchers):
+    gate = threading.Event()
+    sender = _Sender(gate=gate)
+    dispatcher = _dispatcher(dispatchers, sender)
+
+    futures = [dispatcher.submit({"id": "bulk-1"}, priority=SEND_PRIORITY_BULK)]
+    time.sleep(0.05)  # bulk-1 ya está en el envío, bloqueado
+    futures += [dispatcher.submit({"id": f"bulk-{i}"}, priority=SEND_PRIORITY_BULK) for i in (2, 3)]
+    futures.append(dispatcher.submit({"id": "reply"}, priority=SEND_PRIORITY_REPLY))
+    gate.set()
+
+    assert [future.result(timeout=2) for future in futures] == ["ok-bulk-1", "ok-bulk-2", "ok-bulk-3", "ok-reply"]
+    assert sender.sent == ["bulk-1", "reply", "bulk-2", "bulk-3"]
+
+
+def test_throttled_message_is_requeued_with_its_turn(dispatchers):
+    sender = _Sender(errors={"a": [_http_error(429, retry_after="0.05")]})
+    dispatcher = _dispatcher(dispatchers, sender)
+
+    first = dispatcher.submit({"id": "a"})
+    second = dispatcher.submit({"id": "b"})
+    started_at = time.monotonic()
+
+    assert first.result(timeout=2) == "ok-a"
+    assert second.result(timeout=2) == "ok-b"
+    assert time.monotonic() - started_at >= 0.05  # el número esperó el Retry-After
+    assert sender.sent == ["a", "a", "b"]
+    stats = dispatcher.stats()
+    assert stats["phones"]["123"]["throttled"] == 1
+    assert (stats["sent"], stats["failed"]) == (2, 0)
+
+
+def test_throttling_gives_up_after_max_attempts(dispatchers):
+    errors = [_http_error(429, retry_after="0") for _ in range(5)]
+    sender = _Sender(errors={"a": errors})
+    dispatcher = _dispatcher(dispatchers, sender, max_attempts=2)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        dispatcher.submit({"id": "a"}).result(timeout=2)
+    assert sender.sent == ["a", "a"]
+
+
+def test_other_errors_are_not_retried(dispatchers):
+    sender = _Sender(errors={"a": [_http_error(400)]})
+    dispatcher = _dispatcher(dispatchers, sender)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        dispatcher.submit({"id": "a"}).result(timeout=2)
+    assert sender.sent == ["a"]
+    assert dispatcher.stats()["failed"] == 1
+
+
+def test_full_bulk_queue_rejects_bulk_but_not_replies(dispatchers):
+    gate = threading.Event()
+    dispatcher = _dispatcher(dispatchers, _Sender(gate=gate), max_bulk_queue=1)
+
+    dispatcher.submit({"id": "bulk-1"}, priority=SEND_PRIORITY_BULK)
+    time.sleep(0.05)
+    dispatcher.submit({"id": "bulk-2"}, priority=SEND_PRIORITY_BULK)
+    rejected = dispatcher.submit({"id": "bulk-3"}, priority=SEND_PRIORITY_BULK)
+    reply = dispatcher.submit({"id": "reply"})
+    gate.set()
+
+    with pytest.raises(OutboundQueueFullError):
+        rejected.result(timeout=2)
+    assert reply.result(timeout=2) == "ok-reply"
+    assert dispatcher.stats()["rejected"] == 1
+
+
+def test_sends_are_paced_per_phone_number(dispatchers):
+    sender = _Sender()
+    dispatcher = _dispatcher(dispatchers, sender, num_workers=4, messages_per_second=50.0, burst=1)
+
+    started_at = time.monotonic()
+    futures = [dispatcher.submit({"id": str(i)}) for i in range(6)]
+    for future in futures:
+        future.result(timeout=2)
+    # Cubeta de 1 con 50/s: tras el primero, uno cada 20 ms
+    assert time.monotonic() - started_at >= 0.09
+
+    other = dispatcher.submit({"id": "otro"}, phone_number_id="456")
+    assert other.result(timeout=2) == "ok-otro"
+    assert set(dispatcher.stats()["phones"]) == {"123", "456"}
@@ -0,0 +1,147 @@
+from concurrent.futures import Future
+
+import pytest
+
+from app.services import promotion_broadcast
+from app.services.promotion_broadcast import BROADCAST_COMPLETED, PromotionBroadcast
+
+ID_PROMOCION = 7
+
+
+class _Database:
+    """clientes, clientes_promociones y difusiones_promociones en memoria"""
+
+    def __init__(self, clients):
+        self.clients = [(id_cliente, f"5917{id_cliente:05d}") for id_cliente in clients]
+        self.recorded = set()
+        self.checkpoints = {}
+        self.commits = 0
+
+    def session(self):
+        return _Session(self)
+
+
+class _Session:
+    """Las escrituras solo se aplican al hacer commit"""
+
+    def __init__(self, db):
+        self.db = db
+        self.pending = []
+
+    def commit(self):
+        for apply in self.pending:
+            apply()
+        self.pending = []
+        self.db.commits += 1
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = _Database(range(1, 8))
+
+    def pending_clients(session, id_promocion, despues_de, limite):
+        rows = [row for row in db.clients
+                if row[0] > despues_de and (row[0], id_promocion) not in db.recorded]
+        return rows[:limite]
+
+    def record(session, id_promocion, ids_clientes):
+        session.pending.append(lambda: db.recorded.update((i, id_promocion) for i in ids_clientes))
+
+    def save_checkpoint(session, id_promocion, ultimo_id_cliente, enviados, fallidos, estado):
+        row = (ultimo_id_cliente, enviados, fallidos, estado)
+        session.pending.append(lambda: db.checkpoints.__setitem__(id_promocion, row))
+
+    monkeypatch.setattr(promotion_broadcast, "obtener_clientes_pendientes", pending_clients)
+    monkeypatch.setattr(promotion_broadcast, "registrar_envios_promocion", record)
+    monkeypatch.setattr(promotion_broadcast, "guardar_punto_control", save_checkpoint)
+    monkeypatch.setattr(promotion_broadcast, "obtener_punto_control",
+                        lambda session, id_promocion: db.checkpoints.get(id_promocion))
+    return db
+
+
+class _Dispatcher:
+    """submit() resuelve al instante; `failing` da error y `stop_at` interrumpe el proceso"""
+
+    def __init__(self, failing=(), stop_at=None):
+        self.failing = set(failing)
+        self.stop_at = stop_at
+        self.sent = []
+
+    def submit(self, request, priority=None):
+        if request["to"] == self.stop_at:
+            raise KeyboardInterrupt
+        future = Future()
+        if request["to"] in self.failing:
+            future.set_exception(ConnectionError("Graph API caída"))
+        else:
+            self.sent.append(request["to"])
+            future.set_result(None)
+        return future
+
+
+def _broadcast(db, dispatcher, chunk_size=2):
+    return PromotionBroadcast(ID_PROMOCION, build_request=lambda telefono: {"to": telefono},
+                              session_factory=db.session, dispatcher=dispatcher, chunk_size=chunk_size)
+
+
+def _phones(db, *ids):
+    return [telefono for id_cliente, telefono in db.clients if id_cliente in ids]
+
+
+def test_every_client_is_recorded_once_with_the_checkpoint(db):
+    dispatcher = _Dispatcher()
+
+    stats = _broadcast(db, dispatcher).run()
+
+    assert dispatcher.sent == _phones(db, *range(1, 8))
+    assert db.recorded == {(id_cliente, ID_PROMOCION) for id_cliente in range(1, 8)}
+    assert db.checkpoints[ID_PROMOCION] == (7, 7, 0, BROADCAST_COMPLETED)
+    # Un commit por lote (4 lotes de 2) más el de cierre
+    assert db.commits == 5
+    assert (stats["state"], stats["sent"], stats["chunks"]) == (BROADCAST_COMPLETED, 7, 4)
+
+
+def test_interrupted_broadcast_resumes_from_the_last_confirmed_chunk(db):
+    with pytest.raises(KeyboardInterrupt):
+        _broadcast(db, _Dispatcher(stop_at=_phones(db, 5)[0])).run()
+
+    # Solo el primer lote alcanzó a confirmarse; el segundo quedó en vuelo
+    assert db.checkpoints[ID_PROMOCION][:3] == (2, 2, 0)
+    assert db.recorded == {(1, ID_PROMOCION), (2, ID_PROMOCION)}
+
+    dispatcher = _Dispatcher()
+    stats = _broadcast(db, dispatcher).run()
+
+    assert dispatcher.sent == _phones(db, *range(3, 8))
+    assert (stats["state"], stats["sent"], stats["last_client_id"]) == (BROADCAST_COMPLETED, 7, 7)
+    assert len(db.recorded) == 7
+
+
+def test_failed_sends_are_not_recorded_and_restart_retries_them(db):
+    failing = _phones(db, 3, 6)
+    stats = _broadcast(db, _Dispatcher(failing=failing)).run()
+
+    assert (stats["sent"], stats["failed"]) == (5, 2)
+    assert (3, ID_PROMOCION) not in db.recorded and (6, ID_PROMOCION) not in db.recorded
+
+    dispatcher = _Dispatcher()
+    _broadcast(db, dispatcher).run(restart=True)
+
+    assert dispatcher.sent == failing
+    assert len(db.recorded) == 7
+
+
+def test_completed_broadcast_sends_nothing(db):
+    db.checkpoints[ID_PROMOCION] = (7, 7, 0, BROADCAST_COMPLETED)
+    dispatcher = _Dispatcher()
+
+    stats = _broadcast(db, dispatcher).run()
+
+    assert dispatcher.sent == [] and db.commits == 0
+    assert (stats["state"], stats["sent"]) == (BROADCAST_COMPLETED, 7)
@@ -0,0 +1,108 @@
+from app.services.reply_streaming import ProgressiveReply, ReplyStreamer, split_message
+
+PARAGRAPH = "El garrafón de 20 litros cuesta 15 Bs y lo entregamos en 30 a 40 minutos."
+
+
+def test_short_text_is_a_single_chunk():
+    assert split_message("  hola  ") == ["hola"]
+    assert split_message("") == []
+
+
+def test_long_text_splits_at_paragraphs_within_the_limit():
+    text = "\n\n".join([PARAGRAPH] * 6)
+    chunks = split_message(text, limit=200)
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert all(chunk.endswith(".") for chunk in chunks)
+    assert "\n\n".join(chunks) == text
+
+
+def test_text_without_separators_is_cut_at_the_limit():
+    chunks = split_message("x" * 250, limit=100)
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+
+
+def test_words_are_not_cut():
+    text = " ".join(["palabra"] * 40)
+    chunks = split_message(text, limit=50)
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert all(set(chunk.split()) == {"palabra"} for chunk in chunks)
+
+
+def _collect(**kwargs):
+    sent = []
+
+    def send(chunk):
+        sent.append(chunk)
+        return True
+
+    return ProgressiveReply(send, **kwargs), sent
+
+
+def _stream(reply, text, step=7):
+    for start in range(0, len(text), step):
+        reply.on_delta(text[start:start + step])
+
+
+def test_finished_paragraphs_are_sent_while_generating():
+    text = "\n\n".join([PARAGRAPH] * 4)
+    reply, sent = _collect(min_chars=100)
+    _stream(reply, text)
+    streamed = list(sent)
+    assert streamed and all(len(chunk) >= 100 for chunk in streamed)
+
+    assert reply.finish(text) is True
+    assert "\n\n".join(sent) == text
+
+
+def test_finish_sends_everything_when_not_progressive():
+    text = "\n\n".join([PARAGRAPH] * 4)
+    reply, sent = _collect(progressive=False, min_chars=10)
+    _stream(reply, text)
+    assert sent == []
+    assert reply.finish(text) is True
+    assert sent == [text]
+
+
+def test_final_text_that_differs_from_stream_is_sent_whole():
+    text = "\n\n".join([PARAGRAPH] * 3)
+    reply, sent = _collect(min_chars=10)
+    _stream(reply, text)
+    streamed = len(sent)
+    reply.finish("Lo siento, la respuesta tardó demasiado.")
+    assert sent[streamed:] == ["Lo siento, la respuesta tardó demasiado."]
+
+
+def test_stream_without_paragraphs_respects_the_limit():
+    text = " ".join(["palabra"] * 100)
+    reply, sent = _collect(min_chars=10, limit=120)
+    _stream(reply, text)
+    reply.finish(text)
+    assert all(len(chunk) <= 120 for chunk in sent)
+    assert " ".join(sent) == text
+
+
+def test_failed_chunk_is_reported():
+    reply = ProgressiveReply(lambda chunk: False)
+    assert reply.finish(PARAGRAPH) is False
+
+
+def test_streamer_acknowledges_and_counts_replies():
+    receipts = []
+    streamer = ReplyStreamer(receipts.append, min_chars=10)
+    streamer.acknowledge("wamid.1")
+    streamer.acknowledge(None)
+
+    reply = streamer.start(lambda chunk: True)
+    reply.finish(PARAGRAPH)
+    stats = streamer.stats()
+    assert receipts == ["wamid.1"]
+    assert (stats["receipts_sent"], stats["replies"], stats["chunks_sent"]) == (1, 1, 1)
+
+
+def test_streamer_survives_receipt_errors():
+    def fail(message_id):
+        raise RuntimeError("sin red")
+
+    streamer = ReplyStreamer(fail)
+    streamer.acknowledge("wamid.1")
+    assert streamer.stats()["receipt_errors"] == 1
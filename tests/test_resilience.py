@@ -0,0 +1,208 @@
+import pytest
+import requests
+
+import app.utils.resilience as resilience
+import app.utils.whatsapp_utils as whatsapp_utils
+from app.utils.resilience import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientEndpoint,
+    RetryBudget,
+    RetryPolicy,
+)
+from app.utils.whatsapp_utils import (
+    GRAPH_MEDIA_ENDPOINT,
+    GRAPH_MESSAGES_ENDPOINT,
+    is_graph_idempotent_retryable,
+    is_graph_retryable,
+)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _http_error(status: int, code: int = None) -> requests.exceptions.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    response._content = (b'{"error": {"code": %d}}' % code) if code is not None else b"{}"
+    return requests.exceptions.HTTPError(response=response)
+
+
+def _endpoint(max_attempts=3, failure_threshold=5, budget=None):
+    return ResilientEndpoint(
+        "test",
+        CircuitBreaker("test", failure_threshold=failure_threshold, open_seconds=30),
+        budget or RetryBudget(),
+        RetryPolicy(max_attempts=max_attempts, base_delay=0, max_delay=0.01),
+    )
+
+
+def _failing(*errors):
+    """Función que lanza los errores en orden y luego retorna "ok"; cuenta las llamadas"""
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return "ok"
+
+    return fn, calls
+
+
+def test_breaker_opens_after_threshold_and_probes_once(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    breaker = CircuitBreaker("graph", failure_threshold=2, open_seconds=30)
+
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_CLOSED
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    assert not breaker.allow()
+
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    assert not breaker.allow()  # solo una llamada de prueba
+
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CIRCUIT_CLOSED
+    assert breaker.stats()["trips"] == 2
+
+
+def test_retry_budget_limits_retries_to_ratio_of_requests(monkeypatch):
+    monkeypatch.setattr(resilience.time, "monotonic", _Clock())
+    budget = RetryBudget(ratio=0.5, min_per_second=0, window_seconds=10)
+    for _ in range(4):
+        budget.record_request()
+    assert [budget.try_retry() for _ in range(3)] == [True, True, False]
+
+
+def test_retry_budget_window_expires(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    budget = RetryBudget(ratio=1.0, min_per_second=0, window_seconds=10)
+    budget.record_request()
+    assert budget.try_retry()
+    assert not budget.try_retry()
+    clock.now += 11
+    budget.record_request()
+    assert budget.try_retry()
+
+
+def test_policy_delay_respects_cap_and_retry_after():
+    policy = RetryPolicy(base_delay=0.2, max_delay=1.0)
+    assert all(0 <= policy.delay(attempt) <= 1.0 for attempt in range(1, 10))
+    assert policy.delay(1, retry_after=0.5) >= 0.5
+
+
+def test_endpoint_retries_only_retryable_errors():
+    endpoint = _endpoint()
+    fn, calls = _failing(ConnectionError("reset"), ConnectionError("reset"))
+    assert endpoint.call(fn, is_retryable=lambda error: True) == "ok"
+    assert len(calls) == 3
+
+    fn, calls = _failing(ValueError("400"))
+    with pytest.raises(ValueError):
+        endpoint.call(fn, is_retryable=lambda error: False)
+    assert len(calls) == 1
+    assert endpoint.stats()["retries"] == 2
+
+
+def test_endpoint_stops_at_max_attempts_and_when_budget_is_spent():
+    endpoint = _endpoint(max_attempts=2)
+    fn, calls = _failing(*[ConnectionError("reset")] * 5)
+    with pytest.raises(ConnectionError):
+        endpoint.call(fn, is_retryable=lambda error: True)
+    assert len(calls) == 2
+
+    endpoint = _endpoint(budget=RetryBudget(ratio=0, min_per_second=0))
+    fn, calls = _failing(ConnectionError("reset"))
+    with pytest.raises(ConnectionError):
+        endpoint.call(fn, is_retryable=lambda error: True)
+    assert len(calls) == 1
+    assert endpoint.stats()["retries_denied"] == 1
+
+
+def test_endpoint_rejects_calls_while_open():
+    endpoint = _endpoint(max_attempts=1, failure_threshold=1)
+    fn, calls = _failing(ConnectionError("reset"))
+    with pytest.raises(ConnectionError):
+        endpoint.call(fn)
+    with pytest.raises(CircuitOpenError):
+        endpoint.call(fn)
+    assert len(calls) == 1
+
+
+def test_client_errors_do_not_count_as_failures():
+    endpoint = _endpoint(failure_threshold=1)
+    fn, _ = _failing(ValueError("400"))
+    with pytest.raises(ValueError):
+        endpoint.call(fn, is_failure=lambda error: False)
+    assert endpoint.breaker.state == CIRCUIT_CLOSED
+
+
+@pytest.mark.parametrize("error, messages, media", [
+    (requests.exceptions.ConnectionError("reset"), True, True),
+    (requests.exceptions.ReadTimeout("lento"), False, False),
+    (_http_error(429), True, True),
+    (_http_error(400, code=130429), True, False),
+    (_http_error(500), False, True),
+    (_http_error(503), False, True),
+    (_http_error(400, code=100), False, False),
+])
+def test_messages_retry_only_connection_errors_and_throttling(error, messages, media):
+    assert is_graph_retryable(error) is messages
+    assert is_graph_idempotent_retryable(error) is media
+
+
+class _GraphClient:
+    phone_number_id = "123"
+
+    def __init__(self, status: int):
+        self.status = status
+        self.calls = 0
+
+    def _response(self):
+        self.calls += 1
+        response = requests.Response()
+        response.status_code = self.status
+        response._content = b'{"id": "media-1"}'
+        return response
+
+    def post(self, path, **kwargs):
+        return self._response()
+
+    def upload(self, filepath, mime_type):
+        return self._response()
+
+
+def test_server_error_on_messages_is_not_resent(monkeypatch, tmp_path, request):
+    resilience.init_resilience({"RESILIENCE_BASE_DELAY_SECONDS": 0.0, "RESILIENCE_MAX_DELAY_SECONDS": 0.01})
+    request.addfinalizer(lambda: resilience.init_resilience({}))
+    client = _GraphClient(500)
+    monkeypatch.setattr(whatsapp_utils, "get_graph_client", lambda: client)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        whatsapp_utils.graph_post(GRAPH_MESSAGES_ENDPOINT, "messages", json={})
+    assert client.calls == 1
+
+    monkeypatch.setattr(whatsapp_utils, "get_media_cache", lambda: None)
+    image = tmp_path / "foto.jpg"
+    image.write_bytes(b"jpeg")
+    assert whatsapp_utils.upload_media(str(image)) is None
+    assert client.calls == 1 + 3
+    assert resilience.get_endpoint(GRAPH_MEDIA_ENDPOINT).stats()["retries"] == 2
@@ -0,0 +1,153 @@
+import threading
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from app.services import assistant_manager
+from app.services.assistant_manager import AssistantManager
+from app.services.conversation_scheduler import ConversationScheduler
+from app.services.response_cache import ResponseCache
+from app.services.response_engine import AssistantsEngine, ChatCompletionsEngine
+from app.utils.resilience import get_endpoint, init_resilience
+
+
+def _cache(version="v1"):
+    return ResponseCache(lambda: version, max_size=10, ttl_seconds=60)
+
+
+def test_key_is_version_and_normalized_question():
+    cache = _cache()
+    key = cache.cache_key("591700", ["¿Cuánto cuesta el garrafón?"])
+    assert key == ("v1", "cuanto cuesta el garrafon")
+    assert cache.cache_key("591701", ["cuanto cuesta el garrafon"]) == key
+
+
+def test_answer_is_shared_with_the_name_of_who_asks():
+    cache = _cache()
+    cache.put(cache.cache_key("591700", ["¿Hacen envíos?"]), "Sí Ana Pérez, enviamos. Gracias Ana.", 1.5, "Ana Pérez")
+
+    assert cache.get(cache.cache_key("591701", ["¿Hacen envíos?"]), "Luis Rojas") == \
+        "Sí Luis Rojas, enviamos. Gracias Luis."
+    assert cache.get(cache.cache_key("591700", ["hacen envios"]), "Ana Pérez") == \
+        "Sí Ana Pérez, enviamos. Gracias Ana."
+    assert cache.stats()["hits"] == 2
+
+
+def test_named_answer_is_a_miss_for_a_customer_without_name():
+    cache = _cache()
+    cache.put(cache.cache_key("591700", ["horarios"]), "Ana, abrimos de 8 a 18.", 1.0, "Ana")
+    assert cache.get(cache.cache_key("591701", ["horarios"]), None) is None
+    # Una respuesta sin nombre se sirve a cualquiera
+    cache.put(cache.cache_key("591700", ["envios"]), "Enviamos a todo el país.", 1.0, "Ana")
+    assert cache.get(cache.cache_key("591701", ["envios"]), "") == "Enviamos a todo el país."
+
+
+def test_name_inside_other_words_is_kept():
+    cache = _cache()
+    cache.put(cache.cache_key("591700", ["productos"]), "Tenemos ananás, Ana.", 1.0, "Ana")
+    assert cache.get(cache.cache_key("591701", ["productos"]), "Luis") == "Tenemos ananás, Luis."
+
+
+def test_context_dependent_question_opts_the_customer_out():
+    cache = _cache()
+    assert cache.cache_key("591700", ["¿y ese cuánto cuesta?"]) is None
+    assert cache.cache_key("591700", ["¿Hacen envíos?"]) is None
+    assert cache.cache_key("591700", ["hola", "¿Hacen envíos?"]) is None
+    assert cache.stats()["bypassed"] == 3
+
+
+def test_new_knowledge_version_invalidates_answers():
+    versions = iter(["v1", "v2"])
+    cache = ResponseCache(lambda: next(versions), max_size=10, ttl_seconds=60)
+    cache.put(cache.cache_key("591700", ["horarios"]), "De 8 a 18.", 1.0)
+    assert cache.get(cache.cache_key("591700", ["horarios"])) is None
+
+
+class _RecordingEngine:
+    def __init__(self):
+        self.recorded = []
+
+    def record_exchange(self, messages, wa_id, name, response):
+        self.recorded.append((messages, wa_id, name, response))
+
+    def generate(self, *args, **kwargs):
+        raise AssertionError("un acierto no debe llamar al modelo")
+
+
+def test_cache_hit_is_recorded_in_the_background(monkeypatch):
+    recorded = threading.Event()
+    release = threading.Event()
+
+    class _SlowEngine(_RecordingEngine):
+        def record_exchange(self, *args):
+            release.wait(5)
+            super().record_exchange(*args)
+            recorded.set()
+
+    monkeypatch.setattr(assistant_manager, "get_conversation_scheduler", lambda: None)
+    manager = AssistantManager.__new__(AssistantManager)
+    manager.ensure_initialized = lambda: True
+    manager.response_cache = _cache()
+    manager.engine = _SlowEngine()
+    manager._history_executor = None
+    manager._history_lock = threading.Lock()
+    manager.response_cache.put(manager.response_cache.cache_key("591700", ["horarios"]), "De 8 a 18, Ana.", 1.0, "Ana")
+
+    # La respuesta sale sin esperar a que el historial se escriba
+    assert manager.generate_response_for_messages(["Horarios"], "591701", "Luis") == "De 8 a 18, Luis."
+    assert manager.engine.recorded == []
+
+    release.set()
+    assert recorded.wait(5)
+    assert manager.engine.recorded == [(["Horarios"], "591701", "Luis", "De 8 a 18, Luis.")]
+
+
+def test_cache_hit_is_recorded_in_the_conversation_queue(monkeypatch):
+    scheduler = ConversationScheduler(max_concurrency=2)
+    monkeypatch.setattr(assistant_manager, "get_conversation_scheduler", lambda: scheduler)
+    manager = AssistantManager.__new__(AssistantManager)
+    manager.ensure_initialized = lambda: True
+    manager.engine = _RecordingEngine()
+    try:
+        manager.record_exchange(["horarios"], "591700", "Ana", "De 8 a 18.")
+        # El siguiente trabajo de la conversación corre después del registro
+        scheduler.submit("591700", lambda: None).result(timeout=5)
+    finally:
+        scheduler.shutdown()
+    assert manager.engine.recorded == [(["horarios"], "591700", "Ana", "De 8 a 18.")]
+
+
+def test_assistants_history_goes_through_the_openai_circuit(monkeypatch):
+    init_resilience({})
+    breaker = get_endpoint(assistant_manager.OPENAI_ENDPOINT).breaker
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs["role"])
+        raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com"))
+
+    manager = AssistantManager.__new__(AssistantManager)
+    manager.rate_limiter = None
+    manager.client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(messages=SimpleNamespace(create=create))))
+    manager._get_or_create_thread = lambda wa_id: "thread_1"
+    failures_before = breaker.stats()["failures"]
+
+    with pytest.raises(openai.APIConnectionError):
+        AssistantsEngine(manager).record_exchange(["horarios"], "591700", "Ana", "De 8 a 18.")
+
+    assert calls == ["user"]
+    assert breaker.stats()["failures"] == failures_before + 1
+
+
+def test_chat_engine_writes_cached_exchange_to_mensajes():
+    written, turns = [], []
+    context = SimpleNamespace(record_turn=lambda wa_id, count, usage, **kwargs: turns.append((wa_id, count, usage)))
+    engine = ChatCompletionsEngine(SimpleNamespace(context=context),
+                                   exchange_writer=lambda *args: written.append(args))
+
+    engine.record_exchange(["horarios"], "591700", "Ana", "De 8 a 18.")
+
+    assert written == [("591700", "Ana", ["horarios"], "De 8 a 18.")]
+    assert turns == [("591700", 1, None)]
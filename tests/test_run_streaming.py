@@ -0,0 +1,145 @@
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from app.services import assistant_manager
+from app.services.assistant_manager import (
+    RUN_CANCELLED_MESSAGE,
+    RUN_FAILED_MESSAGE,
+    RUN_TIMEOUT_MESSAGE,
+    AssistantConfig,
+    AssistantManager,
+    next_polling_interval,
+)
+
+
+def _event(name, **data):
+    return SimpleNamespace(event=name, data=SimpleNamespace(**data))
+
+
+def _text(value):
+    return [SimpleNamespace(type="text", text=SimpleNamespace(value=value))]
+
+
+class _Stream:
+    """Stream de eventos del run; `error` se lanza después de los eventos"""
+
+    def __init__(self, events, error=None):
+        self.events = events
+        self.error = error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        yield from self.events
+        if self.error is not None:
+            raise self.error
+
+
+class _Runs:
+    def __init__(self, stream):
+        self.stream = stream
+        self.created = []
+        self.cancelled = []
+
+    def create(self, **kwargs):
+        self.created.append(kwargs)
+        return self.stream
+
+    def cancel(self, thread_id, run_id):
+        self.cancelled.append((thread_id, run_id))
+
+
+def _manager(events, error=None, run_timeout=5.0):
+    runs = _Runs(_Stream(events, error))
+    client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=runs)))
+    client.with_options = lambda timeout: client
+    manager = AssistantManager.__new__(AssistantManager)
+    manager.client = client
+    manager.config = AssistantConfig(openai_api_key="sk-test", run_timeout=run_timeout)
+    return manager, runs
+
+
+RUN_PARAMS = {"thread_id": "thread_1", "assistant_id": "asst_1"}
+
+
+def test_stream_returns_the_final_text_and_forwards_deltas():
+    manager, runs = _manager([
+        _event("thread.run.created", id="run_1"),
+        _event("thread.message.delta", delta=SimpleNamespace(content=_text("Hola, "))),
+        _event("thread.message.delta", delta=SimpleNamespace(content=_text("Ana"))),
+        _event("thread.message.completed", content=_text("Hola, Ana")),
+        _event("thread.run.completed", usage=SimpleNamespace(total_tokens=42)),
+    ])
+    deltas, usage = [], []
+
+    assert manager._run_streaming(dict(RUN_PARAMS), deltas.append, usage.append) == "Hola, Ana"
+
+    assert deltas == ["Hola, ", "Ana"]
+    assert [u.total_tokens for u in usage] == [42]
+    assert runs.created[0]["stream"] is True
+    assert runs.cancelled == []
+
+
+@pytest.mark.parametrize("name, data, expected", [
+    ("thread.run.failed", {"last_error": "server_error"}, RUN_FAILED_MESSAGE),
+    ("thread.run.expired", {}, RUN_CANCELLED_MESSAGE),
+    ("error", {}, RUN_FAILED_MESSAGE),
+])
+def test_terminal_events_map_to_their_message(name, data, expected):
+    manager, runs = _manager([_event("thread.run.created", id="run_1"), _event(name, **data)])
+
+    assert manager._run_streaming(dict(RUN_PARAMS)) == expected
+    assert runs.cancelled == []
+
+
+def test_stream_without_events_is_cancelled_after_the_timeout():
+    timeout = openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com"))
+    manager, runs = _manager([_event("thread.run.created", id="run_1")], error=timeout)
+
+    assert manager._run_streaming(dict(RUN_PARAMS)) == RUN_TIMEOUT_MESSAGE
+    assert runs.cancelled == [("thread_1", "run_1")]
+
+
+def test_run_past_the_deadline_is_cancelled_keeping_the_text(monkeypatch):
+    clock = [100.0]
+
+    def monotonic():
+        clock[0] += 3
+        return clock[0]
+
+    monkeypatch.setattr(assistant_manager, "time", SimpleNamespace(monotonic=monotonic))
+    manager, runs = _manager([
+        _event("thread.run.created", id="run_1"),
+        _event("thread.message.completed", content=_text("Respuesta parcial")),
+        _event("thread.run.step.created"),
+    ], run_timeout=5.0)
+
+    assert manager._run_streaming(dict(RUN_PARAMS)) == "Respuesta parcial"
+    assert runs.cancelled == [("thread_1", "run_1")]
+
+
+def test_polling_interval_backs_off_up_to_the_maximum():
+    config = AssistantConfig(openai_api_key="sk-test", polling_interval=0.25,
+                             polling_backoff=1.5, max_polling_interval=2.0)
+    intervals = [config.polling_interval]
+    for _ in range(7):
+        intervals.append(next_polling_interval(intervals[-1], config))
+
+    assert intervals[:3] == [0.25, 0.375, 0.5625]
+    assert intervals[-1] == 2.0
+    assert intervals == sorted(intervals)
+
+
+def test_invalid_run_mode_falls_back_to_stream(monkeypatch):
+    monkeypatch.setattr(assistant_manager, "_app_options", {})
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("OPENAI_RUN_MODE", "websocket")
+
+    assert assistant_manager.load_assistant_config_from_env().run_mode == "stream"
@@ -0,0 +1,114 @@
+import threading
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import app.utils.whatsapp_utils as whatsapp_utils
+from app.services.assistant_manager import RUN_TIMEOUT_MESSAGE, AssistantConfig
+from app.services.conversation_scheduler import Deferred, resolve
+from app.services.response_engine import AssistantsEngine
+from app.services.run_tracker import RunTracker
+
+
+class _FakeRuns:
+    """runs.retrieve que devuelve los estados de `statuses` en orden por run"""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.retrieved = {}
+        self.cancelled = []
+        self.lock = threading.Lock()
+
+    def retrieve(self, thread_id, run_id):
+        with self.lock:
+            count = self.retrieved.get(run_id, 0)
+            self.retrieved[run_id] = count + 1
+        status = self.statuses[run_id][min(count, len(self.statuses[run_id]) - 1)]
+        return SimpleNamespace(status=status, usage=SimpleNamespace(total_tokens=7), last_error=None)
+
+    def cancel(self, thread_id, run_id):
+        self.cancelled.append(run_id)
+
+
+def _client(statuses):
+    part = SimpleNamespace(type="text", text=SimpleNamespace(value="respuesta"))
+    messages = SimpleNamespace(list=lambda **kwargs: SimpleNamespace(data=[SimpleNamespace(content=[part])]))
+    runs = _FakeRuns(statuses)
+    return SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=runs, messages=messages))), runs
+
+
+def _config(**overrides):
+    values = {"openai_api_key": "sk-test", "polling_interval": 0.01, "max_polling_interval": 0.02,
+              "run_timeout": 5.0}
+    values.update(overrides)
+    return AssistantConfig(**values)
+
+
+def test_runs_resolve_with_the_reply_and_usage():
+    client, runs = _client({"run_1": ["queued", "in_progress", "completed"], "run_2": ["completed"]})
+    tracker = RunTracker(client, _config(), io_workers=2)
+    usage = []
+    try:
+        first = tracker.track("thread_1", "run_1", on_usage=usage.append)
+        second = tracker.track("thread_2", "run_2")
+        assert first.result(timeout=2) == "respuesta"
+        assert second.result(timeout=2) == "respuesta"
+    finally:
+        tracker.stop()
+
+    assert runs.retrieved == {"run_1": 3, "run_2": 1}
+    assert [u.total_tokens for u in usage] == [7]
+    stats = tracker.stats()
+    assert (stats["completed"], stats["failed"], stats["in_flight"]) == (2, 0, 0)
+
+
+def test_run_past_its_timeout_is_cancelled():
+    client, runs = _client({"run_1": ["in_progress"]})
+    tracker = RunTracker(client, _config(), io_workers=1)
+    try:
+        future = tracker.track("thread_1", "run_1", timeout=0.05)
+        assert future.result(timeout=2) == RUN_TIMEOUT_MESSAGE
+    finally:
+        tracker.stop()
+
+    assert runs.cancelled == ["run_1"]
+    assert tracker.stats()["timed_out"] == 1
+
+
+def test_poll_run_does_not_block_the_engine_caller():
+    pending = Future()
+    turns = []
+    manager = SimpleNamespace(
+        config=SimpleNamespace(knowledge_index_enabled=False),
+        context=SimpleNamespace(summary_instructions=lambda wa_id: None,
+                                record_turn=lambda wa_id, count, usage, **kwargs: turns.append((wa_id, count, usage))),
+        _get_or_create_thread=lambda wa_id: "thread_1",
+    )
+
+    def start_run(*args, on_usage, **kwargs):
+        pending.add_done_callback(lambda done: on_usage("uso"))
+        return pending
+
+    manager._start_assistant_run = start_run
+    future = AssistantsEngine(manager).start(["hola"], "591700", "Ana")
+    assert not future.done()
+
+    pending.set_result("respuesta")
+    assert future.result(1) == "respuesta"
+    assert turns == [("591700", 1, "uso")]
+
+
+def test_reply_is_sent_when_the_run_finishes(monkeypatch):
+    pending = Future()
+    sent = []
+    manager = SimpleNamespace(submit_response_for_messages=lambda **kwargs: pending)
+    monkeypatch.setattr(whatsapp_utils, "get_assistant_manager", lambda: manager)
+    monkeypatch.setattr(whatsapp_utils, "get_message_router", lambda: None)
+    monkeypatch.setattr(whatsapp_utils, "get_reply_streamer", lambda: None)
+    monkeypatch.setattr(whatsapp_utils, "send_text_message", lambda wa_id, text: sent.append(text) or True)
+
+    outcome = whatsapp_utils.reply_to_messages("591700", "Ana", ["hola"])
+    assert isinstance(outcome, Deferred) and sent == []
+
+    pending.set_result("¡Hola Ana!")
+    assert resolve(outcome) is True
+    assert sent == ["¡Hola Ana!"]
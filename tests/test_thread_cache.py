@@ -0,0 +1,62 @@
+from contextlib import contextmanager
+
+from sqlalchemy.exc import OperationalError
+
+import app.services.assistant_manager as manager_module
+from app.services.assistant_manager import AssistantManager
+from app.services.thread_cache import ThreadCache
+
+
+class _Session:
+    def __init__(self, fail: bool):
+        self.fail = fail
+        self.executed = []
+
+    def execute(self, statement, params=None):
+        self.executed.append(params)
+
+    def commit(self):
+        if self.fail:
+            raise OperationalError("INSERT", {}, Exception("sin conexión"))
+
+
+def _manager(monkeypatch, fail: bool):
+    session = _Session(fail)
+
+    @contextmanager
+    def connection():
+        yield session
+
+    monkeypatch.setattr(manager_module, "get_db_connection", connection)
+    manager = AssistantManager.__new__(AssistantManager)
+    manager.thread_cache = ThreadCache(max_size=10, verify_ttl_seconds=60)
+    return manager
+
+
+def test_thread_is_cached_after_commit(monkeypatch):
+    manager = _manager(monkeypatch, fail=False)
+    assert manager._store_thread_in_db("59170000000", "thread_1") is True
+    assert manager.thread_cache.get("59170000000") == "thread_1"
+
+
+def test_failed_commit_does_not_fill_the_cache(monkeypatch):
+    manager = _manager(monkeypatch, fail=True)
+    assert manager._store_thread_in_db("59170000000", "thread_1") is False
+    assert manager.thread_cache.get("59170000000") is None
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ThreadCache(max_size=2, verify_ttl_seconds=60)
+    cache.put("a", "thread_a")
+    cache.put("b", "thread_b")
+    assert cache.get("a") == "thread_a"
+    cache.put("c", "thread_c")
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_stale_entry_is_read_again_from_db():
+    cache = ThreadCache(max_size=2, verify_ttl_seconds=-1)
+    cache.put("a", "thread_a")
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1
@@ -0,0 +1,125 @@
+import hashlib
+import hmac
+import json
+
+import pytest
+from flask import Flask
+
+import app.views.webhook as webhook_view
+from app.utils.decorators import verificar_solicitud_firmada
+from app.views.webhook import webhook_blueprint
+
+APP_SECRET = "secreto"
+
+
+def _signature(raw: bytes) -> str:
+    return "sha256=" + hmac.new(APP_SECRET.encode(), raw, hashlib.sha256).hexdigest()
+
+
+def _body(messages=None, statuses=None) -> bytes:
+    value = {"messaging_product": "whatsapp"}
+    if messages is not None:
+        value["messages"] = messages
+        value["contacts"] = [{"wa_id": "591700", "profile": {"name": "Ñusta"}}]
+    if statuses is not None:
+        value["statuses"] = statuses
+    body = {"object": "whatsapp_business_account", "entry": [{"changes": [{"field": "messages", "value": value}]}]}
+    # Sin escapar: la firma de Meta se calcula sobre los bytes UTF-8 tal como llegan
+    return json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+
+class _Pool:
+    def __init__(self, accept=True):
+        self.accept = accept
+        self.events = []
+
+    def submit(self, event):
+        self.events.append(event)
+        return self.accept
+
+
+class _StatusWriter:
+    def __init__(self):
+        self.added = []
+
+    def add(self, statuses):
+        self.added.extend(statuses)
+
+
+@pytest.fixture
+def ingress(monkeypatch):
+    parsed = []
+    parse = webhook_view.parse_webhook_payload
+
+    def counting_parse(raw):
+        parsed.append(raw)
+        return parse(raw)
+
+    state = {"pool": _Pool(), "writer": None, "parsed": parsed}
+    monkeypatch.setattr(webhook_view, "parse_webhook_payload", counting_parse)
+    monkeypatch.setattr(webhook_view, "get_webhook_worker_pool", lambda: state["pool"])
+    monkeypatch.setattr(webhook_view, "get_status_batch_writer", lambda: state["writer"])
+
+    app = Flask(__name__)
+    app.config["APP_SECRET"] = APP_SECRET
+    app.register_blueprint(webhook_blueprint)
+    client = app.test_client()
+
+    def post(raw, signature=None):
+        headers = {"X-Hub-Signature-256": signature if signature is not None else _signature(raw)}
+        return client.post("/webhook", data=raw, headers=headers, content_type="application/json")
+
+    state["post"] = post
+    return state
+
+
+def test_signed_utf8_body_is_parsed_once_and_queued(ingress):
+    raw = _body(messages=[{"from": "591700", "id": "wamid.1", "type": "text", "text": {"body": "¿Tienen añil?"}}])
+
+    response = ingress["post"](raw)
+
+    assert response.status_code == 200
+    assert ingress["parsed"] == [raw]
+    [event] = ingress["pool"].events
+    assert [(m.wa_id, m.name, m.text) for m in event.messages] == [("591700", "Ñusta", "¿Tienen añil?")]
+
+
+@pytest.mark.parametrize("signature", ["", "sha256=" + "0" * 64, "md5=abc"])
+def test_missing_or_wrong_signature_is_rejected_before_parsing(ingress, signature):
+    raw = _body(messages=[{"from": "591700", "id": "wamid.1", "type": "text", "text": {"body": "hola"}}])
+
+    assert ingress["post"](raw, signature=signature).status_code == 403
+    assert ingress["parsed"] == [] and ingress["pool"].events == []
+
+
+def test_status_only_delivery_skips_parsing_without_a_status_writer(ingress):
+    raw = _body(statuses=[{"id": "wamid.1", "recipient_id": "591700", "status": "read"}])
+
+    assert ingress["post"](raw).status_code == 200
+    assert ingress["parsed"] == []
+
+
+def test_statuses_go_to_the_batch_writer(ingress):
+    ingress["writer"] = _StatusWriter()
+    raw = _body(statuses=[{"id": "wamid.1", "recipient_id": "591700", "status": "delivered"}])
+
+    assert ingress["post"](raw).status_code == 200
+    assert [(s.message_id, s.status) for s in ingress["writer"].added] == [("wamid.1", "delivered")]
+    assert ingress["pool"].events == []
+
+
+def test_invalid_json_and_full_pool(ingress):
+    assert ingress["post"](b"{no es json").status_code == 400
+
+    ingress["pool"] = _Pool(accept=False)
+    raw = _body(messages=[{"from": "591700", "id": "wamid.1", "type": "text", "text": {"body": "hola"}}])
+    # Pool lleno: 503 para que Meta reintente la entrega
+    assert ingress["post"](raw).status_code == 503
+
+
+def test_signature_check_works_on_raw_bytes_without_flask():
+    raw = "{\"texto\": \"añil\"}".encode("utf-8")
+
+    assert verificar_solicitud_firmada(raw, _signature(raw), APP_SECRET) is None
+    assert verificar_solicitud_firmada(raw + b" ", _signature(raw), APP_SECRET)[1] == 403
+    assert verificar_solicitud_firmada(raw, _signature(raw), "")[1] == 403
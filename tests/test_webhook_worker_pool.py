@@ -0,0 +1,75 @@
+import contextlib
+import threading
+from types import SimpleNamespace
+
+from app.services.webhook_worker_pool import WebhookWorkerPool
+
+
+def _app():
+    return SimpleNamespace(app_context=contextlib.nullcontext)
+
+
+def test_events_are_processed_in_the_background():
+    processed = []
+    pool = WebhookWorkerPool(_app(), processed.append, num_workers=2)
+    pool.start()
+    try:
+        for i in range(10):
+            assert pool.submit(i)
+        pool.queue.join()
+        stats = pool.stats()
+    finally:
+        pool.stop()
+    assert sorted(processed) == list(range(10))
+    assert (stats["enqueued"], stats["processed"], stats["failed"]) == (10, 10, 0)
+
+
+def test_full_queue_rejects_events():
+    release = threading.Event()
+    started = threading.Event()
+
+    def handler(event):
+        started.set()
+        release.wait(2)
+
+    pool = WebhookWorkerPool(_app(), handler, num_workers=1, max_queue_size=1)
+    pool.start()
+    try:
+        assert pool.submit("en curso")
+        assert started.wait(2)
+        assert pool.submit("en cola")
+        assert pool.submit("rechazado") is False
+        assert pool.stats()["rejected"] == 1
+    finally:
+        release.set()
+        pool.stop()
+
+
+def test_handler_errors_do_not_stop_the_workers():
+    processed = []
+
+    def handler(event):
+        if event == "malo":
+            raise ValueError("payload inválido")
+        processed.append(event)
+
+    pool = WebhookWorkerPool(_app(), handler, num_workers=1)
+    pool.start()
+    try:
+        pool.submit("malo")
+        pool.submit("bueno")
+        pool.queue.join()
+        assert processed == ["bueno"]
+        assert pool.stats()["failed"] == 1
+    finally:
+        pool.stop()
+
+
+def test_stop_drains_the_queue():
+    processed = []
+    pool = WebhookWorkerPool(_app(), processed.append, num_workers=2)
+    pool.start()
+    for i in range(20):
+        pool.submit(i)
+    pool.stop()
+    assert len(processed) == 20
@@ -0,0 +1,97 @@
+import json
+
+from app.utils.whatsapp_payload import (
+    get_read_receipt_input,
+    group_events_by_wa_id,
+    is_status_only_payload,
+    parse_webhook_body,
+    parse_webhook_payload,
+    process_text_for_whatsapp,
+)
+
+
+def _webhook(messages=None, contacts=None, statuses=None):
+    value = {"messaging_product": "whatsapp"}
+    if messages is not None:
+        value["messages"] = messages
+    if contacts is not None:
+        value["contacts"] = contacts
+    if statuses is not None:
+        value["statuses"] = statuses
+    return {"object": "whatsapp_business_account",
+            "entry": [{"changes": [{"field": "messages", "value": value}]}]}
+
+
+def _text(wa_id, message_id, body):
+    return {"from": wa_id, "id": message_id, "type": "text", "text": {"body": body}}
+
+
+def test_every_message_of_a_batch_is_parsed_with_its_contact():
+    body = _webhook(
+        messages=[_text("591700", "m1", "hola"), _text("591711", "m2", "precio"), _text("591700", "m3", "2")],
+        contacts=[{"wa_id": "591700", "profile": {"name": "Ana"}}, {"wa_id": "591711", "profile": {"name": "Luis"}}],
+    )
+    event = parse_webhook_body(body)
+    assert event.is_valid_message_event
+    assert [(m.wa_id, m.name, m.message_id, m.text) for m in event.messages] == [
+        ("591700", "Ana", "m1", "hola"), ("591711", "Luis", "m2", "precio"), ("591700", "Ana", "m3", "2"),
+    ]
+    groups = group_events_by_wa_id(event.messages)
+    assert list(groups) == ["591700", "591711"]
+    assert [m.message_id for m in groups["591700"]] == ["m1", "m3"]
+
+
+def test_message_without_sender_uses_single_contact_only():
+    single = parse_webhook_body(_webhook(
+        messages=[{"id": "m1", "type": "text", "text": {"body": "hola"}}],
+        contacts=[{"wa_id": "591700"}],
+    ))
+    assert single.messages[0].wa_id == "591700"
+    assert single.messages[0].name == "Cliente"
+
+    ambiguous = parse_webhook_body(_webhook(
+        messages=[{"id": "m1", "type": "text", "text": {"body": "hola"}}],
+        contacts=[{"wa_id": "591700"}, {"wa_id": "591711"}],
+    ))
+    assert ambiguous.messages == []
+    assert not ambiguous.is_valid_message_event
+
+
+def test_statuses_are_parsed_with_error_details():
+    event = parse_webhook_body(_webhook(statuses=[
+        {"id": "wamid.1", "recipient_id": "591700", "status": "delivered", "timestamp": "1"},
+        {"id": "wamid.2", "recipient_id": "591700", "status": "failed",
+         "errors": [{"code": 131047, "title": "Re-engagement message"}]},
+    ]))
+    assert not event.is_valid_message_event
+    assert [(s.message_id, s.status, s.error_code) for s in event.statuses] == [
+        ("wamid.1", "delivered", None), ("wamid.2", "failed", 131047),
+    ]
+
+
+def test_malformed_bodies_do_not_raise():
+    assert parse_webhook_body([]).object is None
+    assert parse_webhook_body({"object": "x", "entry": ["bad", {"changes": [None, {"value": 3}]}]}).messages == []
+    try:
+        parse_webhook_payload(b"{no es json")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("JSON inválido debe lanzar ValueError")
+
+
+def test_status_only_precheck_ignores_field_value():
+    statuses = json.dumps(_webhook(statuses=[{"id": "wamid.1", "status": "read"}])).encode()
+    messages = json.dumps(_webhook(messages=[_text("591700", "m1", "hola")])).encode()
+    # "messages" aparece como valor de "field" también en los eventos de estado
+    assert b'"field": "messages"' in statuses
+    assert is_status_only_payload(statuses)
+    assert not is_status_only_payload(messages)
+
+
+def test_text_formatting_and_read_receipt_payload():
+    assert process_text_for_whatsapp("**Hola** ［x］ ") == "*Hola* x"
+    payload = json.loads(get_read_receipt_input("wamid.in"))
+    assert payload == {"messaging_product": "whatsapp", "status": "read", "message_id": "wamid.in",
+                       "typing_indicator": {"type": "text"}}
+    assert "typing_indicator" not in json.loads(get_read_receipt_input("wamid.in", typing_indicator=False))